@@ -1,32 +1,62 @@
 """CLI tool for working with prefect flows and agents."""
 import asyncio
 import importlib
+import time
 from collections import defaultdict
 from pathlib import Path
-from typing import DefaultDict, List, Tuple
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 import yaml
+from prefect.cli._types import PrefectTyper
+from prefect.cli._utilities import exit_with_error
 from prefect.cli.root import app
 
+if TYPE_CHECKING:
+    from meta_prefect.implementations.autotune import AutotuneConfig, AutotuneDecision
+    from meta_prefect.implementations.builders.scheduling.plan import SchedulePlan
+    from meta_prefect.implementations.journal import DeployJournal, DeployPhase
+    from meta_prefect.implementations.load import LoadForecast
+    from meta_prefect.implementations.mirror import StateMirror, SyncReport
+    from meta_prefect.implementations.packing import PackingResult
+    from meta_prefect.implementations.queues import QueueReconciliation
+    from meta_prefect.implementations.rightsizing import Recommendation
+    from meta_prefect.interface import DeployableFlow, Deployment
+
 FlowNameStr = str
 app.registered_groups = []
 app.registered_commands = []
 
+workers_app = PrefectTyper(
+    name="workers", help="Manage the supervisor of the local process workers."
+)
+app.add_typer(workers_app)
+
 # from rich import console
 
 # app.console = console
 # app.console.print = print
 
 
-async def _deploy(
+async def _discover_deployable_flows(
     path: str,
-    dry_run: bool,
-) -> None:
+) -> DefaultDict[FlowNameStr, List["DeployableFlow"]]:
+    """Find the deployable flows, or build them from the meta_prefect.yaml file."""
     from prefect.flows import Flow
 
     from meta_prefect.implementations.project import ProjectSpec
     from meta_prefect.implementations.recipes import recipes
-    from meta_prefect.interface import DeployableFlow, Deployment
+    from meta_prefect.interface import DeployableFlow
 
     meta_prefect_yaml_path = Path(path) / "meta_prefect.yaml"
     if meta_prefect_yaml_path.exists():
@@ -36,7 +66,6 @@ async def _deploy(
     else:
         project_spec = ProjectSpec(deployments={})
 
-    # find the deployable flows, or build them from the yaml file
     deployable_flows_map: DefaultDict[FlowNameStr, List[DeployableFlow]] = defaultdict(
         list
     )
@@ -74,65 +103,358 @@ async def _deploy(
                             deployable_flow
                         )
 
-    # for flow_name, deployable_flows in deployable_flows_map.items():
-    #     app.console.print(
-    #         f"Performing pre-deployment updates for {flow_name=}...",
-    #     )
-    #     if dry_run:
-    #         app.console.print(
-    #             f"Would have performed pre-deployment updates for {flow_name=}.",
-    #         )
-    #     else:
-    #         for deployable_flow in deployable_flows:
-    #             await deployable_flow.pre_deployment_update()
-    pre_deployment_actions = {
-        action
-        for deployable_flows in deployable_flows_map.values()
-        for action in deployable_flow.pre_deployment_actions
+    return deployable_flows_map
+
+
+async def _deploy_to_workspace(
+    deployable_flows_map: Mapping[FlowNameStr, List["DeployableFlow"]],
+    dry_run: bool,
+    prefix: str = "",
+    journal: Optional["DeployJournal"] = None,
+    mirror: Optional["StateMirror"] = None,
+    plan: Optional["SchedulePlan"] = None,
+) -> int:
+    """Run actions, build, apply and post-update deployments in one workspace.
+
+    When a journal is given, every completed phase is recorded in it and phases
+    it already records as completed are skipped. When a state mirror is given,
+    it is synced first and builders read the workspace state from it. When a
+    schedule plan is given, schedules are shifted by its planned offsets.
+
+    Returns the number of deployments applied.
+    """
+    from meta_prefect.implementations.builders.scheduling.plan import use_schedule_plan
+    from meta_prefect.implementations.client import get_workspace_key, pooled_client
+    from meta_prefect.implementations.journal import (
+        DeployPhase,
+        fingerprint_deployable_flow,
+        journal_key,
+    )
+    from meta_prefect.implementations.mirror import use_mirror
+    from meta_prefect.interface import DeployableFlow, Deployment
+
+    workspace = get_workspace_key()
+    keyed_flows: Dict[FlowNameStr, List[Tuple[str, str, DeployableFlow]]] = {
+        flow_name: [
+            (
+                journal_key(workspace, flow_name, index),
+                fingerprint_deployable_flow(deployable_flow),
+                deployable_flow,
+            )
+            for index, deployable_flow in enumerate(deployable_flows)
+        ]
+        for flow_name, deployable_flows in deployable_flows_map.items()
     }
-    for action in pre_deployment_actions:
-        app.console.print(f"Running {action}...")
-        await action.run()
-
-    deployments_map: DefaultDict[
-        FlowNameStr, List[Tuple[DeployableFlow, Deployment]]
-    ] = defaultdict(list)
-    for flow_name, deployable_flows in deployable_flows_map.items():
-        app.console.print(
-            f"Building deployments for {flow_name=}...",
-        )
-        if dry_run:
+
+    fingerprints = {
+        key: fingerprint
+        for keyed in keyed_flows.values()
+        for key, fingerprint, _ in keyed
+    }
+
+    def completed(key: str) -> Set["DeployPhase"]:
+        # a dry run leaves entries whose inputs changed in the journal
+        if journal is None or journal.fingerprint(key) != fingerprints[key]:
+            return set()
+        return journal.completed(key)
+
+    def record(key: str, fingerprint: str, phase: "DeployPhase", **kwargs: Any) -> None:
+        if journal is not None and not dry_run:
+            journal.record(key, fingerprint, phase, **kwargs)
+
+    if journal is not None and not dry_run:
+        expired = journal.expire(workspace, fingerprints)
+        for key in expired:
+            app.console.print(f"{prefix}Expired journal entry {key}, inputs changed.")
+
+    pending = {
+        flow_name: [
+            (key, fingerprint, deployable_flow)
+            for key, fingerprint, deployable_flow in keyed
+            if DeployPhase.POST_UPDATED not in completed(key)
+        ]
+        for flow_name, keyed in keyed_flows.items()
+    }
+
+    async with pooled_client():
+        if mirror is not None:
+            report = await mirror.sync()
             app.console.print(
-                f"Would have built and deployed flow {flow_name}.",
+                f"{prefix}Synced state mirror with {report.reads} reads in "
+                f"{report.seconds:.2f}s."
+            )
+
+        with use_mirror(mirror), use_schedule_plan(plan):
+            # builders rely on the results of the actions, so they run again for as
+            # long as anything is left to deploy
+            pre_deployment_actions = {
+                action
+                for keyed in pending.values()
+                for _, _, deployable_flow in keyed
+                for action in deployable_flow.pre_deployment_actions
+            }
+            for action in pre_deployment_actions:
+                app.console.print(f"{prefix}Running {action}...")
+                await action.run()
+            for keyed in pending.values():
+                for key, fingerprint, _ in keyed:
+                    record(key, fingerprint, DeployPhase.ACTIONS_DONE)
+
+            deployments_map: DefaultDict[
+                FlowNameStr, List[Tuple[str, str, DeployableFlow, Deployment]]
+            ] = defaultdict(list)
+            for flow_name, keyed in pending.items():
+                app.console.print(
+                    f"{prefix}Building deployments for {flow_name=}...",
+                )
+                if dry_run:
+                    app.console.print(
+                        f"{prefix}Would have built and deployed flow {flow_name}.",
+                    )
+                    continue
+
+                for key, fingerprint, deployable_flow in keyed:
+                    if DeployPhase.APPLIED in completed(key):
+                        # re-building would bump the version of an applied deployment
+                        deployment = Deployment(
+                            name=journal.deployment_name(key),  # type: ignore[union-attr]
+                            flow_name=flow_name,
+                        )
+                        await deployment.load()
+                        app.console.print(
+                            f"{prefix}Skipping {deployment.name} for flow {flow_name}, "
+                            "already applied."
+                        )
+                    else:
+                        deployment = await deployable_flow.build_deployment()
+                        record(key, fingerprint, DeployPhase.BUILT)
+                        app.console.print(
+                            f"{prefix}Applying {deployment.name} for flow {flow_name}..."
+                        )
+                        await deployment.apply(upload=True)
+                        record(
+                            key,
+                            fingerprint,
+                            DeployPhase.APPLIED,
+                            deployment_name=deployment.name,
+                        )
+                    deployments_map[flow_name].append(
+                        (key, fingerprint, deployable_flow, deployment)
+                    )
+
+            for flow_name, deployments_tuple in deployments_map.items():
+                app.console.print(
+                    f"{prefix}Performing post-deployment update for {flow_name}...",
+                )
+                for key, fingerprint, deployable_flow, deployment in deployments_tuple:
+                    app.console.print(
+                        f"{prefix}Running post-deployment update for "
+                        f"{deployment.name} for flow {deployable_flow.name}...",
+                    )
+                    await deployable_flow.post_deployment_update(deployment)
+                    record(key, fingerprint, DeployPhase.POST_UPDATED)
+
+            if dry_run:
+                for flow_name in pending:
+                    app.console.print(
+                        f"{prefix}Would have performed post-deployment update for "
+                        f"{flow_name}."
+                    )
+
+    return sum(len(deployments) for deployments in deployments_map.values())
+
+
+class WorkspaceDeployReport(NamedTuple):
+    """Outcome of deploying to a single workspace."""
+
+    profile: str
+    deployments: int
+    seconds: float
+    error: Optional[BaseException] = None
+
+
+async def _deploy_to_profile(
+    deployable_flows_map: Mapping[FlowNameStr, List["DeployableFlow"]],
+    dry_run: bool,
+    profile: str,
+    journal: Optional["DeployJournal"] = None,
+    mirror: Optional["StateMirror"] = None,
+    plan: Optional["SchedulePlan"] = None,
+) -> WorkspaceDeployReport:
+    """Deploy to the workspace of a prefect profile, capturing the outcome."""
+    from prefect.context import use_profile
+
+    start = time.perf_counter()
+    try:
+        # the profile only applies to this task's context, so concurrent deploys
+        # to different profiles do not interfere with each other
+        with use_profile(profile, override_environment_variables=True):
+            deployments = await _deploy_to_workspace(
+                deployable_flows_map,
+                dry_run,
+                prefix=f"[{profile}] ",
+                journal=journal,
+                mirror=mirror,
+                plan=plan,
             )
+    except Exception as exc:
+        return WorkspaceDeployReport(
+            profile=profile,
+            deployments=0,
+            seconds=time.perf_counter() - start,
+            error=exc,
+        )
+    return WorkspaceDeployReport(
+        profile=profile,
+        deployments=deployments,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _print_workspace_reports(reports: List[WorkspaceDeployReport]) -> None:
+    from rich.table import Table
+
+    table = Table(title="Workspace deploys")
+    table.add_column("Profile")
+    table.add_column("Status")
+    table.add_column("Deployments", justify="right")
+    table.add_column("Latency (s)", justify="right")
+    for report in reports:
+        if report.error is None:
+            status = "ok"
         else:
-            for deployable_flow in deployable_flows:
-                deployment = await deployable_flow.build_deployment()
-                deployments_map[flow_name].append((deployable_flow, deployment))
-                app.console.print(f"Applying {deployment.name} for flow {flow_name}...")
-                await deployment.apply(upload=True)
+            message = str(report.error).splitlines()[0] if str(report.error) else ""
+            status = f"failed: {type(report.error).__name__} {message}".rstrip()
+        table.add_row(
+            report.profile,
+            status,
+            str(report.deployments),
+            f"{report.seconds:.2f}",
+        )
+    app.console.print(table)
 
-    for flow_name, deployments_pair in deployments_map.items():
-        app.console.print(
-            f"Performing post-deployment update for {flow_name}...",
+
+async def _deploy(
+    path: str,
+    dry_run: bool,
+    profiles: Optional[List[str]] = None,
+    resume: bool = False,
+    use_mirror: bool = True,
+) -> None:
+    from meta_prefect.implementations.builders.scheduling.plan import SchedulePlan
+    from meta_prefect.implementations.journal import DeployJournal
+    from meta_prefect.implementations.mirror import StateMirror
+
+    deployable_flows_map = await _discover_deployable_flows(path)
+    mirror = StateMirror.for_project(path) if use_mirror else None
+    plan = SchedulePlan.for_project(path)
+
+    journal = DeployJournal.for_project(path)
+    if resume:
+        journal.load()
+    elif not dry_run:
+        journal.reset()
+
+    if not profiles:
+        await _deploy_to_workspace(
+            deployable_flows_map, dry_run, journal=journal, mirror=mirror, plan=plan
         )
-        if dry_run:
-            app.console.print(
-                f"Would have performed post-deployment update for {flow_name}."
+        if not dry_run:
+            journal.compact()
+        return
+
+    # discovery happens once, every workspace is then deployed concurrently
+    reports = await asyncio.gather(
+        *[
+            _deploy_to_profile(
+                deployable_flows_map, dry_run, profile, journal, mirror, plan
             )
-        else:
-            for deployable_flow, deployment in deployments_pair:
-                app.console.print(
-                    f"Running post-deployment update for {deployment.name} for "
-                    f"flow {deployable_flow.name}...",
-                )
-                await deployable_flow.post_deployment_update(deployment)
+            for profile in profiles
+        ]
+    )
+    _print_workspace_reports(reports)
+    if not dry_run:
+        journal.compact()
+
+    failed = [report.profile for report in reports if report.error is not None]
+    if failed:
+        exit_with_error(f"Deploy failed for profiles: {', '.join(failed)}")
+
+
+def _parse_profiles(profiles: Optional[str]) -> Optional[List[str]]:
+    if not profiles:
+        return None
+    return [name.strip() for name in profiles.split(",") if name.strip()] or None
+
+
+@app.command()
+def run(
+    flow_name: str,
+    path: str = ".",
+    deployment: Optional[str] = None,
+    params: Optional[str] = None,
+    local: bool = False,
+    isolated: bool = False,
+) -> None:
+    """Run a flow's deployment now and wait for it to finish.
+
+    Args:
+        flow_name: the name of the flow to run.
+        path: the path to a directory or file containing the prefect flow(s).
+            If not specified, the current working directory is used.
+        deployment: the name of the deployment to run, required if the flow has
+            several.
+        params: the parameters of the run as a JSON object, overriding the
+            deployment's.
+        local: if True, run the flow on this machine right away instead of
+            scheduling it for a worker, still recording the run in the API.
+        isolated: if True with `local`, run the flow in a warm subprocess,
+            within the deployment's resource limits, instead of in-process.
+    """
+    import json
+
+    parameters = json.loads(params) if params else {}
+    deployable_flows_map = asyncio.run(_discover_deployable_flows(path))
+    if flow_name not in deployable_flows_map:
+        exit_with_error(f"No deployable flow named {flow_name!r} in {path}.")
+    built = asyncio.run(
+        _build_deployments({flow_name: deployable_flows_map[flow_name]})
+    )
+    matching = [
+        (deployable_flow, built_deployment)
+        for deployable_flow, built_deployment in built
+        if deployment is None or built_deployment.name == deployment
+    ]
+    if len(matching) != 1:
+        names = sorted(built_deployment.name for _, built_deployment in built)
+        exit_with_error(f"Pick a deployment of {flow_name} with --deployment: {names}")
+    deployable_flow, built_deployment = matching[0]
+
+    if local:
+        from meta_prefect.implementations.fast_run import run_locally
+
+        state = run_locally(
+            deployable_flow, built_deployment, parameters, isolated=isolated
+        )
+    else:
+        from prefect.deployments import run_deployment
+
+        flow_run = run_deployment(
+            f"{flow_name}/{built_deployment.name}", parameters=parameters
+        )
+        state = flow_run.state
+    if state is None or not state.is_completed():
+        exit_with_error(f"Flow run finished in state {state}.")
+    app.console.print(f"Flow run finished in state {state}.")
 
 
 @app.command()
 def deploy(
     path: str = ".",
     dry_run: bool = False,
+    profiles: Optional[str] = None,
+    resume: bool = False,
+    mirror: bool = True,
 ) -> None:
     """Deploy prefect flows to prefect cloud.
 
@@ -140,8 +462,980 @@ def deploy(
         path: the path to a directory or file containing the prefect flow(s).
             If not specified, the current working directory is used.
         dry_run: if True, pre, post, and deployment steps are not run.
+        profiles: a comma-separated list of prefect profiles to deploy to
+            concurrently. If not specified, the active profile is used.
+        resume: if True, continue the previous deploy from its journal, skipping
+            the deployments it already completed whose inputs did not change.
+        mirror: if True, sync the local state mirror of each workspace and let
+            builders read from it instead of the API.
+    """
+    asyncio.run(_deploy(path, dry_run, _parse_profiles(profiles), resume, mirror))
+
+
+async def _sync_profile(
+    mirror: "StateMirror", full: bool, profile: Optional[str] = None
+) -> "SyncReport":
+    from prefect.context import use_profile
+
+    from meta_prefect.implementations.client import pooled_client
+
+    if profile is None:
+        async with pooled_client():
+            return await mirror.sync(full=full)
+    with use_profile(profile, override_environment_variables=True):
+        async with pooled_client():
+            return await mirror.sync(full=full)
+
+
+async def _sync(path: str, full: bool, profiles: Optional[List[str]] = None) -> None:
+    from rich.table import Table
+
+    from meta_prefect.implementations.mirror import StateMirror
+
+    mirror = StateMirror.for_project(path)
+    reports = await asyncio.gather(
+        *[_sync_profile(mirror, full, profile) for profile in profiles or [None]]
+    )
+
+    table = Table(title="State mirror sync")
+    for column in ("Workspace", "Flows", "Deployments"):
+        table.add_column(column, justify="left" if column == "Workspace" else "right")
+    table.add_column("Reads", justify="right")
+    table.add_column("Latency (s)", justify="right")
+    for report in reports:
+        table.add_row(
+            report.workspace,
+            str(report.flows),
+            str(report.deployments),
+            str(report.reads),
+            f"{report.seconds:.2f}",
+        )
+    app.console.print(table)
+
+
+@app.command()
+def sync(path: str = ".", full: bool = False, profiles: Optional[str] = None) -> None:
+    """Refresh the local mirror of workspace state read by builders.
+
+    Args:
+        path: the project directory holding the mirror.
+        full: if True, drop the mirrored state and read everything again,
+            picking up deleted flows and deployments.
+        profiles: a comma-separated list of prefect profiles to sync
+            concurrently. If not specified, the active profile is used.
+    """
+    asyncio.run(_sync(path, full, _parse_profiles(profiles)))
+
+
+async def _reconcile_profile(
+    work_pools: Optional[List[str]], dry_run: bool, profile: Optional[str] = None
+) -> List["QueueReconciliation"]:
+    from prefect.context import use_profile
+
+    from meta_prefect.implementations.client import pooled_client
+    from meta_prefect.implementations.index import get_work_pool_index
+    from meta_prefect.implementations.queues import reconcile_work_queues
+
+    async def reconcile() -> List["QueueReconciliation"]:
+        async with pooled_client():
+            names = work_pools or [
+                work_pool.name
+                for work_pool in (await get_work_pool_index("process")).all()
+            ]
+            reconciliations = []
+            for name in names:
+                reconciliations.extend(await reconcile_work_queues(name, dry_run))
+            return reconciliations
+
+    if profile is None:
+        return await reconcile()
+    with use_profile(profile, override_environment_variables=True):
+        return await reconcile()
+
+
+async def _reconcile_queues(
+    work_pools: Optional[List[str]],
+    dry_run: bool,
+    profiles: Optional[List[str]] = None,
+) -> None:
+    from rich.table import Table
+
+    results = await asyncio.gather(
+        *[
+            _reconcile_profile(work_pools, dry_run, profile)
+            for profile in profiles or [None]
+        ]
+    )
+
+    table = Table(title="Work queue reconciliation" + (" (dry run)" if dry_run else ""))
+    for column in ("Profile", "Work pool", "Work queue", "Action", "Deployments"):
+        table.add_column(column, justify="right" if column == "Deployments" else "left")
+    table.add_column("Merged into")
+    for profile, reconciliations in zip(profiles or ["active"], results):
+        for reconciliation in reconciliations:
+            table.add_row(
+                profile,
+                reconciliation.work_pool_name,
+                reconciliation.work_queue_name,
+                reconciliation.action,
+                str(reconciliation.deployments),
+                reconciliation.merged_into or "",
+            )
+    app.console.print(table)
+
+
+@app.command()
+def reconcile_queues(
+    work_pools: Optional[str] = None,
+    dry_run: bool = False,
+    profiles: Optional[str] = None,
+) -> None:
+    """Delete the work queues meta-prefect created that are no longer used.
+
+    Queues created by older versions as `work-queue-<id>` are merged into the
+    registry queue with the same concurrency limit and priority, moving their
+    deployments over, which drops their auto-scheduled runs. Queues still holding
+    scheduled, pending or running flow runs are kept until their runs are done.
+
+    Args:
+        work_pools: a comma-separated list of work pools to reconcile. If not
+            specified, every process work pool is reconciled.
+        dry_run: if True, only report what would be deleted or merged.
+        profiles: a comma-separated list of prefect profiles to reconcile
+            concurrently. If not specified, the active profile is used.
     """
-    asyncio.run(_deploy(path, dry_run))
+    asyncio.run(
+        _reconcile_queues(
+            _parse_profiles(work_pools), dry_run, _parse_profiles(profiles)
+        )
+    )
+
+
+async def _build_deployments(
+    deployable_flows_map: Mapping[FlowNameStr, List["DeployableFlow"]],
+) -> List[Tuple["DeployableFlow", "Deployment"]]:
+    """Build deployments without applying them, to plan or forecast their load.
+
+    Pre-deployment actions only resolve the work pools and queues that exist,
+    nothing is created or updated, and actions starting processes such as
+    workers are skipped. Missing pools and queues are unlimited.
+    """
+    from meta_prefect.implementations.actions.base import read_only_actions
+
+    pre_deployment_actions = {
+        action
+        for deployable_flows in deployable_flows_map.values()
+        for deployable_flow in deployable_flows
+        for action in deployable_flow.pre_deployment_actions
+        if not action.spawns_processes
+    }
+    with read_only_actions():
+        for action in pre_deployment_actions:
+            await action.run()
+        return [
+            (deployable_flow, await deployable_flow.build_deployment())
+            for deployable_flows in deployable_flows_map.values()
+            for deployable_flow in deployable_flows
+        ]
+
+
+async def _read_run_durations(
+    deployments: List["Deployment"], durations: Optional[str]
+) -> Dict[str, float]:
+    """Read the run durations of deployments from a CSV file, or else the API."""
+    from meta_prefect.implementations.load import load_durations_csv, read_durations
+
+    if durations:
+        return load_durations_csv(Path(durations))
+    return await read_durations(
+        (deployment.flow_name, deployment.name) for deployment in deployments
+    )
+
+
+async def _read_concurrency_limits(
+    work_pool_name: str,
+) -> Tuple[Optional[int], Dict[str, Optional[int]]]:
+    """Read the concurrency limit of a work pool and of each of its queues.
+
+    A work pool which does not exist yet, and its queues, are unlimited.
+    """
+    from prefect.exceptions import ObjectNotFound
+
+    from meta_prefect.implementations.client import get_client
+    from meta_prefect.implementations.index import get_work_queue_index
+
+    async with get_client() as client:
+        try:
+            work_pool = await client.read_work_pool(work_pool_name)
+        except ObjectNotFound:
+            return None, {}
+    queue_index = await get_work_queue_index(work_pool_name)
+    return work_pool.concurrency_limit, {
+        work_queue.name: work_queue.concurrency_limit
+        for work_queue in queue_index.all()
+    }
+
+
+def _describe_schedule(schedule: Any) -> str:
+    for attr in ("cron", "rrule"):
+        if hasattr(schedule, attr):
+            lines = getattr(schedule, attr).splitlines()
+            return lines[0] + (f" (+{len(lines) - 1} lines)" if len(lines) > 1 else "")
+    return f"every {schedule.interval} from {schedule.anchor_date}"
+
+
+def _print_packing_results(results: List["PackingResult"]) -> None:
+    from rich.table import Table
+
+    def percent(value: Optional[float]) -> str:
+        return f"{value:.0%}" if value is not None else "-"
+
+    table = Table(title="Predicted work pool load")
+    table.add_column("Work pool")
+    for column in (
+        "Deployments",
+        "Runs",
+        "Limit",
+        "Peak before",
+        "Peak after",
+        "Utilization before",
+        "Utilization after",
+        "Mean delay before (s)",
+        "Mean delay after (s)",
+    ):
+        table.add_column(column, justify="right")
+    for result in results:
+        report = result.report
+        table.add_row(
+            report.work_pool_name,
+            str(report.deployments),
+            str(report.runs),
+            str(report.concurrency_limit or "-"),
+            str(report.peak_before),
+            str(report.peak_after),
+            percent(report.utilization_before),
+            percent(report.utilization_after),
+            f"{report.mean_delay_before:.1f}",
+            f"{report.mean_delay_after:.1f}",
+        )
+    app.console.print(table)
+
+    table = Table(title="Planned schedules")
+    table.add_column("Deployment")
+    table.add_column("Offset (s)", justify="right")
+    table.add_column("Schedule")
+    for result in results:
+        for key, schedule in sorted(result.schedules.items()):
+            offset = result.offsets.get(key)
+            table.add_row(
+                key,
+                str(offset) if offset is not None else "fixed",
+                _describe_schedule(schedule),
+            )
+    app.console.print(table)
+
+
+async def _pack(
+    path: str,
+    window: Optional[int],
+    durations: Optional[str],
+    default_duration: float,
+    horizon_days: int,
+    bucket_seconds: int,
+    dry_run: bool,
+) -> None:
+    import pendulum
+
+    from meta_prefect.implementations.builders.scheduling.plan import (
+        deployment_key,
+        SchedulePlan,
+        use_schedule_plan,
+    )
+    from meta_prefect.implementations.builders.scheduling.stagger import (
+        schedule_staggerer,
+    )
+    from meta_prefect.implementations.client import pooled_client
+    from meta_prefect.implementations.load import ScheduledLoad
+    from meta_prefect.implementations.mirror import StateMirror, use_mirror
+    from meta_prefect.implementations.packing import (
+        allowed_offsets,
+        DEFAULT_WINDOW_SECONDS,
+        pack_work_pool,
+        PackingItem,
+    )
+
+    deployable_flows_map = await _discover_deployable_flows(path)
+    mirror = StateMirror.for_project(path)
+    async with pooled_client():
+        await mirror.sync()
+        # offsets are planned from the schedules as declared
+        with use_mirror(mirror), use_schedule_plan(SchedulePlan.unstaggered()):
+            built = [
+                (deployable_flow, deployment)
+                for deployable_flow, deployment in await _build_deployments(
+                    deployable_flows_map
+                )
+                if deployment.schedule
+            ]
+            duration_by_key = await _read_run_durations(
+                [deployment for _, deployment in built], durations
+            )
+
+            items_by_pool: DefaultDict[str, List[PackingItem]] = defaultdict(list)
+            for deployable_flow, deployment in built:
+                key = deployment_key(deployment.flow_name, deployment.name)
+                staggerer = next(
+                    (
+                        builder
+                        for builder in deployable_flow.deployment_builders
+                        if isinstance(builder, schedule_staggerer)
+                    ),
+                    None,
+                )
+                # only deployments with a staggerer apply the planned offsets
+                offsets: List[int] = []
+                if staggerer is not None:
+                    staggerer = staggerer.copy(
+                        update={
+                            "window_seconds": window
+                            or staggerer.window_seconds
+                            or DEFAULT_WINDOW_SECONDS
+                        }
+                    )
+                    offsets = allowed_offsets(staggerer, deployment.schedule)
+                load = ScheduledLoad(
+                    key=key,
+                    schedule=deployment.schedule,
+                    duration_seconds=duration_by_key.get(key, default_duration),
+                    work_pool_name=deployment.work_pool_name,
+                    work_queue_name=deployment.work_queue_name,
+                )
+                items_by_pool[deployment.work_pool_name or ""].append(
+                    PackingItem(load, offsets)
+                )
+
+            limits = {
+                work_pool_name: (
+                    await _read_concurrency_limits(work_pool_name)
+                    if work_pool_name
+                    else (None, {})
+                )
+                for work_pool_name in items_by_pool
+            }
+
+    start = pendulum.now("UTC").start_of("day")
+    end = start.add(days=horizon_days)
+    results = [
+        pack_work_pool(
+            work_pool_name,
+            items,
+            start,
+            end,
+            concurrency_limit=limits[work_pool_name][0],
+            queue_limits=limits[work_pool_name][1],
+            bucket_seconds=bucket_seconds,
+        )
+        for work_pool_name, items in items_by_pool.items()
+    ]
+    _print_packing_results(results)
+
+    if dry_run:
+        return
+    plan = SchedulePlan.for_project(path)
+    for result in results:
+        plan.offsets.update(result.offsets)
+    plan.save()
+    app.console.print(f"Saved the schedule plan to {plan.path}.")
+
+
+@app.command()
+def pack(
+    path: str = ".",
+    window: Optional[int] = None,
+    durations: Optional[str] = None,
+    default_duration: float = 60,
+    horizon_days: int = 7,
+    bucket_seconds: int = 60,
+    dry_run: bool = False,
+) -> None:
+    """Plan schedule offsets minimizing the peak load of each work pool.
+
+    The planned offsets are saved to the project's schedule plan and applied by
+    the schedule staggerer on the next deploy.
+
+    Args:
+        path: the path to a directory containing the prefect flow(s).
+        window: the window, in seconds, offsets are picked from. If not
+            specified, the stagger window of each deployment is used, or 15
+            minutes for deployments that are not staggered.
+        durations: a CSV file with flow_name, deployment_name and
+            duration_seconds columns. If not specified, durations are read from
+            the last completed flow runs of each deployment.
+        default_duration: the run duration, in seconds, of deployments without
+            a known duration.
+        horizon_days: the number of days schedules are expanded over.
+        bucket_seconds: the resolution at which concurrent runs are counted.
+        dry_run: if True, only report the plan without saving it.
+    """
+    asyncio.run(
+        _pack(
+            path,
+            window,
+            durations,
+            default_duration,
+            horizon_days,
+            bucket_seconds,
+            dry_run,
+        )
+    )
+
+
+def _print_forecasts(forecasts: List["LoadForecast"]) -> None:
+    from rich.table import Table
+
+    table = Table(title="Schedule load forecast")
+    table.add_column("Work pool")
+    table.add_column("Work queue")
+    for column in ("Runs", "Peak starts", "Peak concurrency", "Limit", "Overloaded"):
+        table.add_column(column, justify="right")
+    table.add_column("First overload")
+    for forecast in forecasts:
+        overloaded = forecast.overloaded
+        table.add_row(
+            forecast.work_pool_name,
+            forecast.work_queue_name or "(all)",
+            str(int(forecast.starts.sum())),
+            str(int(forecast.starts.max(initial=0))),
+            str(int(forecast.concurrency.max(initial=0))),
+            str(forecast.concurrency_limit)
+            if forecast.concurrency_limit is not None
+            else "-",
+            str(int(overloaded.sum())),
+            f"{forecast.bucket_starts[overloaded.argmax()]}Z"
+            if overloaded.any()
+            else "-",
+        )
+    app.console.print(table)
+
+
+async def _forecast(
+    path: str,
+    durations: Optional[str],
+    default_duration: float,
+    horizon_days: int,
+    bucket_seconds: int,
+    include_inactive: bool,
+    output: Optional[str],
+) -> None:
+    import pendulum
+
+    from meta_prefect.implementations.builders.scheduling.plan import (
+        deployment_key,
+        SchedulePlan,
+        use_schedule_plan,
+    )
+    from meta_prefect.implementations.client import pooled_client
+    from meta_prefect.implementations.load import (
+        forecast_load,
+        ScheduledLoad,
+        write_forecast,
+    )
+    from meta_prefect.implementations.mirror import StateMirror, use_mirror
+
+    deployable_flows_map = await _discover_deployable_flows(path)
+    mirror = StateMirror.for_project(path)
+    async with pooled_client():
+        await mirror.sync()
+        # the schedules are built as they would be deployed
+        with use_mirror(mirror), use_schedule_plan(SchedulePlan.for_project(path)):
+            deployments = [
+                deployment
+                for _, deployment in await _build_deployments(deployable_flows_map)
+                if deployment.schedule
+                and (include_inactive or deployment.is_schedule_active is not False)
+            ]
+            duration_by_key = await _read_run_durations(deployments, durations)
+            limits = {
+                work_pool_name: await _read_concurrency_limits(work_pool_name)
+                for work_pool_name in {
+                    deployment.work_pool_name
+                    for deployment in deployments
+                    if deployment.work_pool_name
+                }
+            }
+
+    loads = []
+    for deployment in deployments:
+        key = deployment_key(deployment.flow_name, deployment.name)
+        loads.append(
+            ScheduledLoad(
+                key=key,
+                schedule=deployment.schedule,
+                duration_seconds=duration_by_key.get(key, default_duration),
+                work_pool_name=deployment.work_pool_name,
+                work_queue_name=deployment.work_queue_name,
+            )
+        )
+    start = pendulum.now("UTC").start_of("hour")
+    forecasts = forecast_load(
+        loads, start, start.add(days=horizon_days), bucket_seconds, limits
+    )
+    _print_forecasts(forecasts)
+    if output:
+        write_forecast(forecasts, Path(output))
+        app.console.print(f"Wrote the forecast to {output}.")
+
+
+@app.command()
+def forecast(
+    path: str = ".",
+    durations: Optional[str] = None,
+    default_duration: float = 60,
+    horizon_days: int = 7,
+    bucket_seconds: int = 900,
+    include_inactive: bool = False,
+    output: Optional[str] = None,
+) -> None:
+    """Forecast the load the schedules of a project put on work pools and queues.
+
+    Deployments are built as on deploy, so holidays are excluded and only the
+    schedules activated for the environment count.
+
+    Args:
+        path: the path to a directory containing the prefect flow(s).
+        durations: a CSV file with flow_name, deployment_name and
+            duration_seconds columns. If not specified, durations are read from
+            the last completed flow runs of each deployment.
+        default_duration: the run duration, in seconds, of deployments without
+            a known duration.
+        horizon_days: the number of days schedules are expanded over.
+        bucket_seconds: the length of the time buckets runs are counted in.
+        include_inactive: if True, also count inactive schedules, e.g. to
+            forecast dev deployments.
+        output: a .json or .csv file to export the forecast of every bucket to.
+    """
+    asyncio.run(
+        _forecast(
+            path,
+            durations,
+            default_duration,
+            horizon_days,
+            bucket_seconds,
+            include_inactive,
+            output,
+        )
+    )
+
+
+async def _autotune(
+    work_pool: str,
+    work_queues: Optional[List[str]],
+    config: "AutotuneConfig",
+    iterations: Optional[int],
+    dry_run: bool,
+) -> None:
+    from meta_prefect.implementations.autotune import PrefectAutotuneApi, QueueAutotuner
+    from meta_prefect.implementations.client import pooled_client
+
+    def log(decision: "AutotuneDecision") -> None:
+        app.console.print(
+            f"{decision.work_queue_name}: {decision.previous_limit} -> "
+            f"{decision.limit} ({decision.reason}; "
+            f"backlog={decision.signals.backlog}, "
+            f"running={decision.signals.running}, "
+            f"cpu={decision.host.cpu_percent:.0f}%, "
+            f"memory={decision.host.memory_percent:.0f}%)"
+        )
+
+    autotuner = QueueAutotuner(
+        PrefectAutotuneApi(work_pool, work_queues),
+        config,
+        dry_run=dry_run,
+        on_decision=log,
+    )
+    async with pooled_client():
+        await autotuner.run(iterations)
+
+
+@app.command()
+def autotune(
+    work_pool: str,
+    work_queues: Optional[str] = None,
+    min_limit: int = 1,
+    max_limit: int = 16,
+    interval: float = 30,
+    cooldown: float = 120,
+    cpu_high: float = 85,
+    memory_high: float = 85,
+    iterations: Optional[int] = None,
+    dry_run: bool = False,
+) -> None:
+    """Adjust the concurrency limits of work queues to their load and the host's.
+
+    Limits grow by one while runs wait with every slot busy, and are halved when
+    the host's CPU or memory use is high or runs get slower than usual.
+
+    Args:
+        work_pool: the work pool whose queues are tuned.
+        work_queues: a comma-separated list of queues to tune. If not
+            specified, every queue of the pool with a concurrency limit is tuned.
+            Queues unique to a deployment are never tuned.
+        min_limit: the lowest concurrency limit set.
+        max_limit: the highest concurrency limit set.
+        interval: the seconds between two adjustments.
+        cooldown: the seconds between two decreases of a queue's limit.
+        cpu_high: the CPU use, in percent, above which limits are decreased.
+        memory_high: the memory use, in percent, above which limits are decreased.
+        iterations: the number of adjustments to make. If not specified, limits
+            are adjusted until interrupted.
+        dry_run: if True, only log the limits that would be set.
+    """
+    from meta_prefect.implementations.autotune import AutotuneConfig
+
+    config = AutotuneConfig(
+        min_limit=min_limit,
+        max_limit=max_limit,
+        interval_seconds=interval,
+        cooldown_seconds=cooldown,
+        cpu_high_percent=cpu_high,
+        memory_high_percent=memory_high,
+    )
+    asyncio.run(
+        _autotune(work_pool, _parse_profiles(work_queues), config, iterations, dry_run)
+    )
+
+
+def _print_recommendations(
+    recommendations: List["Recommendation"], report: bool
+) -> None:
+    from rich.table import Table
+
+    def size(cpu: float, memory_gb: float) -> str:
+        return f"{cpu:g} / {memory_gb:g}Gi"
+
+    table = Table(title="Pod right-sizing")
+    table.add_column("Deployment")
+    table.add_column("Env")
+    table.add_column("Runs", justify="right")
+    if report:
+        table.add_column("Current requests", justify="right")
+    table.add_column("Requests", justify="right")
+    table.add_column("Limits", justify="right")
+    if report:
+        for column in ("CPU saved", "Memory saved", "OOM risk"):
+            table.add_column(column, justify="right")
+    for recommendation in recommendations:
+        current, resources = recommendation.current, recommendation.resources
+        row = [
+            recommendation.key,
+            recommendation.env,
+            str(recommendation.samples),
+        ]
+        if report:
+            row.append(size(current.cpu_request, current.memory_request_gb))
+        if recommendation.recommended is None:
+            row.extend(["-", "-"])
+        else:
+            row.extend(
+                [
+                    size(resources.cpu_request, resources.memory_request_gb),
+                    size(resources.cpu_limit, resources.memory_limit_gb),
+                ]
+            )
+        if report:
+            row.extend(
+                [
+                    f"{recommendation.cpu_saved:g}",
+                    f"{recommendation.memory_saved_gb:g}Gi",
+                    "yes" if recommendation.oom_risk else "",
+                ]
+            )
+        table.add_row(*row)
+    app.console.print(table)
+    if report:
+        current_cpu = sum(r.current.cpu_request for r in recommendations)
+        current_memory = sum(r.current.memory_request_gb for r in recommendations)
+        cpu_saved = sum(r.cpu_saved for r in recommendations)
+        memory_saved = sum(r.memory_saved_gb for r in recommendations)
+        app.console.print(
+            f"Requests per run of every deployment: {cpu_saved:g} of "
+            f"{current_cpu:g} cores and {memory_saved:g} of {current_memory:g}Gi "
+            f"saved ({100 * cpu_saved / current_cpu if current_cpu else 0:.0f}% "
+            f"CPU, {100 * memory_saved / current_memory if current_memory else 0:.0f}"
+            "% memory)."
+        )
+
+
+async def _rightsize(path: str, metrics: Optional[str], report: bool) -> None:
+    from meta_prefect.implementations.builders.infra.eks import eks
+    from meta_prefect.implementations.client import pooled_client
+    from meta_prefect.implementations.rightsizing import (
+        FileMetricsSource,
+        get_metrics_source,
+        use_metrics_source,
+    )
+
+    source = FileMetricsSource(Path(metrics)) if metrics else get_metrics_source()
+    if source is None:
+        exit_with_error(
+            "No metrics to right-size from, pass --metrics or set "
+            "META_PREFECT__RESOURCE_METRICS."
+        )
+    deployable_flows_map = await _discover_deployable_flows(path)
+    recommendations = []
+    async with pooled_client():
+        with use_metrics_source(source):
+            for deployable_flow, deployment in await _build_deployments(
+                deployable_flows_map
+            ):
+                # only pods of the eks builder are sized
+                for builder in deployable_flow.deployment_builders:
+                    if isinstance(builder, eks):
+                        recommendations.append(
+                            await builder.recommend(
+                                deployment.flow_name, deployment.name
+                            )
+                        )
+    _print_recommendations(recommendations, report)
+
+
+@app.command()
+def rightsize(
+    path: str = ".", metrics: Optional[str] = None, report: bool = False
+) -> None:
+    """Recommend the CPU and memory requests and limits of deployments' pods.
+
+    Pods are sized from the peak usage of the past runs of each deployment,
+    with the profile of its environment. Deployments using the eks builder with
+    `rightsizing="apply"` get the recommended size on their next deploy.
+
+    Args:
+        path: the path to a directory containing the prefect flow(s).
+        metrics: a CSV or JSON file with flow_name, deployment_name, cpu and
+            memory_gb fields, a row per past run. If not specified, the file
+            set in META_PREFECT__RESOURCE_METRICS is used.
+        report: if True, also compare to the current requests and total the
+            savings.
+    """
+    asyncio.run(_rightsize(path, metrics, report))
+
+
+@workers_app.command("start")
+def start_workers(
+    count: Optional[int] = None,
+    detach: bool = False,
+    drain_timeout: float = 300,
+    max_backoff: float = 60,
+    autoscale: bool = False,
+    min_workers: int = 1,
+    max_workers: Optional[int] = None,
+    runs_per_worker: int = 1,
+    memory_headroom: float = 20,
+    worker_memory: float = 512,
+    warm: bool = False,
+    pool_size: int = 1,
+    recycle_after: int = 100,
+    preload: Optional[str] = None,
+) -> None:
+    """Keep workers polling every registered work pool until stopped.
+
+    Deploys register their work pool and start the supervisor in the background
+    when it is not running. Crashed workers are restarted with exponential
+    backoff, and stopping drains them.
+
+    Args:
+        count: the number of workers per pool. If not specified, a quarter of the
+            CPUs, between 1 and 8.
+        detach: if True, run the supervisor in the background.
+        drain_timeout: the seconds workers are given to finish their runs on
+            stop before being killed.
+        max_backoff: the most seconds between two restarts of a crashing worker.
+        autoscale: if True, scale the workers of each pool to its backlog of due
+            runs instead of keeping `count` workers.
+        min_workers: the fewest workers per pool when autoscaling.
+        max_workers: the most workers per pool when autoscaling. If not
+            specified, one per CPU.
+        runs_per_worker: the flow runs a worker runs at a time when autoscaling.
+        memory_headroom: the share of the host's memory, in percent, kept free
+            when autoscaling.
+        worker_memory: the memory, in MB, a worker and its runs are expected to
+            use when autoscaling.
+        warm: if True, start warm workers, which run flow runs in interpreters
+            forked from a zygote that already imported Prefect and the flows'
+            modules.
+        pool_size: the idle interpreters each warm worker keeps forked.
+        recycle_after: the flow runs after which a warm worker replaces its
+            zygote.
+        preload: a comma separated list of modules warm workers import up front,
+            besides the flow files they learn of from their runs.
+    """
+    import logging
+
+    from meta_prefect.implementations.supervisor import (
+        ensure_supervisor,
+        STOCK_WORKER_COMMAND,
+        SupervisorHome,
+        WorkerSupervisor,
+    )
+
+    home = SupervisorHome.default()
+    pid = home.supervisor_pid()
+    if pid is not None:
+        exit_with_error(f"The worker supervisor is already running as {pid}.")
+    if detach:
+        options = {
+            "count": count,
+            "drain-timeout": drain_timeout,
+            "max-backoff": max_backoff,
+            "min-workers": min_workers,
+            "max-workers": max_workers,
+            "runs-per-worker": runs_per_worker,
+            "memory-headroom": memory_headroom,
+            "worker-memory": worker_memory,
+            "pool-size": pool_size,
+            "recycle-after": recycle_after,
+            "preload": preload,
+        }
+        args = [
+            f"--{name}={value}" for name, value in options.items() if value is not None
+        ]
+        if autoscale:
+            args.append("--autoscale")
+        if warm:
+            args.append("--warm")
+        pid = ensure_supervisor(home, args)
+        app.console.print(f"Started the worker supervisor as {pid}.")
+        return
+
+    autoscaler = None
+    if autoscale:
+        from meta_prefect.implementations.autoscale import (
+            AutoscaleConfig,
+            PrefectAutoscaleApi,
+            WorkerAutoscaler,
+        )
+
+        config = AutoscaleConfig(
+            min_workers=min_workers,
+            runs_per_worker=runs_per_worker,
+            memory_headroom_percent=memory_headroom,
+            worker_memory_mb=worker_memory,
+            **({"max_workers": max_workers} if max_workers else {}),
+        )
+        autoscaler = WorkerAutoscaler(
+            PrefectAutoscaleApi(), config, metrics_file=home.metrics_file
+        )
+    worker_command: Tuple[str, ...] = STOCK_WORKER_COMMAND
+    if warm:
+        from meta_prefect.implementations.warm_worker import warm_worker_command
+
+        worker_command = tuple(
+            warm_worker_command(
+                pool_size=pool_size,
+                recycle_after=recycle_after,
+                preload=[module for module in (preload or "").split(",") if module],
+            )
+        )
+    logging.getLogger("meta_prefect").setLevel(logging.INFO)
+    WorkerSupervisor(
+        home,
+        count=count,
+        drain_seconds=drain_timeout,
+        max_backoff_seconds=max_backoff,
+        autoscaler=autoscaler,
+        worker_command=worker_command,
+    ).run()
+
+
+@workers_app.command("stop")
+def stop_workers(timeout: float = 600) -> None:
+    """Drain the workers and stop their supervisor.
+
+    Args:
+        timeout: the seconds to wait for the supervisor to exit.
+    """
+    import os
+    import signal
+
+    from meta_prefect.implementations.supervisor import SupervisorHome
+
+    home = SupervisorHome.default()
+    pid = home.supervisor_pid()
+    if pid is None:
+        exit_with_error("The worker supervisor is not running.")
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while home.supervisor_pid() is not None:
+        if time.monotonic() > deadline:
+            exit_with_error(f"The worker supervisor {pid} is still draining.")
+        time.sleep(0.5)
+    app.console.print("Stopped the worker supervisor.")
+
+
+@workers_app.command("status")
+def workers_status() -> None:
+    """Show the workers kept running by the supervisor."""
+    from rich.table import Table
+
+    from meta_prefect.implementations.supervisor import SupervisorHome
+
+    home = SupervisorHome.default()
+    pid = home.supervisor_pid()
+    if pid is None:
+        exit_with_error("The worker supervisor is not running.")
+    table = Table(title=f"Workers of supervisor {pid}")
+    for column in ("Profile", "Work pool", "Name", "State", "PID"):
+        table.add_column(column)
+    for column in ("Uptime", "Restarts", "Last exit"):
+        table.add_column(column, justify="right")
+    now = time.time()
+    for worker in home.status():
+        started_at = worker["started_at"]
+        table.add_row(
+            worker["profile"] or "-",
+            worker["work_pool_name"],
+            worker["name"],
+            worker["state"],
+            str(worker["pid"] or "-"),
+            f"{now - started_at:.0f}s" if worker["pid"] and started_at else "-",
+            str(worker["restarts"]),
+            str(worker["last_exit_code"])
+            if worker["last_exit_code"] is not None
+            else "-",
+        )
+    app.console.print(table)
+
+
+@workers_app.command("benchmark")
+def benchmark_workers(runs: int = 5, imports: Optional[str] = None) -> None:
+    """Compare how fast the process and warm workers start flow runs.
+
+    Runs a throwaway deployment in a work pool of the current workspace with
+    each worker, and prints the time from a run being handed to the worker to
+    its flow starting.
+
+    Args:
+        runs: the flow runs per worker.
+        imports: a comma separated list of modules the benchmarked flow
+            imports, such as its heavy dependencies.
+    """
+    from rich.table import Table
+
+    from meta_prefect.implementations.warm_worker import benchmark_run_start
+
+    results = asyncio.run(
+        benchmark_run_start(
+            runs=runs,
+            imports=[module for module in (imports or "").split(",") if module],
+        )
+    )
+    table = Table(title=f"Flow run start latency over {runs} runs")
+    table.add_column("Worker")
+    for column in ("Median", "P90"):
+        table.add_column(column, justify="right")
+    for result in results:
+        table.add_row(result.worker, f"{result.median:.2f}s", f"{result.p90:.2f}s")
+    app.console.print(table)
 
 
 if __name__ == "__main__":
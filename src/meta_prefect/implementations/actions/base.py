@@ -1,12 +1,33 @@
 """Base action implementation."""
 from abc import ABC, abstractmethod
-from typing import Any, Dict, FrozenSet
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, ClassVar, Dict, FrozenSet, Iterator, Tuple
 
 from pydantic import BaseModel, Field, PrivateAttr
 
+from meta_prefect.implementations.client import get_workspace_key
+
 # TODO - use weakref.WeakKeyDictionary() instead but it doesn't work with
 # frozen pydantic models
-cache: Dict["Action", Any] = {}  # weakref.WeakKeyDictionary()
+# results are keyed by workspace so the same action can run once per workspace,
+# and by whether it ran read-only
+cache: Dict[Tuple[str, bool, "Action"], Any] = {}  # weakref.WeakKeyDictionary()
+
+_read_only: ContextVar[bool] = ContextVar("meta_prefect_read_only", default=False)
+
+
+@contextmanager
+def read_only_actions() -> Iterator[None]:
+    """Make actions in this context resolve their results without changing anything.
+
+    Used to build deployments without deploying them, e.g. to plan their load.
+    """
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
 
 
 class Action(BaseModel, ABC):
@@ -17,26 +38,37 @@ class Action(BaseModel, ABC):
         description="The actions that must be run before this action.",
     )
 
+    # actions starting processes, e.g. workers, are skipped when only planning
+    spawns_processes: ClassVar[bool] = False
+
     _outputs: Any = PrivateAttr(default=None)
 
+    def _cache_key(self) -> Tuple[str, bool, "Action"]:
+        return get_workspace_key(), _read_only.get(), self
+
     @property
     def result(self) -> Any:
         """Get the result of the action."""
         try:
-            return cache[self]
+            return cache[self._cache_key()]
         except KeyError:
             raise RuntimeError("Action has not been run yet.")
 
     async def run(self) -> Any:
-        """Run the action."""
-        if self not in cache:
-            cache[self] = await self._run()
-        return cache[self]
+        """Run the action, or only resolve its result within `read_only_actions`."""
+        key = self._cache_key()
+        if key not in cache:
+            cache[key] = await (self._resolve() if key[1] else self._run())
+        return cache[key]
 
     @abstractmethod
     async def _run(self) -> Any:
         ...
 
+    async def _resolve(self) -> Any:
+        """Get the result the action would have from what exists, changing nothing."""
+        raise NotImplementedError(f"{self!r} cannot be run read-only.")
+
     class Config:
         frozen = True
 
@@ -0,0 +1,23 @@
+"""Actions for dependency bundles."""
+import asyncio
+from typing import ClassVar
+
+from pydantic import Field
+
+from meta_prefect.implementations.bundle import build_bundle, DependencyBundle
+
+from .base import Action
+
+
+class EnsureDependencyBundleBuiltAction(Action):
+    """Ensure the dependency bundle of a flow package is built and published."""
+
+    # pip runs for minutes, so bundles are not built when only planning
+    spawns_processes: ClassVar[bool] = True
+
+    bundle: DependencyBundle = Field(description="The bundle to build.")
+
+    async def _run(self) -> str:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, build_bundle, self.bundle
+        )
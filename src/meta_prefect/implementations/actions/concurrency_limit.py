@@ -0,0 +1,26 @@
+"""Actions for global concurrency limits."""
+from typing import FrozenSet, List, Tuple
+
+from meta_prefect.implementations.components.concurrency_limit import ConcurrencyLimit
+from meta_prefect.implementations.concurrency_limits import ensure_concurrency_limits
+from meta_prefect.implementations.index import get_concurrency_limit_index
+
+from .base import Action
+
+
+class EnsureConcurrencyLimitsCreatedAction(Action):
+    """Ensure global concurrency limits exist with the given number of slots."""
+
+    limits: FrozenSet[Tuple[str, int]] = frozenset()
+
+    def __repr__(self) -> str:
+        limits = ", ".join(f"{name}={limit}" for name, limit in sorted(self.limits))
+        return f"EnsureConcurrencyLimitsCreatedAction({limits})"
+
+    async def _run(self) -> List[ConcurrencyLimit]:
+        return await ensure_concurrency_limits(dict(self.limits))
+
+    async def _resolve(self) -> List[ConcurrencyLimit]:
+        index = await get_concurrency_limit_index()
+        existing = [index.get(name) for name, _ in sorted(self.limits)]
+        return [limit for limit in existing if limit is not None]
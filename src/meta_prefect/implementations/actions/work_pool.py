@@ -1,56 +1,116 @@
 """Actions for work pools."""
-from typing import List
+from typing import Any, Dict
 from uuid import uuid4
 
-from prefect import get_client
 from prefect.workers.process import ProcessJobConfiguration
 
 from meta_prefect.implementations.components.work_pool import WorkPool
+from meta_prefect.implementations.index import get_work_pool_index
+from meta_prefect.implementations.run_resources import RUN_RESOURCE_VARIABLES
 
 from .base import Action
 
 
+def local_process_base_job_template(env: str) -> Dict[str, Any]:
+    """Get the base job template of local process work pools.
+
+    Besides the env split, it lets deployments override the command of their
+    runs, and set their CPU pinning, resource limits and nice level.
+    """
+    job_configuration = {
+        k: v
+        for k, v in ProcessJobConfiguration(
+            env={
+                "META_PREFECT__ENV": "{{env}}",
+                **{
+                    spec["env"]: f"{{{{{variable}}}}}"
+                    for variable, spec in RUN_RESOURCE_VARIABLES.items()
+                },
+            }
+        )
+        .dict()
+        .items()
+        if v is not None
+    }
+    job_configuration["command"] = "{{command}}"
+    return {
+        "job_configuration": job_configuration,
+        "variables": {
+            "type": "object",
+            "properties": {
+                "env": {
+                    "type": "string",
+                    "default": env,
+                },
+                "command": {
+                    "type": "string",
+                    "description": "The command starting the flow run.",
+                },
+                **{
+                    variable: {"type": spec["type"], "description": spec["description"]}
+                    for variable, spec in RUN_RESOURCE_VARIABLES.items()
+                },
+            },
+        },
+    }
+
+
+LOCAL_PROCESS_WORK_POOL_PREFIX = "local-process-work-pool"
+
+
+async def find_local_process_work_pool(env: str) -> WorkPool:
+    """Get the local process work pool, or an unsaved one if there is none yet.
+
+    Args:
+        env: the default env of the work pool, if missing.
+    """
+    index = await get_work_pool_index("process")
+    work_pool = index.first_with_env_key("{{env}}")
+    if work_pool is None:
+        return WorkPool(
+            name=LOCAL_PROCESS_WORK_POOL_PREFIX,
+            type="process",
+            base_job_template=local_process_base_job_template(env),
+        )
+    return work_pool
+
+
+async def ensure_local_process_work_pool(env: str) -> WorkPool:
+    """Get the local process work pool, created or upgraded to the latest template.
+
+    Args:
+        env: the default env of the work pool, if created.
+    """
+    index = await get_work_pool_index("process")
+    work_pool = index.first_with_env_key("{{env}}")
+    if work_pool is None:
+        work_pool = WorkPool(
+            name=f"{LOCAL_PROCESS_WORK_POOL_PREFIX}-{str(uuid4())[:8]}",
+            type="process",
+            base_job_template=local_process_base_job_template(env),
+        )
+        await work_pool.create()
+        index.add(work_pool)
+    elif "command" not in work_pool.base_job_template.get("variables", {}).get(
+        "properties", {}
+    ):
+        # pools created before runs could be limited keep their default env
+        properties = work_pool.base_job_template["variables"]["properties"]
+        work_pool.base_job_template = local_process_base_job_template(
+            properties.get("env", {}).get("default", env)
+        )
+        await work_pool.update()
+    return work_pool
+
+
 class EnsureLocalProcessWorkPoolCreatedAction(Action):
     """Ensure a local process work pool is created."""
 
     def __repr__(self) -> str:
         return "EnsureLocalProcessWorkPoolCreatedAction()"
 
-    async def _get_existing_work_pools(self) -> List[WorkPool]:
-        async with get_client() as client:
-            available_workpools = await client.read_work_pools()
-        return [WorkPool.from_client_workpool(wp) for wp in available_workpools]
-
     async def _run(self) -> WorkPool:
-        for work_pool in await self._get_existing_work_pools():
-            if work_pool.type == "process":
-                job_config = work_pool.base_job_template["job_configuration"]
-                if job_config["env"]["META_PREFECT__ENV"] == "{{env}}":
-                    break
-        else:
-            work_pool = WorkPool(
-                name=f"local-process-work-pool-{str(uuid4())[:8]}",
-                type="process",
-                base_job_template={
-                    "job_configuration": {
-                        k: v
-                        for k, v in ProcessJobConfiguration(
-                            env={"META_PREFECT__ENV": "{{env}}"}
-                        )
-                        .dict()
-                        .items()
-                        if v is not None
-                    },
-                    "variables": {
-                        "type": "object",
-                        "properties": {
-                            "env": {
-                                "type": "string",
-                                "default": "dev",
-                            }
-                        },
-                    },
-                },
-            )
-            work_pool.create()
-        return work_pool
+        return await ensure_local_process_work_pool("dev")
+
+    async def _resolve(self) -> WorkPool:
+        return await find_local_process_work_pool("dev")
@@ -1,20 +1,25 @@
 """Actions for work queus."""
 from typing import FrozenSet, Optional
-from uuid import uuid4
-
-from prefect import get_client
 
 from meta_prefect.implementations.components.work_pool import WorkPool
 from meta_prefect.implementations.components.work_queue import WorkQueue
+from meta_prefect.implementations.index import get_work_pool_index
+from meta_prefect.implementations.queues import (
+    ensure_work_queue,
+    find_work_queue,
+    QueueSpec,
+)
 
 from .base import Action
 from .work_pool import EnsureLocalProcessWorkPoolCreatedAction
 
 
 class EnsureWorkQueueCreatedAction(Action):
-    """Ensure a work queue is created."""
+    """Ensure the registry work queue of a limit, priority and owner is created."""
 
     concurrency_limit: Optional[int] = None
+    priority: int = 1
+    owner: Optional[str] = None
 
     requires: FrozenSet["Action"] = frozenset(
         {EnsureLocalProcessWorkPoolCreatedAction()}
@@ -22,36 +27,34 @@ class EnsureWorkQueueCreatedAction(Action):
 
     def __repr__(self) -> str:
         return (
-            f"EnsureWorkQueueCreatedAction(concurrency_limit={self.concurrency_limit})"
+            f"EnsureWorkQueueCreatedAction(concurrency_limit={self.concurrency_limit}"
+            f", priority={self.priority}, owner={self.owner})"
         )
 
-    async def _ensure_work_queue_created(self, work_pool: WorkPool) -> WorkQueue:
-        async with get_client() as client:
-            work_queues = [
-                WorkQueue.from_client_workqueue(wq)
-                for wq in await client.read_work_queues(
-                    work_pool_name=work_pool.name,
-                )
-            ]
-
-            for work_queue in work_queues:
-                if work_queue.concurrency_limit == self.concurrency_limit:
-                    wq = work_queue
-                    break
-            else:
-                wq = WorkQueue(
-                    name=f"work-queue-{str(uuid4())[:8]}",
-                    work_pool_name=work_pool.name,
-                    concurrency_limit=self.concurrency_limit,
-                )
-                await wq.create()
-        return wq
+    def _spec(self, work_pool: WorkPool) -> QueueSpec:
+        return QueueSpec(
+            work_pool_name=work_pool.name,
+            concurrency_limit=self.concurrency_limit,
+            priority=self.priority,
+            owner=self.owner,
+        )
 
-    async def _run(self) -> WorkQueue:
+    async def _work_pool(self) -> WorkPool:
         work_pool_action = next(
             action
             for action in self.requires
             if isinstance(action, EnsureLocalProcessWorkPoolCreatedAction)
         )
-        work_pool = await work_pool_action.run()
-        return await self._ensure_work_queue_created(work_pool)
+        work_pool: WorkPool = await work_pool_action.run()
+        return work_pool
+
+    async def _run(self) -> WorkQueue:
+        return await ensure_work_queue(self._spec(await self._work_pool()))
+
+    async def _resolve(self) -> WorkQueue:
+        work_pool = await self._work_pool()
+        index = await get_work_pool_index(work_pool.type)
+        # the queues of a pool that does not exist yet are all missing
+        return await find_work_queue(
+            self._spec(work_pool), pool_exists=index.get(work_pool.name) is not None
+        )
@@ -1,10 +1,6 @@
 """Actions for workers."""
-from typing import FrozenSet
+from typing import ClassVar, FrozenSet
 
-from pendulum import duration
-from prefect import get_client
-from prefect._internal.schemas.fields import DateTimeTZ
-from prefect.client.schemas.filters import WorkerFilter, WorkerFilterLastHeartbeatTime
 from pydantic import Field
 
 from meta_prefect.implementations.components.work_pool import WorkPool
@@ -22,6 +18,8 @@ class EnsureWorkerCreatedAction(Action):
         {EnsureLocalProcessWorkPoolCreatedAction()}
     )
 
+    spawns_processes: ClassVar[bool] = True
+
     machine_id: str = Field(
         default_factory=get_machine_id,
         description="The machine ID of the worker to create.",
@@ -31,25 +29,9 @@ class EnsureWorkerCreatedAction(Action):
         return f"EnsureWorkerCreatedAction(machine_id={self.machine_id})"
 
     async def _ensure_local_worker_created(self, work_pool: WorkPool) -> ProcessWorker:
-        async with get_client() as client:
-            workers = [
-                ProcessWorker.from_client_worker(w, work_pool.name)
-                for w in await client.read_workers_for_work_pool(
-                    work_pool_name=work_pool.name,
-                    worker_filter=WorkerFilter(
-                        last_heartbeat_time=WorkerFilterLastHeartbeatTime(
-                            after_=DateTimeTZ.now() - duration(minutes=10)
-                        )
-                    ),
-                )
-            ]
-
-            for worker in workers:
-                if self.machine_id in worker.name:
-                    break
-            else:
-                worker = ProcessWorker(work_pool_name=work_pool.name)
-                await worker.create()
+        # registering is idempotent, the supervisor keeps the workers running
+        worker = ProcessWorker(work_pool_name=work_pool.name)
+        await worker.create()
         return worker
 
     async def _run(self) -> ProcessWorker:
@@ -0,0 +1,357 @@
+"""Backlog-driven autoscaling of the local process workers of the supervisor.
+
+Each worker of the supervisor runs at most `runs_per_worker` flow runs at a
+time, so a burst of scheduled runs waits for a worker while the host may have
+idle cores. The autoscaler periodically reads, for every registered work pool,
+the scheduled runs that are due (late ones included), the running runs and the
+age of the oldest due run, and picks the number of workers of the pool:
+
+* while runs wait, workers are added up to what the backlog needs, `max_workers`
+  and the memory left above the host's headroom;
+* once nothing waits and a whole worker's worth of slots is idle, workers are
+  removed one at a time, down to what the running runs need and `min_workers`;
+* workers are removed when the host's memory falls below the headroom.
+
+Thresholds apart for adding and removing workers, and cooldowns after every
+change, keep the count from flapping. Every decision is logged along with the
+latency of the pool's backlog, and appended to a JSON lines metrics file.
+"""
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from prefect._internal.schemas.fields import DateTimeTZ
+from prefect.client.schemas.filters import (
+    FlowRunFilter,
+    FlowRunFilterExpectedStartTime,
+    FlowRunFilterState,
+    FlowRunFilterStateName,
+    FlowRunFilterStateType,
+    WorkPoolFilter,
+    WorkPoolFilterName,
+)
+from prefect.client.schemas.objects import StateType
+from prefect.client.schemas.sorting import FlowRunSort
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.supervisor import PoolRegistration
+
+logger = getLogger(__name__)
+
+MB = 1024 * 1024
+METRICS_MAX_BYTES = 10 * MB
+
+
+def default_max_workers() -> int:
+    """Get the default most workers per pool, one per CPU."""
+    return os.cpu_count() or 1
+
+
+class PoolBacklog(NamedTuple):
+    """What the autoscaler observes of a work pool."""
+
+    due: int
+    late: int
+    running: int
+    latency_seconds: float = 0.0
+
+
+class HostMemory(NamedTuple):
+    """The memory of the host running the workers, in bytes."""
+
+    available: int
+    total: int
+
+
+class AutoscaleDecision(NamedTuple):
+    """A number of workers the autoscaler picked for a work pool, and why."""
+
+    pool: str
+    previous_workers: int
+    workers: int
+    reason: str
+    backlog: PoolBacklog
+    memory: HostMemory
+
+    @property
+    def changed(self) -> bool:
+        return self.workers != self.previous_workers
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "previous_workers": self.previous_workers,
+            "reason": self.reason,
+            **self.backlog._asdict(),
+            "memory_available_mb": self.memory.available // MB,
+        }
+
+
+class AutoscaleConfig(BaseModel):
+    """The bounds, thresholds and cooldowns of the worker autoscaler."""
+
+    min_workers: int = Field(1, ge=0, description="The fewest workers per pool.")
+    max_workers: int = Field(
+        default_factory=default_max_workers,
+        ge=1,
+        description="The most workers per pool, one per CPU by default.",
+    )
+    runs_per_worker: int = Field(
+        1, ge=1, description="The flow runs a worker runs at a time."
+    )
+    max_step: int = Field(
+        4, ge=1, description="The most workers added to a pool at once."
+    )
+    scale_up_backlog: int = Field(
+        1, ge=1, description="The due runs waiting before workers are added."
+    )
+    scale_down_idle_workers: float = Field(
+        1.0,
+        gt=0,
+        description="The idle workers' worth of slots before one is removed.",
+    )
+    scale_up_cooldown_seconds: float = Field(
+        30.0, ge=0, description="The time after a change before adding workers."
+    )
+    scale_down_cooldown_seconds: float = Field(
+        300.0, ge=0, description="The time after a change before removing workers."
+    )
+    memory_headroom_percent: float = Field(
+        20.0,
+        ge=0,
+        lt=100,
+        description="The share of the host's memory kept free.",
+    )
+    worker_memory_mb: float = Field(
+        512.0,
+        gt=0,
+        description="The memory a worker and its runs are expected to use.",
+    )
+    interval_seconds: float = Field(
+        15.0, gt=0, description="The time between two scaling steps."
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_bounds(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["min_workers"] > values["max_workers"]:
+            raise ValueError("min_workers must not be greater than max_workers.")
+        return values
+
+
+def scale_workers(
+    workers: int,
+    backlog: PoolBacklog,
+    memory: HostMemory,
+    config: AutoscaleConfig,
+    may_scale_up: bool = True,
+    may_scale_down: bool = True,
+) -> Tuple[int, str]:
+    """Pick the next number of workers of a pool, and say why."""
+    headroom = memory.total * config.memory_headroom_percent / 100
+    spare = math.floor((memory.available - headroom) / (config.worker_memory_mb * MB))
+    needed = math.ceil((backlog.running + backlog.due) / config.runs_per_worker)
+    floor = max(config.min_workers, math.ceil(backlog.running / config.runs_per_worker))
+    if not config.min_workers <= workers <= config.max_workers:
+        bounded = min(max(workers, config.min_workers), config.max_workers)
+        return bounded, "bound"
+    if spare < 0 and workers > config.min_workers:
+        if not may_scale_down:
+            return workers, "cooling down despite memory below headroom"
+        return workers - 1, (
+            f"scale down, {memory.available // MB}MB available "
+            f"below {headroom // MB:.0f}MB headroom"
+        )
+    target = min(config.max_workers, needed, workers + config.max_step)
+    if backlog.due >= config.scale_up_backlog and target > workers:
+        if spare <= 0:
+            return workers, f"hold, {backlog.due} runs waiting but no memory to spare"
+        target = min(target, workers + spare)
+        if not may_scale_up:
+            return workers, f"cooling down despite {backlog.due} runs waiting"
+        return target, f"scale up, {backlog.due} runs waiting"
+    idle = workers * config.runs_per_worker - backlog.running
+    if (
+        not backlog.due
+        and workers > floor
+        and idle >= config.scale_down_idle_workers * config.runs_per_worker
+    ):
+        if not may_scale_down:
+            return workers, f"cooling down despite {idle} idle slots"
+        return workers - 1, f"scale down, {idle} idle slots"
+    return workers, "hold"
+
+
+class AutoscaleApi(ABC):
+    """Where the autoscaler reads the backlog of pools and the host's memory."""
+
+    @abstractmethod
+    async def read_backlog(self, registration: PoolRegistration) -> PoolBacklog:
+        """Read the due, late and running runs of a pool."""
+
+    @abstractmethod
+    async def read_memory(self) -> HostMemory:
+        """Read the available and total memory of the host."""
+
+
+@dataclass
+class _PoolState:
+    workers: int
+    last_change: Optional[float] = None
+
+
+class WorkerAutoscaler:
+    """Picks the number of workers of every pool, a step at a time."""
+
+    def __init__(
+        self,
+        api: AutoscaleApi,
+        config: AutoscaleConfig,
+        metrics_file: Optional[Path] = None,
+        on_decision: Optional[Callable[[AutoscaleDecision], Any]] = None,
+    ) -> None:
+        self.api = api
+        self.config = config
+        self.metrics_file = metrics_file
+        self.on_decision = on_decision
+        self._states: Dict[str, _PoolState] = {}
+
+    def workers(self, registration: PoolRegistration) -> int:
+        """Get the number of workers picked for a pool, `min_workers` at first."""
+        state = self._states.get(registration.key)
+        return state.workers if state else max(1, self.config.min_workers)
+
+    def _record(self, decision: AutoscaleDecision, now: float) -> None:
+        logger.info(
+            f"{decision.pool}: {decision.previous_workers} -> {decision.workers} "
+            f"workers, {decision.reason} (due={decision.backlog.due}, "
+            f"late={decision.backlog.late}, running={decision.backlog.running}, "
+            f"latency={decision.backlog.latency_seconds:.0f}s)"
+        )
+        if self.metrics_file is not None:
+            if (
+                self.metrics_file.exists()
+                and self.metrics_file.stat().st_size > METRICS_MAX_BYTES
+            ):
+                os.replace(self.metrics_file, self.metrics_file.with_suffix(".1.jsonl"))
+            with open(self.metrics_file, "a") as file:
+                file.write(json.dumps({"time": now, **decision.metrics()}) + "\n")
+        if self.on_decision is not None:
+            self.on_decision(decision)
+
+    async def step(
+        self, registrations: List[PoolRegistration], now: float
+    ) -> List[AutoscaleDecision]:
+        """Read the backlog of every pool once and pick its number of workers."""
+        memory = await self.api.read_memory()
+        decisions = []
+        for registration in registrations:
+            state = self._states.setdefault(
+                registration.key, _PoolState(self.workers(registration))
+            )
+            backlog = await self.api.read_backlog(registration)
+            since_change = (
+                math.inf if state.last_change is None else now - state.last_change
+            )
+            workers, reason = scale_workers(
+                state.workers,
+                backlog,
+                memory,
+                self.config,
+                may_scale_up=since_change >= self.config.scale_up_cooldown_seconds,
+                may_scale_down=since_change >= self.config.scale_down_cooldown_seconds,
+            )
+            decision = AutoscaleDecision(
+                registration.key, state.workers, workers, reason, backlog, memory
+            )
+            if decision.changed:
+                state.workers, state.last_change = workers, now
+            if workers > decision.previous_workers:
+                # the memory of the workers just added is no longer spare
+                added = workers - decision.previous_workers
+                memory = memory._replace(
+                    available=memory.available
+                    - int(added * self.config.worker_memory_mb * MB)
+                )
+            self._record(decision, now)
+            decisions.append(decision)
+        # pools no longer registered start over if registered again
+        keys = {registration.key for registration in registrations}
+        for key in set(self._states) - keys:
+            del self._states[key]
+        return decisions
+
+
+class PrefectAutoscaleApi(AutoscaleApi):
+    """Reads backlogs from the Prefect API of each pool's profile."""
+
+    async def _count(self, work_pool_name: str, flow_run_filter: FlowRunFilter) -> int:
+        async with get_client() as client:
+            response = await client._client.post(
+                "/flow_runs/count",
+                json={
+                    "flow_runs": flow_run_filter.dict(json_compatible=True),
+                    "work_pools": WorkPoolFilter(
+                        name=WorkPoolFilterName(any_=[work_pool_name])
+                    ).dict(json_compatible=True),
+                },
+            )
+        return int(response.json())
+
+    async def _read_backlog(self, work_pool_name: str) -> PoolBacklog:
+        now = DateTimeTZ.now("UTC")
+        scheduled = FlowRunFilterStateType(any_=[StateType.SCHEDULED])
+        due = FlowRunFilter(
+            state=FlowRunFilterState(type=scheduled),
+            expected_start_time=FlowRunFilterExpectedStartTime(before_=now),
+        )
+        late = FlowRunFilter(
+            state=FlowRunFilterState(
+                type=scheduled, name=FlowRunFilterStateName(any_=["Late"])
+            ),
+        )
+        running = FlowRunFilter(
+            state=FlowRunFilterState(
+                type=FlowRunFilterStateType(any_=[StateType.PENDING, StateType.RUNNING])
+            )
+        )
+        async with get_client() as client:
+            oldest = await client.read_flow_runs(
+                work_pool_filter=WorkPoolFilter(
+                    name=WorkPoolFilterName(any_=[work_pool_name])
+                ),
+                flow_run_filter=due,
+                sort=FlowRunSort.EXPECTED_START_TIME_ASC,
+                limit=1,
+            )
+        latency = (
+            (now - oldest[0].expected_start_time).total_seconds()
+            if oldest and oldest[0].expected_start_time
+            else 0.0
+        )
+        return PoolBacklog(
+            due=await self._count(work_pool_name, due),
+            late=await self._count(work_pool_name, late),
+            running=await self._count(work_pool_name, running),
+            latency_seconds=max(0.0, latency),
+        )
+
+    async def read_backlog(self, registration: PoolRegistration) -> PoolBacklog:
+        from prefect.context import use_profile
+
+        if registration.profile is None:
+            return await self._read_backlog(registration.work_pool_name)
+        with use_profile(registration.profile, override_environment_variables=True):
+            return await self._read_backlog(registration.work_pool_name)
+
+    async def read_memory(self) -> HostMemory:
+        import psutil
+
+        memory = psutil.virtual_memory()
+        return HostMemory(available=memory.available, total=memory.total)
@@ -0,0 +1,408 @@
+"""Adaptive concurrency limits for work queues.
+
+A static queue concurrency limit is too low when the host is idle and too high
+when it is busy. The autotuner periodically reads the backlog of each queue (its
+due and late scheduled runs), its running runs, the duration of its recent runs
+and the CPU and memory pressure of the host, and adjusts the queue's limit with
+additive increase, multiplicative decrease (AIMD) control:
+
+* under host pressure, or when runs slow down compared to their baseline, the
+  limit is cut by a factor, at most once per cooldown;
+* when runs are waiting while every slot is busy, the limit grows by a step;
+* otherwise the limit is kept.
+
+Limits are kept within configured bounds and every decision is logged. Queues
+unique to a deployment are never tuned: their name states the limit the
+deployment relies on, e.g. to not overlap its runs, and deploys reset it. Other
+queues, including the tier and shared queues meta-prefect creates, are tuned.
+"""
+import asyncio
+import datetime
+import math
+import statistics
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from prefect.client.schemas.filters import (
+    FlowRunFilter,
+    FlowRunFilterExpectedStartTime,
+    FlowRunFilterState,
+    FlowRunFilterStateType,
+    WorkPoolFilter,
+    WorkPoolFilterName,
+    WorkQueueFilter,
+    WorkQueueFilterName,
+)
+from prefect.client.schemas.objects import StateType
+from prefect.client.schemas.sorting import FlowRunSort
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.client import get_client, read_pages
+from meta_prefect.implementations.components.work_queue import WorkQueue
+from meta_prefect.implementations.queues import is_owned
+
+logger = getLogger(__name__)
+
+DURATION_HISTORY = 20
+
+
+class QueueSignals(NamedTuple):
+    """What the autotuner observes of a work queue."""
+
+    backlog: int
+    running: int
+    duration_seconds: Optional[float] = None
+
+
+class HostPressure(NamedTuple):
+    """The CPU and memory use of the host, in percent."""
+
+    cpu_percent: float
+    memory_percent: float
+
+
+class AutotuneDecision(NamedTuple):
+    """A limit the autotuner picked for a work queue, and why."""
+
+    work_queue_name: str
+    previous_limit: int
+    limit: int
+    reason: str
+    signals: QueueSignals
+    host: HostPressure
+
+    @property
+    def changed(self) -> bool:
+        return self.limit != self.previous_limit
+
+
+class AutotuneConfig(BaseModel):
+    """The bounds and gains of the AIMD controller."""
+
+    min_limit: int = Field(1, ge=1, description="The lowest limit set.")
+    max_limit: int = Field(16, ge=1, description="The highest limit set.")
+    increase_step: int = Field(
+        1, ge=1, description="The slots added when runs wait for a slot."
+    )
+    decrease_factor: float = Field(
+        0.5, gt=0, lt=1, description="The factor the limit is cut by under pressure."
+    )
+    cpu_high_percent: float = Field(
+        85.0, description="The host CPU use above which limits are cut."
+    )
+    memory_high_percent: float = Field(
+        85.0, description="The host memory use above which limits are cut."
+    )
+    slowdown_ratio: float = Field(
+        1.5,
+        gt=1,
+        description="How much slower than their baseline runs get before a cut.",
+    )
+    baseline_weight: float = Field(
+        0.2,
+        gt=0,
+        le=1,
+        description="The weight of the latest duration in the baseline average.",
+    )
+    cooldown_seconds: float = Field(
+        120.0, ge=0, description="The time between two cuts of a queue's limit."
+    )
+    interval_seconds: float = Field(
+        30.0, gt=0, description="The time between two control steps."
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_bounds(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["min_limit"] > values["max_limit"]:
+            raise ValueError("min_limit must not be greater than max_limit.")
+        return values
+
+
+def pressure_reasons(
+    signals: QueueSignals,
+    host: HostPressure,
+    baseline_seconds: Optional[float],
+    config: AutotuneConfig,
+) -> List[str]:
+    """Say what, if anything, calls for a lower limit."""
+    reasons = []
+    if host.cpu_percent >= config.cpu_high_percent:
+        reasons.append(f"cpu at {host.cpu_percent:.0f}%")
+    if host.memory_percent >= config.memory_high_percent:
+        reasons.append(f"memory at {host.memory_percent:.0f}%")
+    if (
+        baseline_seconds
+        and signals.duration_seconds
+        and signals.running
+        and signals.duration_seconds > baseline_seconds * config.slowdown_ratio
+    ):
+        reasons.append(
+            f"runs {signals.duration_seconds / baseline_seconds:.1f}x slower "
+            "than baseline"
+        )
+    return reasons
+
+
+def aimd_limit(
+    limit: int,
+    signals: QueueSignals,
+    host: HostPressure,
+    baseline_seconds: Optional[float],
+    config: AutotuneConfig,
+    may_decrease: bool = True,
+) -> Tuple[int, str]:
+    """Pick the next limit of a queue, and say why."""
+    pressure = pressure_reasons(signals, host, baseline_seconds, config)
+    if pressure:
+        decreased = max(config.min_limit, math.floor(limit * config.decrease_factor))
+        if not may_decrease:
+            return limit, f"cooling down despite {', '.join(pressure)}"
+        return decreased, f"decrease, {', '.join(pressure)}"
+    if signals.backlog and signals.running >= limit:
+        increased = min(config.max_limit, limit + config.increase_step)
+        return increased, f"increase, {signals.backlog} runs waiting for a slot"
+    return limit, "hold"
+
+
+class AutotuneApi(ABC):
+    """Where the autotuner reads its signals from and writes limits to."""
+
+    @abstractmethod
+    async def read_work_queues(self) -> List[WorkQueue]:
+        """Read the work queues to tune."""
+
+    @abstractmethod
+    async def read_signals(self, work_queue: WorkQueue) -> QueueSignals:
+        """Read the backlog, running runs and run durations of a queue."""
+
+    @abstractmethod
+    async def read_host(self) -> HostPressure:
+        """Read the pressure on the host running the flows."""
+
+    @abstractmethod
+    async def set_concurrency_limit(self, work_queue: WorkQueue, limit: int) -> None:
+        """Set the concurrency limit of a queue."""
+
+
+@dataclass
+class _QueueState:
+    baseline_seconds: Optional[float] = None
+    last_decrease: Optional[float] = None
+
+
+class QueueAutotuner:
+    """Adjusts the concurrency limits of work queues, a step at a time."""
+
+    def __init__(
+        self,
+        api: AutotuneApi,
+        config: AutotuneConfig,
+        dry_run: bool = False,
+        on_decision: Optional[Callable[[AutotuneDecision], Any]] = None,
+    ) -> None:
+        self.api = api
+        self.config = config
+        self.dry_run = dry_run
+        self.on_decision = on_decision
+        self._states: Dict[str, _QueueState] = {}
+
+    async def _decide(
+        self, work_queue: WorkQueue, host: HostPressure, now: float
+    ) -> AutotuneDecision:
+        state = self._states.setdefault(work_queue.name, _QueueState())
+        signals = await self.api.read_signals(work_queue)
+        previous = min(
+            max(work_queue.concurrency_limit or 0, self.config.min_limit),
+            self.config.max_limit,
+        )
+        may_decrease = (
+            state.last_decrease is None
+            or now - state.last_decrease >= self.config.cooldown_seconds
+        )
+        limit, reason = aimd_limit(
+            previous,
+            signals,
+            host,
+            state.baseline_seconds,
+            self.config,
+            may_decrease=may_decrease,
+        )
+        if limit < previous:
+            state.last_decrease = now
+        if signals.duration_seconds and not pressure_reasons(
+            signals, host, state.baseline_seconds, self.config
+        ):
+            # the baseline only learns from durations seen without pressure
+            weight = self.config.baseline_weight
+            state.baseline_seconds = (
+                signals.duration_seconds
+                if state.baseline_seconds is None
+                else (1 - weight) * state.baseline_seconds
+                + weight * signals.duration_seconds
+            )
+        if limit != work_queue.concurrency_limit and not self.dry_run:
+            await self.api.set_concurrency_limit(work_queue, limit)
+        return AutotuneDecision(
+            work_queue.name,
+            work_queue.concurrency_limit or 0,
+            limit,
+            reason,
+            signals,
+            host,
+        )
+
+    async def step(self, now: float) -> List[AutotuneDecision]:
+        """Read the signals of every queue once and adjust their limits."""
+        host = await self.api.read_host()
+        decisions = []
+        for work_queue in await self.api.read_work_queues():
+            decision = await self._decide(work_queue, host, now)
+            logger.info(
+                f"{decision.work_queue_name}: {decision.previous_limit} -> "
+                f"{decision.limit}, {decision.reason} "
+                f"(backlog={decision.signals.backlog}, "
+                f"running={decision.signals.running})"
+            )
+            if self.on_decision is not None:
+                self.on_decision(decision)
+            decisions.append(decision)
+        return decisions
+
+    async def run(
+        self,
+        iterations: Optional[int] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        """Step every interval, forever unless a number of iterations is given."""
+        clock = clock or asyncio.get_running_loop().time
+        iteration = 0
+        while iterations is None or iteration < iterations:
+            await self.step(clock())
+            iteration += 1
+            if iterations is None or iteration < iterations:
+                await asyncio.sleep(self.config.interval_seconds)
+
+
+class PrefectAutotuneApi(AutotuneApi):
+    """Reads signals from the Prefect API and the host running the workers."""
+
+    def __init__(
+        self, work_pool_name: str, work_queue_names: Optional[List[str]] = None
+    ) -> None:
+        self.work_pool_name = work_pool_name
+        self.work_queue_names = work_queue_names
+
+    def _filters(self, work_queue: WorkQueue) -> Dict[str, Any]:
+        return {
+            "work_pools": WorkPoolFilter(
+                name=WorkPoolFilterName(any_=[self.work_pool_name])
+            ).dict(json_compatible=True),
+            "work_pool_queues": WorkQueueFilter(
+                name=WorkQueueFilterName(any_=[work_queue.name])
+            ).dict(json_compatible=True),
+        }
+
+    async def _count(
+        self, work_queue: WorkQueue, flow_run_filter: FlowRunFilter
+    ) -> int:
+        async with get_client() as client:
+            response = await client._client.post(
+                "/flow_runs/count",
+                json={
+                    "flow_runs": flow_run_filter.dict(json_compatible=True),
+                    **self._filters(work_queue),
+                },
+            )
+        return int(response.json())
+
+    async def read_work_queues(self) -> List[WorkQueue]:
+        async with get_client() as client:
+            work_queues = await read_pages(
+                lambda offset, limit: client.read_work_queues(
+                    work_pool_name=self.work_pool_name, offset=offset, limit=limit
+                )
+            )
+        names = self.work_queue_names or []
+        tuned = []
+        for work_queue in work_queues:
+            named = work_queue.name in names
+            if is_owned(work_queue.name):
+                # deploys hold the queues unique to a deployment to their limit
+                if named:
+                    logger.warning(
+                        f"Not tuning {work_queue.name}, its limit is set on deploy."
+                    )
+                continue
+            # queues without a limit are left unlimited
+            if named or (not names and work_queue.concurrency_limit is not None):
+                tuned.append(WorkQueue.from_client_workqueue(work_queue))
+        return tuned
+
+    async def read_signals(self, work_queue: WorkQueue) -> QueueSignals:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        backlog = await self._count(
+            work_queue,
+            FlowRunFilter(
+                state=FlowRunFilterState(
+                    type=FlowRunFilterStateType(any_=[StateType.SCHEDULED])
+                ),
+                expected_start_time=FlowRunFilterExpectedStartTime(before_=now),
+            ),
+        )
+        running = await self._count(
+            work_queue,
+            FlowRunFilter(
+                state=FlowRunFilterState(
+                    type=FlowRunFilterStateType(
+                        any_=[StateType.PENDING, StateType.RUNNING]
+                    )
+                )
+            ),
+        )
+        async with get_client() as client:
+            completed = await client.read_flow_runs(
+                work_pool_filter=WorkPoolFilter(
+                    name=WorkPoolFilterName(any_=[self.work_pool_name])
+                ),
+                work_queue_filter=WorkQueueFilter(
+                    name=WorkQueueFilterName(any_=[work_queue.name])
+                ),
+                flow_run_filter=FlowRunFilter(
+                    state=FlowRunFilterState(
+                        type=FlowRunFilterStateType(any_=[StateType.COMPLETED])
+                    )
+                ),
+                sort=FlowRunSort.END_TIME_DESC,
+                limit=DURATION_HISTORY,
+            )
+        durations = [
+            flow_run.total_run_time.total_seconds()
+            for flow_run in completed
+            if flow_run.total_run_time
+        ]
+        return QueueSignals(
+            backlog=backlog,
+            running=running,
+            duration_seconds=statistics.median(durations) if durations else None,
+        )
+
+    async def read_host(self) -> HostPressure:
+        import psutil
+
+        return HostPressure(
+            # the CPU use since the previous step, 0 on the first one
+            cpu_percent=psutil.cpu_percent(interval=None),
+            memory_percent=psutil.virtual_memory().percent,
+        )
+
+    async def set_concurrency_limit(self, work_queue: WorkQueue, limit: int) -> None:
+        async with get_client() as client:
+            if work_queue.id is None:
+                work_queue.id = (
+                    await client.read_work_queue_by_name(
+                        work_queue.name, work_pool_name=self.work_pool_name
+                    )
+                ).id
+            await client.update_work_queue(work_queue.id, concurrency_limit=limit)
@@ -0,0 +1,83 @@
+"""A deployment builder limiting concurrency with global concurrency limits."""
+from typing import Any, Dict, Optional, Set
+
+from prefect.flows import P, R
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.actions.base import Action
+from meta_prefect.implementations.actions.concurrency_limit import (
+    EnsureConcurrencyLimitsCreatedAction,
+)
+from meta_prefect.implementations.concurrency_limits import (
+    deployment_limit_name,
+    limit_tag,
+    limited_entrypoint,
+)
+from meta_prefect.interface import (
+    DeployableFlow,
+    DeployableFlowBuilderInterface,
+    Deployment,
+)
+
+
+class global_concurrency_limiter(BaseModel, DeployableFlowBuilderInterface):
+    """Global concurrency limiter.
+
+    Limits the concurrent runs of a deployment, and of every deployment sharing
+    a tag, without dedicated work queues. Must be piped after the entrypoint
+    resolver.
+    """
+
+    concurrency_limit: Optional[int] = Field(
+        None,
+        ge=1,
+        description="The number of concurrent runs of the deployment, if limited.",
+    )
+    owner: Optional[str] = Field(
+        None,
+        description="The deployment the limit applies to, e.g. `flow/name`.",
+    )
+    tag_limits: Dict[str, int] = Field(
+        default_factory=dict,
+        description="The number of concurrent runs of all deployments with a tag.",
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_owner(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["concurrency_limit"] is not None and not values["owner"]:
+            raise ValueError("A deployment concurrency limit requires an owner.")
+        return values
+
+    def _limits(self) -> Dict[str, int]:
+        limits = dict(self.tag_limits)
+        if self.concurrency_limit is not None and self.owner:
+            limits[deployment_limit_name(self.owner)] = self.concurrency_limit
+        return limits
+
+    @property
+    def pre_deployment_actions(self) -> Set[Action]:
+        limits = self._limits()
+        if not limits:
+            return set()
+        return {EnsureConcurrencyLimitsCreatedAction(limits=frozenset(limits.items()))}
+
+    @sync_compatible
+    async def update_deployment(
+        self, flow: DeployableFlow[P, R], deployment: Deployment
+    ) -> Deployment:
+        """Update the deployment."""
+        limits = self._limits()
+        if not limits:
+            return deployment
+        if deployment.entrypoint is None:
+            raise ValueError(
+                "Cannot limit the concurrency of a deployment without an "
+                "entrypoint, pipe the limiter after the entrypoint resolver."
+            )
+        tags = set(deployment.tags or [])
+        tags.update(self.tag_limits)
+        tags.update(limit_tag(name) for name in limits)
+        deployment.tags = sorted(tags)
+        deployment.entrypoint = limited_entrypoint(deployment.entrypoint)
+        return deployment
@@ -0,0 +1,101 @@
+"""A deployment builder routing deployments to work queues by priority tier."""
+from typing import Any, Dict, Optional, Set
+
+from prefect.flows import P, R
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.actions.base import Action
+from meta_prefect.implementations.actions.work_pool import (
+    EnsureLocalProcessWorkPoolCreatedAction,
+)
+from meta_prefect.implementations.actions.work_queue import EnsureWorkQueueCreatedAction
+from meta_prefect.implementations.run_resources import RunResources
+from meta_prefect.interface import (
+    DeployableFlow,
+    DeployableFlowBuilderInterface,
+    Deployment,
+)
+
+
+class PriorityTier(BaseModel):
+    """The work queue of the deployments of a priority tier."""
+
+    priority: int = Field(
+        ge=1, description="The priority of the tier's queue, 1 is the highest."
+    )
+    concurrency_limit: Optional[int] = Field(
+        None,
+        ge=0,
+        description=(
+            "The concurrent runs of the tier, capping it reserves the rest of "
+            "the work pool for the other tiers."
+        ),
+    )
+    nice: Optional[int] = Field(
+        None,
+        ge=-20,
+        le=19,
+        description=(
+            "The nice level of the tier's runs, unless their deployment sets one."
+        ),
+    )
+
+    class Config:
+        frozen = True
+
+
+DEFAULT_TIERS: Dict[str, PriorityTier] = {
+    "critical": PriorityTier(priority=1),
+    "standard": PriorityTier(priority=2),
+    "batch": PriorityTier(priority=3),
+}
+
+
+class priority_tier_router(BaseModel, DeployableFlowBuilderInterface):
+    """Priority tier router.
+
+    Sends a deployment to the work queue of its tier. The registry ranks the
+    queues of a pool by the priority in their name, ahead of other queues such
+    as `default`, and workers pick up the scheduled runs of higher priority
+    queues first, so critical runs do not wait behind batch runs when the work
+    pool is saturated. Tiers with a nice
+    level also have their runs deprioritized on the worker's host.
+    """
+
+    tier: str = Field("standard", description="The priority tier of the deployment.")
+    tiers: Dict[str, PriorityTier] = Field(
+        default_factory=lambda: dict(DEFAULT_TIERS),
+        description="The priority tiers by name.",
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_tier(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["tier"] not in values["tiers"]:
+            raise ValueError(
+                f"Unknown priority tier {values['tier']!r}, expected one of "
+                f"{sorted(values['tiers'])}."
+            )
+        return values
+
+    def _work_queue_action(self) -> EnsureWorkQueueCreatedAction:
+        tier = self.tiers[self.tier]
+        return EnsureWorkQueueCreatedAction(
+            concurrency_limit=tier.concurrency_limit, priority=tier.priority
+        )
+
+    @property
+    def pre_deployment_actions(self) -> Set[Action]:
+        return {EnsureLocalProcessWorkPoolCreatedAction(), self._work_queue_action()}
+
+    @sync_compatible
+    async def update_deployment(
+        self, flow: DeployableFlow[P, R], deployment: Deployment
+    ) -> Deployment:
+        """Update the deployment."""
+        work_queue = self._work_queue_action().result
+        deployment.work_queue_name = work_queue.name
+        nice = self.tiers[self.tier].nice
+        if nice is not None and deployment.infra_overrides.get("run_nice") is None:
+            deployment.infra_overrides.update(RunResources(nice=nice).infra_overrides())
+        return deployment
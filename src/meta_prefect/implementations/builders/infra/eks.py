@@ -1,14 +1,61 @@
 """EKS infrastructure builder."""
-from typing import Optional
+import json
+import os
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Set
 
-from meta_prefect.interface import DeployableFlowBuilderInterface, Deployment
 from prefect.infrastructure import KubernetesJob
 from prefect.utilities.asyncutils import sync_compatible
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.actions.base import Action
+from meta_prefect.implementations.actions.bundle import (
+    EnsureDependencyBundleBuiltAction,
+)
+from meta_prefect.implementations.builders.scheduling.plan import deployment_key
+from meta_prefect.implementations.bundle import (
+    BUNDLE_MOUNT_PATH,
+    BUNDLE_SITE_PACKAGES,
+    DependencyBundle,
+    fetch_steps,
+)
+from meta_prefect.implementations.colocation import (
+    ColocationGroup,
+    EnsureColocationRunnerAction,
+    EnsureColocationWorkPoolCreatedAction,
+)
+from meta_prefect.implementations.rightsizing import (
+    DEFAULT_PROFILES,
+    PodResources,
+    recommend,
+    Recommendation,
+    RightsizingProfile,
+)
+from meta_prefect.implementations.sharding import COMPLETIONS_ENV, SHARDING_MODULE
+from meta_prefect.interface import (
+    DeployableFlow,
+    DeployableFlowBuilderInterface,
+    Deployment,
+)
+
+logger = getLogger(__name__)
 
 
 class eks(BaseModel, DeployableFlowBuilderInterface):
-    """EKS infrastructure builder."""
+    """EKS infrastructure builder.
+
+    With `parallelism` or `completions` above 1, flow runs fan out as an
+    Indexed Job, see `meta_prefect.implementations.sharding`, and fail if any
+    of their shards does. With `rightsizing="apply"`, pods get the requests and
+    limits recommended from the usage of past runs, see
+    `meta_prefect.implementations.rightsizing`, and `cpu` and `memory_gb` are
+    only used for deployments without history.
+    With a `bundle`, pods start with dependencies prebuilt on deploy, see
+    `meta_prefect.implementations.bundle`, rather than pip installing them.
+    With `colocate`, flow runs are not Jobs but forks in the long-lived runner
+    pod of their group, see `meta_prefect.implementations.colocation`, which
+    takes the image, namespace and bundle of the group's deployments.
+    """
 
     image: str = Field(
         description="Docker image used to run flow.",
@@ -25,6 +72,12 @@ class eks(BaseModel, DeployableFlowBuilderInterface):
         default=None,
     )
 
+    env: str = Field(
+        env="META_PREFECT__ENV",
+        default=os.environ.get("META_PREFECT__ENV", "prod"),
+        description="The environment to deploy to, which picks the sizing profile.",
+    )
+
     cpu: float = Field(
         description="Number of virtual CPU cores to allocate to flow.",
         gt=0,
@@ -37,7 +90,59 @@ class eks(BaseModel, DeployableFlowBuilderInterface):
         le=256,
     )
 
-    @validator("namespace")
+    parallelism: int = Field(
+        default=1,
+        ge=1,
+        description="Number of pods of a flow run running at once.",
+    )
+
+    completions: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description=(
+            "Number of shards of a flow run, each run by a pod of an Indexed "
+            "Job. If not specified, one per pod running at once."
+        ),
+    )
+
+    rightsizing: str = Field(
+        default="off",
+        regex="^(off|recommend|apply)$",
+        description=(
+            "Whether pods are sized from the usage of past runs, or only the "
+            "recommended size is logged."
+        ),
+    )
+
+    rightsizing_profiles: Dict[str, RightsizingProfile] = Field(
+        default_factory=lambda: dict(DEFAULT_PROFILES),
+        description="How pods are right-sized, by environment.",
+    )
+
+    bundle: Optional[DependencyBundle] = Field(
+        default=None,
+        description=(
+            "The prebuilt dependencies of the pods. If not specified, pods pip "
+            "install s3fs when they start."
+        ),
+    )
+
+    colocate: Optional[ColocationGroup] = Field(
+        default=None,
+        description="The group sharing a runner pod the flow runs are run in.",
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_colocation(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        shards = values["completions"] or values["parallelism"]
+        if values["colocate"] is not None and shards > 1:
+            raise ValueError("Co-located flow runs cannot fan out over pods.")
+        return values
+
+    @property
+    def shards(self) -> int:
+        return self.completions or self.parallelism
+
     def _resolve_namespace(self, deployment: Deployment) -> str:
         """Resolve namespace from deployment project name and environment."""
         if self.namespace is None:
@@ -47,66 +152,245 @@ class eks(BaseModel, DeployableFlowBuilderInterface):
                 raise ValueError("namespace must be specified in deployment or builder")
         return self.namespace
 
+    def _env(self) -> List[Dict[str, str]]:
+        env = {
+            "PREFECT_LOGGING_LEVEL": "DEBUG",
+            "PREFECT_KUBERNETES_CLUSTER_UID": "1",
+        }
+        if self.bundle is None:
+            env["EXTRA_PIP_PACKAGES"] = "s3fs"
+        else:
+            env["PYTHONPATH"] = BUNDLE_SITE_PACKAGES
+        if self.shards > 1:
+            env[COMPLETIONS_ENV] = str(self.shards)
+        return [{"name": name, "value": value} for name, value in env.items()]
+
+    @property
+    def pre_deployment_actions(self) -> Set[Action]:
+        actions: Set[Action] = set()
+        if self.bundle is not None:
+            actions.add(EnsureDependencyBundleBuiltAction(bundle=self.bundle))
+        if self.colocate is not None:
+            actions.add(
+                EnsureColocationWorkPoolCreatedAction(group=self.colocate, env=self.env)
+            )
+        return actions
+
+    async def recommend(self, flow_name: str, deployment_name: str) -> Recommendation:
+        """Recommend the resources of a deployment's pods from its past runs."""
+        return await recommend(
+            deployment_key(flow_name, deployment_name),
+            self.env,
+            PodResources.fixed(self.cpu, self.memory_gb),
+            self.rightsizing_profiles,
+        )
+
+    def build_pod_spec(
+        self,
+        resources: PodResources,
+        restart_policy: str = "Never",
+        args: Optional[List[str]] = None,
+        env: Optional[List[Any]] = None,
+    ) -> Any:
+        """Build the spec of the pods of a flow run, or of a runner."""
+        from kubernetes.client import (
+            V1Container,
+            V1EmptyDirVolumeSource,
+            V1EnvVar,
+            V1PersistentVolumeClaimVolumeSource,
+            V1PodSpec,
+            V1ResourceRequirements,
+            V1Volume,
+            V1VolumeMount,
+        )
+
+        volumes: List[V1Volume] = []
+        volume_mounts: List[V1VolumeMount] = []
+        init_containers: List[V1Container] = []
+        if self.bundle is not None:
+            if self.bundle.unpacked:
+                # the store's volume, of which pods only see this bundle
+                volume = V1Volume(
+                    name="dependency-bundle",
+                    persistent_volume_claim=V1PersistentVolumeClaimVolumeSource(
+                        claim_name=self.bundle.claim_name, read_only=True
+                    ),
+                )
+                mount = V1VolumeMount(
+                    name=volume.name,
+                    mount_path=BUNDLE_MOUNT_PATH,
+                    sub_path=self.bundle.key,
+                    read_only=True,
+                )
+            else:
+                volume = V1Volume(
+                    name="dependency-bundle", empty_dir=V1EmptyDirVolumeSource()
+                )
+                mount = V1VolumeMount(name=volume.name, mount_path=BUNDLE_MOUNT_PATH)
+                init_containers.extend(
+                    V1Container(
+                        name=step.name,
+                        image=step.image or self.image,
+                        command=step.command,
+                        volume_mounts=[mount],
+                    )
+                    for step in fetch_steps(self.bundle)
+                )
+            volumes.append(volume)
+            volume_mounts.append(mount)
+        return V1PodSpec(
+            restart_policy=restart_policy,
+            volumes=volumes or None,
+            init_containers=init_containers or None,
+            containers=[
+                V1Container(
+                    name="prefect-job",
+                    image=self.image if args else None,
+                    args=args,
+                    env=[V1EnvVar(**env) for env in self._env()] + (env or []),
+                    resources=V1ResourceRequirements(**resources.manifest()),
+                    volume_mounts=volume_mounts or None,
+                )
+            ],
+        )
+
+    def build_job_manifest(
+        self, namespace: str, resources: Optional[PodResources] = None
+    ) -> Dict[str, Any]:
+        """Build the manifest of the Job of a flow run, with Kubernetes models."""
+        from kubernetes.client import (
+            ApiClient,
+            V1Job,
+            V1JobSpec,
+            V1ObjectMeta,
+            V1PodTemplateSpec,
+        )
+
+        resources = resources or PodResources.fixed(self.cpu, self.memory_gb)
+        job = V1Job(
+            api_version="batch/v1",
+            kind="Job",
+            metadata=V1ObjectMeta(
+                namespace=namespace,
+                labels={"prefect.io/flow-run-id": "${{flow_run_id}}"},
+            ),
+            spec=V1JobSpec(
+                completions=self.shards,
+                parallelism=min(self.parallelism, self.shards),
+                completion_mode="Indexed" if self.shards > 1 else None,
+                template=V1PodTemplateSpec(spec=self.build_pod_spec(resources)),
+            ),
+        )
+        manifest: Dict[str, Any] = ApiClient().sanitize_for_serialization(job)
+        # prefect requires these of the pod spec, where kubernetes drops them
+        manifest["spec"]["template"]["spec"].update(completions=1, parallelism=1)
+        return manifest
+
+    def build_runner_manifest(
+        self, namespace: str, group: ColocationGroup
+    ) -> Dict[str, Any]:
+        """Build the manifest of the Deployment of a co-location group's runner."""
+        from kubernetes.client import (
+            ApiClient,
+            V1Deployment,
+            V1DeploymentSpec,
+            V1EnvVar,
+            V1EnvVarSource,
+            V1LabelSelector,
+            V1ObjectMeta,
+            V1PodTemplateSpec,
+            V1SecretKeySelector,
+        )
+        from prefect.settings import PREFECT_API_URL
+
+        env = [
+            V1EnvVar(name="PREFECT_API_URL", value=PREFECT_API_URL.value()),
+            # the secret of the prefect worker helm chart, if any
+            V1EnvVar(
+                name="PREFECT_API_KEY",
+                value_from=V1EnvVarSource(
+                    secret_key_ref=V1SecretKeySelector(
+                        name="prefect-api-key", key="key", optional=True
+                    )
+                ),
+            ),
+        ]
+        deployment = V1Deployment(
+            api_version="apps/v1",
+            kind="Deployment",
+            metadata=V1ObjectMeta(
+                name=group.runner_name, namespace=namespace, labels=group.labels
+            ),
+            spec=V1DeploymentSpec(
+                replicas=1,
+                selector=V1LabelSelector(match_labels=group.labels),
+                template=V1PodTemplateSpec(
+                    metadata=V1ObjectMeta(labels=group.labels),
+                    spec=self.build_pod_spec(
+                        PodResources.fixed(group.cpu, group.memory_gb),
+                        restart_policy="Always",
+                        args=group.runner_args(),
+                        env=env,
+                    ),
+                ),
+            ),
+        )
+        return ApiClient().sanitize_for_serialization(deployment)
+
     @sync_compatible
     async def update_deployment(
         self, flow: DeployableFlow, deployment: Deployment
     ) -> Deployment:
         """Update a deployment by building kubernetes Job and setting infra block."""
         namespace = self._resolve_namespace(deployment)
+        if self.colocate is not None:
+            deployment.work_pool_name = self.colocate.work_pool_name
+            deployment.tags = sorted(
+                set(deployment.tags or []) | {f"colocation={self.colocate.name}"}
+            )
+            deployment.infra_overrides.update(
+                {"env": self.env, **self.colocate.run_resources().infra_overrides()}
+            )
+            return deployment
+        resources = None
+        if self.rightsizing != "off":
+            recommendation = await self.recommend(deployment.flow_name, deployment.name)
+            if recommendation.recommended is None:
+                logger.info(
+                    f"Not right-sizing {recommendation.key}, only "
+                    f"{recommendation.samples} past runs."
+                )
+            else:
+                logger.info(
+                    f"Right-sized {recommendation.key}: {recommendation.recommended}"
+                )
+                if self.rightsizing == "apply":
+                    resources = recommendation.recommended
         infra_block = KubernetesJob(
             image=self.image,
             namespace=namespace,
             job_watch_timeout_seconds=10 * 60,  # 10 minutes
             finished_job_ttl=10 * 60,  # 10 minutes
-            job={
-                "apiVersion": "batch/v1",
-                "kind": "Job",
-                "metadata": {
-                    "namespace": namespace,
-                    "labels": {
-                        "prefect.io/flow-run-id": "${{flow_run_id}}",
-                    },
-                },
-                "spec": {
-                    "template": {
-                        "spec": {
-                            "completions": 1,
-                            "parallelism": 1,
-                            "restartPolicy": "Never",
-                            "containers": [
-                                {
-                                    "name": "prefect-job",
-                                    "env": [
-                                        {
-                                            "name": "PREFECT_LOGGING_LEVEL",
-                                            "value": "DEBUG",
-                                        },
-                                        {
-                                            "name": "PREFECT_KUBERNETES_CLUSTER_UID",
-                                            "value": "1",
-                                        },
-                                        {
-                                            "name": "EXTRA_PIP_PACKAGES",
-                                            "value": "s3fs",
-                                        },
-                                    ],
-                                    "resources": {
-                                        "requests": {
-                                            "cpu": self.cpu,
-                                            "memory": f"{self.memory_gb}Gi",
-                                        },
-                                        "limits": {
-                                            "cpu": self.cpu,
-                                            "memory": f"{self.memory_gb}Gi",
-                                        },
-                                    },
-                                }
-                            ],
-                        }
-                    },
-                },
-            },
+            job=self.build_job_manifest(namespace, resources),
+            **(
+                {"command": ["python", "-m", SHARDING_MODULE]}
+                if self.shards > 1
+                else {}
+            ),
         )
 
         deployment.infrastructure = infra_block
         return deployment
+
+    @sync_compatible
+    async def update_post_deployment(
+        self, flow: DeployableFlow, deployment: Deployment
+    ) -> None:
+        """Apply the runner of the deployment's co-location group, if any."""
+        if self.colocate is not None:
+            runner_manifest = self.build_runner_manifest(
+                self._resolve_namespace(deployment), self.colocate
+            )
+            await EnsureColocationRunnerAction(
+                runner_manifest=json.dumps(runner_manifest, sort_keys=True)
+            ).run()
@@ -0,0 +1,104 @@
+"""Business calendar schedule updater."""
+import datetime
+from abc import abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+from prefect.client.schemas.schedules import SCHEDULE_TYPES
+from prefect.flows import P, R
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.builders.scheduling.engine import (
+    exclude_occurrences,
+    get_occurrence_grid,
+    Schedule,
+    to_client_schedule,
+)
+from meta_prefect.implementations.calendars import (
+    CalendarCache,
+    CalendarProvider,
+    CompiledCalendar,
+    custom_calendar,
+    get_calendar,
+)
+from meta_prefect.interface.builder import DeployableFlowBuilderInterface
+from meta_prefect.interface.deployment import Deployment
+from meta_prefect.interface.flow import DeployableFlow
+
+
+class _calendar_schedule_updater(BaseModel, DeployableFlowBuilderInterface):
+    """Excludes the occurrences of a schedule falling on calendar holidays."""
+
+    schedule: Optional[SCHEDULE_TYPES] = None
+    horizon_years: int = 1
+
+    @abstractmethod
+    def _get_providers(self) -> List[CalendarProvider]:
+        """Get the providers of the calendars whose holidays are excluded."""
+
+    def _get_horizon(
+        self, timezone: Optional[datetime.tzinfo], start: Optional[datetime.datetime]
+    ) -> Tuple[datetime.datetime, datetime.datetime]:
+        """Get the window over which occurrences are excluded."""
+        start = start or datetime.datetime.now(timezone)
+        end = datetime.datetime(
+            start.year + self.horizon_years + 1, 1, 1, tzinfo=start.tzinfo
+        )
+        return start, end
+
+    def _get_calendar(self, years: Sequence[int]) -> CompiledCalendar:
+        cache = CalendarCache.default()
+        return CompiledCalendar.union(
+            [cache.load(provider, years) for provider in self._get_providers()]
+        )
+
+    def _update_schedule(
+        self, schedule: Schedule, start: Optional[datetime.datetime] = None
+    ) -> Schedule:
+        """Exclude the occurrences of a schedule falling on a holiday."""
+        grid = get_occurrence_grid(schedule)
+        start, end = self._get_horizon(grid.tzinfo, start)
+        occurrences = grid.occurrences(start, end)
+        # the holidays of the current year up to the end of the horizon
+        calendar = self._get_calendar(range(start.year, end.year))
+        on_holidays = occurrences[calendar.contains(grid.local_dates(occurrences))]
+        if len(on_holidays) == 0:
+            return schedule
+        return exclude_occurrences(grid.to_rrule_schedule(start), on_holidays, start)
+
+    @sync_compatible
+    async def update_deployment(
+        self, flow: DeployableFlow[P, R], deployment: Deployment
+    ) -> Deployment:
+        """Update the deployment."""
+        if self.schedule:
+            deployment.schedule = self.schedule
+
+        if deployment.schedule:
+            deployment.schedule = to_client_schedule(
+                self._update_schedule(deployment.schedule)
+            )
+        return deployment
+
+
+class business_calendar_schedule_updater(_calendar_schedule_updater):
+    """Business calendar schedule updater.
+
+    Excludes the holidays of any of the named calendars, e.g. NYSE, UK,
+    TARGET2 or a country code, and of a custom list of dates.
+    """
+
+    calendars: List[str] = Field(
+        default_factory=list,
+        description="The names of the calendars whose holidays are excluded.",
+    )
+    dates: List[datetime.date] = Field(
+        default_factory=list,
+        description="Additional dates excluded from the schedule.",
+    )
+
+    def _get_providers(self) -> List[CalendarProvider]:
+        providers = [get_calendar(name) for name in self.calendars]
+        if self.dates:
+            providers.append(custom_calendar(dates=tuple(self.dates)))
+        return providers
@@ -0,0 +1,803 @@
+"""A vectorized engine expanding schedules over a horizon.
+
+Occurrences of cron and interval schedules are computed on a NumPy datetime64
+grid instead of being iterated in Python, so minute-level schedules over a year
+are expanded in milliseconds. Cron and interval schedules can also be converted
+to equivalent rrule schedules, to which exclusions are added as EXDATE or
+EXRULE lines, whichever is shorter.
+"""
+import calendar
+import datetime
+import math
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import dateutil.rrule
+import dateutil.tz
+import numpy as np
+from prefect.client.schemas.schedules import (
+    CronSchedule as ClientCronSchedule,
+    IntervalSchedule as ClientIntervalSchedule,
+    MAX_RRULE_LENGTH,
+    RRuleSchedule as ClientRRuleSchedule,
+)
+from prefect.server.schemas.schedules import (
+    CronSchedule as ServerCronSchedule,
+    IntervalSchedule as ServerIntervalSchedule,
+    RRuleSchedule as ServerRRuleSchedule,
+)
+
+CronSchedule = Union[ClientCronSchedule, ServerCronSchedule]
+IntervalSchedule = Union[ClientIntervalSchedule, ServerIntervalSchedule]
+RRuleSchedule = Union[ClientRRuleSchedule, ServerRRuleSchedule]
+Schedule = Union[CronSchedule, IntervalSchedule, RRuleSchedule]
+ClientSchedule = Union[ClientCronSchedule, ClientIntervalSchedule, ClientRRuleSchedule]
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# prefect anchors rrules without DTSTART to this date
+RRULE_ANCHOR_DATE = datetime.datetime(2020, 1, 1)
+SUB_DAILY_UNITS = {
+    dateutil.rrule.HOURLY: 3600,
+    dateutil.rrule.MINUTELY: 60,
+    dateutil.rrule.SECONDLY: 1,
+}
+EXDATE_FORMAT = "%Y%m%dT%H%M%S"
+# length of a formatted EXDATE and its separator
+EXDATE_LENGTH = 16
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+CRON_MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+CRON_MONTH_NAMES = {
+    name: index + 1
+    for index, name in enumerate(
+        "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split()
+    )
+}
+CRON_WEEKDAY_NAMES = {
+    name: index for index, name in enumerate("SUN MON TUE WED THU FRI SAT".split())
+}
+
+
+def _in_timezone(
+    value: datetime.datetime, timezone: Optional[datetime.tzinfo]
+) -> datetime.datetime:
+    # pendulum datetimes cannot be converted to dateutil timezones in place
+    if value.tzinfo is None or timezone is None:
+        return value
+    return datetime.datetime.fromtimestamp(value.timestamp(), timezone)
+
+
+def to_datetime64(
+    value: datetime.datetime, timezone: Optional[datetime.tzinfo]
+) -> np.datetime64:
+    """Convert a datetime to a naive datetime64 in a timezone, to the second."""
+    value = _in_timezone(value, timezone)
+    return np.datetime64(value.replace(tzinfo=None, microsecond=0), "s")
+
+
+def _format(value: np.datetime64) -> str:
+    moment: datetime.datetime = value.astype(datetime.datetime)
+    return moment.strftime(EXDATE_FORMAT)
+
+
+def _join(values: Sequence[int]) -> str:
+    return ",".join(str(value) for value in values)
+
+
+def _utc_offsets(
+    timezone: datetime.tzinfo, start: np.datetime64, end: np.datetime64
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the UTC offsets of a timezone over a window and the instants they apply from.
+
+    Offsets are sampled once a day, and the instant of every change is then
+    found by bisection, so the cost depends on the window and not on the number
+    of occurrences.
+    """
+
+    def offset_at(instant: np.datetime64) -> int:
+        utc = instant.astype(datetime.datetime).replace(tzinfo=datetime.timezone.utc)
+        offset = utc.astimezone(timezone).utcoffset()
+        return int(offset.total_seconds()) if offset is not None else 0
+
+    days = np.arange(
+        start.astype("M8[D]"), end.astype("M8[D]") + 2, dtype="M8[D]"
+    ).astype("M8[s]")
+    offsets = [offset_at(day) for day in days]
+    instants = [days[0]]
+    values = [offsets[0]]
+    one_second = np.timedelta64(1, "s")
+    for index in range(1, len(days)):
+        if offsets[index] == offsets[index - 1]:
+            continue
+        low, high = days[index - 1], days[index]
+        while high - low > one_second:
+            middle = low + (high - low) // 2
+            if offset_at(middle) == offsets[index - 1]:
+                low = middle
+            else:
+                high = middle
+        instants.append(high)
+        values.append(offsets[index])
+    return np.array(instants, dtype="M8[s]"), np.array(values, dtype="m8[s]")
+
+
+def utc_to_local(instants: np.ndarray, timezone: datetime.tzinfo) -> np.ndarray:
+    """Convert naive UTC datetime64 values to naive local ones."""
+    if len(instants) == 0:
+        return instants
+    changes, offsets = _utc_offsets(timezone, instants.min(), instants.max())
+    index = np.searchsorted(changes, instants, side="right") - 1
+    return instants + offsets[np.clip(index, 0, None)]
+
+
+def local_to_utc(values: np.ndarray, timezone: datetime.tzinfo) -> np.ndarray:
+    """Convert naive local datetime64 values to naive UTC ones.
+
+    Nonexistent and ambiguous local times around DST changes are only
+    approximated, which is enough to estimate load.
+    """
+    if len(values) == 0:
+        return values
+    day = np.timedelta64(1, "D")
+    changes, offsets = _utc_offsets(timezone, values.min() - day, values.max() + day)
+    guess = values - offsets[np.searchsorted(changes, values, side="right") - 1]
+    index = np.searchsorted(changes, guess, side="right") - 1
+    return values - offsets[np.clip(index, 0, None)]
+
+
+def by_time_rules(seconds_of_day: np.ndarray) -> List[str]:
+    """Express times of day as few BYHOUR;BYMINUTE;BYSECOND rule parts.
+
+    Each rule part is the product of its hours, minutes and seconds, and the
+    rule parts together cover exactly the given times.
+    """
+    hours_by_minute_second: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for value in np.unique(seconds_of_day).tolist():
+        hour, rest = divmod(int(value), 3600)
+        minute, second = divmod(rest, 60)
+        hours_by_minute_second[(minute, second)].append(hour)
+
+    pairs_by_hours: Dict[Tuple[int, ...], List[Tuple[int, int]]] = defaultdict(list)
+    for minute_second, hours in hours_by_minute_second.items():
+        pairs_by_hours[tuple(hours)].append(minute_second)
+
+    rules = []
+    for hour_values, pairs in pairs_by_hours.items():
+        minutes_by_second: Dict[int, List[int]] = defaultdict(list)
+        for minute, second in pairs:
+            minutes_by_second[second].append(minute)
+        seconds_by_minutes: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+        for second, minutes in minutes_by_second.items():
+            seconds_by_minutes[tuple(minutes)].append(second)
+        for minute_values, seconds in seconds_by_minutes.items():
+            rules.append(
+                f"BYHOUR={_join(hour_values)};BYMINUTE={_join(minute_values)};"
+                f"BYSECOND={_join(seconds)}"
+            )
+    return rules
+
+
+def _sub_daily_rule(rule: str) -> Optional[Tuple[str, List[str]]]:
+    """Express a BYHOUR;BYMINUTE;BYSECOND rule part with a sub-daily frequency.
+
+    A part listing every value, e.g. every minute of some hours, is dropped by
+    iterating at its frequency instead, which keeps the rules of whole days of
+    minute-level schedules short. Returns the frequency and the remaining parts.
+    """
+    values = dict(part.split("=") for part in rule.split(";"))
+    sizes = {"BYHOUR": 24, "BYMINUTE": 60, "BYSECOND": 60}
+    full = {key for key, size in sizes.items() if values[key].count(",") + 1 == size}
+    # finer parts expand each iteration, so only the finest full part and the
+    # coarser ones, which merely filter, can be dropped
+    for frequency, key in (
+        ("SECONDLY", "BYSECOND"),
+        ("MINUTELY", "BYMINUTE"),
+        ("HOURLY", "BYHOUR"),
+    ):
+        if key in full:
+            return frequency, [
+                f"{name}={value}" for name, value in values.items() if name not in full
+            ]
+    return None
+
+
+def _shift_times(seconds_of_day: np.ndarray, seconds: int) -> np.ndarray:
+    shifted = np.asarray(seconds_of_day) + seconds
+    if len(shifted) and (shifted.min() < 0 or shifted.max() >= SECONDS_PER_DAY):
+        raise ValueError(f"Shifting by {seconds}s moves occurrences to another day.")
+    return shifted
+
+
+def _lattice(base: int, step: int) -> np.ndarray:
+    """Get the seconds of the day visited by steps from a base second."""
+    period = math.gcd(step, SECONDS_PER_DAY)
+    return np.arange(base % period, SECONDS_PER_DAY, period)
+
+
+def _offsets_within(rule: dateutil.rrule.rrule, unit: int) -> np.ndarray:
+    """Get the offsets a sub-daily rule expands to within each of its units."""
+    if unit == 3600:
+        return np.array(
+            [
+                minute * 60 + second
+                for minute in rule._byminute
+                for second in rule._bysecond
+            ]
+        )
+    if unit == 60:
+        return np.array(sorted(rule._bysecond))
+    return np.array([0])
+
+
+def _rule_parts(seconds_of_day: np.ndarray) -> List[Dict[str, Tuple[int, ...]]]:
+    """Get the byhour, byminute and bysecond arguments of rules covering times."""
+    parts = []
+    for rule in by_time_rules(seconds_of_day):
+        values = dict(part.split("=") for part in rule.split(";"))
+        parts.append(
+            {
+                name: tuple(int(value) for value in values[key].split(","))
+                for name, key in (
+                    ("byhour", "BYHOUR"),
+                    ("byminute", "BYMINUTE"),
+                    ("bysecond", "BYSECOND"),
+                )
+            }
+        )
+    return parts
+
+
+class OccurrenceGrid(ABC):
+    """The occurrences of a schedule, expanded on a datetime64 grid.
+
+    Occurrences are naive datetime64 values in the timezone of the equivalent
+    rrule schedule, see `rule_timezone`.
+    """
+
+    def __init__(self, timezone: Optional[str]) -> None:
+        self.timezone = timezone
+        self.tzinfo = dateutil.tz.gettz(timezone)
+
+    @property
+    def rule_timezone(self) -> Optional[str]:
+        """The timezone of the equivalent rrule schedule."""
+        return self.timezone
+
+    @property
+    def rule_tzinfo(self) -> Optional[datetime.tzinfo]:
+        tzinfo: Optional[datetime.tzinfo] = dateutil.tz.gettz(self.rule_timezone)
+        return tzinfo
+
+    @abstractmethod
+    def occurrences(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> np.ndarray:
+        """Get the sorted occurrences within [start, end)."""
+
+    def utc_occurrences(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> np.ndarray:
+        """Get the sorted occurrences within [start, end) as naive UTC values."""
+        occurrences = self.occurrences(start, end)
+        tzinfo = self.rule_tzinfo
+        return occurrences if tzinfo is None else local_to_utc(occurrences, tzinfo)
+
+    def local_dates(self, occurrences: np.ndarray) -> np.ndarray:
+        """Get the date of occurrences in the timezone of the schedule."""
+        return occurrences.astype("M8[D]")
+
+    @abstractmethod
+    def to_rrule_schedule(
+        self, start: Optional[datetime.datetime] = None
+    ) -> RRuleSchedule:
+        """Get an equivalent rrule schedule.
+
+        Args:
+            start: the start of the horizon the schedule is used over, used to
+                anchor rules that would otherwise be iterated from a distant
+                anchor date.
+        """
+
+    @abstractmethod
+    def times_of_day(self) -> np.ndarray:
+        """Get the sorted seconds of the day occurrences can fall on."""
+
+    @abstractmethod
+    def shift(self, seconds: int) -> Schedule:
+        """Get the schedule with every occurrence shifted by some seconds.
+
+        Occurrences must not be shifted past midnight, which would move them to
+        another day.
+        """
+
+
+class RRuleGrid(OccurrenceGrid):
+    """Occurrences of an rrule schedule, as expanded by dateutil."""
+
+    def __init__(self, schedule: RRuleSchedule) -> None:
+        super().__init__(schedule.timezone)
+        self.schedule = schedule
+
+    def occurrences(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> np.ndarray:
+        rrule = self.schedule.to_rrule()
+        occurrences = [
+            occurrence.replace(tzinfo=None)
+            for occurrence in rrule.between(
+                _in_timezone(start, self.tzinfo),
+                _in_timezone(end, self.tzinfo),
+                inc=True,
+            )
+            if occurrence < end
+        ]
+        return np.array(occurrences, dtype="M8[s]")
+
+    def to_rrule_schedule(
+        self, start: Optional[datetime.datetime] = None
+    ) -> RRuleSchedule:
+        return self.schedule
+
+    def _parse(self) -> dateutil.rrule.rruleset:
+        rruleset = dateutil.rrule.rrulestr(
+            self.schedule.rrule, dtstart=RRULE_ANCHOR_DATE, forceset=True
+        )
+        if any(rule._dtstart.tzinfo is not None for rule in rruleset._rrule):
+            raise NotImplementedError(
+                "Rrules with a timezone in DTSTART are not supported, "
+                "set the timezone of the schedule instead."
+            )
+        return rruleset
+
+    @staticmethod
+    def _rule_times_of_day(rule: dateutil.rrule.rrule) -> np.ndarray:
+        hours = rule._byhour or range(24)
+        minutes = rule._byminute or range(60)
+        seconds = rule._bysecond or range(60)
+        if rule._freq <= dateutil.rrule.DAILY:
+            return np.array(
+                sorted(
+                    hour * 3600 + minute * 60 + second
+                    for hour in hours
+                    for minute in minutes
+                    for second in seconds
+                )
+            )
+
+        dtstart = rule._dtstart
+        base = dtstart.hour * 3600 + dtstart.minute * 60 + dtstart.second
+        unit = SUB_DAILY_UNITS[rule._freq]
+        lattice = _lattice(base - base % unit, rule._interval * unit)
+        times = (lattice[:, None] + _offsets_within(rule, unit)[None, :]).ravel()
+        return np.unique(
+            times[
+                np.isin(times // 3600, list(hours))
+                & np.isin(times // 60 % 60, list(minutes))
+                & np.isin(times % 60, list(seconds))
+            ]
+        )
+
+    def times_of_day(self) -> np.ndarray:
+        rruleset = self._parse()
+        return np.unique(
+            np.concatenate(
+                [self._rule_times_of_day(rule) for rule in rruleset._rrule]
+                or [np.array([], dtype=int)]
+            )
+        )
+
+    def shift(self, seconds: int) -> Schedule:
+        rruleset = self._parse()
+        delta = datetime.timedelta(seconds=seconds)
+        rules = rruleset._rrule + rruleset._exrule
+        sub_daily = [rule for rule in rules if rule._freq > dateutil.rrule.DAILY]
+        if any(
+            key in rule._original_rule
+            for rule in sub_daily
+            for key in ("byhour", "byminute", "bysecond")
+        ):
+            raise NotImplementedError(
+                "Shifting hourly, minutely or secondly rrules with BYHOUR, "
+                "BYMINUTE or BYSECOND is not supported."
+            )
+        dtstart = rules[0]._dtstart if rules else RRULE_ANCHOR_DATE
+        if sub_daily:
+            dtstart += delta
+
+        def shifted(rule: dateutil.rrule.rrule) -> List[dateutil.rrule.rrule]:
+            until = {"until": rule._until + delta} if rule._until else {}
+            if rule._freq > dateutil.rrule.DAILY:
+                return [rule.replace(dtstart=dtstart, **until)]
+            times = _shift_times(self._rule_times_of_day(rule), seconds)
+            return [
+                rule.replace(dtstart=dtstart, **until, **parts)
+                for parts in _rule_parts(times)
+            ]
+
+        def rule_lines(rule: dateutil.rrule.rrule, name: str) -> List[str]:
+            return [
+                line.replace("RRULE:", f"{name}:", 1)
+                for line in str(rule).splitlines()
+                if not line.startswith("DTSTART")
+            ]
+
+        lines = [f"DTSTART:{dtstart.strftime(EXDATE_FORMAT)}"]
+        for rule in rruleset._rrule:
+            for new_rule in shifted(rule):
+                lines.extend(rule_lines(new_rule, "RRULE"))
+        for rule in rruleset._exrule:
+            for new_rule in shifted(rule):
+                lines.extend(rule_lines(new_rule, "EXRULE"))
+        for name, values in (("RDATE", rruleset._rdate), ("EXDATE", rruleset._exdate)):
+            if values:
+                lines.append(
+                    f"{name}:"
+                    + ",".join(
+                        (value.replace(tzinfo=None) + delta).strftime(EXDATE_FORMAT)
+                        for value in values
+                    )
+                )
+        return self.schedule.copy(update={"rrule": "\n".join(lines)})
+
+
+class IntervalGrid(OccurrenceGrid):
+    """Occurrences of an interval schedule.
+
+    As with prefect, intervals of whole days keep the local time of day across
+    DST changes, while shorter intervals are fixed durations in UTC.
+    """
+
+    def __init__(self, schedule: IntervalSchedule) -> None:
+        super().__init__(schedule.timezone or "UTC")
+        interval = schedule.interval
+        if interval.microseconds or (interval.days and interval.seconds):
+            raise NotImplementedError(
+                f"Interval {interval} is not supported, intervals must be whole "
+                "seconds shorter than a day or a whole number of days."
+            )
+        if interval.total_seconds() <= 0:
+            raise ValueError(f"Interval {interval} must be positive.")
+        self.schedule = schedule
+        self.whole_days = interval.days > 0
+        self.step = int(interval.total_seconds())
+        self.anchor = to_datetime64(schedule.anchor_date, self.rule_tzinfo)
+
+    @property
+    def rule_timezone(self) -> Optional[str]:
+        return self.timezone if self.whole_days else "UTC"
+
+    def _first_at_or_after(self, value: np.datetime64) -> np.datetime64:
+        offset = int((value - self.anchor).astype(int))
+        steps = -(-offset // self.step)
+        return self.anchor + np.timedelta64(steps * self.step, "s")
+
+    def occurrences(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> np.ndarray:
+        first = self._first_at_or_after(to_datetime64(start, self.rule_tzinfo))
+        last = to_datetime64(end, self.rule_tzinfo)
+        return np.arange(first, last, np.timedelta64(self.step, "s"), dtype="M8[s]")
+
+    def local_dates(self, occurrences: np.ndarray) -> np.ndarray:
+        if self.rule_timezone == self.timezone:
+            return occurrences.astype("M8[D]")
+        return utc_to_local(occurrences, self.tzinfo).astype("M8[D]")
+
+    def to_rrule_schedule(
+        self, start: Optional[datetime.datetime] = None
+    ) -> RRuleSchedule:
+        if self.whole_days:
+            rrule = (
+                f"DTSTART:{_format(self.anchor)}\n"
+                f"RRULE:FREQ=DAILY;INTERVAL={self.step // SECONDS_PER_DAY}"
+            )
+        elif SECONDS_PER_DAY % self.step == 0:
+            # a fixed set of times every day, which needs no anchor
+            anchor_second = int((self.anchor - self.anchor.astype("M8[D]")).astype(int))
+            seconds_of_day = (
+                anchor_second + np.arange(SECONDS_PER_DAY // self.step) * self.step
+            ) % SECONDS_PER_DAY
+            rrule = "\n".join(
+                f"RRULE:FREQ=DAILY;{rule}" for rule in by_time_rules(seconds_of_day)
+            )
+        else:
+            # re-anchor close to the horizon so the rule is not iterated from
+            # a distant anchor date
+            anchor = self.anchor
+            if start is not None:
+                anchor = self._first_at_or_after(
+                    to_datetime64(start, self.rule_tzinfo)
+                    - np.timedelta64(SECONDS_PER_DAY, "s")
+                )
+            if self.step % 3600 == 0:
+                frequency, interval = "HOURLY", self.step // 3600
+            elif self.step % 60 == 0:
+                frequency, interval = "MINUTELY", self.step // 60
+            else:
+                frequency, interval = "SECONDLY", self.step
+            rrule = (
+                f"DTSTART:{_format(anchor)}\n"
+                f"RRULE:FREQ={frequency};INTERVAL={interval}"
+            )
+        return ClientRRuleSchedule(rrule=rrule, timezone=self.rule_timezone)
+
+    def times_of_day(self) -> np.ndarray:
+        anchor_second = int((self.anchor - self.anchor.astype("M8[D]")).astype(int))
+        if self.whole_days:
+            return np.array([anchor_second])
+        return _lattice(anchor_second, self.step)
+
+    def shift(self, seconds: int) -> Schedule:
+        return self.schedule.copy(
+            update={
+                "anchor_date": self.schedule.anchor_date
+                + datetime.timedelta(seconds=seconds)
+            }
+        )
+
+
+def _parse_cron_value(text: str, names: Optional[Dict[str, int]]) -> int:
+    if names and text.upper() in names:
+        return names[text.upper()]
+    try:
+        return int(text)
+    except ValueError as e:
+        raise NotImplementedError(f"Cron value {text!r} is not supported.") from e
+
+
+def _parse_cron_field(
+    field: str, low: int, high: int, names: Optional[Dict[str, int]] = None
+) -> List[int]:
+    """Parse a cron field into the sorted values it matches."""
+    values: Set[int] = set()
+    for part in field.split(","):
+        expression, _, step_str = part.partition("/")
+        step = int(step_str) if step_str else 1
+        if expression in ("*", "?"):
+            first, last = low, high
+        else:
+            bounds = expression.split("-")
+            if len(bounds) > 2:
+                raise ValueError(f"Invalid cron field {field!r}.")
+            first = _parse_cron_value(bounds[0], names)
+            if len(bounds) == 2:
+                last = _parse_cron_value(bounds[1], names)
+            else:
+                # `5/15` means from 5 to the end every 15
+                last = high if step_str else first
+        if not low <= first <= last <= high or step < 1:
+            raise ValueError(f"Invalid cron field {field!r}.")
+        values.update(range(first, last + 1, step))
+    return sorted(values)
+
+
+class CronGrid(OccurrenceGrid):
+    """Occurrences of a cron schedule with minute, hour, day, month and weekday."""
+
+    def __init__(self, schedule: CronSchedule) -> None:
+        super().__init__(schedule.timezone or "UTC")
+        cron = CRON_MACROS.get(schedule.cron.strip().lower(), schedule.cron)
+        fields = cron.split()
+        if len(fields) != 5:
+            raise NotImplementedError(
+                f"Cron {schedule.cron!r} is not supported, only cron with 5 fields."
+            )
+        minutes, hours, day, month, weekday = fields
+        self.schedule = schedule
+        self.day_fields = (day, month, weekday)
+        self.seconds_of_day = np.array(
+            [
+                hour * 3600 + minute * 60
+                for hour in _parse_cron_field(hours, 0, 23)
+                for minute in _parse_cron_field(minutes, 0, 59)
+            ]
+        )
+        self.days = _parse_cron_field(day, 1, 31)
+        self.months = _parse_cron_field(month, 1, 12, CRON_MONTH_NAMES)
+        # cron counts weekdays from sunday, both 0 and 7, numpy from monday
+        self.weekdays = sorted(
+            {
+                (value + 6) % 7
+                for value in _parse_cron_field(weekday, 0, 7, CRON_WEEKDAY_NAMES)
+            }
+        )
+        self.days_restricted = day not in ("*", "?")
+        self.weekdays_restricted = weekday not in ("*", "?")
+        # as with croniter, days and weekdays match either one if both are set
+        self.day_or = (
+            schedule.day_or and self.days_restricted and self.weekdays_restricted
+        )
+
+    def occurrences(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> np.ndarray:
+        first = to_datetime64(start, self.tzinfo)
+        last = to_datetime64(end, self.tzinfo)
+        days = np.arange(first.astype("M8[D]"), last.astype("M8[D]") + 1, dtype="M8[D]")
+        months = days.astype("M8[M]")
+        month_matches = np.isin(months.astype(int) % 12 + 1, self.months)
+        day_matches = np.isin((days - months).astype(int) + 1, self.days)
+        # 1970-01-01 was a thursday
+        weekday_matches = np.isin((days.astype(int) + 3) % 7, self.weekdays)
+        if self.day_or:
+            matches = month_matches & (day_matches | weekday_matches)
+        else:
+            matches = month_matches & day_matches & weekday_matches
+
+        times = self.seconds_of_day.astype("m8[s]")
+        occurrences = (days[matches].astype("M8[s]")[:, None] + times[None, :]).ravel()
+        return occurrences[(occurrences >= first) & (occurrences < last)]
+
+    def to_rrule_schedule(
+        self, start: Optional[datetime.datetime] = None
+    ) -> RRuleSchedule:
+        parts = ["FREQ=DAILY"]
+        if len(self.months) < 12:
+            parts.append(f"BYMONTH={_join(self.months)}")
+        by_day = f"BYMONTHDAY={_join(self.days)}" if self.days_restricted else None
+        by_weekday = (
+            f"BYDAY={','.join(WEEKDAYS[weekday] for weekday in self.weekdays)}"
+            if self.weekdays_restricted
+            else None
+        )
+
+        if self.day_or:
+            day_parts = [[part] for part in (by_day, by_weekday) if part]
+        else:
+            day_parts = [[part for part in (by_day, by_weekday) if part]]
+        rrule = "\n".join(
+            "RRULE:" + ";".join(parts + day_part + [times])
+            for day_part in day_parts
+            for times in by_time_rules(self.seconds_of_day)
+        )
+        return ClientRRuleSchedule(rrule=rrule, timezone=self.rule_timezone)
+
+    def times_of_day(self) -> np.ndarray:
+        return np.unique(self.seconds_of_day)
+
+    def shift(self, seconds: int) -> Schedule:
+        """Shift the schedule, keeping it a cron schedule when possible."""
+        if seconds % 60:
+            raise ValueError("Cron schedules can only be shifted by whole minutes.")
+        shifted = CronGrid(self.schedule)
+        shifted.seconds_of_day = _shift_times(self.seconds_of_day, seconds)
+        hours = np.unique(shifted.seconds_of_day // 3600)
+        minutes = np.unique(shifted.seconds_of_day // 60 % 60)
+        if len(hours) * len(minutes) != len(shifted.seconds_of_day):
+            return shifted.to_rrule_schedule()
+        cron = " ".join(
+            [_join(minutes.tolist()), _join(hours.tolist()), *self.day_fields]
+        )
+        return self.schedule.copy(update={"cron": cron})
+
+
+def get_occurrence_grid(schedule: Schedule) -> OccurrenceGrid:
+    """Get the occurrence grid of a schedule."""
+    if isinstance(schedule, (ClientCronSchedule, ServerCronSchedule)):
+        return CronGrid(schedule)
+    if isinstance(schedule, (ClientIntervalSchedule, ServerIntervalSchedule)):
+        return IntervalGrid(schedule)
+    if isinstance(schedule, (ClientRRuleSchedule, ServerRRuleSchedule)):
+        return RRuleGrid(schedule)
+    raise NotImplementedError(f"Schedule {type(schedule).__name__} is not supported.")
+
+
+def to_client_schedule(schedule: Schedule) -> ClientSchedule:
+    """Get a schedule as the client schedule a deployment holds."""
+    if isinstance(schedule, ServerCronSchedule):
+        return ClientCronSchedule.parse_obj(schedule.dict())
+    if isinstance(schedule, ServerIntervalSchedule):
+        return ClientIntervalSchedule.parse_obj(schedule.dict())
+    if isinstance(schedule, ServerRRuleSchedule):
+        return ClientRRuleSchedule.parse_obj(schedule.dict())
+    return schedule
+
+
+def _get_dtstart(schedule: RRuleSchedule) -> datetime.datetime:
+    rrule = schedule.to_rrule()
+    if isinstance(rrule, dateutil.rrule.rruleset):
+        rrule = rrule._rrule[0]
+    dtstart: datetime.datetime = rrule._dtstart
+    return dtstart.replace(tzinfo=None)
+
+
+def exclude_occurrences(
+    schedule: RRuleSchedule, occurrences: np.ndarray, start: datetime.datetime
+) -> RRuleSchedule:
+    """Exclude occurrences from an rrule schedule.
+
+    The occurrences of each day are excluded with EXDATEs or, when shorter, with
+    EXRULEs matching their times on that date. Whole days of minute-level
+    schedules, e.g. the two UTC days a local holiday spans, are matched by
+    minutely or secondly EXRULEs, which need not list every minute.
+
+    Args:
+        schedule: the rrule schedule.
+        occurrences: naive occurrences in the timezone of the schedule.
+        start: the start of the horizon of the occurrences.
+    """
+    if len(occurrences) == 0:
+        return schedule
+
+    occurrences = np.unique(occurrences)
+    first_day = to_datetime64(start, dateutil.tz.gettz(schedule.timezone)).astype(
+        "M8[D]"
+    )
+    dtstart = _get_dtstart(schedule)
+
+    exdates: List[str] = []
+    exrules: List[str] = []
+    days, first_indexes, counts = np.unique(
+        occurrences.astype("M8[D]"), return_index=True, return_counts=True
+    )
+    for day, index, count in zip(days, first_indexes.tolist(), counts.tolist()):
+        day_occurrences = occurrences[index : index + count]
+        date = day.astype(datetime.date)
+        # a yearly rule fires from the year of dtstart, then every `interval`
+        # years, so it must not fire on the same date within the horizon
+        interval = max(date.year - dtstart.year, 1)
+        try:
+            first_fire = datetime.date(dtstart.year, date.month, date.day)
+        except ValueError:
+            first_fire = None
+        yearly_fits = not (
+            date.year > dtstart.year
+            and first_fire is not None
+            and np.datetime64(first_fire, "D") >= first_day
+        )
+        # a sub-daily rule fires on the same date every year from dtstart, so
+        # the last of these before the date must precede the horizon
+        sub_daily_fits = all(
+            np.datetime64(datetime.date(year, date.month, date.day), "D") < first_day
+            for year in range(dtstart.year, date.year)
+            if date.day <= calendar.monthrange(year, date.month)[1]
+        )
+        day_filter = f"BYMONTH={date.month};BYMONTHDAY={date.day}"
+        until = f"UNTIL={date:%Y%m%d}T235959"
+        day_exrules: List[str] = []
+        for rule in by_time_rules((day_occurrences - day).astype(int)):
+            candidates = []
+            if yearly_fits:
+                candidates.append(
+                    f"EXRULE:FREQ=YEARLY;INTERVAL={interval};{day_filter};{rule};"
+                    f"{until}"
+                )
+            sub_daily = _sub_daily_rule(rule)
+            if sub_daily_fits and sub_daily is not None:
+                frequency, parts = sub_daily
+                candidates.append(
+                    ";".join([f"EXRULE:FREQ={frequency}", day_filter, *parts, until])
+                )
+            if not candidates:
+                day_exrules = []
+                break
+            day_exrules.append(min(candidates, key=len))
+        if day_exrules and sum(len(rule) + 1 for rule in day_exrules) < (
+            count * EXDATE_LENGTH
+        ):
+            exrules.extend(day_exrules)
+        else:
+            exdates.extend(_format(occurrence) for occurrence in day_occurrences)
+
+    rrule = schedule.rrule
+    if exrules:
+        rrule += "\n" + "\n".join(exrules)
+    if exdates:
+        rrule += "\nEXDATE:" + ",".join(exdates)
+
+    if len(rrule) > MAX_RRULE_LENGTH:
+        raise ValueError(
+            f"The updated schedule exceeds the {MAX_RRULE_LENGTH} character limit "
+            f"with {len(occurrences)} excluded occurrences. "
+            "Please reduce the horizon."
+        )
+    return ClientRRuleSchedule(rrule=rrule, timezone=schedule.timezone)
@@ -0,0 +1,76 @@
+"""A plan of schedule offsets, written by the planner and read by the staggerer."""
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+PLAN_DIR = ".meta_prefect"
+PLAN_FILE = "schedule_plan.json"
+
+_active_plan: ContextVar[Optional["SchedulePlan"]] = ContextVar(
+    "schedule_plan", default=None
+)
+
+
+def deployment_key(flow_name: str, deployment_name: str) -> str:
+    """Get the key deployments are staggered and planned by."""
+    return f"{flow_name}/{deployment_name}"
+
+
+class SchedulePlan:
+    """The offsets, in seconds, to shift the schedule of deployments by.
+
+    Deployments missing from the plan get the `default` offset, or their hash
+    based offset if it is None.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        offsets: Optional[Dict[str, int]] = None,
+        default: Optional[int] = None,
+    ) -> None:
+        self.path = path
+        self.offsets = dict(offsets or {})
+        self.default = default
+
+    @classmethod
+    def for_project(cls, project_path: str) -> "SchedulePlan":
+        """Get the plan of a project directory, loaded if it exists."""
+        path = Path(project_path) / PLAN_DIR / PLAN_FILE
+        offsets = json.loads(path.read_text())["offsets"] if path.exists() else {}
+        return cls(path, offsets)
+
+    @classmethod
+    def unstaggered(cls) -> "SchedulePlan":
+        """Get a plan keeping every schedule as declared, to plan from."""
+        return cls(default=0)
+
+    def offset(self, key: str) -> Optional[int]:
+        """Get the planned offset of a deployment."""
+        return self.offsets.get(key, self.default)
+
+    def save(self) -> None:
+        """Write the plan to its path."""
+        if self.path is None:
+            raise ValueError("The plan has no path to be saved to.")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps({"offsets": self.offsets}, indent=2, sort_keys=True)
+        )
+
+
+@contextmanager
+def use_schedule_plan(plan: Optional[SchedulePlan]) -> Iterator[Optional[SchedulePlan]]:
+    """Make staggerers in this context apply a plan, if any."""
+    token = _active_plan.set(plan)
+    try:
+        yield plan
+    finally:
+        _active_plan.reset(token)
+
+
+def get_schedule_plan() -> Optional[SchedulePlan]:
+    """Get the active schedule plan."""
+    return _active_plan.get()
@@ -0,0 +1,132 @@
+"""Hash-based schedule staggerer.
+
+Schedules written as `FREQ=DAILY;BYHOUR=0` or `0 * * * *` make every deployment
+start in the same second. The staggerer shifts each schedule by an offset
+derived from a hash of the deployment name, so a deployment always gets the
+same offset while different deployments are spread over the window.
+"""
+import datetime
+import hashlib
+from logging import getLogger
+from typing import Optional
+
+from prefect.client.schemas.schedules import SCHEDULE_TYPES
+from prefect.flows import P, R
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.builders.scheduling.engine import (
+    get_occurrence_grid,
+    IntervalGrid,
+    Schedule,
+    SECONDS_PER_DAY,
+    to_client_schedule,
+)
+from meta_prefect.implementations.builders.scheduling.plan import (
+    deployment_key,
+    get_schedule_plan,
+)
+from meta_prefect.interface.builder import DeployableFlowBuilderInterface
+from meta_prefect.interface.deployment import Deployment
+from meta_prefect.interface.flow import DeployableFlow
+
+logger = getLogger(__name__)
+
+
+def _seconds(value: datetime.time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class schedule_staggerer(BaseModel, DeployableFlowBuilderInterface):
+    """Schedule staggerer.
+
+    Shifts every occurrence of the schedule later by a stable offset within
+    `window_seconds`, keeping the occurrences between `earliest` and `latest`.
+    An offset planned for the deployment in the active schedule plan is used
+    instead. Supports rrule, cron and interval schedules.
+    """
+
+    schedule: Optional[SCHEDULE_TYPES] = None
+    window_seconds: int = Field(
+        default=900,
+        ge=0,
+        description="The offsets are picked in [0, window_seconds).",
+    )
+    granularity_seconds: int = Field(
+        default=60,
+        ge=1,
+        description="The offsets are multiples of this, cron needs whole minutes.",
+    )
+    earliest: Optional[datetime.time] = Field(
+        default=None,
+        description="No occurrence is shifted before this time of day.",
+    )
+    latest: Optional[datetime.time] = Field(
+        default=None,
+        description="No occurrence is shifted after this time of day.",
+    )
+    salt: str = Field(
+        default="",
+        description="Changes every offset, e.g. to reshuffle deployments.",
+    )
+
+    def get_offsets(self, schedule: Schedule) -> range:
+        """Get the offsets within the window keeping a schedule within bounds."""
+        grid = get_occurrence_grid(schedule)
+        times = grid.times_of_day().tolist()
+        if len(times) == 0:
+            return range(0)
+        lower = max(0, _seconds(self.earliest) - min(times)) if self.earliest else 0
+        lower = -(-lower // self.granularity_seconds) * self.granularity_seconds
+        upper = lower + self.window_seconds - 1
+        if self.latest:
+            upper = min(upper, _seconds(self.latest) - max(times))
+        elif not isinstance(grid, IntervalGrid):
+            # intervals wrap around midnight, other schedules would change day
+            upper = min(upper, SECONDS_PER_DAY - 1 - max(times))
+        return range(lower, upper + 1, self.granularity_seconds)
+
+    def get_offset(self, key: str, schedule: Schedule) -> Optional[int]:
+        """Get the offset of a schedule, or None if no offset fits the bounds."""
+        offsets = self.get_offsets(schedule)
+        if len(offsets) == 0:
+            return None
+        digest = hashlib.sha256(f"{key}{self.salt}".encode()).digest()
+        return offsets[int.from_bytes(digest[:8], "big") % len(offsets)]
+
+    def _update_schedule(
+        self, key: str, schedule: Schedule, offset: Optional[int] = None
+    ) -> Schedule:
+        """Shift a schedule by a planned offset, or else the offset of a key."""
+        try:
+            if offset is None:
+                offset = self.get_offset(key, schedule)
+            if offset is None:
+                logger.warning(f"No stagger offset of {key} fits its bounds.")
+                return schedule
+            if offset == 0:
+                return schedule
+            return get_occurrence_grid(schedule).shift(offset)
+        except NotImplementedError as e:
+            logger.warning(f"Not staggering the schedule of {key}: {e}")
+            return schedule
+
+    @sync_compatible
+    async def update_deployment(
+        self, flow: DeployableFlow[P, R], deployment: Deployment
+    ) -> Deployment:
+        """Update the deployment."""
+        if self.schedule:
+            deployment.schedule = self.schedule
+
+        # the key of a deployment needs the name of its flow
+        if not deployment.schedule or deployment.flow_name is None:
+            return deployment
+        key = deployment_key(deployment.flow_name, deployment.name)
+        plan = get_schedule_plan()
+        offset = plan.offset(key) if plan is not None else None
+        if offset is not None or self.window_seconds:
+            deployment.schedule = to_client_schedule(
+                self._update_schedule(key, deployment.schedule, offset)
+            )
+        return deployment
@@ -1,5 +1,4 @@
 """A deployment versioneer that versions by incrementing the existing version."""
-from prefect import get_client
 from prefect.client.schemas.filters import (
     DeploymentFilter,
     DeploymentFilterName,
@@ -12,6 +11,8 @@ from prefect.client.schemas.sorting import DeploymentSort
 from prefect.utilities.asyncutils import sync_compatible
 from pydantic import BaseModel
 
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.mirror import get_mirror
 from meta_prefect.interface import DeployableFlowBuilderInterface, Deployment
 from meta_prefect.interface.flow import DeployableFlow
 
@@ -23,24 +24,29 @@ class simple_increment_versioning(BaseModel, DeployableFlowBuilderInterface):
         self, flow: DeployableFlow, deployment: Deployment
     ) -> int:
         """Get the existing version."""
-        async with get_client() as client:
-            latest_deployment = await client.read_deployments(
-                flow_filter=FlowFilter(
-                    name=FlowFilterName(any=[flow.name]),
-                ),
-                deployment_filter=DeploymentFilter(
-                    name=DeploymentFilterName(any_=[deployment.name]),
-                    tags=DeploymentFilterTags(all_=deployment.tags),
-                ),
-                limit=1,
-                sort=DeploymentSort.UPDATED_DESC,
+        mirror = get_mirror()
+        if mirror is not None:
+            version = mirror.latest_deployment_version(
+                flow.name, deployment.name, deployment.tags
             )
+        else:
+            async with get_client() as client:
+                latest_deployment = await client.read_deployments(
+                    flow_filter=FlowFilter(
+                        name=FlowFilterName(any_=[flow.name]),
+                    ),
+                    deployment_filter=DeploymentFilter(
+                        name=DeploymentFilterName(any_=[deployment.name]),
+                        tags=DeploymentFilterTags(all_=deployment.tags),
+                    ),
+                    limit=1,
+                    sort=DeploymentSort.UPDATED_DESC,
+                )
+            version = latest_deployment[0].version if latest_deployment else None
 
-        if not latest_deployment:
+        if version is None:
             return 0
 
-        version = latest_deployment[0].version
-
         try:
             return int(version)
 
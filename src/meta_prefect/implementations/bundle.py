@@ -0,0 +1,255 @@
+"""Prebuilt dependency bundles, so flow run pods start without installing.
+
+Instead of pip installing packages when a pod starts (`EXTRA_PIP_PACKAGES`),
+a deploy step installs the locked dependencies of the flow package, for the
+pods' platform and Python version, into a `site-packages` directory and
+publishes it to a store, e.g. an S3 bucket or a shared file system. Bundles are
+keyed by a hash of the lockfile and of what they are built for, so a bundle is
+only built once per version of the dependencies.
+
+Wheels are downloaded to a local wheelhouse first, which later builds reuse, so
+with `offline=True` bundles are built from local wheels without an index.
+
+Pods get the bundle either from a volume of the store, e.g. a persistent
+volume claim on EFS or on an S3 bucket with the Mountpoint CSI driver, which
+is mounted read-only at the bundle's subpath, or from init containers
+extracting its tarball into an `emptyDir`. Either way, the bundle's
+`site-packages` is put on the `PYTHONPATH`.
+
+Init containers only use the standard library of the flow image, which has no
+`s3fs`: tarballs on S3 are downloaded by the AWS CLI in its own image first,
+and tarballs served over HTTP are streamed by `urllib`.
+"""
+import hashlib
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+import fsspec
+from pydantic import BaseModel, Field
+
+BUNDLE_MOUNT_PATH = "/opt/meta-prefect/bundle"
+BUNDLE_SITE_PACKAGES = f"{BUNDLE_MOUNT_PATH}/site-packages"
+COMPLETE_MARKER = "COMPLETE"
+DEFAULT_WHEELHOUSE = Path("~/.cache/meta-prefect/wheelhouse")
+
+DEFAULT_FETCH_IMAGE = "amazon/aws-cli"
+FETCHED_SCHEMES = ("s3", "http", "https")
+
+# runs in the flow image, with only the standard library
+EXTRACT_SCRIPT = (
+    "import os, sys, tarfile, urllib.request\n"
+    "source, target = sys.argv[1:]\n"
+    "url = '://' in source\n"
+    "with urllib.request.urlopen(source) if url else open(source, 'rb') as f:\n"
+    "    with tarfile.open(fileobj=f, mode='r|gz') as tar:\n"
+    "        tar.extractall(target)\n"
+    "if not url:\n"
+    "    os.remove(source)\n"
+)
+
+
+class DependencyBundle(BaseModel):
+    """The dependencies of a flow package, bundled for the pods running it."""
+
+    lockfile: Path = Field(
+        description=(
+            "The lockfile of the flow package, a requirements file with pinned "
+            "versions or a poetry.lock exported with poetry."
+        ),
+    )
+    packages: Tuple[str, ...] = Field(
+        ("s3fs",),
+        description="Packages bundled besides the locked ones, e.g. for storage.",
+    )
+    store: str = Field(
+        description="The directory or URL, e.g. s3://bucket/bundles, of bundles.",
+    )
+    python_version: str = Field(
+        "3.10", description="The Python version of the flow image."
+    )
+    platform: str = Field(
+        "manylinux2014_x86_64", description="The platform of the cluster's nodes."
+    )
+    claim_name: Optional[str] = Field(
+        None,
+        description=(
+            "The persistent volume claim of the store, to mount bundles from. "
+            "If not specified, an init container fetches the bundle's tarball."
+        ),
+    )
+    offline: bool = Field(
+        False, description="Build from the local wheelhouse only, without an index."
+    )
+    fetch_image: str = Field(
+        DEFAULT_FETCH_IMAGE,
+        description="The image with the AWS CLI downloading bundles from S3.",
+    )
+    wheelhouse: Path = Field(
+        DEFAULT_WHEELHOUSE, description="Where downloaded wheels are kept."
+    )
+
+    class Config:
+        frozen = True
+
+    @property
+    def unpacked(self) -> bool:
+        """Whether the bundle is published as a directory, to mount."""
+        return self.claim_name is not None
+
+    @property
+    def key(self) -> str:
+        """Get the version of the bundle, a hash of what it is built from and for."""
+        digest = hashlib.sha256(self.lockfile.read_bytes())
+        for value in (*sorted(self.packages), self.python_version, self.platform):
+            digest.update(b"\0" + value.encode())
+        return digest.hexdigest()[:16]
+
+    @property
+    def tarball(self) -> str:
+        return f"{self.key}.tar.gz"
+
+
+def _store_fs(store: str) -> Tuple[fsspec.AbstractFileSystem, str]:
+    fs, path = fsspec.core.url_to_fs(store)
+    return fs, path.rstrip("/")
+
+
+def is_published(bundle: DependencyBundle) -> bool:
+    """Whether the bundle of this version of the dependencies is in the store."""
+    fs, path = _store_fs(bundle.store)
+    if bundle.unpacked:
+        return fs.exists(f"{path}/{bundle.key}/{COMPLETE_MARKER}")
+    return fs.exists(f"{path}/{bundle.tarball}")
+
+
+def _requirements(bundle: DependencyBundle, build_dir: Path) -> List[str]:
+    if bundle.lockfile.name == "poetry.lock":
+        requirements = build_dir / "requirements.txt"
+        subprocess.run(
+            [
+                "poetry",
+                "export",
+                "--format=requirements.txt",
+                "--without-hashes",
+                f"--output={requirements}",
+            ],
+            cwd=bundle.lockfile.parent,
+            check=True,
+        )
+    else:
+        requirements = bundle.lockfile
+    return ["-r", str(requirements), *bundle.packages]
+
+
+def _pip(bundle: DependencyBundle, *args: str) -> None:
+    wheelhouse = bundle.wheelhouse.expanduser()
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            *args,
+            "--only-binary=:all:",
+            f"--platform={bundle.platform}",
+            f"--python-version={bundle.python_version}",
+            f"--find-links={wheelhouse}",
+            "--disable-pip-version-check",
+            "--quiet",
+        ],
+        check=True,
+    )
+
+
+def install_bundle(bundle: DependencyBundle, build_dir: Path) -> Path:
+    """Install the dependencies of a bundle, get its site-packages directory."""
+    wheelhouse = bundle.wheelhouse.expanduser()
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    requirements = _requirements(bundle, build_dir)
+    # wheels already in the wheelhouse are not downloaded again
+    _pip(
+        bundle,
+        "download",
+        f"--dest={wheelhouse}",
+        *(["--no-index"] if bundle.offline else []),
+        *requirements,
+    )
+    site_packages = build_dir / "site-packages"
+    _pip(
+        bundle,
+        "install",
+        f"--target={site_packages}",
+        "--no-index",
+        "--no-compile",
+        *requirements,
+    )
+    return site_packages
+
+
+def publish_bundle(bundle: DependencyBundle, site_packages: Path) -> None:
+    """Publish an installed bundle to its store, as a directory or a tarball."""
+    fs, path = _store_fs(bundle.store)
+    if bundle.unpacked:
+        fs.put(str(site_packages), f"{path}/{bundle.key}/site-packages", recursive=True)
+        # pods only mount complete bundles
+        fs.pipe(f"{path}/{bundle.key}/{COMPLETE_MARKER}", b"")
+        return
+    tarball = site_packages.parent / bundle.tarball
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(site_packages, arcname="site-packages")
+    fs.makedirs(path, exist_ok=True)
+    # pods only fetch complete bundles
+    fs.put(str(tarball), f"{path}/{bundle.tarball}.partial")
+    fs.mv(f"{path}/{bundle.tarball}.partial", f"{path}/{bundle.tarball}")
+
+
+def build_bundle(bundle: DependencyBundle) -> str:
+    """Build and publish a bundle, unless already published, get its key."""
+    if not is_published(bundle):
+        with tempfile.TemporaryDirectory() as build_dir:
+            site_packages = install_bundle(bundle, Path(build_dir))
+            publish_bundle(bundle, site_packages)
+    return bundle.key
+
+
+class FetchStep(NamedTuple):
+    """An init container fetching a bundle, in the flow image if no image is set."""
+
+    name: str
+    command: List[str]
+    image: Optional[str] = None
+
+
+def fetch_steps(
+    bundle: DependencyBundle, mount_path: str = BUNDLE_MOUNT_PATH
+) -> List[FetchStep]:
+    """Get the init containers extracting a bundle's tarball for a pod."""
+    scheme = urlparse(bundle.store).scheme
+    if scheme not in FETCHED_SCHEMES:
+        raise ValueError(
+            f"Bundles in {bundle.store} can only be mounted, set the claim_name of "
+            f"its volume or use a store of {', '.join(FETCHED_SCHEMES)}."
+        )
+    source = f"{bundle.store.rstrip('/')}/{bundle.tarball}"
+    steps = []
+    if scheme == "s3":
+        download = f"{mount_path}/{bundle.tarball}"
+        steps.append(
+            FetchStep(
+                "download-dependency-bundle",
+                ["aws", "s3", "cp", "--only-show-errors", source, download],
+                image=bundle.fetch_image,
+            )
+        )
+        source = download
+    steps.append(
+        FetchStep(
+            "extract-dependency-bundle",
+            ["python", "-c", EXTRACT_SCRIPT, source, mount_path],
+        )
+    )
+    return steps
@@ -0,0 +1,227 @@
+"""Business calendars and an on-disk cache of their compiled holidays.
+
+A calendar provider lists the holidays of a calendar over some years. Building
+`holidays` calendars is slow for long horizons, so the holidays of a provider
+are compiled once to a sorted `datetime64[D]` array, saved as a `.npy` file in
+a cache directory shared by every deploy on the machine and memory-mapped on
+later loads. Membership is checked by binary search.
+"""
+import datetime
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Type, Union
+
+import holidays
+import numpy as np
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.registry import ClassRegistry
+
+CALENDAR_CACHE_ENV = "META_PREFECT__CALENDAR_CACHE"
+DEFAULT_CALENDAR_CACHE = Path("~/.cache/meta_prefect/calendars")
+
+calendar_providers: "ClassRegistry[str, Type[CalendarProvider]]" = ClassRegistry()
+
+
+class CompiledCalendar:
+    """The sorted holidays of a calendar, answering membership in O(log n)."""
+
+    def __init__(self, dates: np.ndarray) -> None:
+        self.dates = dates
+
+    @classmethod
+    def from_dates(
+        cls, dates: Iterable[Union[datetime.date, np.datetime64]]
+    ) -> "CompiledCalendar":
+        """Compile a calendar from dates in any order."""
+        return cls(np.unique(np.array(list(dates), dtype="M8[D]")))
+
+    @classmethod
+    def union(cls, calendars: Sequence["CompiledCalendar"]) -> "CompiledCalendar":
+        """Get the calendar of the holidays of any of some calendars."""
+        if len(calendars) == 1:
+            return calendars[0]
+        return cls(
+            np.unique(
+                np.concatenate(
+                    [calendar.dates for calendar in calendars]
+                    or [np.array([], dtype="M8[D]")]
+                )
+            )
+        )
+
+    def contains(self, dates: np.ndarray) -> np.ndarray:
+        """Flag the dates that are holidays."""
+        dates = np.asarray(dates, dtype="M8[D]")
+        if len(self.dates) == 0:
+            return np.zeros(dates.shape, dtype=bool)
+        index = np.searchsorted(self.dates, dates)
+        flags: np.ndarray = (index < len(self.dates)) & (
+            self.dates[np.clip(index, 0, len(self.dates) - 1)] == dates
+        )
+        return flags
+
+    def __contains__(self, date: datetime.date) -> bool:
+        return bool(self.contains(np.array([date]))[0])
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+class CalendarProvider(BaseModel, ABC):
+    """A provider of the holidays of a business calendar."""
+
+    @property
+    def cache_key(self) -> Optional[str]:
+        """The key of the compiled calendar in the cache, None to not cache it."""
+        return hashlib.sha256(
+            f"{type(self).__name__}:{self.json(sort_keys=True)}:"
+            f"{holidays.__version__}".encode()
+        ).hexdigest()[:16]
+
+    @abstractmethod
+    def holidays(self, years: Sequence[int]) -> Iterable[datetime.date]:
+        """List the holidays of some years."""
+
+    class Config:
+        frozen = True
+
+
+@calendar_providers.register
+class country_calendar(CalendarProvider):
+    """The public holidays of a country, or of one of its subdivisions."""
+
+    country: str = Field(description="The ISO 3166 code of the country.")
+    subdiv: Optional[str] = Field(
+        default=None, description="The subdivision, e.g. ENG for the UK."
+    )
+
+    def holidays(self, years: Sequence[int]) -> Iterable[datetime.date]:
+        return holidays.country_holidays(
+            self.country, subdiv=self.subdiv, years=list(years)
+        ).keys()
+
+
+@calendar_providers.register
+class market_calendar(CalendarProvider):
+    """The holidays of a financial market, e.g. NYSE or ECB for TARGET2."""
+
+    market: str = Field(description="The code of the market.")
+
+    def holidays(self, years: Sequence[int]) -> Iterable[datetime.date]:
+        return holidays.financial_holidays(self.market, years=list(years)).keys()
+
+
+@calendar_providers.register
+class custom_calendar(CalendarProvider):
+    """A fixed list of dates."""
+
+    dates: Tuple[datetime.date, ...] = Field(description="The holidays.")
+
+    @property
+    def cache_key(self) -> Optional[str]:
+        # compiling the dates is cheaper than reading them back
+        return None
+
+    def holidays(self, years: Sequence[int]) -> Iterable[datetime.date]:
+        return [date for date in self.dates if date.year in years]
+
+
+CALENDAR_ALIASES: Dict[str, CalendarProvider] = {
+    "NYSE": market_calendar(market="NYSE"),
+    "TARGET2": market_calendar(market="ECB"),
+    "UK": country_calendar(country="GB", subdiv="ENG"),
+}
+
+
+def get_calendar(name: str) -> CalendarProvider:
+    """Get the provider of a calendar by name.
+
+    Names are aliases such as NYSE, TARGET2 and UK, market codes supported by
+    `holidays`, or country codes optionally followed by a subdivision, e.g.
+    GB-SCT.
+    """
+    name = name.strip().upper()
+    if name in CALENDAR_ALIASES:
+        return CALENDAR_ALIASES[name]
+    if name in holidays.list_supported_financial():
+        return market_calendar(market=name)
+    country, _, subdiv = name.partition("-")
+    return country_calendar(country=country, subdiv=subdiv or None)
+
+
+class CalendarCache:
+    """Compiled calendars saved in a directory and memory-mapped when loaded.
+
+    A file holds the holidays of a provider over a contiguous span of years,
+    named `<cache key>-<first year>-<last year>.npy`. It is recompiled over a
+    wider span when years outside of it are requested.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path.expanduser()
+        self._loaded: Dict[str, Tuple[int, int, CompiledCalendar]] = {}
+
+    @classmethod
+    def default(cls) -> "CalendarCache":
+        """Get the cache of the machine, see META_PREFECT__CALENDAR_CACHE."""
+        return cls(Path(os.environ.get(CALENDAR_CACHE_ENV, DEFAULT_CALENDAR_CACHE)))
+
+    def _files(self, key: str) -> List[Tuple[int, int, Path]]:
+        files = []
+        for path in self.path.glob(f"{key}-*-*.npy"):
+            _, first, last = path.stem.rsplit("-", 2)
+            files.append((int(first), int(last), path))
+        return files
+
+    def _compile(
+        self, provider: CalendarProvider, key: str, first: int, last: int
+    ) -> Path:
+        calendar = CompiledCalendar.from_dates(
+            provider.holidays(range(first, last + 1))
+        )
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path / f"{key}-{first}-{last}.npy"
+        # written to a temporary file first, as deploys share the cache
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "wb") as f:
+            np.save(f, calendar.dates)
+        os.replace(temporary, path)
+        return path
+
+    def load(
+        self, provider: CalendarProvider, years: Sequence[int]
+    ) -> CompiledCalendar:
+        """Load the compiled calendar of a provider, covering at least some years."""
+        key = provider.cache_key
+        if key is None:
+            return CompiledCalendar.from_dates(provider.holidays(years))
+        first, last = min(years), max(years)
+
+        loaded = self._loaded.get(key)
+        if loaded is not None and loaded[0] <= first and last <= loaded[1]:
+            return loaded[2]
+
+        files = self._files(key)
+        covering = [
+            path for start, end, path in files if start <= first and last <= end
+        ]
+        if covering:
+            path = covering[0]
+        else:
+            first = min([first] + [start for start, _, _ in files])
+            last = max([last] + [end for _, end, _ in files])
+            path = self._compile(provider, key, first, last)
+            for _, _, stale in files:
+                stale.unlink(missing_ok=True)
+
+        _, start, end = path.stem.rsplit("-", 2)
+        try:
+            calendar = CompiledCalendar(np.load(path, mmap_mode="r"))
+        except FileNotFoundError:
+            # another deploy widened the span and removed the file meanwhile
+            return self.load(provider, years)
+        self._loaded[key] = (int(start), int(end), calendar)
+        return calendar
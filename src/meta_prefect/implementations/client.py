@@ -0,0 +1,80 @@
+"""Client access shared by builders and actions."""
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TypeVar
+
+import prefect
+from prefect.client.orchestration import PrefectClient, ServerType
+
+from meta_prefect.implementations.governor import get_governor, govern_client
+
+T = TypeVar("T")
+
+PAGE_SIZE = 200
+
+_pooled_client: ContextVar[Optional[PrefectClient]] = ContextVar(
+    "meta_prefect_pooled_client", default=None
+)
+
+
+def get_workspace_key() -> str:
+    """Get a key identifying the workspace the current context talks to."""
+    settings_context = prefect.context.get_settings_context()
+    return settings_context.profile.name
+
+
+def _new_client() -> PrefectClient:
+    """Create a prefect client whose requests go through the request governor."""
+    client = prefect.get_client()
+    if client.server_type != ServerType.EPHEMERAL:
+        govern_client(client._client, get_governor(str(client.api_url)))
+    return client
+
+
+@asynccontextmanager
+async def get_client() -> AsyncIterator[PrefectClient]:
+    """Get a client, re-using the pooled client of the current context if any.
+
+    Drop-in replacement for `prefect.get_client` for use as an async context
+    manager. When called within `pooled_client`, the already-open client and its
+    connection pool are shared instead of opening a new connection per call.
+    Requests to a remote API are sent through the shared request governor.
+    """
+    client = _pooled_client.get()
+    if client is not None:
+        yield client
+        return
+
+    async with _new_client() as client:
+        yield client
+
+
+@asynccontextmanager
+async def pooled_client() -> AsyncIterator[PrefectClient]:
+    """Open a single client shared by every `get_client` call in this context."""
+    async with _new_client() as client:
+        token = _pooled_client.set(client)
+        try:
+            yield client
+        finally:
+            _pooled_client.reset(token)
+
+
+async def read_pages(
+    read_page: Callable[[int, int], Awaitable[List[T]]],
+    page_size: int = PAGE_SIZE,
+) -> List[T]:
+    """Read all items of a paginated query.
+
+    Args:
+        read_page: reads the page at an offset, given the offset and page size.
+        page_size: the number of items requested per page.
+    """
+    items: List[T] = []
+    offset = 0
+    while True:
+        page = await read_page(offset, page_size)
+        items.extend(page)
+        if len(page) < page_size:
+            return items
+        offset += page_size
@@ -0,0 +1,233 @@
+"""Co-location of tiny flow runs in a shared, long-lived runner pod.
+
+A Job per flow run costs pod scheduling and container startup, which dwarfs
+runs of a few seconds. Deployments built with `eks(colocate=ColocationGroup(...))`
+are instead tagged `colocation=<group>` and sent to the process work pool of
+their group. The group's runner pod, a Kubernetes Deployment of one replica
+applied once the deployments are, polls the pool with a warm worker (see
+`meta_prefect.implementations.warm_worker`), so every run is a fork of a
+process which already imported Prefect.
+
+The runner is bounded by its group's concurrency and memory: it runs at most
+`slots` runs at a time, as many as fit in its memory at `run_memory_gb` each,
+and every run is capped at `run_memory_gb` with an rlimit (see
+`meta_prefect.implementations.run_resources`).
+
+`measure_overhead` compares the Kubernetes overhead of a number of runs with a
+Job per run, and on a runner, against any `KubernetesApi`, e.g. a fake one.
+"""
+import asyncio
+import json
+import math
+from typing import Dict, List, NamedTuple, Tuple
+
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.actions.base import Action
+from meta_prefect.implementations.actions.work_pool import (
+    local_process_base_job_template,
+)
+from meta_prefect.implementations.components.work_pool import WorkPool
+from meta_prefect.implementations.index import get_work_pool_index
+from meta_prefect.implementations.kubernetes_api import (
+    get_kubernetes_api,
+    KubernetesApi,
+    Manifest,
+    wait_for_running_pods,
+)
+from meta_prefect.implementations.run_resources import RunResources
+from meta_prefect.implementations.warm_worker import WARM_WORKER_MODULE
+
+COLOCATION_LABEL = "meta-prefect.io/colocation-group"
+
+
+class ColocationGroup(BaseModel):
+    """The runner pod shared by the runs of a group of deployments."""
+
+    name: str = Field(description="The name of the group.")
+    concurrency: int = Field(8, ge=1, description="The most runs at a time.")
+    cpu: float = Field(1, gt=0, le=64, description="The CPU cores of the runner.")
+    memory_gb: float = Field(
+        2, gt=0, le=256, description="The memory of the runner, in GB."
+    )
+    run_memory_gb: float = Field(
+        0.25, gt=0, description="The most memory of each run, in GB."
+    )
+    recycle_after: int = Field(
+        100, ge=1, description="The runs after which the runner's zygote is replaced."
+    )
+
+    class Config:
+        frozen = True
+
+    @property
+    def slots(self) -> int:
+        """Get the most runs at a time, within the concurrency and memory."""
+        return max(1, min(self.concurrency, int(self.memory_gb / self.run_memory_gb)))
+
+    @property
+    def work_pool_name(self) -> str:
+        return f"colocated-{self.name}"
+
+    @property
+    def runner_name(self) -> str:
+        return f"meta-prefect-runner-{self.name}"
+
+    @property
+    def labels(self) -> Dict[str, str]:
+        return {COLOCATION_LABEL: self.name}
+
+    def run_resources(self) -> RunResources:
+        """Get the limits of each run, forks of the runner apply them."""
+        return RunResources(
+            memory_mb=math.floor(self.run_memory_gb * 1024), limit_with="rlimit"
+        )
+
+    def runner_args(self) -> List[str]:
+        """Get the command of the runner's container."""
+        return [
+            "python",
+            "-m",
+            WARM_WORKER_MODULE,
+            "--pool",
+            self.work_pool_name,
+            "--name",
+            self.runner_name,
+            "--limit",
+            str(self.slots),
+            "--pool-size",
+            "1",
+            "--recycle-after",
+            str(self.recycle_after),
+        ]
+
+
+async def ensure_colocation_work_pool(group: ColocationGroup, env: str) -> WorkPool:
+    """Get the work pool of a group, created or with its limit updated."""
+    index = await get_work_pool_index("process")
+    work_pool = next(
+        (pool for pool in index.all() if pool.name == group.work_pool_name), None
+    )
+    if work_pool is None:
+        work_pool = WorkPool(
+            name=group.work_pool_name,
+            type="process",
+            base_job_template=local_process_base_job_template(env),
+            concurrency_limit=group.slots,
+        )
+        await work_pool.create()
+        index.add(work_pool)
+    elif work_pool.concurrency_limit != group.slots:
+        work_pool.concurrency_limit = group.slots
+        await work_pool.update()
+    return work_pool
+
+
+async def find_colocation_work_pool(group: ColocationGroup, env: str) -> WorkPool:
+    """Get the work pool of a group, or an unsaved, unlimited one if missing."""
+    index = await get_work_pool_index("process")
+    return index.get(group.work_pool_name) or WorkPool(
+        name=group.work_pool_name,
+        type="process",
+        base_job_template=local_process_base_job_template(env),
+    )
+
+
+class EnsureColocationWorkPoolCreatedAction(Action):
+    """Ensure the work pool of a co-location group is created."""
+
+    group: ColocationGroup = Field(description="The co-location group.")
+    env: str = Field(description="The default env of the group's work pool.")
+
+    def __repr__(self) -> str:
+        return f"EnsureColocationWorkPoolCreatedAction(group={self.group.name})"
+
+    async def _run(self) -> WorkPool:
+        return await ensure_colocation_work_pool(self.group, self.env)
+
+    async def _resolve(self) -> WorkPool:
+        return await find_colocation_work_pool(self.group, self.env)
+
+
+class EnsureColocationRunnerAction(Action):
+    """Ensure the runner pod of a co-location group is created and up to date."""
+
+    runner_manifest: str = Field(
+        description="The JSON manifest of the runner's Kubernetes Deployment."
+    )
+
+    async def _run(self) -> Manifest:
+        return await get_kubernetes_api().apply(json.loads(self.runner_manifest))
+
+
+class OverheadReport(NamedTuple):
+    """The Kubernetes overhead of starting a number of flow runs."""
+
+    mode: str
+    runs: int
+    pods_started: int
+    overhead_seconds: float
+
+    @property
+    def seconds_per_run(self) -> float:
+        return self.overhead_seconds / self.runs
+
+
+def _named(manifest: Manifest, name: str) -> Manifest:
+    manifest = json.loads(json.dumps(manifest))
+    manifest["metadata"]["name"] = name
+    return manifest
+
+
+async def _job_overhead(
+    api: KubernetesApi, job_manifest: Manifest, name: str, interval: float
+) -> float:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    namespace = job_manifest["metadata"]["namespace"]
+    await api.apply(_named(job_manifest, name))
+    await wait_for_running_pods(api, namespace, {"job-name": name}, interval=interval)
+    overhead = loop.time() - start
+    await api.delete("batch/v1", "Job", name, namespace)
+    return overhead
+
+
+async def measure_overhead(
+    api: KubernetesApi,
+    job_manifest: Manifest,
+    runner_manifest: Manifest,
+    runs: int,
+    interval: float = 1,
+) -> Tuple[OverheadReport, OverheadReport]:
+    """Measure the time until runs can start, with a Job per run and on a runner.
+
+    With a Job per run, a Job of the manifest, e.g. built by `KubernetesJob`, is
+    created for every run, and deleted once its pod is running. On a runner,
+    only the first run waits, if the runner is not running yet, and runs then
+    start as forks of the runner's zygote, whose latency `meta-prefect workers
+    benchmark` measures.
+    """
+    loop = asyncio.get_running_loop()
+    namespace = runner_manifest["metadata"]["namespace"]
+    labels = runner_manifest["spec"]["selector"]["matchLabels"]
+    job_overheads = await asyncio.gather(
+        *[
+            _job_overhead(api, job_manifest, f"overhead-{run}", interval)
+            for run in range(runs)
+        ]
+    )
+    running = [
+        pod
+        for pod in await api.list_pods(namespace, labels)
+        if pod["status"].get("phase") == "Running"
+    ]
+    runner_overhead = 0.0
+    if not running:
+        start = loop.time()
+        await api.apply(runner_manifest)
+        await wait_for_running_pods(api, namespace, labels, interval=interval)
+        runner_overhead = loop.time() - start
+    return (
+        OverheadReport("job-per-run", runs, runs, sum(job_overheads)),
+        OverheadReport("colocated", runs, 0 if running else 1, runner_overhead),
+    )
@@ -0,0 +1,75 @@
+"""Global concurrency limit implementation."""
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import httpx
+from prefect.exceptions import ObjectAlreadyExists
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.client import get_client
+
+logger = getLogger(__name__)
+
+# the prefect client does not wrap the v2 concurrency limit routes yet
+CONCURRENCY_LIMITS_ROUTE = "/v2/concurrency_limits"
+
+
+class ConcurrencyLimit(BaseModel):
+    """Global concurrency limit."""
+
+    id: Optional[UUID] = Field(
+        default=None, description="The id of the concurrency limit, once created."
+    )
+    name: str = Field(description="The name of the concurrency limit.")
+    limit: int = Field(description="The number of slots of the limit.", ge=0)
+    active: bool = Field(
+        default=True, description="Whether the concurrency limit is enforced."
+    )
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> "ConcurrencyLimit":
+        """Create a concurrency limit from an API response."""
+        return cls.parse_obj(data)
+
+    @staticmethod
+    async def read_page(offset: int, limit: int) -> List["ConcurrencyLimit"]:
+        """Read a page of the concurrency limits of the workspace."""
+        async with get_client() as client:
+            response = await client._client.post(
+                f"{CONCURRENCY_LIMITS_ROUTE}/filter",
+                json={"offset": offset, "limit": limit},
+            )
+        return [ConcurrencyLimit.from_response(data) for data in response.json()]
+
+    @sync_compatible
+    async def create(self) -> None:
+        try:
+            async with get_client() as client:
+                response = await client._client.post(
+                    f"{CONCURRENCY_LIMITS_ROUTE}/",
+                    json={
+                        "name": self.name,
+                        "limit": self.limit,
+                        "active": self.active,
+                    },
+                )
+                self.id = response.json()["id"]
+                logger.debug(f"Created concurrency limit {self.name}")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == httpx.codes.CONFLICT:
+                raise ObjectAlreadyExists(http_exc=e) from e
+            logger.exception(
+                f"Failed to create concurrency limit {self.name}", exc_info=True
+            )
+            raise e
+
+    @sync_compatible
+    async def update(self) -> None:
+        async with get_client() as client:
+            await client._client.patch(
+                f"{CONCURRENCY_LIMITS_ROUTE}/{self.id or self.name}",
+                json={"limit": self.limit, "active": self.active},
+            )
+        logger.debug(f"Updated concurrency limit {self.name} to {self.limit}")
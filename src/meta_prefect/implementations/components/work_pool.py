@@ -2,12 +2,13 @@
 from logging import getLogger
 from typing import Any, Dict, Optional
 
-from prefect import get_client
-from prefect.client.schemas.actions import WorkPoolCreate
+from prefect.client.schemas.actions import WorkPoolCreate, WorkPoolUpdate
 from prefect.client.schemas.objects import WorkPool as ClientWorkPool
 from prefect.utilities.asyncutils import sync_compatible
 from pydantic import BaseModel, Field
 
+from meta_prefect.implementations.client import get_client
+
 logger = getLogger(__name__)
 
 
@@ -54,3 +55,16 @@ class WorkPool(BaseModel):
         except Exception as e:
             logger.exception(f"Failed to create work pool {self.name}", exc_info=True)
             raise e
+
+    @sync_compatible
+    async def update(self) -> None:
+        """Update the work pool's description, template, pause and limit."""
+        wp = WorkPoolUpdate(
+            description=self.description,
+            base_job_template=self.base_job_template,
+            is_paused=self.is_paused,
+            concurrency_limit=self.concurrency_limit,
+        )
+        async with get_client() as client:
+            await client.update_work_pool(self.name, wp)
+            logger.debug(f"Updated work pool {self.name}")
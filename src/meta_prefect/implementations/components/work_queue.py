@@ -1,18 +1,24 @@
 """Work queue implementation."""
 from logging import getLogger
 from typing import Optional
+from uuid import UUID
 
-from prefect import get_client
 from prefect.client.schemas.objects import WorkQueue as ClientWorkQueue
+from prefect.exceptions import ObjectAlreadyExists
 from prefect.utilities.asyncutils import sync_compatible
 from pydantic import BaseModel, Field
 
+from meta_prefect.implementations.client import get_client
+
 logger = getLogger(__name__)
 
 
 class WorkQueue(BaseModel):
     """Work queue."""
 
+    id: Optional[UUID] = Field(
+        default=None, description="The id of the work queue, once created."
+    )
     name: str = Field(default=..., description="The name of the work queue.")
     description: Optional[str] = Field(
         default="", description="An optional description for the work queue."
@@ -52,6 +58,9 @@ class WorkQueue(BaseModel):
                     work_pool_name=self.work_pool_name,
                 )
                 logger.debug(f"Created work queue {work_queue.name}")
+                self.id = work_queue.id
+        except ObjectAlreadyExists:
+            raise
         except Exception as e:
             logger.exception(f"Failed to create work queue {self.name}", exc_info=True)
             raise e
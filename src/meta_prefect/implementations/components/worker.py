@@ -1,21 +1,24 @@
 """Worker implementation."""
-import subprocess
-import uuid
 from logging import getLogger
 
 from prefect.client.schemas.objects import Worker as ClientWorker
 from prefect.utilities.asyncutils import sync_compatible
 from pydantic import BaseModel, Field
 
-from meta_prefect.implementations.utils import get_machine_id
+from meta_prefect.implementations.client import get_workspace_key
+from meta_prefect.implementations.supervisor import (
+    ensure_supervisor,
+    PoolRegistration,
+    SupervisorHome,
+    worker_name,
+)
 
 logger = getLogger(__name__)
 
 
 def gen_worker_name() -> str:
-    """Generate a worker name."""
-    uuid_str = str(uuid.uuid4())[:4]
-    return f"ProcessWorker -- {get_machine_id()} -- {uuid_str}"
+    """Generate the name of the first worker the supervisor keeps running."""
+    return worker_name(0)
 
 
 class ProcessWorker(BaseModel):
@@ -33,15 +36,11 @@ class ProcessWorker(BaseModel):
 
     @sync_compatible
     async def create(self) -> None:
-        subprocess.Popen(
-            [
-                "nohup",
-                "prefect",
-                "worker",
-                "start",
-                "--name",
-                self.name,
-                "--pool",
-                self.work_pool_name,
-            ]
-        )
+        """Have the worker supervisor of the machine keep workers polling the pool.
+
+        The supervisor is started in the background if it is not running yet.
+        """
+        home = SupervisorHome.default()
+        home.register(PoolRegistration(self.work_pool_name, get_workspace_key()))
+        pid = ensure_supervisor(home)
+        logger.info(f"Registered {self.work_pool_name} with the supervisor {pid}.")
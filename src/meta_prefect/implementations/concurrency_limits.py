@@ -0,0 +1,132 @@
+"""Per-deployment and per-tag concurrency through global concurrency limits.
+
+Limiting a deployment by sending it to a limit-1 work queue serializes every
+deployment sharing that queue. Instead, each limited deployment is tagged with
+the names of the global concurrency limits it takes a slot of, e.g.
+`concurrency=deployment:my-flow:run-prod`, and its entrypoint is wrapped so that
+a flow run holds a slot of each of these limits while it runs. Unrelated
+deployments then run in parallel while each is still held to its own limit.
+"""
+import asyncio
+import functools
+from logging import getLogger
+from typing import Any, Callable, Iterable, List, Mapping
+
+from prefect.context import FlowRunContext
+from prefect.exceptions import ObjectAlreadyExists
+from prefect.flows import Flow
+from prefect.utilities.asyncutils import is_async_fn
+
+from meta_prefect.implementations.components.concurrency_limit import ConcurrencyLimit
+from meta_prefect.implementations.index import get_concurrency_limit_index
+
+logger = getLogger(__name__)
+
+LIMIT_TAG_PREFIX = "concurrency="
+LIMITED_ENTRYPOINT_MODULE = "meta_prefect.implementations.limited_entrypoint"
+
+
+def deployment_limit_name(owner: str) -> str:
+    """Get the name of the concurrency limit of a deployment, e.g. `flow/name`."""
+    # slashes are not allowed in limit names
+    return "deployment:" + owner.replace("/", ":")
+
+
+def limit_tag(name: str) -> str:
+    """Get the tag making a deployment's runs take a slot of a limit."""
+    return f"{LIMIT_TAG_PREFIX}{name}"
+
+
+def limit_names(tags: Iterable[str]) -> List[str]:
+    """Get the names of the concurrency limits a run with some tags is held to."""
+    return sorted(
+        {
+            tag[len(LIMIT_TAG_PREFIX) :]
+            for tag in tags
+            if tag.startswith(LIMIT_TAG_PREFIX)
+        }
+    )
+
+
+def limited_entrypoint(entrypoint: str) -> str:
+    """Get the entrypoint loading the flow of an entrypoint with its limits applied.
+
+    Prefect entrypoints hold a single colon, so the original one is kept with
+    `@` in place of its colon.
+    """
+    if entrypoint.startswith(f"{LIMITED_ENTRYPOINT_MODULE}:"):
+        return entrypoint
+    path, separator, name = entrypoint.rpartition(":")
+    if not separator or ":" in path:
+        raise ValueError(f"Cannot limit the concurrency of entrypoint {entrypoint!r}.")
+    return f"{LIMITED_ENTRYPOINT_MODULE}:{path}@{name}"
+
+
+async def ensure_concurrency_limits(
+    limits: Mapping[str, int]
+) -> List[ConcurrencyLimit]:
+    """Create the missing concurrency limits and update the changed ones.
+
+    Existing limits are looked up in the index, loaded once per workspace, and
+    the missing or changed ones are written concurrently.
+    """
+    index = await get_concurrency_limit_index()
+
+    async def ensure(name: str, limit: int) -> ConcurrencyLimit:
+        concurrency_limit = index.get(name)
+        if concurrency_limit is None:
+            concurrency_limit = ConcurrencyLimit(name=name, limit=limit)
+            try:
+                await concurrency_limit.create()
+            except ObjectAlreadyExists:
+                # created concurrently, e.g. by a deploy to another profile
+                await concurrency_limit.update()
+        elif concurrency_limit.limit != limit or not concurrency_limit.active:
+            concurrency_limit = concurrency_limit.copy(
+                update={"limit": limit, "active": True}
+            )
+            await concurrency_limit.update()
+        index.add(concurrency_limit)
+        return concurrency_limit
+
+    return list(
+        await asyncio.gather(*[ensure(name, limit) for name, limit in limits.items()])
+    )
+
+
+def _run_limit_names() -> List[str]:
+    context = FlowRunContext.get()
+    if context is None:
+        return []
+    return limit_names(context.flow_run.tags)
+
+
+def apply_concurrency_limits(flow: Flow) -> Flow:
+    """Make the runs of a flow hold a slot of the limits named by their tags."""
+    from prefect.concurrency.asyncio import concurrency as async_concurrency
+    from prefect.concurrency.sync import concurrency
+
+    fn: Callable[..., Any] = flow.fn
+    if is_async_fn(fn):
+
+        @functools.wraps(fn)
+        async def limited_fn(*args: Any, **kwargs: Any) -> Any:
+            names = _run_limit_names()
+            if not names:
+                return await fn(*args, **kwargs)
+            async with async_concurrency(names):
+                return await fn(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(fn)
+        def limited_fn(*args: Any, **kwargs: Any) -> Any:
+            names = _run_limit_names()
+            if not names:
+                return fn(*args, **kwargs)
+            with concurrency(names):
+                return fn(*args, **kwargs)
+
+    limited = flow.with_options()
+    limited.fn = limited_fn
+    return limited
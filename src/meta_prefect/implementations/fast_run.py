@@ -0,0 +1,212 @@
+"""Runs of local deployments started right away, without a worker.
+
+A run of a `local_run_deployer` deployment is scheduled through the API, then
+waits for a worker polling its work queue to pick it up, which takes seconds.
+Instead, `meta-prefect run <flow> --local` builds the deployment from the
+flow's recipe, creates a run of it in the API, so that it is kept in the
+deployment's history, and runs it right away:
+
+* in-process, with the flow object already imported, the run's environment
+  rendered from the work pool's job template and the deployment's infra
+  overrides as a worker would;
+* or isolated, in a subprocess forked from a zygote which preloaded the flow
+  (see `meta_prefect.implementations.warm_worker`), where its resource limits
+  apply too.
+
+Prefect reports the states of the run and of its tasks to the API as it goes.
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+import threading
+from logging import getLogger
+from typing import Any, cast, Dict, Iterator, Mapping, Optional, Tuple, TYPE_CHECKING
+
+from prefect.client.schemas.objects import FlowRun
+from prefect.exceptions import ObjectNotFound
+from prefect.flows import Flow
+from prefect.states import Pending, State
+from prefect.workers.process import ProcessJobConfiguration
+
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.concurrency_limits import (
+    apply_concurrency_limits,
+    LIMITED_ENTRYPOINT_MODULE,
+)
+
+if TYPE_CHECKING:
+    from meta_prefect.interface import Deployment
+
+logger = getLogger(__name__)
+
+
+async def render_job_configuration(
+    deployment: "Deployment", flow_run: FlowRun
+) -> ProcessJobConfiguration:
+    """Render the job configuration a worker of the deployment's pool would."""
+    base_job_template: Dict[str, Any] = {}
+    if deployment.work_pool_name:
+        async with get_client() as client:
+            work_pool = await client.read_work_pool(deployment.work_pool_name)
+        base_job_template = work_pool.base_job_template
+    configuration: ProcessJobConfiguration
+    if base_job_template:
+        configuration = await ProcessJobConfiguration.from_template_and_values(
+            base_job_template, deployment.infra_overrides or {}
+        )
+    else:
+        configuration = ProcessJobConfiguration()
+    configuration.prepare_for_flow_run(flow_run)
+    return configuration
+
+
+async def create_flow_run(
+    flow: Flow[..., Any],
+    deployment: "Deployment",
+    parameters: Mapping[str, Any],
+    deployed_only: bool = False,
+) -> FlowRun:
+    """Create a pending run of the deployment, or of the flow if not deployed."""
+    parameters = {**(deployment.parameters or {}), **parameters}
+    async with get_client() as client:
+        try:
+            deployment_id = (
+                await client.read_deployment_by_name(
+                    f"{deployment.flow_name}/{deployment.name}"
+                )
+            ).id
+        except ObjectNotFound:
+            if deployed_only:
+                raise ValueError(
+                    f"{deployment.flow_name}/{deployment.name} is not deployed."
+                )
+            logger.warning(
+                f"{deployment.flow_name}/{deployment.name} is not deployed, "
+                "its run is not linked to it."
+            )
+            return await client.create_flow_run(
+                flow, parameters=parameters, tags=deployment.tags, state=Pending()
+            )
+        # a pending run is not picked up by workers, which poll scheduled runs
+        return await client.create_flow_run_from_deployment(
+            deployment_id, parameters=parameters, state=Pending()
+        )
+
+
+@contextlib.contextmanager
+def _environment(env: Mapping[str, Optional[str]]) -> Iterator[None]:
+    previous = dict(os.environ)
+    os.environ.update({key: str(value) for key, value in env.items() if value})
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(previous)
+
+
+async def _begin_flow_run(
+    flow: Flow[..., Any], flow_run_id: Any, user_thread: threading.Thread
+) -> State[Any]:
+    from prefect.engine import begin_flow_run
+    from prefect.utilities.callables import get_parameter_defaults
+
+    async with get_client() as client:
+        flow_run = await client.read_flow_run(flow_run_id)
+        parameters = (
+            flow.validate_parameters(flow_run.parameters)
+            if flow.should_validate_parameters
+            else flow_run.parameters
+        )
+        return await begin_flow_run(
+            flow=flow,
+            flow_run=flow_run,
+            parameters={**get_parameter_defaults(flow.fn), **parameters},
+            client=client,
+            user_thread=user_thread,
+        )
+
+
+def run_in_process(
+    flow: Flow[..., Any], flow_run: FlowRun, configuration: ProcessJobConfiguration
+) -> State[Any]:
+    """Run a pending flow run in this process, as the engine of a worker's would."""
+    from prefect._internal.concurrency.api import create_call, from_sync
+    from prefect.logging.configuration import setup_logging
+
+    setup_logging()
+    with _environment(configuration.env):
+        # the call's coroutine is awaited in the loop thread, its state returned
+        return cast(
+            State[Any],
+            from_sync.wait_for_call_in_loop_thread(
+                create_call(
+                    _begin_flow_run,
+                    flow=flow,
+                    flow_run_id=flow_run.id,
+                    user_thread=threading.current_thread(),
+                )
+            ),
+        )
+
+
+async def run_isolated(
+    deployment: "Deployment", configuration: ProcessJobConfiguration
+) -> int:
+    """Run a pending flow run in a process forked from a zygote, get its exit code."""
+    from meta_prefect.implementations.warm_worker import preload_targets, WarmPool
+
+    pool = WarmPool(recycle_after=1)
+    for target in preload_targets(deployment.entrypoint):
+        pool.learn(target, deployment.path)
+    try:
+        with tempfile.TemporaryDirectory(suffix="prefect") as working_dir:
+            _, returncode = await pool.run(
+                {key: str(value) for key, value in configuration.env.items()},
+                str(configuration.working_dir or working_dir),
+                configuration.stream_output,
+            )
+            return await returncode
+    finally:
+        await pool.close()
+
+
+def run_locally(
+    flow: Flow[..., Any],
+    deployment: "Deployment",
+    parameters: Optional[Mapping[str, Any]] = None,
+    isolated: bool = False,
+) -> State[Any]:
+    """Run a deployment's flow now, on this machine, and get the run's final state.
+
+    Args:
+        flow: the flow of the deployment, as built by its recipe.
+        deployment: the deployment built from the flow.
+        parameters: parameters overriding the deployment's.
+        isolated: if True, run the flow in a warm subprocess instead of this one.
+    """
+    if (deployment.entrypoint or "").startswith(f"{LIMITED_ENTRYPOINT_MODULE}:"):
+        # the deployment's runs hold its concurrency limits, and so does this one
+        flow = apply_concurrency_limits(flow)
+
+    async def prepare() -> Tuple[FlowRun, ProcessJobConfiguration]:
+        # runs started from a zygote load their flow from the deployment
+        flow_run = await create_flow_run(
+            flow, deployment, parameters or {}, deployed_only=isolated
+        )
+        return flow_run, await render_job_configuration(deployment, flow_run)
+
+    flow_run, configuration = asyncio.run(prepare())
+    logger.info(f"Running {flow_run.name!r} of {deployment.name} locally...")
+    if not isolated:
+        return run_in_process(flow, flow_run, configuration)
+
+    async def run_then_read_state() -> State[Any]:
+        await run_isolated(deployment, configuration)
+        async with get_client() as client:
+            state = (await client.read_flow_run(flow_run.id)).state
+        if state is None:
+            raise RuntimeError(f"{flow_run.name!r} has no state.")
+        return state
+
+    return asyncio.run(run_then_read_state())
@@ -0,0 +1,334 @@
+"""A request governor shared by every client call made by builders and actions.
+
+The governor sits at the httpx transport level of the prefect client and
+provides:
+
+- token-bucket rate limiting shared by all concurrent requests to an API
+- retries honoring `Retry-After` on 429 responses
+- jittered exponential backoff for idempotent reads failing with 5xx or
+  transport errors
+- a circuit breaker that fails fast once errors are sustained
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+from pydantic import BaseSettings, Field
+
+logger = getLogger(__name__)
+
+RETRYABLE_READ_STATUS_CODES = frozenset({500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# prefect reads use POST with a filter body
+IDEMPOTENT_POST_SUFFIXES = ("/filter", "/count", "/history")
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+class GovernorSettings(BaseSettings):
+    """Settings of the request governor."""
+
+    rate: float = Field(
+        default=20.0, gt=0, description="Sustained requests per second."
+    )
+    burst: int = Field(
+        default=40, ge=1, description="Requests that can be sent in a burst."
+    )
+    max_attempts: int = Field(
+        default=5, ge=1, description="Attempts per request, including the first."
+    )
+    backoff_base: float = Field(
+        default=0.5, ge=0, description="Base delay of the exponential backoff."
+    )
+    backoff_max: float = Field(
+        default=30.0, ge=0, description="Maximum delay between two attempts."
+    )
+    failure_threshold: int = Field(
+        default=10,
+        ge=1,
+        description="Consecutive failures after which the circuit opens.",
+    )
+    reset_timeout: float = Field(
+        default=30.0,
+        ge=0,
+        description="Seconds the circuit stays open before letting a probe through.",
+    )
+
+    class Config:
+        env_prefix = "META_PREFECT__GOVERNOR_"
+
+
+class TokenBucket:
+    """An async token bucket."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # locks are bound to the loop they are first used in, while the bucket
+        # outlives event loops started by `sync_compatible` calls
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def pause_until(self, deadline: float) -> None:
+        """Hold every request until the deadline, e.g. following a 429."""
+        self._paused_until = max(self._paused_until, deadline)
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._get_lock():
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await self._sleep(self._paused_until - now)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self._sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """A consecutive-failure circuit breaker."""
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are currently rejected."""
+        if self._opened_at is None:
+            return False
+        return self._probing or (self._clock() - self._opened_at < self.reset_timeout)
+
+    def before_request(self) -> None:
+        """Reject the request if the circuit is open, or let a probe through."""
+        if self._opened_at is None:
+            return
+        if self.is_open:
+            raise CircuitOpenError(
+                f"Circuit open after {self._failures} consecutive failures."
+            )
+        # half-open, this request is the probe
+        self._probing = True
+
+    def record_success(self) -> None:
+        """Close the circuit."""
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit once the threshold is reached."""
+        self._failures += 1
+        self._probing = False
+        if self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(
+                    f"Opening circuit after {self._failures} consecutive failures."
+                )
+            self._opened_at = self._clock()
+
+
+def is_idempotent(request: httpx.Request) -> bool:
+    """Whether a request can safely be sent more than once."""
+    if request.method in IDEMPOTENT_METHODS:
+        return True
+    return request.method == "POST" and request.url.path.endswith(
+        IDEMPOTENT_POST_SUFFIXES
+    )
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Get the seconds to wait from a `Retry-After` header, if any."""
+    value: Optional[str] = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RequestGovernor:
+    """Rate limits, retries and circuit-breaks requests sent to one API."""
+
+    def __init__(
+        self,
+        settings: Optional[GovernorSettings] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.settings = settings or GovernorSettings()
+        self._clock = clock
+        self._sleep = sleep
+        self.bucket = TokenBucket(
+            rate=self.settings.rate,
+            capacity=self.settings.burst,
+            clock=clock,
+            sleep=sleep,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.settings.failure_threshold,
+            reset_timeout=self.settings.reset_timeout,
+            clock=clock,
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter
+        ceiling = min(
+            self.settings.backoff_max, self.settings.backoff_base * 2**attempt
+        )
+        return random.uniform(0, ceiling)
+
+    async def send(
+        self,
+        request: httpx.Request,
+        send: Callable[[httpx.Request], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """Send a request through the governor."""
+        idempotent = is_idempotent(request)
+        # make the body replayable
+        await request.aread()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_request()
+            await self.bucket.acquire()
+            is_last_attempt = attempt >= self.settings.max_attempts
+
+            try:
+                response = await send(request)
+            except httpx.TransportError:
+                self.breaker.record_failure()
+                if not idempotent or is_last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+                logger.debug(f"Retrying {request.method} {request.url} in {delay}s")
+                await self._sleep(delay)
+                continue
+
+            if response.status_code == 429:
+                # rejected before being processed, safe to retry any method
+                retry_after = parse_retry_after(response)
+                delay = (
+                    retry_after if retry_after is not None else self._backoff(attempt)
+                )
+                self.bucket.pause_until(self._clock() + delay)
+                if is_last_attempt:
+                    return response
+                await response.aclose()
+                logger.debug(f"Rate limited on {request.url}, waiting {delay}s")
+                continue
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                if (
+                    not idempotent
+                    or is_last_attempt
+                    or response.status_code not in RETRYABLE_READ_STATUS_CODES
+                ):
+                    return response
+                retry_after = parse_retry_after(response)
+                delay = (
+                    retry_after if retry_after is not None else self._backoff(attempt)
+                )
+                await response.aclose()
+                logger.debug(f"Retrying {request.method} {request.url} in {delay}s")
+                await self._sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return response
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """An httpx transport sending every request through a governor."""
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, governor: RequestGovernor
+    ) -> None:
+        self.transport = transport
+        self.governor = governor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.governor.send(request, self.transport.handle_async_request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_governors: Dict[str, RequestGovernor] = {}
+
+
+def get_governor(api_url: str) -> RequestGovernor:
+    """Get the governor shared by all requests to an API."""
+    if api_url not in _governors:
+        _governors[api_url] = RequestGovernor()
+    return _governors[api_url]
+
+
+def govern_client(client: httpx.AsyncClient, governor: RequestGovernor) -> None:
+    """Route every transport of an httpx client through a governor."""
+    # httpx has no public API to wrap the transports of an instantiated client
+    # without losing its proxy configuration, see prefect.client.orchestration
+    transport = getattr(client, "_transport", None)
+    if isinstance(transport, httpx.AsyncBaseTransport) and not isinstance(
+        transport, GovernedTransport
+    ):
+        client._transport = GovernedTransport(transport, governor)
+
+    mounts = getattr(client, "_mounts", None)
+    if isinstance(mounts, dict):
+        for pattern, mounted in mounts.items():
+            if isinstance(mounted, httpx.AsyncBaseTransport) and not isinstance(
+                mounted, GovernedTransport
+            ):
+                mounts[pattern] = GovernedTransport(mounted, governor)
@@ -0,0 +1,265 @@
+"""In-memory indexes of work pools, work queues and concurrency limits.
+
+Lookups made by builders and actions used to read every work pool (or every
+queue of a pool) and scan the result for each lookup. Indexes are instead loaded
+once per workspace, from the state mirror when one is active or else with
+server-side filtered, paginated queries, and then answer lookups from memory.
+"""
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from prefect._internal.schemas.fields import DateTimeTZ
+from prefect.client.schemas.filters import (
+    WorkerFilter,
+    WorkerFilterLastHeartbeatTime,
+    WorkPoolFilter,
+    WorkPoolFilterType,
+)
+
+from meta_prefect.implementations.client import (
+    get_client,
+    get_workspace_key,
+    read_pages,
+)
+from meta_prefect.implementations.components.concurrency_limit import ConcurrencyLimit
+from meta_prefect.implementations.components.work_pool import WorkPool
+from meta_prefect.implementations.components.work_queue import WorkQueue
+from meta_prefect.implementations.components.worker import ProcessWorker
+from meta_prefect.implementations.mirror import get_mirror, LIVE_WORKER_WINDOW
+
+ENV_TEMPLATE_KEY = "META_PREFECT__ENV"
+
+K = TypeVar("K", bound=Hashable)
+
+
+def template_env_key(work_pool: WorkPool) -> Optional[str]:
+    """Get the env value templated into a work pool's base job configuration."""
+    job_configuration = work_pool.base_job_template.get("job_configuration") or {}
+    env = job_configuration.get("env") or {}
+    if not isinstance(env, dict):
+        return None
+    return env.get(ENV_TEMPLATE_KEY)
+
+
+class _Index(Generic[K]):
+    def __init__(self) -> None:
+        self._by_key: Dict[K, List[str]] = {}
+
+    def _add(self, key: K, name: str) -> None:
+        names = self._by_key.setdefault(key, [])
+        if name not in names:
+            names.append(name)
+
+    def _remove(self, key: K, name: str) -> None:
+        names = self._by_key.get(key, [])
+        if name in names:
+            names.remove(name)
+
+
+class WorkPoolIndex(_Index[Optional[str]]):
+    """Work pools of a type indexed by name and by the env key of their template."""
+
+    def __init__(self, work_pool_type: str) -> None:
+        super().__init__()
+        self.work_pool_type = work_pool_type
+        self._by_name: Dict[str, WorkPool] = {}
+
+    @classmethod
+    async def load(cls, work_pool_type: str) -> "WorkPoolIndex":
+        """Load the work pools of a type."""
+        mirror = get_mirror()
+        if mirror is not None:
+            work_pools = await mirror.work_pools(work_pool_type)
+        else:
+            work_pool_filter = WorkPoolFilter(
+                type=WorkPoolFilterType(any_=[work_pool_type])
+            )
+            async with get_client() as client:
+                work_pools = await read_pages(
+                    lambda offset, limit: client.read_work_pools(
+                        limit=limit, offset=offset, work_pool_filter=work_pool_filter
+                    )
+                )
+        index = cls(work_pool_type)
+        for work_pool in work_pools:
+            index.add(WorkPool.from_client_workpool(work_pool))
+        return index
+
+    def add(self, work_pool: WorkPool) -> None:
+        """Add or replace a work pool."""
+        if work_pool.type != self.work_pool_type:
+            return
+        existing = self._by_name.get(work_pool.name)
+        if existing is not None:
+            self._remove(template_env_key(existing), existing.name)
+        self._by_name[work_pool.name] = work_pool
+        self._add(template_env_key(work_pool), work_pool.name)
+
+    def get(self, name: str) -> Optional[WorkPool]:
+        """Get a work pool by name."""
+        return self._by_name.get(name)
+
+    def first(self) -> Optional[WorkPool]:
+        """Get the first indexed work pool."""
+        return next(iter(self._by_name.values()), None)
+
+    def all(self) -> List[WorkPool]:
+        """Get all indexed work pools."""
+        return list(self._by_name.values())
+
+    def first_with_env_key(self, env_key: Optional[str]) -> Optional[WorkPool]:
+        """Get the first work pool whose template sets the env to `env_key`."""
+        names = self._by_key.get(env_key)
+        return self._by_name[names[0]] if names else None
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+
+class WorkQueueIndex(_Index[Optional[int]]):
+    """The queues of a work pool indexed by name and by concurrency limit."""
+
+    def __init__(self, work_pool_name: str) -> None:
+        super().__init__()
+        self.work_pool_name = work_pool_name
+        self._by_name: Dict[str, WorkQueue] = {}
+
+    @classmethod
+    async def load(cls, work_pool_name: str) -> "WorkQueueIndex":
+        """Load the queues of a work pool."""
+        mirror = get_mirror()
+        if mirror is not None:
+            work_queues = await mirror.work_queues(work_pool_name)
+        else:
+            async with get_client() as client:
+                work_queues = await read_pages(
+                    lambda offset, limit: client.read_work_queues(
+                        work_pool_name=work_pool_name, limit=limit, offset=offset
+                    )
+                )
+        index = cls(work_pool_name)
+        for work_queue in work_queues:
+            index.add(WorkQueue.from_client_workqueue(work_queue))
+        return index
+
+    def add(self, work_queue: WorkQueue) -> None:
+        """Add or replace a work queue."""
+        existing = self._by_name.get(work_queue.name)
+        if existing is not None:
+            self._remove(existing.concurrency_limit, existing.name)
+        self._by_name[work_queue.name] = work_queue
+        self._add(work_queue.concurrency_limit, work_queue.name)
+
+    def remove(self, name: str) -> None:
+        """Remove a work queue."""
+        existing = self._by_name.pop(name, None)
+        if existing is not None:
+            self._remove(existing.concurrency_limit, existing.name)
+
+    def get(self, name: str) -> Optional[WorkQueue]:
+        """Get a work queue by name."""
+        return self._by_name.get(name)
+
+    def first_with_concurrency_limit(
+        self, concurrency_limit: Optional[int]
+    ) -> Optional[WorkQueue]:
+        """Get the first work queue with a given concurrency limit."""
+        names = self._by_key.get(concurrency_limit)
+        return self._by_name[names[0]] if names else None
+
+    def all(self) -> List[WorkQueue]:
+        """Get all indexed work queues."""
+        return list(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+
+class ConcurrencyLimitIndex:
+    """The global concurrency limits of a workspace indexed by name."""
+
+    def __init__(self) -> None:
+        self._by_name: Dict[str, ConcurrencyLimit] = {}
+
+    @classmethod
+    async def load(cls) -> "ConcurrencyLimitIndex":
+        """Load the concurrency limits of the workspace."""
+        index = cls()
+        for concurrency_limit in await read_pages(ConcurrencyLimit.read_page):
+            index.add(concurrency_limit)
+        return index
+
+    def add(self, concurrency_limit: ConcurrencyLimit) -> None:
+        """Add or replace a concurrency limit."""
+        self._by_name[concurrency_limit.name] = concurrency_limit
+
+    def get(self, name: str) -> Optional[ConcurrencyLimit]:
+        """Get a concurrency limit by name."""
+        return self._by_name.get(name)
+
+    def all(self) -> List[ConcurrencyLimit]:
+        """Get all indexed concurrency limits."""
+        return list(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+
+async def read_live_workers(work_pool_name: str) -> List[ProcessWorker]:
+    """Read the workers of a work pool that recently sent a heartbeat."""
+    mirror = get_mirror()
+    if mirror is not None:
+        workers = await mirror.live_workers(work_pool_name)
+    else:
+        worker_filter = WorkerFilter(
+            last_heartbeat_time=WorkerFilterLastHeartbeatTime(
+                after_=DateTimeTZ.now() - LIVE_WORKER_WINDOW
+            )
+        )
+        async with get_client() as client:
+            workers = await read_pages(
+                lambda offset, limit: client.read_workers_for_work_pool(
+                    work_pool_name=work_pool_name,
+                    worker_filter=worker_filter,
+                    offset=offset,
+                    limit=limit,
+                )
+            )
+    return [
+        ProcessWorker.from_client_worker(worker, work_pool_name) for worker in workers
+    ]
+
+
+_work_pool_indexes: Dict[Tuple[str, str], WorkPoolIndex] = {}
+_work_queue_indexes: Dict[Tuple[str, str], WorkQueueIndex] = {}
+_concurrency_limit_indexes: Dict[str, ConcurrencyLimitIndex] = {}
+
+
+async def get_work_pool_index(work_pool_type: str) -> WorkPoolIndex:
+    """Get the work pool index of a type for the current workspace."""
+    key = (get_workspace_key(), work_pool_type)
+    if key not in _work_pool_indexes:
+        _work_pool_indexes[key] = await WorkPoolIndex.load(work_pool_type)
+    return _work_pool_indexes[key]
+
+
+async def get_work_queue_index(work_pool_name: str) -> WorkQueueIndex:
+    """Get the queue index of a work pool for the current workspace."""
+    key = (get_workspace_key(), work_pool_name)
+    if key not in _work_queue_indexes:
+        _work_queue_indexes[key] = await WorkQueueIndex.load(work_pool_name)
+    return _work_queue_indexes[key]
+
+
+async def get_concurrency_limit_index() -> ConcurrencyLimitIndex:
+    """Get the concurrency limit index of the current workspace."""
+    key = get_workspace_key()
+    if key not in _concurrency_limit_indexes:
+        _concurrency_limit_indexes[key] = await ConcurrencyLimitIndex.load()
+    return _concurrency_limit_indexes[key]
+
+
+def invalidate_indexes() -> None:
+    """Forget every loaded index, e.g. in long running processes."""
+    _work_pool_indexes.clear()
+    _work_queue_indexes.clear()
+    _concurrency_limit_indexes.clear()
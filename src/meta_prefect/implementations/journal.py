@@ -0,0 +1,199 @@
+"""A local journal of deploy progress used to resume partially failed deploys."""
+import hashlib
+import inspect
+from datetime import datetime, timezone
+from enum import Enum
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import BaseModel, Field
+
+from meta_prefect.interface import DeployableFlow
+
+logger = getLogger(__name__)
+
+JOURNAL_DIR = ".meta_prefect"
+JOURNAL_FILE = "deploy_journal.jsonl"
+
+
+class DeployPhase(str, Enum):
+    """Phases a deployment goes through during a deploy."""
+
+    ACTIONS_DONE = "actions_done"
+    BUILT = "built"
+    APPLIED = "applied"
+    POST_UPDATED = "post_updated"
+
+
+class JournalRecord(BaseModel):
+    """A single line of the journal, recording one completed phase."""
+
+    key: str
+    fingerprint: str
+    phase: DeployPhase
+    deployment_name: Optional[str] = None
+    at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class JournalEntry(BaseModel):
+    """The replayed state of a single deployment."""
+
+    fingerprint: str
+    phases: Set[DeployPhase] = Field(default_factory=set)
+    deployment_name: Optional[str] = None
+
+
+def _describe_builder(builder: Any) -> str:
+    if isinstance(builder, BaseModel):
+        try:
+            return f"{type(builder).__qualname__}:{builder.json(sort_keys=True)}"
+        except TypeError:
+            pass
+    return f"{type(builder).__qualname__}:{builder!r}"
+
+
+def fingerprint_deployable_flow(flow: DeployableFlow) -> str:
+    """Fingerprint the inputs that determine the deployment built from a flow.
+
+    The fingerprint covers the flow name, the source file of the flow function
+    and the configuration of every deployment builder.
+    """
+    digest = hashlib.sha256()
+    digest.update(flow.name.encode())
+    try:
+        source_file = inspect.getsourcefile(flow.fn)
+    except TypeError:
+        source_file = None
+    if source_file is not None and Path(source_file).exists():
+        digest.update(Path(source_file).read_bytes())
+    for builder in flow.deployment_builders:
+        digest.update(_describe_builder(builder).encode())
+    return digest.hexdigest()
+
+
+def journal_key(workspace: str, flow_name: str, index: int) -> str:
+    """Build the journal key of the index-th deployable flow of a flow name."""
+    return f"{workspace}::{flow_name}::{index}"
+
+
+class DeployJournal:
+    """An append-only journal of completed deploy phases per deployment.
+
+    Every completed phase is appended as a JSON line so progress survives a
+    crash mid-deploy. Replaying the lines yields the last known state of every
+    deployment; a record with a new fingerprint resets the state of its key.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._entries: Dict[str, JournalEntry] = {}
+
+    @classmethod
+    def for_project(cls, project_path: str) -> "DeployJournal":
+        """Get the journal of a project directory."""
+        return cls(Path(project_path) / JOURNAL_DIR / JOURNAL_FILE)
+
+    def load(self) -> None:
+        """Replay the journal file."""
+        self._entries = {}
+        if not self.path.exists():
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = JournalRecord.parse_raw(line)
+                except ValueError:
+                    # a torn write from a crash, everything before it is valid
+                    logger.warning(f"Ignoring corrupt journal line in {self.path}")
+                    continue
+                self._apply(record)
+
+    def reset(self) -> None:
+        """Forget all progress and truncate the journal file."""
+        self._entries = {}
+        if self.path.exists():
+            self.path.unlink()
+
+    def compact(self) -> None:
+        """Rewrite the journal file with one record per known phase."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            for key, entry in self._entries.items():
+                for phase in DeployPhase:
+                    if phase in entry.phases:
+                        record = JournalRecord(
+                            key=key,
+                            fingerprint=entry.fingerprint,
+                            phase=phase,
+                            deployment_name=entry.deployment_name,
+                        )
+                        f.write(record.json() + "\n")
+        tmp_path.replace(self.path)
+
+    def _apply(self, record: JournalRecord) -> None:
+        entry = self._entries.get(record.key)
+        if entry is None or entry.fingerprint != record.fingerprint:
+            entry = JournalEntry(fingerprint=record.fingerprint)
+            self._entries[record.key] = entry
+        entry.phases.add(record.phase)
+        if record.deployment_name is not None:
+            entry.deployment_name = record.deployment_name
+
+    def expire(self, workspace: str, fingerprints: Dict[str, str]) -> List[str]:
+        """Drop entries of a workspace whose inputs changed or are not deployed.
+
+        Args:
+            workspace: the workspace being deployed to.
+            fingerprints: the current fingerprint of every key being deployed.
+
+        Returns:
+            The expired keys.
+        """
+        prefix = f"{workspace}::"
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if key.startswith(prefix) and fingerprints.get(key) != entry.fingerprint
+        ]
+        for key in expired:
+            del self._entries[key]
+        return expired
+
+    def completed(self, key: str) -> Set[DeployPhase]:
+        """Get the completed phases of a deployment."""
+        entry = self._entries.get(key)
+        return set(entry.phases) if entry else set()
+
+    def fingerprint(self, key: str) -> Optional[str]:
+        """Get the fingerprint of the inputs a deployment was recorded with."""
+        entry = self._entries.get(key)
+        return entry.fingerprint if entry else None
+
+    def deployment_name(self, key: str) -> Optional[str]:
+        """Get the name of the deployment applied for a key, if any."""
+        entry = self._entries.get(key)
+        return entry.deployment_name if entry else None
+
+    def record(
+        self,
+        key: str,
+        fingerprint: str,
+        phase: DeployPhase,
+        deployment_name: Optional[str] = None,
+    ) -> None:
+        """Durably record that a phase completed."""
+        record = JournalRecord(
+            key=key,
+            fingerprint=fingerprint,
+            phase=phase,
+            deployment_name=deployment_name,
+        )
+        self._apply(record)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(record.json() + "\n")
+            f.flush()
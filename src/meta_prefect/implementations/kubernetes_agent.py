@@ -0,0 +1,426 @@
+"""Prefect agents on Kubernetes, with their work queues sharded over replicas.
+
+A single agent polling every work queue polls more, and picks up runs later, as
+queues are added. `PrefectKubernetesAgent` deploys the agent as `replicas`
+Kubernetes Deployments instead, each polling its share of the work queues. Queues
+are assigned to replicas by consistent hashing, so that adding or removing a
+replica only moves the queues of that replica.
+
+With a scaling policy, `autoscale` periodically reads the due scheduled runs of
+the queues and picks the number of replicas:
+
+* replicas are added, at once, up to one per `target_backlog` waiting runs and
+  `max_replicas`;
+* replicas are removed `scale_down_step` at a time, down to `min_replicas`.
+
+The Namespace of the agent is applied first, then its ServiceAccount, Role,
+RoleBinding and Deployments are created, or patched, concurrently, through a
+`KubernetesApi` (see `meta_prefect.implementations.kubernetes_api`).
+"""
+import asyncio
+import bisect
+import datetime
+import hashlib
+import math
+from logging import getLogger
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    cast,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import prefect
+from prefect.client.schemas.filters import (
+    FlowRunFilter,
+    FlowRunFilterExpectedStartTime,
+    FlowRunFilterState,
+    FlowRunFilterStateType,
+    WorkQueueFilter,
+    WorkQueueFilterName,
+)
+from prefect.client.schemas.objects import StateType
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.kubernetes_api import (
+    get_kubernetes_api,
+    KubernetesApi,
+    Manifest,
+)
+
+logger = getLogger(__name__)
+
+VIRTUAL_NODES = 64
+REPLICA_LABEL = "meta-prefect.io/agent-replica"
+
+
+def _hash(value: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """A consistent hash ring of nodes, each at a number of virtual points."""
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        self._ring = sorted(
+            (_hash(f"{node}#{point}"), node)
+            for node in nodes
+            for point in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in self._ring]
+
+    def node(self, key: str) -> str:
+        """Get the node of a key, the first one clockwise of its hash."""
+        index = bisect.bisect(self._points, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def assign_queues(work_queue_names: Sequence[str], replicas: int) -> List[List[str]]:
+    """Assign work queues to replicas, get the queues of each replica."""
+    ring = HashRing(str(replica) for replica in range(replicas))
+    shards: List[List[str]] = [[] for _ in range(replicas)]
+    for work_queue_name in sorted(work_queue_names):
+        shards[int(ring.node(work_queue_name))].append(work_queue_name)
+    return shards
+
+
+class AgentScalingPolicy(BaseModel):
+    """The bounds and thresholds of the number of agent replicas."""
+
+    min_replicas: int = Field(1, ge=1, description="The fewest replicas.")
+    max_replicas: int = Field(4, ge=1, description="The most replicas.")
+    target_backlog: int = Field(
+        20, ge=1, description="The due runs each replica is expected to pick up."
+    )
+    scale_down_step: int = Field(
+        1, ge=1, description="The most replicas removed at once."
+    )
+    interval_seconds: float = Field(
+        60, gt=0, description="The time between two scaling decisions."
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_bounds(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["min_replicas"] > values["max_replicas"]:
+            raise ValueError("min_replicas must not be greater than max_replicas.")
+        return values
+
+
+def agent_replicas(
+    depths: Dict[str, int], replicas: int, policy: AgentScalingPolicy
+) -> Tuple[int, str]:
+    """Pick the number of replicas for the due runs of the queues, and say why."""
+    backlog = sum(depths.values())
+    needed = min(
+        max(math.ceil(backlog / policy.target_backlog), policy.min_replicas),
+        policy.max_replicas,
+    )
+    if needed > replicas:
+        return needed, f"scale up, {backlog} due runs"
+    if needed < replicas:
+        return (
+            max(needed, replicas - policy.scale_down_step),
+            f"scale down, {backlog} due runs",
+        )
+    return replicas, "hold"
+
+
+async def read_queue_depths(work_queue_names: Sequence[str]) -> Dict[str, int]:
+    """Count the due scheduled runs, late ones included, of every work queue."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    async def count(work_queue_name: str) -> int:
+        flow_run_filter = FlowRunFilter(
+            state=FlowRunFilterState(
+                type=FlowRunFilterStateType(any_=[StateType.SCHEDULED])
+            ),
+            expected_start_time=FlowRunFilterExpectedStartTime(before_=now),
+        )
+        async with get_client() as client:
+            response = await client._client.post(
+                "/flow_runs/count",
+                json={
+                    "flow_runs": flow_run_filter.dict(json_compatible=True),
+                    "work_pool_queues": WorkQueueFilter(
+                        name=WorkQueueFilterName(any_=[work_queue_name])
+                    ).dict(json_compatible=True),
+                },
+            )
+        return int(response.json())
+
+    depths = await asyncio.gather(*[count(name) for name in work_queue_names])
+    return dict(zip(work_queue_names, depths))
+
+
+class PrefectKubernetesAgent(BaseModel):
+    """A Prefect Kubernetes Agent."""
+
+    name: str
+    namespace: str
+    image: str
+    match_on_namespace: bool = True
+    work_queue_names: List[str] = []
+    cpu: float = 1
+    memory_gb: float = 0.5
+    replicas: int = Field(
+        1, ge=1, description="The Deployments the work queues are sharded over."
+    )
+    scaling: Optional[AgentScalingPolicy] = Field(
+        None, description="How replicas are added and removed with the backlog."
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _check_sharding(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if (values["replicas"] > 1 or values["scaling"]) and not values[
+            "work_queue_names"
+        ]:
+            raise ValueError("Only listed work queues can be sharded over replicas.")
+        return values
+
+    @property
+    def limits(self) -> Dict[str, str]:
+        """Return the resource limits."""
+        return {
+            "cpu": str(self.cpu),
+            "memory": f"{self.memory_gb}Gi",
+        }
+
+    @property
+    def requests(self) -> Dict[str, str]:
+        """Return the resource requests."""
+        return {
+            "cpu": str(self.cpu),
+            "memory": f"{self.memory_gb}Gi",
+        }
+
+    @property
+    def labels(self) -> Dict[str, str]:
+        """Return the labels for the agent."""
+        return {"app": self.name}
+
+    @property
+    def service_account_name(self) -> str:
+        """Return the service account name."""
+        return self.name
+
+    @property
+    def max_replicas(self) -> int:
+        """Return the most replicas the agent can have."""
+        return max(self.replicas, self.scaling.max_replicas if self.scaling else 1)
+
+    def replica_name(self, replica: int) -> str:
+        # an unsharded agent keeps its name
+        return self.name if self.max_replicas == 1 else f"{self.name}-{replica}"
+
+    def _build_command(self, work_queue_names: Sequence[str]) -> List[str]:
+        command = ["prefect", "agent", "start"]
+        # an agent either matches queues by prefix or polls listed ones
+        if work_queue_names:
+            for work_queue in work_queue_names:
+                command += ["--work-queue", work_queue]
+        elif self.match_on_namespace:
+            command += ["--match", self.namespace]
+        return command
+
+    def _build_env_from_profile(self) -> List[Dict[str, str]]:
+        from prefect.settings import PREFECT_API_URL
+
+        profile = prefect.context.get_settings_context().profile
+        env: Dict[str, str] = {"PREFECT_KUBERNETES_CLUSTER_UID": "1"}
+        for setting, value in cast(
+            Dict[prefect.settings.Setting[str], str], profile.settings
+        ).items():
+            env[cast(str, setting.name)] = str(value)
+        if "PREFECT_API_URL" not in env and PREFECT_API_URL.value():
+            env["PREFECT_API_URL"] = PREFECT_API_URL.value()
+        if "PREFECT_API_URL" not in env:
+            raise ValueError(f"Profile {profile.name!r} has no PREFECT_API_URL.")
+        return [{"name": name, "value": value} for name, value in env.items()]
+
+    def build_manifests(self, replicas: int) -> Tuple[Manifest, List[Manifest]]:
+        """Build the Namespace of the agent, and its other objects."""
+        from kubernetes import client
+
+        shards = (
+            assign_queues(self.work_queue_names, replicas)
+            if self.work_queue_names
+            else [[]]
+        )
+        env = self._build_env_from_profile()
+        namespace = client.V1Namespace(
+            api_version="v1",
+            kind="Namespace",
+            metadata=client.V1ObjectMeta(name=self.namespace),
+        )
+        objects = [
+            client.V1ServiceAccount(
+                api_version="v1",
+                kind="ServiceAccount",
+                metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+            ),
+            client.V1Role(
+                api_version="rbac.authorization.k8s.io/v1",
+                kind="Role",
+                metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+                rules=[
+                    client.V1PolicyRule(
+                        api_groups=["*"],
+                        resources=["namespaces", "pods", "pods/log", "pods/status"],
+                        verbs=["get", "watch", "list"],
+                    ),
+                    client.V1PolicyRule(
+                        api_groups=["*"],
+                        resources=["jobs"],
+                        verbs=[
+                            "get",
+                            "list",
+                            "watch",
+                            "create",
+                            "update",
+                            "patch",
+                            "delete",
+                        ],
+                    ),
+                ],
+            ),
+            client.V1RoleBinding(
+                api_version="rbac.authorization.k8s.io/v1",
+                kind="RoleBinding",
+                metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+                role_ref=client.V1RoleRef(
+                    api_group="rbac.authorization.k8s.io",
+                    kind="Role",
+                    name=self.name,
+                ),
+                subjects=[
+                    client.V1Subject(
+                        kind="ServiceAccount",
+                        name=self.service_account_name,
+                        namespace=self.namespace,
+                    )
+                ],
+            ),
+        ]
+        for replica, work_queue_names in enumerate(shards):
+            if self.work_queue_names and not work_queue_names:
+                # replicas without queues would poll every queue
+                continue
+            labels = {**self.labels, REPLICA_LABEL: str(replica)}
+            objects.append(
+                client.V1Deployment(
+                    api_version="apps/v1",
+                    kind="Deployment",
+                    metadata=client.V1ObjectMeta(
+                        name=self.replica_name(replica),
+                        namespace=self.namespace,
+                        labels=labels,
+                    ),
+                    spec=client.V1DeploymentSpec(
+                        replicas=1,
+                        selector=client.V1LabelSelector(match_labels=labels),
+                        template=client.V1PodTemplateSpec(
+                            metadata=client.V1ObjectMeta(labels=labels),
+                            spec=client.V1PodSpec(
+                                service_account_name=self.service_account_name,
+                                containers=[
+                                    client.V1Container(
+                                        name=self.name,
+                                        command=self._build_command(work_queue_names),
+                                        image=self.image,
+                                        env=env,
+                                        args=[],
+                                        resources=client.V1ResourceRequirements(
+                                            limits=self.limits,
+                                            requests=self.requests,
+                                        ),
+                                    )
+                                ],
+                            ),
+                        ),
+                    ),
+                )
+            )
+        api_client = client.ApiClient()
+        return api_client.sanitize_for_serialization(namespace), [
+            api_client.sanitize_for_serialization(obj) for obj in objects
+        ]
+
+    @sync_compatible
+    async def deploy(
+        self, replicas: Optional[int] = None, api: Optional[KubernetesApi] = None
+    ) -> List[str]:
+        """Deploy the agent, get the names of its replica Deployments.
+
+        The other Deployments of the agent, e.g. replicas beyond the given
+        number after scaling down or lowering the most replicas, or the single
+        Deployment of the agent before it was sharded, are deleted.
+        """
+        replicas = replicas or self.replicas
+        api = api or get_kubernetes_api()
+        namespace, objects = self.build_manifests(replicas)
+        await api.apply(namespace)
+        logger.info(f"namespace/{self.namespace} updated")
+        await asyncio.gather(*[api.apply(obj) for obj in objects])
+        deployments = [
+            obj["metadata"]["name"] for obj in objects if obj["kind"] == "Deployment"
+        ]
+        existing = await api.list_objects(
+            "apps/v1", "Deployment", self.namespace, self.labels
+        )
+        stale = [
+            obj["metadata"]["name"]
+            for obj in existing
+            if obj["metadata"]["name"] not in deployments
+        ]
+        await asyncio.gather(
+            *[
+                api.delete("apps/v1", "Deployment", name, self.namespace)
+                for name in stale
+            ]
+        )
+        logger.info(
+            f"{len(objects)} objects of agent {self.name} updated, "
+            f"{len(deployments)} replicas"
+        )
+        return deployments
+
+    async def autoscale(
+        self,
+        iterations: Optional[int] = None,
+        api: Optional[KubernetesApi] = None,
+        read_depths: Callable[
+            [Sequence[str]], Awaitable[Dict[str, int]]
+        ] = read_queue_depths,
+    ) -> int:
+        """Scale the replicas to the backlog of the queues, get the last count.
+
+        Scales every interval of the policy, forever unless a number of
+        iterations is given.
+        """
+        if self.scaling is None:
+            raise ValueError(f"Agent {self.name} has no scaling policy.")
+        replicas = min(
+            max(self.replicas, self.scaling.min_replicas), self.scaling.max_replicas
+        )
+        await self.deploy(replicas, api)
+        iteration = 0
+        while iterations is None or iteration < iterations:
+            depths = await read_depths(self.work_queue_names)
+            scaled, reason = agent_replicas(depths, replicas, self.scaling)
+            logger.info(f"{self.name}: {replicas} -> {scaled} replicas, {reason}")
+            if scaled != replicas:
+                await self.deploy(scaled, api)
+                replicas = scaled
+            iteration += 1
+            if iterations is None or iteration < iterations:
+                await asyncio.sleep(self.scaling.interval_seconds)
+        return replicas
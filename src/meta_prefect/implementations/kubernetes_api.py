@@ -0,0 +1,182 @@
+"""The parts of the Kubernetes API meta-prefect uses, to apply manifests.
+
+Builders and actions go through a `KubernetesApi` rather than the Kubernetes
+client, so that they can be run against a fake API. The active API is the
+cluster of the current kube config, or the in-cluster config, unless another one
+is made active with `use_kubernetes_api`.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+Manifest = Dict[str, Any]
+
+
+class KubernetesApi(ABC):
+    """Applies manifests to a cluster, and reads its objects and pods."""
+
+    @abstractmethod
+    async def apply(self, manifest: Manifest) -> Manifest:
+        """Create an object, or patch it if it exists, get it as applied."""
+
+    @abstractmethod
+    async def read(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> Optional[Manifest]:
+        """Read an object, None if it does not exist."""
+
+    @abstractmethod
+    async def delete(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> None:
+        """Delete an object, if it exists."""
+
+    @abstractmethod
+    async def list_objects(
+        self, api_version: str, kind: str, namespace: str, labels: Dict[str, str]
+    ) -> List[Manifest]:
+        """List the objects of a kind in a namespace with the given labels."""
+
+    @abstractmethod
+    async def list_pods(self, namespace: str, labels: Dict[str, str]) -> List[Manifest]:
+        """List the pods of a namespace with the given labels."""
+
+
+class ClusterKubernetesApi(KubernetesApi):
+    """The API of a cluster, through the dynamic Kubernetes client."""
+
+    def __init__(self) -> None:
+        self._client: Any = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from kubernetes import config
+            from kubernetes.client import ApiClient
+            from kubernetes.dynamic import DynamicClient
+
+            try:
+                config.load_incluster_config()
+            except config.ConfigException:
+                config.load_kube_config()
+            self._client = DynamicClient(ApiClient())
+        return self._client
+
+    async def _call(self, fn: Callable[..., Any], **kwargs: Any) -> Any:
+        # the client is blocking
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(fn, **kwargs)
+        )
+
+    async def _resource(self, api_version: str, kind: str) -> Any:
+        return await self._call(
+            self.client.resources.get, api_version=api_version, kind=kind
+        )
+
+    async def apply(self, manifest: Manifest) -> Manifest:
+        resource = await self._resource(manifest["apiVersion"], manifest["kind"])
+        metadata = manifest["metadata"]
+        existing = await self.read(
+            manifest["apiVersion"],
+            manifest["kind"],
+            metadata["name"],
+            metadata.get("namespace"),
+        )
+        if existing is None:
+            applied = await self._call(
+                resource.create, body=manifest, namespace=metadata.get("namespace")
+            )
+        else:
+            applied = await self._call(
+                resource.patch,
+                body=manifest,
+                name=metadata["name"],
+                namespace=metadata.get("namespace"),
+                content_type="application/merge-patch+json",
+            )
+        return applied.to_dict()
+
+    async def read(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> Optional[Manifest]:
+        from kubernetes.dynamic.exceptions import NotFoundError
+
+        resource = await self._resource(api_version, kind)
+        try:
+            obj = await self._call(resource.get, name=name, namespace=namespace)
+        except NotFoundError:
+            return None
+        return obj.to_dict()
+
+    async def delete(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> None:
+        from kubernetes.dynamic.exceptions import NotFoundError
+
+        resource = await self._resource(api_version, kind)
+        try:
+            await self._call(resource.delete, name=name, namespace=namespace)
+        except NotFoundError:
+            pass
+
+    async def list_objects(
+        self, api_version: str, kind: str, namespace: str, labels: Dict[str, str]
+    ) -> List[Manifest]:
+        resource = await self._resource(api_version, kind)
+        objects = await self._call(
+            resource.get,
+            namespace=namespace,
+            label_selector=",".join(f"{key}={value}" for key, value in labels.items()),
+        )
+        items: List[Manifest] = objects.to_dict()["items"]
+        return items
+
+    async def list_pods(self, namespace: str, labels: Dict[str, str]) -> List[Manifest]:
+        return await self.list_objects("v1", "Pod", namespace, labels)
+
+
+async def wait_for_running_pods(
+    api: KubernetesApi,
+    namespace: str,
+    labels: Dict[str, str],
+    count: int = 1,
+    timeout: float = 600,
+    interval: float = 1,
+) -> float:
+    """Wait for pods with the given labels to run, get the seconds waited."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    while True:
+        pods = await api.list_pods(namespace, labels)
+        running = [pod for pod in pods if pod["status"].get("phase") == "Running"]
+        if len(running) >= count:
+            return loop.time() - start
+        if loop.time() - start > timeout:
+            raise TimeoutError(
+                f"{len(running)} of {count} pods with labels {labels} running "
+                f"after {timeout} seconds."
+            )
+        await asyncio.sleep(interval)
+
+
+_active_api: ContextVar[Optional[KubernetesApi]] = ContextVar(
+    "kubernetes_api", default=None
+)
+
+
+@contextmanager
+def use_kubernetes_api(api: Optional[KubernetesApi]) -> Iterator[None]:
+    """Make builders and actions in this context use a Kubernetes API."""
+    token = _active_api.set(api)
+    try:
+        yield
+    finally:
+        _active_api.reset(token)
+
+
+def get_kubernetes_api() -> KubernetesApi:
+    """Get the active Kubernetes API, the current cluster's by default."""
+    return _active_api.get() or ClusterKubernetesApi()
@@ -0,0 +1,22 @@
+"""Entrypoints of flows whose runs are held to global concurrency limits.
+
+A deployment limited by `global_concurrency_limiter` has its entrypoint, e.g.
+`flows/etl.py:my_flow`, rewritten to
+`meta_prefect.implementations.limited_entrypoint:flows/etl.py@my_flow`. Loading
+it loads the original flow and wraps it so each run holds a slot of the limits
+named by its tags.
+"""
+from prefect.flows import Flow
+from prefect.utilities.importtools import import_object
+
+from meta_prefect.implementations.concurrency_limits import apply_concurrency_limits
+
+
+def __getattr__(name: str) -> Flow:
+    if name.startswith("__"):
+        raise AttributeError(name)
+    path, _, flow_name = name.rpartition("@")
+    flow = import_object(f"{path}:{flow_name}")
+    if not isinstance(flow, Flow):
+        raise AttributeError(f"{name!r} is not a flow.")
+    return apply_concurrency_limits(flow)
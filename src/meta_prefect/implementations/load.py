@@ -0,0 +1,339 @@
+"""The expected load of deployment schedules on work pools and work queues.
+
+Schedules are expanded over a horizon with the vectorized scheduling engine and
+every run is assumed to last the typical duration of its deployment, taken
+from its past flow runs or from a CSV file standing in for them.
+"""
+import asyncio
+import csv
+import datetime
+import heapq
+import json
+import statistics
+from collections import defaultdict
+from pathlib import Path
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+from prefect.client.schemas.filters import (
+    DeploymentFilter,
+    DeploymentFilterName,
+    FlowFilter,
+    FlowFilterName,
+    FlowRunFilter,
+    FlowRunFilterState,
+    FlowRunFilterStateType,
+)
+from prefect.client.schemas.objects import StateType
+from prefect.client.schemas.sorting import FlowRunSort
+
+from meta_prefect.implementations.builders.scheduling.engine import (
+    get_occurrence_grid,
+    Schedule,
+    to_datetime64,
+)
+from meta_prefect.implementations.builders.scheduling.plan import deployment_key
+from meta_prefect.implementations.client import get_client
+
+DURATION_HISTORY = 20
+FORECAST_COLUMNS = [
+    "work_pool_name",
+    "work_queue_name",
+    "bucket_start",
+    "starts",
+    "concurrency",
+    "concurrency_limit",
+    "overloaded",
+]
+
+
+class ScheduledLoad(NamedTuple):
+    """The schedule of a deployment and the work pool and queue it runs on."""
+
+    key: str
+    schedule: Schedule
+    duration_seconds: float
+    work_pool_name: Optional[str] = None
+    work_queue_name: Optional[str] = None
+
+
+def load_durations_csv(path: Path) -> Dict[str, float]:
+    """Read the median run duration of deployments from a CSV file.
+
+    The file has `flow_name`, `deployment_name` and `duration_seconds` columns,
+    with a row per past run.
+    """
+    durations: Dict[str, List[float]] = defaultdict(list)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            key = deployment_key(row["flow_name"], row["deployment_name"])
+            durations[key].append(float(row["duration_seconds"]))
+    return {key: statistics.median(values) for key, values in durations.items()}
+
+
+async def _read_duration(
+    flow_name: str, deployment_name: str, limit: int
+) -> Optional[float]:
+    async with get_client() as client:
+        flow_runs = await client.read_flow_runs(
+            flow_filter=FlowFilter(name=FlowFilterName(any_=[flow_name])),
+            deployment_filter=DeploymentFilter(
+                name=DeploymentFilterName(any_=[deployment_name])
+            ),
+            flow_run_filter=FlowRunFilter(
+                state=FlowRunFilterState(
+                    type=FlowRunFilterStateType(any_=[StateType.COMPLETED])
+                )
+            ),
+            sort=FlowRunSort.START_TIME_DESC,
+            limit=limit,
+        )
+    durations = [
+        flow_run.total_run_time.total_seconds()
+        for flow_run in flow_runs
+        if flow_run.total_run_time
+    ]
+    return statistics.median(durations) if durations else None
+
+
+async def read_durations(
+    deployments: Iterable[Tuple[str, str]], limit: int = DURATION_HISTORY
+) -> Dict[str, float]:
+    """Read the median duration of the last completed runs of deployments.
+
+    Deployments without completed runs are left out.
+    """
+    names = list(deployments)
+    durations = await asyncio.gather(
+        *[_read_duration(flow_name, name, limit) for flow_name, name in names]
+    )
+    return {
+        deployment_key(flow_name, name): duration
+        for (flow_name, name), duration in zip(names, durations)
+        if duration is not None
+    }
+
+
+def expand_starts(
+    schedule: Schedule, start: datetime.datetime, end: datetime.datetime
+) -> np.ndarray:
+    """Get the run starts of a schedule within [start, end) as naive UTC values."""
+    return get_occurrence_grid(schedule).utc_occurrences(start, end)
+
+
+def to_buckets(
+    instants: np.ndarray, origin: np.datetime64, bucket_seconds: int
+) -> np.ndarray:
+    """Get the index of the bucket each naive UTC instant falls in."""
+    return (instants - origin).astype("m8[s]").astype(np.int64) // bucket_seconds
+
+
+def concurrency_profile(
+    starts: np.ndarray,
+    duration_seconds: float,
+    origin: np.datetime64,
+    bucket_seconds: int,
+    buckets: int,
+) -> np.ndarray:
+    """Count the runs active during each bucket, runs lasting the duration.
+
+    `starts` may be a 2-d array, in which case a profile is counted per row.
+    """
+    starts = np.atleast_2d(starts)
+    first = to_buckets(starts, origin, bucket_seconds)
+    # a run counts from the bucket it starts in, for its duration rounded up
+    length = max(1, int(np.ceil(duration_seconds / bucket_seconds)))
+    last = first + length
+    rows = np.broadcast_to(np.arange(len(starts))[:, None], first.shape)
+    changes = np.zeros((len(starts), buckets + 1), dtype=np.int64)
+    np.add.at(changes, (rows, np.clip(first, 0, buckets)), 1)
+    np.add.at(changes, (rows, np.clip(last, 0, buckets)), -1)
+    return np.cumsum(changes, axis=1)[:, :buckets]
+
+
+def peak_concurrency(
+    starts: np.ndarray,
+    durations: np.ndarray,
+    origin: np.datetime64,
+    bucket_seconds: int,
+    buckets: int,
+) -> np.ndarray:
+    """Get the most runs active at the same instant within each bucket.
+
+    The starts and ends of runs are swept in order, so the peak is exact
+    whatever the length of the buckets.
+    """
+    if len(starts) == 0:
+        return np.zeros(buckets, dtype=np.int64)
+    seconds = (starts - origin).astype("m8[s]").astype(np.float64)
+    times = np.concatenate([seconds, seconds + durations])
+    changes = np.concatenate(
+        [np.ones(len(seconds), dtype=np.int64), -np.ones(len(seconds), dtype=np.int64)]
+    )
+    # runs ending at the instant another one starts do not overlap it
+    order = np.lexsort((changes, times))
+    times, levels = times[order], np.cumsum(changes[order])
+
+    # the runs still active when each bucket starts
+    bucket_starts = np.arange(buckets) * float(bucket_seconds)
+    before = np.searchsorted(times, bucket_starts, side="right") - 1
+    peaks = np.where(before >= 0, levels[np.clip(before, 0, None)], 0)
+    within = (times >= 0) & (times < buckets * bucket_seconds)
+    np.maximum.at(
+        peaks, (times[within] // bucket_seconds).astype(np.int64), levels[within]
+    )
+    return peaks
+
+
+def simulate_delays(
+    starts: np.ndarray, durations: np.ndarray, limit: Optional[int]
+) -> np.ndarray:
+    """Get how long each run waits for a slot when at most `limit` run at once.
+
+    Runs are picked first come first served, `starts` being naive UTC values.
+    """
+    delays = np.zeros(len(starts))
+    if not limit or len(starts) == 0:
+        return delays
+    seconds = (starts - starts.min()).astype("m8[s]").astype(np.int64)
+    order = np.argsort(seconds, kind="stable")
+    # a heap of the instants the slots free up at
+    free = [0.0] * limit
+    for index in order.tolist():
+        begin = max(float(seconds[index]), free[0])
+        delays[index] = begin - seconds[index]
+        heapq.heapreplace(free, begin + float(durations[index]))
+    return delays
+
+
+class LoadForecast(NamedTuple):
+    """The expected run starts and concurrent runs of a work pool or queue.
+
+    `work_queue_name` is None for the forecast of the work pool as a whole.
+    """
+
+    work_pool_name: str
+    work_queue_name: Optional[str]
+    concurrency_limit: Optional[int]
+    bucket_starts: np.ndarray
+    starts: np.ndarray
+    concurrency: np.ndarray
+
+    @property
+    def overloaded(self) -> np.ndarray:
+        """Flag the buckets where concurrent runs exceed the concurrency limit."""
+        if self.concurrency_limit is None:
+            return np.zeros(len(self.concurrency), dtype=bool)
+        return self.concurrency > self.concurrency_limit
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Get a row per bucket, e.g. to export the forecast."""
+        return [
+            {
+                "work_pool_name": self.work_pool_name,
+                "work_queue_name": self.work_queue_name,
+                "bucket_start": f"{bucket_start}Z",
+                "starts": starts,
+                "concurrency": concurrency,
+                "concurrency_limit": self.concurrency_limit,
+                "overloaded": overloaded,
+            }
+            for bucket_start, starts, concurrency, overloaded in zip(
+                self.bucket_starts.astype(str).tolist(),
+                self.starts.tolist(),
+                self.concurrency.tolist(),
+                self.overloaded.tolist(),
+            )
+        ]
+
+
+def forecast_load(
+    loads: Sequence[ScheduledLoad],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    bucket_seconds: int,
+    limits: Mapping[str, Tuple[Optional[int], Mapping[str, Optional[int]]]],
+) -> List[LoadForecast]:
+    """Forecast the load of deployments on their work pools and queues.
+
+    Args:
+        loads: the schedules of the deployments and where they run.
+        start: the start of the horizon the schedules are expanded over.
+        end: the end of the horizon.
+        bucket_seconds: the length of the time buckets runs are counted in.
+        limits: the concurrency limit of each work pool and of its queues.
+    """
+    origin = to_datetime64(start, datetime.timezone.utc)
+    buckets = int(np.ceil((end - start).total_seconds() / bucket_seconds))
+    bucket_starts = origin + np.arange(buckets) * np.timedelta64(bucket_seconds, "s")
+
+    runs: DefaultDict[
+        Tuple[str, Optional[str]], List[Tuple[np.ndarray, float]]
+    ] = defaultdict(list)
+    for load in loads:
+        run_starts = expand_starts(load.schedule, start, end)
+        work_pool_name = load.work_pool_name or ""
+        runs[(work_pool_name, None)].append((run_starts, load.duration_seconds))
+        # runs without a queue are only counted in their pool's totals
+        if load.work_queue_name is not None:
+            runs[(work_pool_name, load.work_queue_name)].append(
+                (run_starts, load.duration_seconds)
+            )
+
+    totals = {}
+    for key, group in runs.items():
+        run_starts = np.concatenate([group_starts for group_starts, _ in group])
+        durations = np.concatenate(
+            [np.full(len(group_starts), duration) for group_starts, duration in group]
+        )
+        totals[key] = (
+            np.bincount(
+                to_buckets(run_starts, origin, bucket_seconds), minlength=buckets
+            )[:buckets],
+            peak_concurrency(run_starts, durations, origin, bucket_seconds, buckets),
+        )
+
+    forecasts = []
+    for (work_pool_name, work_queue_name), (starts, concurrency) in sorted(
+        totals.items(), key=lambda item: (item[0][0], item[0][1] or "")
+    ):
+        pool_limit, queue_limits = limits.get(work_pool_name, (None, {}))
+        forecasts.append(
+            LoadForecast(
+                work_pool_name=work_pool_name,
+                work_queue_name=work_queue_name,
+                concurrency_limit=(
+                    pool_limit
+                    if work_queue_name is None
+                    else queue_limits.get(work_queue_name)
+                ),
+                bucket_starts=bucket_starts,
+                starts=starts,
+                concurrency=concurrency,
+            )
+        )
+    return forecasts
+
+
+def write_forecast(forecasts: Sequence[LoadForecast], path: Path) -> None:
+    """Write forecasts to a JSON file, or to a CSV file for any other suffix."""
+    rows = [row for forecast in forecasts for row in forecast.rows()]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".json":
+        path.write_text(json.dumps(rows, indent=2))
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FORECAST_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,532 @@
+"""A local SQLite mirror of the workspace state builders need to read.
+
+Builders look up the latest version of deployments, work pools, work queues and
+live workers. Instead of asking the API for every lookup, the mirror keeps
+these objects in a local database, refreshed by `StateMirror.sync`:
+
+- flows and deployments are synced incrementally, reading them by descending
+  `updated` timestamp until reaching the last synced timestamp
+- work pools, work queues and live workers cannot be read by `updated`, so they
+  are read when first looked up after a sync, and only the pools of the looked
+  up type, and the queues and workers of the looked up pools
+
+Objects deleted from the workspace are only dropped from the mirrored flows
+and deployments by a full sync.
+"""
+import json
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    cast,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from pendulum import duration
+from prefect._internal.schemas.fields import DateTimeTZ
+from prefect.client.schemas.filters import (
+    WorkerFilter,
+    WorkerFilterLastHeartbeatTime,
+    WorkPoolFilter,
+    WorkPoolFilterType,
+)
+from prefect.client.schemas.objects import (
+    Worker as ClientWorker,
+    WorkPool as ClientWorkPool,
+    WorkQueue as ClientWorkQueue,
+)
+from prefect.client.schemas.sorting import DeploymentSort, FlowSort
+
+from meta_prefect.implementations.client import (
+    get_client,
+    get_workspace_key,
+    PAGE_SIZE,
+    read_pages,
+)
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+MIRROR_DIR = ".meta_prefect"
+MIRROR_FILE = "state.sqlite"
+LIVE_WORKER_WINDOW = duration(minutes=10)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flows (
+    workspace TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    updated REAL,
+    PRIMARY KEY (workspace, id)
+);
+CREATE TABLE IF NOT EXISTS deployments (
+    workspace TEXT NOT NULL,
+    id TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT,
+    tags TEXT NOT NULL,
+    updated REAL,
+    PRIMARY KEY (workspace, id)
+);
+CREATE INDEX IF NOT EXISTS deployments_by_name
+    ON deployments (workspace, name, updated);
+CREATE TABLE IF NOT EXISTS work_pools (
+    workspace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (workspace, name)
+);
+CREATE TABLE IF NOT EXISTS work_queues (
+    workspace TEXT NOT NULL,
+    work_pool_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (workspace, work_pool_name, name)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    workspace TEXT NOT NULL,
+    work_pool_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    last_heartbeat_time REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (workspace, work_pool_name, name)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    workspace TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    cursor REAL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (workspace, kind)
+);
+"""
+
+_active_mirror: ContextVar[Optional["StateMirror"]] = ContextVar(
+    "meta_prefect_active_mirror", default=None
+)
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+def _is_fresh(item: Any, cursor: float) -> bool:
+    updated = _timestamp(item.updated)
+    return updated is None or updated >= cursor
+
+
+def _advance(cursor: Optional[float], items: Iterable[Any]) -> Optional[float]:
+    timestamps = [_timestamp(item.updated) for item in items]
+    if cursor is not None:
+        timestamps.append(cursor)
+    return max((value for value in timestamps if value is not None), default=None)
+
+
+class SyncReport(NamedTuple):
+    """Outcome of syncing the mirror of one workspace."""
+
+    workspace: str
+    flows: int
+    deployments: int
+    reads: int
+    seconds: float
+
+
+async def _read_updated_since(
+    read_page: Callable[[int, int], Awaitable[List[T]]],
+    cursor: Optional[float],
+    page_size: int = PAGE_SIZE,
+) -> List[T]:
+    """Read items sorted by descending `updated` until reaching the cursor.
+
+    Items updated at the cursor itself are read again, as several items may
+    share a timestamp with the last synced one.
+    """
+    if cursor is None:
+        return await read_pages(read_page, page_size)
+
+    items: List[T] = []
+    offset = 0
+    while True:
+        page = await read_page(offset, page_size)
+        fresh = [item for item in page if _is_fresh(item, cursor)]
+        items.extend(fresh)
+        if len(page) < page_size or len(fresh) < len(page):
+            return items
+        offset += page_size
+
+
+class StateMirror:
+    """A local SQLite mirror of the state of one or more workspaces.
+
+    Rows are keyed by workspace, see `get_workspace_key`, so a single mirror can
+    serve deploys to several profiles.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._initialized = False
+        self._synced: Set[str] = set()
+        # the (workspace, kind, scope) of pools, queues and workers read since
+        # the workspace was last synced
+        self._fresh: Set[Tuple[str, str, str]] = set()
+
+    @classmethod
+    def for_project(cls, project_path: str) -> "StateMirror":
+        """Get the mirror of a project directory."""
+        return cls(Path(project_path) / MIRROR_DIR / MIRROR_FILE)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per operation, as deploys to several profiles share the
+        # mirror and sync-compatible calls may hop threads
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as conn:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+            with conn:
+                yield conn
+
+    def _cursor(self, workspace: str, kind: str) -> Optional[float]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cursor FROM sync_state WHERE workspace = ? AND kind = ?",
+                (workspace, kind),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _mark_synced(
+        self, conn: sqlite3.Connection, workspace: str, kind: str, cursor: Any
+    ) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (workspace, kind, cursor, synced_at) "
+            "VALUES (?, ?, ?, ?)",
+            (workspace, kind, cursor, time.time()),
+        )
+
+    def is_synced(self, workspace: Optional[str] = None) -> bool:
+        """Whether a workspace has been synced at least once."""
+        workspace = workspace or get_workspace_key()
+        if workspace not in self._synced:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT COUNT(*) FROM sync_state WHERE workspace = ?",
+                    (workspace,),
+                ).fetchone()
+            if row[0] > 0:
+                self._synced.add(workspace)
+        return workspace in self._synced
+
+    def clear(self, workspace: Optional[str] = None) -> None:
+        """Drop everything mirrored for a workspace."""
+        workspace = workspace or get_workspace_key()
+        self._synced.discard(workspace)
+        self._expire_scopes(workspace)
+        with self._connect() as conn:
+            for table in (
+                "flows",
+                "deployments",
+                "work_pools",
+                "work_queues",
+                "workers",
+                "sync_state",
+            ):
+                conn.execute(f"DELETE FROM {table} WHERE workspace = ?", (workspace,))
+
+    async def sync(self, full: bool = False) -> SyncReport:
+        """Refresh the mirror of the current workspace.
+
+        Args:
+            full: if True, drop the mirrored state and read everything again,
+                picking up deleted flows and deployments.
+        """
+        workspace = get_workspace_key()
+        if full:
+            self.clear(workspace)
+
+        start = time.perf_counter()
+        reads = 0
+        flows_cursor = self._cursor(workspace, "flows")
+        deployments_cursor = self._cursor(workspace, "deployments")
+
+        def counted(
+            read_page: Callable[[int, int], Awaitable[List[T]]]
+        ) -> Callable[[int, int], Awaitable[List[T]]]:
+            def _read_page(offset: int, limit: int) -> Awaitable[List[T]]:
+                nonlocal reads
+                reads += 1
+                return read_page(offset, limit)
+
+            return _read_page
+
+        async with get_client() as client:
+            flows = await _read_updated_since(
+                counted(
+                    lambda offset, limit: client.read_flows(
+                        sort=FlowSort.UPDATED_DESC, limit=limit, offset=offset
+                    )
+                ),
+                flows_cursor,
+            )
+            deployments = await _read_updated_since(
+                counted(
+                    lambda offset, limit: client.read_deployments(
+                        sort=DeploymentSort.UPDATED_DESC, limit=limit, offset=offset
+                    )
+                ),
+                deployments_cursor,
+            )
+
+        with self._connect() as conn:
+            self._store_flows(conn, workspace, flows)
+            self._mark_synced(conn, workspace, "flows", _advance(flows_cursor, flows))
+            self._store_deployments(conn, workspace, deployments)
+            self._mark_synced(
+                conn,
+                workspace,
+                "deployments",
+                _advance(deployments_cursor, deployments),
+            )
+        self._expire_scopes(workspace)
+
+        report = SyncReport(
+            workspace=workspace,
+            flows=len(flows),
+            deployments=len(deployments),
+            reads=reads,
+            seconds=time.perf_counter() - start,
+        )
+        logger.debug(f"Synced state mirror {report}")
+        return report
+
+    def _store_flows(
+        self, conn: sqlite3.Connection, workspace: str, flows: Iterable[Any]
+    ) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO flows (workspace, id, name, updated) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (workspace, str(flow.id), flow.name, _timestamp(flow.updated))
+                for flow in flows
+            ],
+        )
+
+    def _store_deployments(
+        self, conn: sqlite3.Connection, workspace: str, deployments: Iterable[Any]
+    ) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO deployments "
+            "(workspace, id, flow_id, name, version, tags, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    workspace,
+                    str(deployment.id),
+                    str(deployment.flow_id),
+                    deployment.name,
+                    deployment.version,
+                    json.dumps(sorted(deployment.tags or [])),
+                    _timestamp(deployment.updated),
+                )
+                for deployment in deployments
+            ],
+        )
+
+    def _expire_scopes(self, workspace: str) -> None:
+        self._fresh = {scope for scope in self._fresh if scope[0] != workspace}
+
+    def _replace_work_pools(
+        self,
+        conn: sqlite3.Connection,
+        workspace: str,
+        work_pool_type: str,
+        work_pools: Iterable[ClientWorkPool],
+    ) -> None:
+        conn.execute(
+            "DELETE FROM work_pools WHERE workspace = ? AND type = ?",
+            (workspace, work_pool_type),
+        )
+        conn.executemany(
+            "INSERT INTO work_pools (workspace, name, type, data) VALUES (?, ?, ?, ?)",
+            [
+                (workspace, work_pool.name, work_pool.type, work_pool.json())
+                for work_pool in work_pools
+            ],
+        )
+
+    def _replace_work_queues(
+        self,
+        conn: sqlite3.Connection,
+        workspace: str,
+        work_pool_name: str,
+        work_queues: Iterable[ClientWorkQueue],
+    ) -> None:
+        conn.execute(
+            "DELETE FROM work_queues WHERE workspace = ? AND work_pool_name = ?",
+            (workspace, work_pool_name),
+        )
+        conn.executemany(
+            "INSERT INTO work_queues (workspace, work_pool_name, name, data) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (workspace, work_pool_name, work_queue.name, work_queue.json())
+                for work_queue in work_queues
+            ],
+        )
+
+    def _replace_workers(
+        self,
+        conn: sqlite3.Connection,
+        workspace: str,
+        work_pool_name: str,
+        workers: Iterable[ClientWorker],
+    ) -> None:
+        conn.execute(
+            "DELETE FROM workers WHERE workspace = ? AND work_pool_name = ?",
+            (workspace, work_pool_name),
+        )
+        conn.executemany(
+            "INSERT INTO workers "
+            "(workspace, work_pool_name, name, last_heartbeat_time, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    workspace,
+                    work_pool_name,
+                    worker.name,
+                    _timestamp(worker.last_heartbeat_time),
+                    worker.json(),
+                )
+                for worker in workers
+            ],
+        )
+
+    def latest_deployment_version(
+        self, flow_name: str, deployment_name: str, tags: Iterable[str] = ()
+    ) -> Optional[str]:
+        """Get the version of the last updated deployment matching all criteria.
+
+        Returns None if no deployment matches.
+        """
+        required_tags = set(tags)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.version, d.tags FROM deployments d "
+                "JOIN flows f ON f.workspace = d.workspace AND f.id = d.flow_id "
+                "WHERE d.workspace = ? AND d.name = ? AND f.name = ? "
+                "ORDER BY d.updated DESC",
+                (get_workspace_key(), deployment_name, flow_name),
+            ).fetchall()
+        for version, deployment_tags in rows:
+            if required_tags <= set(json.loads(deployment_tags)):
+                return cast(Optional[str], version)
+        return None
+
+    async def work_pools(self, work_pool_type: str) -> List[ClientWorkPool]:
+        """Get the mirrored work pools of a type, read once per sync."""
+        workspace = get_workspace_key()
+        if (workspace, "work_pools", work_pool_type) not in self._fresh:
+            work_pool_filter = WorkPoolFilter(
+                type=WorkPoolFilterType(any_=[work_pool_type])
+            )
+            async with get_client() as client:
+                work_pools = await read_pages(
+                    lambda offset, limit: client.read_work_pools(
+                        limit=limit, offset=offset, work_pool_filter=work_pool_filter
+                    )
+                )
+            with self._connect() as conn:
+                self._replace_work_pools(conn, workspace, work_pool_type, work_pools)
+            self._fresh.add((workspace, "work_pools", work_pool_type))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM work_pools WHERE workspace = ? AND type = ? "
+                "ORDER BY name",
+                (workspace, work_pool_type),
+            ).fetchall()
+        return [ClientWorkPool.parse_raw(data) for data, in rows]
+
+    async def work_queues(self, work_pool_name: str) -> List[ClientWorkQueue]:
+        """Get the mirrored queues of a work pool, read once per sync."""
+        workspace = get_workspace_key()
+        if (workspace, "work_queues", work_pool_name) not in self._fresh:
+            async with get_client() as client:
+                work_queues = await read_pages(
+                    lambda offset, limit: client.read_work_queues(
+                        work_pool_name=work_pool_name, limit=limit, offset=offset
+                    )
+                )
+            with self._connect() as conn:
+                self._replace_work_queues(conn, workspace, work_pool_name, work_queues)
+            self._fresh.add((workspace, "work_queues", work_pool_name))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM work_queues "
+                "WHERE workspace = ? AND work_pool_name = ? ORDER BY name",
+                (workspace, work_pool_name),
+            ).fetchall()
+        return [ClientWorkQueue.parse_raw(data) for data, in rows]
+
+    async def live_workers(self, work_pool_name: str) -> List[ClientWorker]:
+        """Get the workers of a work pool that recently sent a heartbeat."""
+        workspace = get_workspace_key()
+        since = DateTimeTZ.now() - LIVE_WORKER_WINDOW
+        if (workspace, "workers", work_pool_name) not in self._fresh:
+            worker_filter = WorkerFilter(
+                last_heartbeat_time=WorkerFilterLastHeartbeatTime(after_=since)
+            )
+            async with get_client() as client:
+                workers = await read_pages(
+                    lambda offset, limit: client.read_workers_for_work_pool(
+                        work_pool_name=work_pool_name,
+                        worker_filter=worker_filter,
+                        offset=offset,
+                        limit=limit,
+                    )
+                )
+            with self._connect() as conn:
+                self._replace_workers(conn, workspace, work_pool_name, workers)
+            self._fresh.add((workspace, "workers", work_pool_name))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM workers WHERE workspace = ? AND work_pool_name = ? "
+                "AND last_heartbeat_time >= ? ORDER BY name",
+                (workspace, work_pool_name, since.timestamp()),
+            ).fetchall()
+        return [ClientWorker.parse_raw(data) for data, in rows]
+
+
+@contextmanager
+def use_mirror(mirror: Optional[StateMirror]) -> Iterator[Optional[StateMirror]]:
+    """Make builders and actions in this context read from a mirror, if any."""
+    token = _active_mirror.set(mirror)
+    try:
+        yield mirror
+    finally:
+        _active_mirror.reset(token)
+
+
+def get_mirror() -> Optional[StateMirror]:
+    """Get the active mirror, if it has been synced for the current workspace."""
+    mirror = _active_mirror.get()
+    if mirror is not None and mirror.is_synced():
+        return mirror
+    return None
@@ -0,0 +1,235 @@
+"""Capacity-aware packing of the schedules of the deployments of a work pool.
+
+The planner expands the schedules of every deployment of a work pool over a
+horizon and assigns each deployment a start offset, one deployment at a time
+from the heaviest to the lightest. Each offset is picked to first minimize the
+runs in excess of the pool and queue concurrency limits, then the peak of
+concurrent runs, then how unevenly runs are spread. The offsets are written to
+a schedule plan, which the schedule staggerer applies on deploy.
+"""
+import datetime
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from meta_prefect.implementations.builders.scheduling.engine import (
+    get_occurrence_grid,
+    Schedule,
+    to_datetime64,
+)
+from meta_prefect.implementations.builders.scheduling.stagger import schedule_staggerer
+from meta_prefect.implementations.load import (
+    concurrency_profile,
+    expand_starts,
+    ScheduledLoad,
+    simulate_delays,
+)
+
+DEFAULT_WINDOW_SECONDS = 900
+
+
+class PackingItem(NamedTuple):
+    """A deployment to pack and the offsets it may be shifted by."""
+
+    load: ScheduledLoad
+    offsets: Sequence[int] = (0,)
+
+
+class PackingReport(NamedTuple):
+    """The predicted load of a work pool before and after packing."""
+
+    work_pool_name: str
+    deployments: int
+    runs: int
+    concurrency_limit: Optional[int]
+    peak_before: int
+    peak_after: int
+    mean_delay_before: float
+    mean_delay_after: float
+
+    @property
+    def utilization_before(self) -> Optional[float]:
+        """The peak of concurrent runs before packing, relative to the limit."""
+        if not self.concurrency_limit:
+            return None
+        return self.peak_before / self.concurrency_limit
+
+    @property
+    def utilization_after(self) -> Optional[float]:
+        """The peak of concurrent runs after packing, relative to the limit."""
+        if not self.concurrency_limit:
+            return None
+        return self.peak_after / self.concurrency_limit
+
+
+class PackingResult(NamedTuple):
+    """The offsets and rewritten schedules of the deployments of a work pool."""
+
+    offsets: Dict[str, int]
+    schedules: Dict[str, Schedule]
+    report: PackingReport
+
+
+def allowed_offsets(staggerer: schedule_staggerer, schedule: Schedule) -> List[int]:
+    """Get the offsets a staggerer can shift a schedule by, empty if none."""
+    try:
+        offsets = list(staggerer.get_offsets(schedule))
+        if offsets:
+            # the schedule may not support being shifted at all
+            get_occurrence_grid(schedule).shift(offsets[-1])
+    except NotImplementedError:
+        return []
+    return offsets
+
+
+def _excess(load: np.ndarray, limit: Optional[int]) -> np.ndarray:
+    if not limit:
+        return np.zeros(load.shape[:-1], dtype=np.int64)
+    return np.clip(load - limit, 0, None).sum(axis=-1)
+
+
+def _mean_delay(
+    items: Sequence[PackingItem],
+    starts: Sequence[np.ndarray],
+    offsets: Mapping[str, int],
+    concurrency_limit: Optional[int],
+    queue_limits: Mapping[str, Optional[int]],
+) -> float:
+    shifted = [
+        item_starts + np.timedelta64(offsets.get(item.load.key, 0), "s")
+        for item, item_starts in zip(items, starts)
+    ]
+    if not any(len(item_starts) for item_starts in shifted):
+        return 0.0
+    all_starts = np.concatenate(shifted)
+    durations = np.concatenate(
+        [
+            np.full(len(item_starts), item.load.duration_seconds)
+            for item, item_starts in zip(items, shifted)
+        ]
+    )
+    queues = np.concatenate(
+        [
+            np.full(len(item_starts), item.load.work_queue_name or "", dtype=object)
+            for item, item_starts in zip(items, shifted)
+        ]
+    )
+    delays = simulate_delays(all_starts, durations, concurrency_limit)
+    for queue, limit in queue_limits.items():
+        in_queue = queues == queue
+        delays[in_queue] = np.maximum(
+            delays[in_queue],
+            simulate_delays(all_starts[in_queue], durations[in_queue], limit),
+        )
+    return float(delays.mean())
+
+
+def pack_work_pool(
+    work_pool_name: str,
+    items: Sequence[PackingItem],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    concurrency_limit: Optional[int] = None,
+    queue_limits: Optional[Mapping[str, Optional[int]]] = None,
+    bucket_seconds: int = 60,
+) -> PackingResult:
+    """Assign start offsets to the deployments of a work pool.
+
+    Args:
+        work_pool_name: the name of the work pool, used in the report.
+        items: the deployments of the work pool and their allowed offsets.
+        start: the start of the horizon the schedules are expanded over.
+        end: the end of the horizon.
+        concurrency_limit: the concurrency limit of the work pool.
+        queue_limits: the concurrency limits of the queues of the work pool.
+        bucket_seconds: the resolution at which concurrent runs are counted.
+    """
+    queue_limits = queue_limits or {}
+    origin = to_datetime64(start, datetime.timezone.utc)
+    starts = [expand_starts(item.load.schedule, start, end) for item in items]
+    longest = max(
+        [max(item.offsets, default=0) + item.load.duration_seconds for item in items],
+        default=0,
+    )
+    buckets = int(np.ceil(((end - start).total_seconds() + longest) / bucket_seconds))
+
+    pool_load = np.zeros(buckets, dtype=np.int64)
+    queue_loads = {queue: np.zeros(buckets, dtype=np.int64) for queue in queue_limits}
+
+    def add(item: PackingItem, profile: np.ndarray) -> None:
+        pool_load[:] += profile
+        if item.load.work_queue_name in queue_loads:
+            queue_loads[item.load.work_queue_name] += profile
+
+    # deployments that cannot move are placed first, then the heaviest ones
+    order = sorted(
+        range(len(items)),
+        key=lambda index: (
+            len(items[index].offsets) > 1,
+            -len(starts[index]) * items[index].load.duration_seconds,
+            items[index].load.key,
+        ),
+    )
+    offsets: Dict[str, int] = {}
+    for index in order:
+        item, item_starts = items[index], starts[index]
+        candidates = np.array(item.offsets or [0], dtype=np.int64)
+        profiles = concurrency_profile(
+            item_starts[None, :] + candidates[:, None].astype("m8[s]"),
+            item.load.duration_seconds,
+            origin,
+            bucket_seconds,
+            buckets,
+        )
+        pool_total = pool_load[None, :] + profiles
+        excess = _excess(pool_total, concurrency_limit)
+        queue = item.load.work_queue_name
+        if queue in queue_loads:
+            excess = excess + _excess(
+                queue_loads[queue][None, :] + profiles, queue_limits[queue]
+            )
+        best = np.lexsort(
+            (
+                candidates,
+                (pool_total**2).sum(axis=1),
+                pool_total.max(axis=1),
+                excess,
+            )
+        )[0]
+        offsets[item.load.key] = int(candidates[best])
+        add(item, profiles[best])
+
+    before = np.zeros(buckets, dtype=np.int64)
+    for item, item_starts in zip(items, starts):
+        before += concurrency_profile(
+            item_starts, item.load.duration_seconds, origin, bucket_seconds, buckets
+        )[0]
+
+    report = PackingReport(
+        work_pool_name=work_pool_name,
+        deployments=len(items),
+        runs=sum(len(item_starts) for item_starts in starts),
+        concurrency_limit=concurrency_limit,
+        peak_before=int(before.max(initial=0)),
+        peak_after=int(pool_load.max(initial=0)),
+        mean_delay_before=_mean_delay(
+            items, starts, {}, concurrency_limit, queue_limits
+        ),
+        mean_delay_after=_mean_delay(
+            items, starts, offsets, concurrency_limit, queue_limits
+        ),
+    )
+    schedules = {
+        item.load.key: (
+            get_occurrence_grid(item.load.schedule).shift(offsets[item.load.key])
+            if offsets[item.load.key]
+            else item.load.schedule
+        )
+        for item in items
+    }
+    movable = {item.load.key for item in items if item.offsets}
+    return PackingResult(
+        offsets={key: offset for key, offset in offsets.items() if key in movable},
+        schedules=schedules,
+        report=report,
+    )
@@ -0,0 +1,365 @@
+"""A registry of the work queues meta-prefect creates.
+
+Queues used to be created as `work-queue-<uuid>` whenever no queue with the
+wanted concurrency limit was found, leaving stray queues every worker polls.
+Registry queues are instead named after what they are for: their concurrency
+limit, their priority and, for queues unique to a deployment, that deployment.
+Names are scoped to their work pool, so the same spec maps to the same queue on
+every deploy and lookups are answered by the work queue index by name.
+
+The server renumbers the priorities of a pool's queues as queues are created,
+so the priority in a registry name is an order rather than the queue's actual
+priority: registry queues are ranked by it, then by name, and every other
+queue, e.g. the pool's `default` one, comes after them.
+
+Deploys hold a queue unique to a deployment to the limit in its name, which the
+deployment relies on, e.g. to not overlap its runs. The limits of other registry
+queues, shared by tiers or deployments, are left to the autotuner once created.
+
+Reconciliation deletes the managed queues no deployment uses anymore, and
+merges legacy `work-queue-<uuid>` queues into the registry queue of the same
+spec by moving their deployments over.
+"""
+import hashlib
+import re
+from logging import getLogger
+from typing import List, NamedTuple, Optional, Sequence
+
+from prefect.client.schemas.filters import (
+    FlowRunFilter,
+    FlowRunFilterState,
+    FlowRunFilterStateType,
+    WorkPoolFilter,
+    WorkPoolFilterName,
+    WorkQueueFilter,
+    WorkQueueFilterName,
+)
+from prefect.client.schemas.objects import StateType
+from prefect.exceptions import ObjectAlreadyExists
+from pydantic import BaseModel, Field
+
+from meta_prefect.implementations.client import get_client, read_pages
+from meta_prefect.implementations.components.work_queue import WorkQueue
+from meta_prefect.implementations.index import get_work_queue_index
+
+logger = getLogger(__name__)
+
+REGISTRY_PREFIX = "meta-prefect"
+LEGACY_PREFIX = "work-queue-"
+OWNER_SLUG_LENGTH = 40
+WAITING_STATES = [StateType.SCHEDULED, StateType.PENDING, StateType.RUNNING]
+REGISTRY_PRIORITY = re.compile(
+    rf"^{REGISTRY_PREFIX}-(?:unlimited|limit-\d+)-priority-(\d+)(?:-|$)"
+)
+
+
+class QueueSpec(BaseModel):
+    """What a registry queue is for."""
+
+    work_pool_name: str = Field(description="The work pool of the queue.")
+    concurrency_limit: Optional[int] = Field(
+        default=None, ge=0, description="The concurrency limit of the queue."
+    )
+    priority: int = Field(
+        default=1, ge=1, description="The priority of the queue, 1 is the highest."
+    )
+    owner: Optional[str] = Field(
+        default=None,
+        description="The deployment the queue is unique to, if any.",
+    )
+
+    class Config:
+        frozen = True
+
+    @property
+    def tunable(self) -> bool:
+        """Whether the autotuner may change the limit, which deploys then keep."""
+        return self.owner is None
+
+    @property
+    def name(self) -> str:
+        """The deterministic name of the queue within its work pool."""
+        limit = (
+            "unlimited"
+            if self.concurrency_limit is None
+            else f"limit-{self.concurrency_limit}"
+        )
+        name = f"{REGISTRY_PREFIX}-{limit}-priority-{self.priority}"
+        if self.owner is None:
+            return name
+        slug = re.sub(r"[^a-z0-9]+", "-", self.owner.lower()).strip("-")
+        # slugs of different owners can collide, their hashes do not
+        digest = hashlib.sha256(self.owner.encode()).hexdigest()[:8]
+        return f"{name}-{slug[:OWNER_SLUG_LENGTH]}-{digest}"
+
+
+def is_managed(work_queue_name: str) -> bool:
+    """Whether a queue was created by meta-prefect, now or by older versions."""
+    return work_queue_name.startswith((f"{REGISTRY_PREFIX}-", LEGACY_PREFIX))
+
+
+def is_owned(work_queue_name: str) -> bool:
+    """Whether a queue is a registry queue unique to a deployment."""
+    match = REGISTRY_PRIORITY.match(work_queue_name)
+    return match is not None and match.end() < len(work_queue_name)
+
+
+def registry_priority(work_queue_name: str) -> Optional[int]:
+    """The priority in the name of a registry queue, None for other queues."""
+    match = REGISTRY_PRIORITY.match(work_queue_name)
+    return int(match.group(1)) if match else None
+
+
+def rank_order(work_queues: Sequence[WorkQueue]) -> List[WorkQueue]:
+    """Order the queues of a pool as their priorities should be.
+
+    Registry queues come first by the priority in their name, then by name, and
+    other queues after them in their current order.
+    """
+    by_priority = sorted(work_queues, key=lambda work_queue: work_queue.priority)
+    registry = [
+        work_queue
+        for work_queue in by_priority
+        if registry_priority(work_queue.name) is not None
+    ]
+    others = [
+        work_queue
+        for work_queue in by_priority
+        if registry_priority(work_queue.name) is None
+    ]
+    return (
+        sorted(
+            registry,
+            key=lambda work_queue: (
+                registry_priority(work_queue.name),
+                work_queue.name,
+            ),
+        )
+        + others
+    )
+
+
+def _is_ranked(work_queues: Sequence[WorkQueue]) -> bool:
+    return all(
+        work_queue.priority == rank
+        for rank, work_queue in enumerate(rank_order(work_queues), start=1)
+    )
+
+
+async def rank_work_queues(work_pool_name: str) -> None:
+    """Renumber the priorities of a pool's queues in their rank order.
+
+    Queues out of rank are moved to it from the top. Creating a queue bumps the
+    ones after it, and so may moving one depending on the server version, so the
+    queues are read again until ranked, then refreshed in the index.
+    """
+    index = await get_work_queue_index(work_pool_name)
+    passes = 0
+    async with get_client() as client:
+        while True:
+            client_work_queues = await read_pages(
+                lambda offset, limit: client.read_work_queues(
+                    work_pool_name=work_pool_name, limit=limit, offset=offset
+                )
+            )
+            work_queues = [
+                WorkQueue.from_client_workqueue(work_queue)
+                for work_queue in client_work_queues
+            ]
+            moves = [
+                (rank, work_queue.name)
+                for rank, work_queue in enumerate(rank_order(work_queues), start=1)
+                if work_queue.priority != rank
+            ]
+            passes += 1
+            # each pass ranks at least the first queue out of rank
+            if not moves or passes > len(work_queues):
+                break
+            ids = {work_queue.name: work_queue.id for work_queue in client_work_queues}
+            for rank, name in moves:
+                await client.update_work_queue(ids[name], priority=rank)
+    if moves:
+        logger.warning(f"Failed to rank the work queues of work pool {work_pool_name}.")
+    for work_queue in work_queues:
+        index.add(work_queue)
+
+
+async def _reset_concurrency_limit(work_queue: WorkQueue, spec: QueueSpec) -> WorkQueue:
+    logger.warning(
+        f"Resetting the concurrency limit of work queue {spec.name} from "
+        f"{work_queue.concurrency_limit} to {spec.concurrency_limit}."
+    )
+    async with get_client() as client:
+        work_queue_id = work_queue.id
+        if work_queue_id is None:
+            work_queue_id = (
+                await client.read_work_queue_by_name(
+                    spec.name, work_pool_name=spec.work_pool_name
+                )
+            ).id
+        await client.update_work_queue(
+            work_queue_id, concurrency_limit=spec.concurrency_limit
+        )
+    return work_queue.copy(
+        update={"id": work_queue_id, "concurrency_limit": spec.concurrency_limit}
+    )
+
+
+async def ensure_work_queue(spec: QueueSpec) -> WorkQueue:
+    """Get the registry queue of a spec, creating it if missing.
+
+    A queue whose concurrency limit drifted from its spec, e.g. edited in the UI,
+    is reset to it unless the spec is tunable. The queues of the pool are ranked again when one is created
+    or their priorities drifted from their rank order.
+    """
+    index = await get_work_queue_index(spec.work_pool_name)
+    work_queue = index.get(spec.name)
+    if work_queue is not None:
+        if work_queue.concurrency_limit != spec.concurrency_limit and not spec.tunable:
+            work_queue = await _reset_concurrency_limit(work_queue, spec)
+            index.add(work_queue)
+        if not _is_ranked(index.all()):
+            logger.warning(
+                f"Ranking the work queues of work pool {spec.work_pool_name} "
+                "again, their priorities drifted."
+            )
+            await rank_work_queues(spec.work_pool_name)
+        return index.get(spec.name) or work_queue
+
+    work_queue = WorkQueue(
+        name=spec.name,
+        work_pool_name=spec.work_pool_name,
+        concurrency_limit=spec.concurrency_limit,
+        priority=spec.priority,
+    )
+    try:
+        await work_queue.create()
+    except ObjectAlreadyExists:
+        # created concurrently, e.g. by a deploy to another profile
+        logger.debug(f"Work queue {spec.name} already exists.")
+    index.add(work_queue)
+    await rank_work_queues(spec.work_pool_name)
+    return index.get(spec.name) or work_queue
+
+
+async def find_work_queue(spec: QueueSpec, pool_exists: bool = True) -> WorkQueue:
+    """Get the registry queue of a spec, or an unsaved, unlimited one if missing."""
+    if pool_exists:
+        work_queue = (await get_work_queue_index(spec.work_pool_name)).get(spec.name)
+        if work_queue is not None:
+            return work_queue
+    return WorkQueue(
+        name=spec.name, work_pool_name=spec.work_pool_name, priority=spec.priority
+    )
+
+
+class QueueReconciliation(NamedTuple):
+    """What reconciliation did, or would do, to a managed queue."""
+
+    work_pool_name: str
+    work_queue_name: str
+    action: str
+    deployments: int = 0
+    merged_into: Optional[str] = None
+
+
+async def _has_waiting_runs(work_pool_name: str, work_queue_name: str) -> bool:
+    async with get_client() as client:
+        flow_runs = await client.read_flow_runs(
+            work_pool_filter=WorkPoolFilter(
+                name=WorkPoolFilterName(any_=[work_pool_name])
+            ),
+            work_queue_filter=WorkQueueFilter(
+                name=WorkQueueFilterName(any_=[work_queue_name])
+            ),
+            flow_run_filter=FlowRunFilter(
+                state=FlowRunFilterState(
+                    type=FlowRunFilterStateType(any_=WAITING_STATES)
+                )
+            ),
+            limit=1,
+        )
+    return bool(flow_runs)
+
+
+async def reconcile_work_queues(
+    work_pool_name: str, dry_run: bool = False
+) -> List[QueueReconciliation]:
+    """Delete orphaned managed queues of a work pool and merge legacy ones.
+
+    The deployments of legacy queues are moved first, which drops their
+    auto-scheduled runs. Queues still holding scheduled, pending or running flow
+    runs are then left in place, to be reconciled once their runs are done.
+    """
+    index = await get_work_queue_index(work_pool_name)
+    work_pool_filter = WorkPoolFilter(name=WorkPoolFilterName(any_=[work_pool_name]))
+    async with get_client() as client:
+        deployments = await read_pages(
+            lambda offset, limit: client.read_deployments(
+                work_pool_filter=work_pool_filter, offset=offset, limit=limit
+            )
+        )
+
+    reconciliations = []
+    for work_queue in sorted(index.all(), key=lambda work_queue: work_queue.name):
+        if not is_managed(work_queue.name):
+            continue
+        users = [
+            deployment
+            for deployment in deployments
+            if deployment.work_queue_name == work_queue.name
+        ]
+        legacy = work_queue.name.startswith(LEGACY_PREFIX)
+        if users and not legacy:
+            continue
+
+        merged_into = None
+        if users:
+            spec = QueueSpec(
+                work_pool_name=work_pool_name,
+                concurrency_limit=work_queue.concurrency_limit,
+                priority=work_queue.priority,
+            )
+            merged_into = spec.name
+            if not dry_run:
+                await ensure_work_queue(spec)
+                async with get_client() as client:
+                    for deployment in users:
+                        deployment.work_queue_name = merged_into
+                        await client.update_deployment(deployment)
+
+        # a dry run can't tell which runs moving the deployments would drop
+        if (not dry_run or not users) and await _has_waiting_runs(
+            work_pool_name, work_queue.name
+        ):
+            reconciliations.append(
+                QueueReconciliation(
+                    work_pool_name,
+                    work_queue.name,
+                    "kept",
+                    deployments=len(users),
+                    merged_into=merged_into,
+                )
+            )
+            continue
+
+        if not dry_run:
+            async with get_client() as client:
+                if work_queue.id is None:
+                    work_queue.id = (
+                        await client.read_work_queue_by_name(
+                            work_queue.name, work_pool_name=work_pool_name
+                        )
+                    ).id
+                await client.delete_work_queue_by_id(work_queue.id)
+            index.remove(work_queue.name)
+        reconciliations.append(
+            QueueReconciliation(
+                work_pool_name,
+                work_queue.name,
+                "merged" if merged_into else "deleted",
+                deployments=len(users),
+                merged_into=merged_into,
+            )
+        )
+    return reconciliations
@@ -1,13 +1,19 @@
 """A sample local run deployment recipe."""
+import datetime
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 
-from prefect.client.schemas.schedules import RRuleSchedule
+from prefect.client.schemas.schedules import SCHEDULE_TYPES
 from prefect.flows import Flow, P, R
 from pydantic import BaseModel, Field
 
-from meta_prefect.implementations.builders.concurrency.limiter import (
-    concurrency_limiter,
+from meta_prefect.implementations.builders.concurrency.global_limits import (
+    global_concurrency_limiter,
+)
+from meta_prefect.implementations.builders.concurrency.tiers import (
+    DEFAULT_TIERS,
+    priority_tier_router,
+    PriorityTier,
 )
 from meta_prefect.implementations.builders.entrypoint.resolver import (
     entrypoint_resolver,
@@ -17,16 +23,22 @@ from meta_prefect.implementations.builders.naming.env_based_naming import (
     env_split_namer,
 )
 from meta_prefect.implementations.builders.path.resolver import path_resolver
+from meta_prefect.implementations.builders.scheduling.calendar import (
+    business_calendar_schedule_updater,
+)
 from meta_prefect.implementations.builders.scheduling.env_based_activator import (
     schedule_activator_if_prod,
 )
 from meta_prefect.implementations.builders.scheduling.federal import (
     federal_holiday_schedule_updater,
 )
+from meta_prefect.implementations.builders.scheduling.plan import deployment_key
+from meta_prefect.implementations.builders.scheduling.stagger import schedule_staggerer
 from meta_prefect.implementations.builders.tags.env_split import env_split_tag_injector
 from meta_prefect.implementations.builders.versioning.simple_increment import (
     simple_increment_versioning,
 )
+from meta_prefect.implementations.run_resources import RunResources
 from meta_prefect.interface.flow import DeployableFlow
 from meta_prefect.interface.recipe import DeploymentRecipeInterface
 
@@ -43,14 +55,52 @@ class local_run_deployer(BaseModel, DeploymentRecipeInterface):
         default=os.environ.get("META_PREFECT__ENV", "dev"),
         description="The environment to deploy to.",
     )
-    schedule: Optional[RRuleSchedule] = Field(
+    schedule: Optional[SCHEDULE_TYPES] = Field(
         None,
         description="The schedule to deploy the flow with.",
     )
+    calendars: Optional[List[str]] = Field(
+        None,
+        description="The calendars whose holidays are excluded, US if not set.",
+    )
+    stagger_window_seconds: int = Field(
+        0,
+        description="The window to stagger the schedule over, 0 to not stagger.",
+    )
+    earliest: Optional[datetime.time] = Field(
+        None,
+        description="No run is staggered before this time of day.",
+    )
+    latest: Optional[datetime.time] = Field(
+        None,
+        description="No run is staggered after this time of day.",
+    )
     unique: bool = Field(
         False,
-        description="Whether to deploy the flow with a concurrency limiter of 1.",
+        description="Whether to limit the deployment to a single concurrent run.",
+    )
+    priority_tier: str = Field(
+        "standard",
+        description="The priority tier of the deployment, e.g. critical or batch.",
+    )
+    priority_tiers: Dict[str, PriorityTier] = Field(
+        default_factory=lambda: dict(DEFAULT_TIERS),
+        description="The priority and concurrency limit of each tier's work queue.",
     )
+    tag_limits: Dict[str, int] = Field(
+        default_factory=dict,
+        description="Concurrent run limits shared by all deployments with a tag.",
+    )
+    run_resources: RunResources = Field(
+        default_factory=RunResources,
+        description=(
+            "The cores, memory and CPU quota of each run, and its nice level if "
+            "not the priority tier's."
+        ),
+    )
+
+    def _key(self, flow: Flow[P, R]) -> str:
+        return deployment_key(flow.name, f"{self.name}-{self.env}")
 
     def __call__(self, flow: Flow[P, R]) -> "DeployableFlow[P, R]":
         return (
@@ -59,9 +109,30 @@ class local_run_deployer(BaseModel, DeploymentRecipeInterface):
             .pipe(path_resolver())
             .pipe(env_split_namer(name=self.name, env=self.env))
             .pipe(env_split_tag_injector(env=self.env))
-            .pipe(local_run_provisioner(env=self.env))
+            .pipe(local_run_provisioner(env=self.env, resources=self.run_resources))
             .pipe(simple_increment_versioning())
-            .pipe(federal_holiday_schedule_updater(schedule=self.schedule))
+            .pipe(
+                schedule_staggerer(
+                    schedule=self.schedule,
+                    window_seconds=self.stagger_window_seconds,
+                    earliest=self.earliest,
+                    latest=self.latest,
+                )
+            )
+            .pipe(
+                business_calendar_schedule_updater(calendars=self.calendars)
+                if self.calendars
+                else federal_holiday_schedule_updater()
+            )
             .pipe(schedule_activator_if_prod(env=self.env))
-            .pipe(concurrency_limiter(concurrency_limit=1 if self.unique else None))
+            .pipe(
+                priority_tier_router(tier=self.priority_tier, tiers=self.priority_tiers)
+            )
+            .pipe(
+                global_concurrency_limiter(
+                    concurrency_limit=1 if self.unique else None,
+                    owner=self._key(flow),
+                    tag_limits=self.tag_limits,
+                )
+            )
         )
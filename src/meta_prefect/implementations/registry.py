@@ -11,8 +11,9 @@ class ClassRegistry(MutableMapping[KeyT, ValueT]):
     def __init__(self) -> None:
         self._data = {}
 
-    def register(self, cls: ValueT) -> None:
+    def register(self, cls: ValueT) -> ValueT:
         self._data[cls.__name__] = cls
+        return cls
 
     def get(self, name: KeyT) -> ValueT:
         return self._data.get(name)
@@ -0,0 +1,275 @@
+"""Right-sizing of the CPU and memory of flow run pods from their past usage.
+
+Hand-picked pod sizes tend to be generous, and a few are too tight and get
+OOM-killed. A metrics source gives the peak CPU and memory use of the past runs
+of each deployment, and a profile of the deployment's environment turns them
+into requests and limits:
+
+* requests cover the `request_percentile` of the peaks, plus `headroom`;
+* limits cover the `limit_percentile` of the peaks, plus `limit_headroom`, so
+  only runs using more memory than any run before them risk an OOM kill.
+
+Deployments with fewer than `min_samples` runs keep their hand-picked size.
+Metrics are read from a CSV or JSON file standing in for a metrics backend, set
+with `META_PREFECT__RESOURCE_METRICS`, or from any `MetricsSource` made active
+with `use_metrics_source`.
+"""
+import csv
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field, root_validator
+
+from meta_prefect.implementations.builders.scheduling.plan import deployment_key
+
+METRICS_ENV = "META_PREFECT__RESOURCE_METRICS"
+USAGE_COLUMNS = ["flow_name", "deployment_name", "cpu", "memory_gb"]
+CPU_STEP = 0.05  # 50 millicores
+MEMORY_STEP_GB = 0.125  # 128 MiB
+
+
+class ResourceUsage(NamedTuple):
+    """The peak use of a past flow run, in cores and GiB."""
+
+    cpu: float
+    memory_gb: float
+
+
+class MetricsSource(ABC):
+    """Where the peak usage of past flow runs is read from."""
+
+    @abstractmethod
+    async def read_usage(self, key: str) -> List[ResourceUsage]:
+        """Read the peak usage of the past runs of a deployment, by its key."""
+
+
+class FileMetricsSource(MetricsSource):
+    """Reads usage from a CSV or JSON file, with a row per past run.
+
+    Rows have `flow_name`, `deployment_name`, `cpu` and `memory_gb` fields, a
+    JSON file holding a list of such objects.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._usage: Optional[Dict[str, List[ResourceUsage]]] = None
+
+    def _load(self) -> Dict[str, List[ResourceUsage]]:
+        with open(self.path, newline="") as f:
+            rows: List[Dict[str, Any]] = (
+                json.load(f) if self.path.suffix == ".json" else list(csv.DictReader(f))
+            )
+        usage: Dict[str, List[ResourceUsage]] = defaultdict(list)
+        for row in rows:
+            key = deployment_key(row["flow_name"], row["deployment_name"])
+            usage[key].append(
+                ResourceUsage(cpu=float(row["cpu"]), memory_gb=float(row["memory_gb"]))
+            )
+        return usage
+
+    async def read_usage(self, key: str) -> List[ResourceUsage]:
+        if self._usage is None:
+            self._usage = self._load()
+        return self._usage.get(key, [])
+
+
+_active_source: ContextVar[Optional[MetricsSource]] = ContextVar(
+    "metrics_source", default=None
+)
+
+
+@contextmanager
+def use_metrics_source(source: Optional[MetricsSource]) -> Iterator[None]:
+    """Make builders in this context right-size from a metrics source."""
+    token = _active_source.set(source)
+    try:
+        yield
+    finally:
+        _active_source.reset(token)
+
+
+def get_metrics_source() -> Optional[MetricsSource]:
+    """Get the active metrics source, or the file set in the environment."""
+    source = _active_source.get()
+    if source is None and os.environ.get(METRICS_ENV):
+        source = FileMetricsSource(Path(os.environ[METRICS_ENV]))
+    return source
+
+
+class RightsizingProfile(BaseModel):
+    """How the requests and limits of an environment's pods are picked."""
+
+    request_percentile: float = Field(
+        90, ge=0, le=100, description="The percentile of peaks requests cover."
+    )
+    limit_percentile: float = Field(
+        100, ge=0, le=100, description="The percentile of peaks limits cover."
+    )
+    headroom: float = Field(
+        0.2, ge=0, description="The fraction added on top of requests."
+    )
+    limit_headroom: float = Field(
+        0.5, ge=0, description="The fraction added on top of limits."
+    )
+    min_samples: int = Field(
+        5, ge=1, description="The past runs needed to right-size a deployment."
+    )
+    min_cpu: float = Field(0.1, gt=0, description="The smallest CPU request.")
+    max_cpu: float = Field(64, gt=0, description="The largest CPU limit.")
+    min_memory_gb: float = Field(0.25, gt=0, description="The smallest memory request.")
+    max_memory_gb: float = Field(256, gt=0, description="The largest memory limit.")
+
+    @root_validator(skip_on_failure=True)
+    def _check_bounds(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["request_percentile"] > values["limit_percentile"]:
+            raise ValueError("request_percentile must not exceed limit_percentile.")
+        if values["min_cpu"] > values["max_cpu"]:
+            raise ValueError("min_cpu must not be greater than max_cpu.")
+        if values["min_memory_gb"] > values["max_memory_gb"]:
+            raise ValueError("min_memory_gb must not be greater than max_memory_gb.")
+        return values
+
+    class Config:
+        frozen = True
+
+
+DEFAULT_PROFILES: Dict[str, RightsizingProfile] = {
+    "prod": RightsizingProfile(),
+    # dev runs are sized for typical inputs, and capped
+    "dev": RightsizingProfile(
+        request_percentile=50,
+        limit_percentile=95,
+        headroom=0.1,
+        limit_headroom=0.25,
+        min_samples=3,
+        max_cpu=2,
+        max_memory_gb=8,
+    ),
+}
+
+
+class PodResources(NamedTuple):
+    """The CPU, in cores, and memory, in GiB, requested and limited for a pod."""
+
+    cpu_request: float
+    cpu_limit: float
+    memory_request_gb: float
+    memory_limit_gb: float
+
+    @classmethod
+    def fixed(cls, cpu: float, memory_gb: float) -> "PodResources":
+        """Get resources whose requests are their limits."""
+        return cls(cpu, cpu, memory_gb, memory_gb)
+
+    def manifest(self) -> Dict[str, Dict[str, str]]:
+        """Get the `resources` of a container."""
+        return {
+            "requests": {
+                "cpu": str(self.cpu_request),
+                "memory": f"{self.memory_request_gb}Gi",
+            },
+            "limits": {
+                "cpu": str(self.cpu_limit),
+                "memory": f"{self.memory_limit_gb}Gi",
+            },
+        }
+
+
+class Recommendation(NamedTuple):
+    """The resources picked for the pods of a deployment, and what they save."""
+
+    key: str
+    env: str
+    samples: int
+    current: PodResources
+    recommended: Optional[PodResources]
+    peak_memory_gb: Optional[float] = None
+
+    @property
+    def resources(self) -> PodResources:
+        """Get the recommended resources, or the current ones if none."""
+        return self.recommended or self.current
+
+    @property
+    def cpu_saved(self) -> float:
+        """Get the cores no longer requested, negative if more are."""
+        return self.current.cpu_request - self.resources.cpu_request
+
+    @property
+    def memory_saved_gb(self) -> float:
+        """Get the GiB no longer requested, negative if more are."""
+        return self.current.memory_request_gb - self.resources.memory_request_gb
+
+    @property
+    def oom_risk(self) -> bool:
+        """Whether past runs peaked at, or above, the current memory limit."""
+        return (
+            self.peak_memory_gb is not None
+            and self.peak_memory_gb >= self.current.memory_limit_gb
+        )
+
+
+def _round_up(value: float, step: float, low: float, high: float) -> float:
+    return round(min(max(math.ceil(value / step - 1e-9) * step, low), high), 3)
+
+
+def size_pods(usage: List[ResourceUsage], profile: RightsizingProfile) -> PodResources:
+    """Pick the requests and limits covering the peaks of past runs."""
+    peaks = np.array(usage, dtype=float)
+    requests = np.percentile(peaks, profile.request_percentile, axis=0) * (
+        1 + profile.headroom
+    )
+    limits = np.percentile(peaks, profile.limit_percentile, axis=0) * (
+        1 + profile.limit_headroom
+    )
+    cpu_request = _round_up(requests[0], CPU_STEP, profile.min_cpu, profile.max_cpu)
+    memory_request_gb = _round_up(
+        requests[1], MEMORY_STEP_GB, profile.min_memory_gb, profile.max_memory_gb
+    )
+    return PodResources(
+        cpu_request=cpu_request,
+        cpu_limit=_round_up(limits[0], CPU_STEP, cpu_request, profile.max_cpu),
+        memory_request_gb=memory_request_gb,
+        memory_limit_gb=_round_up(
+            limits[1], MEMORY_STEP_GB, memory_request_gb, profile.max_memory_gb
+        ),
+    )
+
+
+async def recommend(
+    key: str,
+    env: str,
+    current: PodResources,
+    profiles: Optional[Dict[str, RightsizingProfile]] = None,
+    source: Optional[MetricsSource] = None,
+) -> Recommendation:
+    """Recommend the resources of a deployment's pods from its past runs.
+
+    Args:
+        key: the key of the deployment, see `deployment_key`.
+        env: the environment of the deployment, which picks its profile.
+        current: the resources the deployment's pods are given without history.
+        profiles: the profiles by environment, the default ones if not given.
+        source: where usage is read from, the active source if not given.
+    """
+    profile = (profiles or DEFAULT_PROFILES).get(env) or RightsizingProfile()
+    source = source or get_metrics_source()
+    usage = await source.read_usage(key) if source is not None else []
+    if len(usage) < profile.min_samples:
+        return Recommendation(key, env, len(usage), current, None)
+    return Recommendation(
+        key,
+        env,
+        len(usage),
+        current,
+        size_pods(usage, profile),
+        peak_memory_gb=max(run.memory_gb for run in usage),
+    )
@@ -0,0 +1,273 @@
+"""CPU pinning, resource limits and nice levels of local flow runs.
+
+Flow runs of a local process work pool share the host, so concurrent runs
+trample each other's CPU caches and a greedy run can get the host killed for
+lack of memory. A deployment setting `RunResources` has its runs started with
+`python -m meta_prefect.implementations.run_resources`, which reads the limits
+from the run's environment, applies them to itself, then replaces itself with
+`python -m prefect.engine` like the stock process worker would start:
+
+* `cpus` pins the run to that many cores, handed out round-robin across the
+  cores of the host, by a counter shared by every run of the machine;
+* `memory_mb` and `cpu_quota` move the run into a cgroup v2 of its own, with
+  `memory.max` and `cpu.max` set, or with `limit_with="rlimit"`, or when no
+  cgroup can be created, cap the run's address space with `RLIMIT_AS`, in which
+  case the CPU quota is not enforced;
+* `nice` sets the run's nice level, e.g. per priority tier.
+
+Cgroups are created under `META_PREFECT__CGROUP_PARENT`, or else under the
+worker's own cgroup, which must be delegated to the user running the worker.
+A cgroup with processes of its own cannot hand controllers to its children, so
+the processes of the parent, the worker's included, are first moved into its
+`worker` leaf cgroup. The cgroups of finished runs are removed by the next run.
+"""
+import errno
+import fcntl
+import os
+import resource
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional
+
+from pydantic import BaseModel, Field
+
+RUN_RESOURCES_MODULE = "meta_prefect.implementations.run_resources"
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+CGROUP_PARENT_ENV = "META_PREFECT__CGROUP_PARENT"
+CGROUP_PREFIX = "meta-prefect-run-"
+WORKER_CGROUP = "worker"
+CPU_PERIOD_MICROSECONDS = 100_000
+
+# job template variables of local process work pools and the env they set
+RUN_RESOURCE_VARIABLES: Dict[str, Dict[str, Any]] = {
+    "run_cpus": {
+        "env": "META_PREFECT__RUN_CPUS",
+        "type": "integer",
+        "description": "The cores each flow run is pinned to, round-robin.",
+    },
+    "run_memory_mb": {
+        "env": "META_PREFECT__RUN_MEMORY_MB",
+        "type": "integer",
+        "description": "The most memory, in MB, of each flow run.",
+    },
+    "run_cpu_quota": {
+        "env": "META_PREFECT__RUN_CPU_QUOTA",
+        "type": "number",
+        "description": "The most cores' worth of CPU time of each flow run.",
+    },
+    "run_nice": {
+        "env": "META_PREFECT__RUN_NICE",
+        "type": "integer",
+        "description": "The nice level of each flow run.",
+    },
+    "run_limit_with": {
+        "env": "META_PREFECT__RUN_LIMIT_WITH",
+        "type": "string",
+        "description": "How memory is limited, with a cgroup or an rlimit.",
+    },
+}
+
+
+def run_resources_command() -> str:
+    """Get the command starting a flow run within its resource limits."""
+    return f"{sys.executable} -m {RUN_RESOURCES_MODULE}"
+
+
+def is_run_resources_command(command: Optional[str]) -> bool:
+    """Whether a job's command starts its flow run within resource limits."""
+    if command is None:
+        return False
+    return command.split(" ")[1:] == ["-m", RUN_RESOURCES_MODULE]
+
+
+class RunResources(BaseModel):
+    """The CPU pinning, resource limits and nice level of local flow runs."""
+
+    cpus: Optional[int] = Field(
+        None, ge=1, description="The cores each run is pinned to, round-robin."
+    )
+    memory_mb: Optional[int] = Field(
+        None, gt=0, description="The most memory, in MB, of each run."
+    )
+    cpu_quota: Optional[float] = Field(
+        None, gt=0, description="The most cores' worth of CPU time of each run."
+    )
+    nice: Optional[int] = Field(
+        None, ge=-20, le=19, description="The nice level of each run."
+    )
+    limit_with: str = Field(
+        "cgroup",
+        regex="^(cgroup|rlimit)$",
+        description="Limit memory with a cgroup v2, or with RLIMIT_AS.",
+    )
+
+    class Config:
+        frozen = True
+
+    @property
+    def is_set(self) -> bool:
+        return any(
+            value is not None
+            for value in (self.cpus, self.memory_mb, self.cpu_quota, self.nice)
+        )
+
+    def infra_overrides(self) -> Dict[str, Any]:
+        """Get the job variables of a local process deployment, if any is set."""
+        if not self.is_set:
+            return {}
+        overrides: Dict[str, Any] = {"command": run_resources_command()}
+        for variable, value in (
+            ("run_cpus", self.cpus),
+            ("run_memory_mb", self.memory_mb),
+            ("run_cpu_quota", self.cpu_quota),
+            ("run_nice", self.nice),
+        ):
+            if value is not None:
+                overrides[variable] = value
+        if self.memory_mb is not None or self.cpu_quota is not None:
+            overrides["run_limit_with"] = self.limit_with
+        return overrides
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "RunResources":
+        """Read the limits set in a flow run's environment."""
+        values = {}
+        for variable, field in (
+            ("run_cpus", "cpus"),
+            ("run_memory_mb", "memory_mb"),
+            ("run_cpu_quota", "cpu_quota"),
+            ("run_nice", "nice"),
+            ("run_limit_with", "limit_with"),
+        ):
+            value = env.get(RUN_RESOURCE_VARIABLES[variable]["env"])
+            if value not in (None, "", "None"):
+                values[field] = value
+        return cls.parse_obj(values)
+
+
+def next_cpu_set(cpus: int, counter_file: Optional[Path] = None) -> List[int]:
+    """Take the next `cpus` cores of the host, round-robin across its runs."""
+    if counter_file is None:
+        from meta_prefect.implementations.supervisor import SupervisorHome
+
+        counter_file = SupervisorHome.default().path / "cpu-round-robin"
+    cores = sorted(os.sched_getaffinity(0))
+    counter_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(counter_file, "a+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        start = int(file.read().strip() or 0)
+        file.seek(0)
+        file.truncate()
+        file.write(str((start + cpus) % len(cores)))
+    return sorted({cores[(start + i) % len(cores)] for i in range(cpus)})
+
+
+def _cgroup_parent() -> Path:
+    parent = os.environ.get(CGROUP_PARENT_ENV)
+    if parent:
+        return Path(parent)
+    with open("/proc/self/cgroup") as file:
+        for line in file:
+            if line.startswith("0::"):
+                cgroup = CGROUP_ROOT / line[3:].strip().lstrip("/")
+                # the worker was moved into the leaf of its cgroup by a run
+                return cgroup.parent if cgroup.name == WORKER_CGROUP else cgroup
+    raise OSError(errno.ENOENT, "Not in a cgroup v2 hierarchy.")
+
+
+def _remove_finished_cgroups(parent: Path) -> None:
+    for cgroup in parent.glob(f"{CGROUP_PREFIX}*"):
+        try:
+            # only empty cgroups can be removed
+            cgroup.rmdir()
+        except OSError:
+            pass
+
+
+def _move_into_leaf(parent: Path) -> None:
+    """Move the processes of a cgroup into its worker leaf cgroup."""
+    pids = (parent / "cgroup.procs").read_text().split()
+    if not pids:
+        return
+    leaf = parent / WORKER_CGROUP
+    leaf.mkdir(exist_ok=True)
+    for pid in pids:
+        try:
+            (leaf / "cgroup.procs").write_text(pid)
+        except ProcessLookupError:
+            # exited since the processes were read
+            pass
+
+
+def enter_cgroup(
+    memory_mb: Optional[int], cpu_quota: Optional[float], parent: Optional[Path] = None
+) -> Path:
+    """Move the current process into a new cgroup v2 with the given limits."""
+    parent = parent or _cgroup_parent()
+    _remove_finished_cgroups(parent)
+    controllers = (parent / "cgroup.subtree_control").read_text().split()
+    wanted = [
+        controller
+        for controller, limit in (("memory", memory_mb), ("cpu", cpu_quota))
+        if limit is not None and controller not in controllers
+    ]
+    if wanted:
+        _move_into_leaf(parent)
+        (parent / "cgroup.subtree_control").write_text(
+            " ".join(f"+{controller}" for controller in wanted)
+        )
+    cgroup = parent / f"{CGROUP_PREFIX}{os.getpid()}"
+    cgroup.mkdir(exist_ok=True)
+    if memory_mb is not None:
+        (cgroup / "memory.max").write_text(str(memory_mb * 1024 * 1024))
+    if cpu_quota is not None:
+        quota = int(cpu_quota * CPU_PERIOD_MICROSECONDS)
+        (cgroup / "cpu.max").write_text(f"{quota} {CPU_PERIOD_MICROSECONDS}")
+    (cgroup / "cgroup.procs").write_text(str(os.getpid()))
+    return cgroup
+
+
+def apply_run_resources(resources: RunResources) -> List[str]:
+    """Apply limits to the current process, and describe what was applied."""
+    applied = []
+    if resources.cpus is not None:
+        cores = next_cpu_set(resources.cpus)
+        os.sched_setaffinity(0, cores)
+        applied.append(f"pinned to cores {cores}")
+    if resources.memory_mb is not None or resources.cpu_quota is not None:
+        cgroup = None
+        if resources.limit_with == "cgroup":
+            try:
+                cgroup = enter_cgroup(resources.memory_mb, resources.cpu_quota)
+            except OSError as exc:
+                applied.append(f"no cgroup ({exc}), falling back to RLIMIT_AS")
+        if cgroup is not None:
+            applied.append(f"limited by cgroup {cgroup}")
+        else:
+            if resources.memory_mb is not None:
+                limit = resources.memory_mb * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+                applied.append(f"address space limited to {resources.memory_mb}MB")
+            if resources.cpu_quota is not None:
+                applied.append("CPU quota not enforced without a cgroup")
+    if resources.nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, resources.nice)
+        except PermissionError:
+            # lowering the nice level needs privileges
+            applied.append(f"not allowed to set nice {resources.nice}")
+        else:
+            applied.append(f"nice {resources.nice}")
+    return applied
+
+
+def main() -> None:
+    for line in apply_run_resources(RunResources.from_env(os.environ)):
+        print(f"meta-prefect: flow run {line}", file=sys.stderr)
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable, "-m", "prefect.engine"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Fan-out of flow runs across the pods of an indexed Kubernetes Job.
+
+A deployment built with `eks(parallelism=4)` runs its flow runs as an Indexed
+Job of 4 completions, where Kubernetes gives every pod its index in the
+`JOB_COMPLETION_INDEX` environment variable, and the builder the number of
+completions in `META_PREFECT__JOB_COMPLETIONS`. A partitionable flow then only
+processes its share of the inputs:
+
+    @flow
+    def backfill(days: List[str]) -> None:
+        for day in shard(days):
+            ...
+
+Prefect only lets a flow run run once, so the pods are started with
+`python -m meta_prefect.implementations.sharding`: the pod of index 0 runs the
+flow run itself, with `prefect.engine`, and every other pod runs a run of the
+same deployment, with the same parameters, tagged `shard=<index>/<count>`.
+Shard runs are created with an idempotency key, so a restarted pod picks up the
+same run. A failed shard run fails its parent too, once the parent is done, so
+that the flow run reports the failure of any of its pods.
+"""
+import os
+import sys
+from typing import Any, List, Optional, Sequence, Tuple, TYPE_CHECKING, TypeVar
+from uuid import UUID
+
+if TYPE_CHECKING:
+    from prefect.client.schemas.objects import FlowRun, State
+
+SHARDING_MODULE = "meta_prefect.implementations.sharding"
+COMPLETION_INDEX_ENV = "JOB_COMPLETION_INDEX"
+COMPLETIONS_ENV = "META_PREFECT__JOB_COMPLETIONS"
+PARENT_POLL_SECONDS = 5.0
+
+T = TypeVar("T")
+
+
+def shard_index() -> Tuple[int, int]:
+    """Get the index of this pod and the number of pods, `(0, 1)` if not indexed."""
+    count = int(os.environ.get(COMPLETIONS_ENV) or 1)
+    index = int(os.environ.get(COMPLETION_INDEX_ENV) or 0)
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} is out of range for {count} shards.")
+    return index, count
+
+
+def shard(
+    items: Sequence[T], index: Optional[int] = None, count: Optional[int] = None
+) -> List[T]:
+    """Get the items of a shard, every `count`-th item from its `index`.
+
+    Args:
+        items: the inputs of the flow run, in the same order in every pod.
+        index: the index of the shard, this pod's by default.
+        count: the number of shards, the number of pods by default.
+    """
+    if index is None or count is None:
+        pod_index, pod_count = shard_index()
+        index = pod_index if index is None else index
+        count = pod_count if count is None else count
+    return list(items[index::count])
+
+
+async def create_shard_run(
+    flow_run_id: str, index: int, count: int
+) -> Tuple["FlowRun", "FlowRun"]:
+    """Create the run of a shard of a flow run, or get it if already created."""
+    from prefect.states import Pending
+
+    from meta_prefect.implementations.client import get_client
+
+    async with get_client() as client:
+        parent = await client.read_flow_run(UUID(flow_run_id))
+        if parent.deployment_id is None:
+            raise ValueError(f"Flow run {flow_run_id} is not a run of a deployment.")
+        shard_run = await client.create_flow_run_from_deployment(
+            parent.deployment_id,
+            parameters=parent.parameters,
+            tags=[*parent.tags, f"shard={index}/{count}"],
+            idempotency_key=f"{flow_run_id}-shard-{index}",
+            state=Pending(),
+        )
+    return parent, shard_run
+
+
+async def fail_parent_run(
+    flow_run_id: str,
+    index: int,
+    count: int,
+    state: "State[Any]",
+    poll_seconds: float = PARENT_POLL_SECONDS,
+) -> None:
+    """Fail the parent of a failed shard run once it is done, unless it failed."""
+    import asyncio
+
+    from prefect.states import Failed
+
+    from meta_prefect.implementations.client import get_client
+
+    async with get_client() as client:
+        # the first pod may still run the parent, which would overwrite its state
+        parent = await client.read_flow_run(UUID(flow_run_id))
+        while parent.state is None or not parent.state.is_final():
+            await asyncio.sleep(poll_seconds)
+            parent = await client.read_flow_run(parent.id)
+        if parent.state.is_completed():
+            await client.set_flow_run_state(
+                parent.id,
+                Failed(message=f"Shard {index}/{count} failed: {state.message}"),
+                force=True,
+            )
+
+
+def run_shard(flow_run_id: str, index: int, count: int) -> int:
+    """Run the shard `index` of a flow run as a run of its own, get its exit code."""
+    import asyncio
+
+    from prefect.deployments import load_flow_from_flow_run
+    from prefect.workers.process import ProcessJobConfiguration
+
+    from meta_prefect.implementations.fast_run import run_in_process
+
+    async def load():
+        parent, shard_run = await create_shard_run(flow_run_id, index, count)
+        return await load_flow_from_flow_run(parent), shard_run
+
+    flow, shard_run = asyncio.run(load())
+    state = run_in_process(flow, shard_run, ProcessJobConfiguration())
+    if state.is_completed():
+        return 0
+    asyncio.run(fail_parent_run(flow_run_id, index, count, state))
+    return 1
+
+
+def main() -> None:
+    index, count = shard_index()
+    if index == 0:
+        # the first pod runs the flow run itself
+        os.execv(sys.executable, [sys.executable, "-m", "prefect.engine"])
+    sys.exit(run_shard(os.environ["PREFECT__FLOW_RUN_ID"], index, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+"""A supervisor keeping a fixed number of local process workers per work pool.
+
+Deploys used to start a `prefect worker` with `nohup` whenever no worker of the
+machine had sent a heartbeat recently, and never looked at it again. Instead, a
+single supervisor runs per machine. Deploys register their work pool with it,
+starting it if needed, and it keeps `count` workers polling each registered
+pool: crashed workers are restarted with exponential backoff, and on shutdown
+workers are drained, i.e. they stop picking up runs and are given time to
+finish the ones in progress.
+
+The supervisor and deploys talk through files in its home directory,
+`~/.cache/meta_prefect/workers` unless `META_PREFECT__WORKERS_HOME` is set:
+
+* `supervisor.pid`, the pid of the running supervisor, which holds an exclusive
+  lock on it so that a single supervisor runs per home;
+* `pools.json`, the registered pools, updated under a file lock;
+* `status.json`, the state of every worker, written by the supervisor;
+* `metrics.jsonl`, the decisions of the autoscaler, when autoscaling;
+* `logs/`, the output of every worker.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    IO,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from meta_prefect.implementations.utils import get_machine_id
+
+if TYPE_CHECKING:
+    from meta_prefect.implementations.autoscale import WorkerAutoscaler
+
+logger = getLogger(__name__)
+
+WORKERS_HOME_ENV = "META_PREFECT__WORKERS_HOME"
+DEFAULT_WORKERS_HOME = Path("~/.cache/meta_prefect/workers")
+MAX_DEFAULT_WORKERS = 8
+STOCK_WORKER_COMMAND = ("prefect", "worker", "start")
+SUPERVISOR_START_SECONDS = 30.0
+LOCK_ATTEMPTS = 10
+LOCK_DELAY_SECONDS = 0.1
+
+
+def default_worker_count() -> int:
+    """Get the default number of workers per pool, a quarter of the CPUs."""
+    return min(MAX_DEFAULT_WORKERS, max(1, (os.cpu_count() or 1) // 4))
+
+
+def lock_exclusively(file: IO[str]) -> bool:
+    """Take an exclusive lock on a file, unless another process holds it.
+
+    Readers probe the lock with a shared one held for an instant, so it is only
+    deemed held after a few attempts.
+    """
+    for attempt in range(LOCK_ATTEMPTS):
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if attempt < LOCK_ATTEMPTS - 1:
+                time.sleep(LOCK_DELAY_SECONDS)
+    return False
+
+
+def worker_name(slot: int) -> str:
+    """Get the name of the worker of a slot, stable across restarts."""
+    return f"ProcessWorker -- {get_machine_id()} -- {slot}"
+
+
+class WorkerProcess(Protocol):
+    """What the supervisor needs of a worker process."""
+
+    pid: int
+
+    def poll(self) -> Optional[int]:
+        ...
+
+    def send_signal(self, sig: int) -> None:
+        ...
+
+    def kill(self) -> None:
+        ...
+
+
+@dataclass(frozen=True)
+class PoolRegistration:
+    """A work pool of a Prefect profile the supervisor keeps workers for."""
+
+    work_pool_name: str
+    profile: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.profile or ''}/{self.work_pool_name}"
+
+
+@dataclass
+class WorkerSlot:
+    """A worker the supervisor keeps running, and its restart history."""
+
+    registration: PoolRegistration
+    index: int
+    run_limit: Optional[int] = None
+    command: Tuple[str, ...] = STOCK_WORKER_COMMAND
+    process: Optional[WorkerProcess] = None
+    started_at: Optional[float] = None
+    restarts: int = 0
+    failures: int = 0
+    last_exit_code: Optional[int] = None
+    next_start_at: float = 0.0
+    draining_since: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return worker_name(self.index)
+
+    @property
+    def state(self) -> str:
+        if self.draining_since is not None:
+            return "draining"
+        if self.process is not None:
+            return "running"
+        return "backoff" if self.failures else "pending"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "work_pool_name": self.registration.work_pool_name,
+            "profile": self.registration.profile,
+            "name": self.name,
+            "state": self.state,
+            "pid": self.process.pid if self.process is not None else None,
+            "started_at": self.started_at,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "next_start_at": self.next_start_at if self.process is None else None,
+        }
+
+
+class SupervisorHome:
+    """The directory the supervisor and deploys share."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path.expanduser()
+
+    @classmethod
+    def default(cls) -> "SupervisorHome":
+        """Get the home of the machine, see META_PREFECT__WORKERS_HOME."""
+        return cls(Path(os.environ.get(WORKERS_HOME_ENV, DEFAULT_WORKERS_HOME)))
+
+    @property
+    def pid_file(self) -> Path:
+        return self.path / "supervisor.pid"
+
+    @property
+    def pools_file(self) -> Path:
+        return self.path / "pools.json"
+
+    @property
+    def status_file(self) -> Path:
+        return self.path / "status.json"
+
+    @property
+    def metrics_file(self) -> Path:
+        return self.path / "metrics.jsonl"
+
+    @property
+    def logs(self) -> Path:
+        return self.path / "logs"
+
+    def _write(self, path: Path, data: Any) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(data, indent=2))
+        os.replace(temporary, path)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "pools.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def registrations(self) -> List[Tuple[PoolRegistration, Optional[int]]]:
+        """Read the registered pools, with their number of workers if set."""
+        return [
+            (
+                PoolRegistration(entry["work_pool_name"], entry["profile"]),
+                entry["count"],
+            )
+            for entry in self.pools().values()
+        ]
+
+    def pools(self) -> Dict[str, Dict[str, Any]]:
+        """Read the registered pools, with their number of workers."""
+        try:
+            pools: Dict[str, Dict[str, Any]] = json.loads(self.pools_file.read_text())
+        except FileNotFoundError:
+            return {}
+        return pools
+
+    def register(
+        self, registration: PoolRegistration, count: Optional[int] = None
+    ) -> None:
+        """Register a pool, keeping its number of workers if already registered."""
+        with self._locked():
+            pools = self.pools()
+            entry = pools.get(registration.key, {})
+            pools[registration.key] = {
+                "work_pool_name": registration.work_pool_name,
+                "profile": registration.profile,
+                "count": count if count is not None else entry.get("count"),
+            }
+            self._write(self.pools_file, pools)
+
+    def unregister(self, registration: PoolRegistration) -> None:
+        """Unregister a pool, its workers are drained."""
+        with self._locked():
+            pools = self.pools()
+            if pools.pop(registration.key, None) is not None:
+                self._write(self.pools_file, pools)
+
+    def supervisor_pid(self) -> Optional[int]:
+        """Get the pid of the running supervisor, if any.
+
+        A supervisor is running while the lock on its pid file is held, so a
+        stale pid file, or a pid reused by another process, is not mistaken for
+        one.
+        """
+        try:
+            with open(self.pid_file) as pid_file:
+                try:
+                    fcntl.flock(pid_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # the pid is written right after the lock is taken
+                    content = pid_file.read()
+                    return int(content) if content else None
+                fcntl.flock(pid_file, fcntl.LOCK_UN)
+                return None
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Read the state of the workers, as last written by the supervisor."""
+        if self.supervisor_pid() is None:
+            return []
+        try:
+            status: List[Dict[str, Any]] = json.loads(self.status_file.read_text())
+        except FileNotFoundError:
+            return []
+        return status
+
+    def write_status(self, slots: List[WorkerSlot]) -> None:
+        self._write(self.status_file, [slot.status() for slot in slots])
+
+
+def spawn_worker(home: SupervisorHome, slot: WorkerSlot) -> WorkerProcess:
+    """Start the prefect worker of a slot, logging to the home's logs."""
+    home.logs.mkdir(parents=True, exist_ok=True)
+    registration = slot.registration
+    env = dict(os.environ)
+    if registration.profile:
+        env["PREFECT_PROFILE"] = registration.profile
+    log_name = f"{registration.profile or 'default'}-{registration.work_pool_name}"
+    command = [
+        *slot.command,
+        "--name",
+        slot.name,
+        "--pool",
+        registration.work_pool_name,
+    ]
+    if slot.run_limit is not None:
+        command += ["--limit", str(slot.run_limit)]
+    with open(home.logs / f"{log_name}-{slot.index}.log", "ab") as log:
+        return subprocess.Popen(
+            command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env,
+        )
+
+
+class WorkerSupervisor:
+    """Keeps `count` workers running for every registered pool.
+
+    With an autoscaler, the number of workers of every pool is picked by the
+    autoscaler instead, and each worker runs `runs_per_worker` runs at a time.
+    """
+
+    def __init__(
+        self,
+        home: SupervisorHome,
+        count: Optional[int] = None,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        stable_seconds: float = 60.0,
+        drain_seconds: float = 300.0,
+        poll_seconds: float = 2.0,
+        spawn: Optional[Callable[[SupervisorHome, WorkerSlot], WorkerProcess]] = None,
+        clock: Callable[[], float] = time.time,
+        autoscaler: Optional["WorkerAutoscaler"] = None,
+        run_limit: Optional[int] = None,
+        worker_command: Sequence[str] = STOCK_WORKER_COMMAND,
+    ) -> None:
+        self.home = home
+        self.count = count or default_worker_count()
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.stable_seconds = stable_seconds
+        self.drain_seconds = drain_seconds
+        self.poll_seconds = poll_seconds
+        self.spawn = spawn or spawn_worker
+        self.clock = clock
+        self.autoscaler = autoscaler
+        self.run_limit = run_limit or (
+            autoscaler.config.runs_per_worker if autoscaler is not None else None
+        )
+        self.worker_command = tuple(worker_command)
+        self.slots: Dict[Tuple[str, int], WorkerSlot] = {}
+        self._stopping = False
+        self._next_autoscale = 0.0
+
+    def _wanted(self) -> Dict[Tuple[str, int], PoolRegistration]:
+        wanted = {}
+        for registration, count in self.home.registrations():
+            if self.autoscaler is not None:
+                count = self.autoscaler.workers(registration)
+            for index in range(count if count is not None else self.count):
+                wanted[(registration.key, index)] = registration
+        return wanted
+
+    def autoscale(self) -> None:
+        """Have the autoscaler pick the number of workers, once per interval."""
+        now = self.clock()
+        if self.autoscaler is None or self._stopping or now < self._next_autoscale:
+            return
+        self._next_autoscale = now + self.autoscaler.config.interval_seconds
+        registrations = [registration for registration, _ in self.home.registrations()]
+        try:
+            asyncio.run(self.autoscaler.step(registrations, now))
+        except Exception as exc:
+            # workers keep their number until the API can be read again
+            logger.warning(f"Could not autoscale workers: {exc!r}")
+
+    def _reap(self, slot: WorkerSlot, now: float) -> None:
+        if slot.process is None:
+            return
+        exit_code = slot.process.poll()
+        if exit_code is None:
+            return
+        uptime = now - (slot.started_at or now)
+        slot.process = None
+        slot.last_exit_code = exit_code
+        if slot.draining_since is not None:
+            return
+        # a worker that ran long enough before exiting starts a new backoff
+        slot.failures = 1 if uptime >= self.stable_seconds else slot.failures + 1
+        backoff = min(
+            self.max_backoff_seconds,
+            self.backoff_seconds * 2 ** (slot.failures - 1),
+        )
+        slot.next_start_at = now + backoff
+        logger.warning(
+            f"Worker {slot.name} of {slot.registration.key} exited with "
+            f"{exit_code}, restarting in {backoff:.0f}s."
+        )
+
+    def _drain(self, slot: WorkerSlot, now: float) -> bool:
+        """Drain a worker, returning whether it exited."""
+        if slot.process is None:
+            return True
+        if slot.draining_since is None:
+            slot.draining_since = now
+            # workers stop polling on SIGINT and wait for their runs to finish
+            slot.process.send_signal(signal.SIGINT)
+            logger.info(f"Draining worker {slot.name} of {slot.registration.key}.")
+        elif now - slot.draining_since >= self.drain_seconds:
+            slot.process.kill()
+            logger.warning(f"Killed worker {slot.name}, it did not drain in time.")
+        self._reap(slot, now)
+        return slot.process is None
+
+    def reconcile(self) -> List[WorkerSlot]:
+        """Start, restart and drain workers to match the registered pools."""
+        now = self.clock()
+        wanted = {} if self._stopping else self._wanted()
+        for key, registration in wanted.items():
+            if key not in self.slots:
+                self.slots[key] = WorkerSlot(
+                    registration, key[1], self.run_limit, self.worker_command
+                )
+
+        for key, slot in list(self.slots.items()):
+            if key not in wanted:
+                if self._drain(slot, now):
+                    del self.slots[key]
+                continue
+            self._reap(slot, now)
+            if slot.process is None and now >= slot.next_start_at:
+                if slot.started_at is not None:
+                    slot.restarts += 1
+                slot.process = self.spawn(self.home, slot)
+                slot.started_at = now
+                logger.info(f"Started worker {slot.name} of {slot.registration.key}.")
+
+        slots = sorted(
+            self.slots.values(),
+            key=lambda slot: (slot.registration.key, slot.index),
+        )
+        self.home.write_status(slots)
+        return slots
+
+    def stop(self, *_: Any) -> None:
+        """Drain every worker, then exit the run loop."""
+        self._stopping = True
+
+    def run(self) -> None:
+        """Supervise workers until stopped by SIGTERM or SIGINT.
+
+        Returns at once if another supervisor holds the lock on the pid file.
+        """
+        self.home.path.mkdir(parents=True, exist_ok=True)
+        # the pid file is never deleted: a supervisor could otherwise lock a
+        # new one while another still holds the lock on the deleted one
+        with open(self.home.pid_file, "a+") as pid_file:
+            if not lock_exclusively(pid_file):
+                logger.warning(
+                    "Another worker supervisor is running as "
+                    f"{self.home.supervisor_pid()}, exiting."
+                )
+                return
+            pid_file.truncate(0)
+            pid_file.write(str(os.getpid()))
+            pid_file.flush()
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+            try:
+                while True:
+                    self.autoscale()
+                    self.reconcile()
+                    if self._stopping and not self.slots:
+                        return
+                    time.sleep(self.poll_seconds)
+            finally:
+                self.home.status_file.unlink(missing_ok=True)
+                pid_file.truncate(0)
+
+
+def ensure_supervisor(home: SupervisorHome, args: Sequence[str] = ()) -> int:
+    """Start the supervisor of the machine in the background if not running.
+
+    Waits for the supervisor, or one started concurrently, to hold the lock on
+    its pid file, and returns its pid. `args` are passed on to
+    `meta-prefect workers start`.
+    """
+    pid = home.supervisor_pid()
+    if pid is not None:
+        return pid
+    home.logs.mkdir(parents=True, exist_ok=True)
+    with open(home.logs / "supervisor.log", "ab") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "meta_prefect.cli.main", "workers", "start", *args],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env={**os.environ, WORKERS_HOME_ENV: str(home.path)},
+            # outlives the deploy that started it
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + SUPERVISOR_START_SECONDS
+    while time.monotonic() < deadline:
+        pid = home.supervisor_pid()
+        if pid is not None:
+            return pid
+        if process.poll() not in (None, 0):
+            break
+        time.sleep(LOCK_DELAY_SECONDS)
+    raise RuntimeError(
+        "The worker supervisor did not start, see " f"{home.logs / 'supervisor.log'}."
+    )
@@ -0,0 +1,568 @@
+"""A process worker starting flow runs from a warm zygote.
+
+The worker polls a `process` work pool like the stock process worker, but
+instead of starting `python -m prefect.engine` for every flow run, it hands the
+run to a zygote (see `meta_prefect.implementations.zygote`) which already
+imported Prefect, the configured modules and the flow files of the deployments
+it ran before. The zygote is replaced by a fresh one after `recycle_after` runs,
+so that memory it accumulates and code changed on disk do not linger.
+
+Runs with a custom command in their job configuration are started as by the
+stock process worker, except for the command applying resource limits (see
+`meta_prefect.implementations.run_resources`), which the forks apply instead.
+
+Start it with `meta-prefect workers start --warm`, or directly with
+`python -m meta_prefect.implementations.warm_worker --pool <work pool>`.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from functools import partial
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    ContextManager,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import anyio
+from prefect.workers.process import (
+    ProcessJobConfiguration,
+    ProcessWorker,
+    ProcessWorkerResult,
+)
+
+from meta_prefect.implementations.concurrency_limits import LIMITED_ENTRYPOINT_MODULE
+from meta_prefect.implementations.run_resources import is_run_resources_command
+
+if TYPE_CHECKING:
+    from prefect.client.schemas.objects import FlowRun
+
+logger = getLogger(__name__)
+
+ZYGOTE_MODULE = "meta_prefect.implementations.zygote"
+WARM_WORKER_MODULE = "meta_prefect.implementations.warm_worker"
+
+
+def warm_worker_command(
+    pool_size: int = 1, recycle_after: int = 100, preload: Sequence[str] = ()
+) -> List[str]:
+    """Get the command starting a warm worker, to which `--pool` is added."""
+    command = [sys.executable, "-m", WARM_WORKER_MODULE]
+    command += ["--pool-size", str(pool_size), "--recycle-after", str(recycle_after)]
+    for module in preload:
+        command += ["--preload", module]
+    return command
+
+
+def preload_targets(entrypoint: Optional[str]) -> List[str]:
+    """Get the modules and scripts to preload for a deployment's entrypoint."""
+    if not entrypoint:
+        return []
+    target, _, name = entrypoint.partition(":")
+    if target == LIMITED_ENTRYPOINT_MODULE:
+        # the entrypoint of a limited flow wraps the flow's own entrypoint
+        return [target, name.rpartition("@")[0]]
+    return [target]
+
+
+class ZygoteClient:
+    """A zygote process and the flow runs it was handed."""
+
+    def __init__(self, pool_size: int = 1) -> None:
+        self.pool_size = pool_size
+        self.runs = 0
+        self.retired = False
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listener: Optional["asyncio.Task[None]"] = None
+        self._futures: Dict[Tuple[str, str], "asyncio.Future[Any]"] = {}
+
+    async def start(self) -> None:
+        """Start the zygote and wait for it to be warm."""
+        parent, child = socket.socketpair()
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            ZYGOTE_MODULE,
+            "--fd",
+            str(child.fileno()),
+            "--pool-size",
+            str(self.pool_size),
+            pass_fds=(child.fileno(),),
+        )
+        child.close()
+        reader, self._writer = await asyncio.open_unix_connection(sock=parent)
+        ready = json.loads(await reader.readline() or b"{}")
+        if ready.get("event") != "ready":
+            raise RuntimeError("The zygote exited before it was ready.")
+        self._listener = asyncio.get_running_loop().create_task(self._listen(reader))
+
+    def _future(self, event: str, key: str) -> "asyncio.Future[Any]":
+        future = self._futures.get((event, key))
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[(event, key)] = future
+        return future
+
+    async def _listen(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                break
+            if not line:
+                break
+            message = json.loads(line)
+            event = message.pop("event")
+            key = message.get("id") or message.get("target")
+            future = self._future(event, key)
+            self._futures.pop((event, key))
+            if not future.done():
+                future.set_result(message)
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(RuntimeError("The zygote exited."))
+        self._futures.clear()
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        if self._writer is None:
+            raise RuntimeError("The zygote is not started.")
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        await self._writer.drain()
+
+    async def run(
+        self, env: Dict[str, str], cwd: str, stream_output: bool = True
+    ) -> Tuple[int, Awaitable[int]]:
+        """Start a flow run, returning its pid and an awaitable of its returncode."""
+        job_id = str(uuid.uuid4())
+        started = self._future("started", job_id)
+        exited = self._future("exited", job_id)
+        self.runs += 1
+        await self._send(
+            {
+                "op": "run",
+                "id": job_id,
+                "env": env,
+                "cwd": cwd,
+                "stream_output": stream_output,
+            }
+        )
+
+        async def returncode() -> int:
+            code: int = (await exited)["returncode"]
+            return code
+
+        pid: int = (await started)["pid"]
+        return pid, returncode()
+
+    async def preload(self, target: str, cwd: Optional[str] = None) -> Optional[str]:
+        """Preload a module or script, returning the error if it failed."""
+        preloaded = self._future("preloaded", target)
+        await self._send({"op": "preload", "target": target, "cwd": cwd})
+        error: Optional[str] = (await preloaded)["error"]
+        return error
+
+    async def retire(self) -> None:
+        """Have the zygote exit once its runs are done."""
+        if self.retired:
+            return
+        self.retired = True
+        with contextlib.suppress(ConnectionError):
+            await self._send({"op": "retire"})
+
+    async def wait(self) -> None:
+        if self.process is not None:
+            await self.process.wait()
+        if self._listener is not None:
+            await self._listener
+
+
+class WarmPool:
+    """Hands flow runs to a zygote, replaced after `recycle_after` runs."""
+
+    def __init__(
+        self,
+        pool_size: int = 1,
+        recycle_after: int = 100,
+        preload: Sequence[str] = (),
+    ) -> None:
+        self.pool_size = pool_size
+        self.recycle_after = recycle_after
+        # preloaded modules and scripts, with the directory scripts run from
+        self.preloads: Dict[str, Optional[str]] = dict.fromkeys(preload)
+        self.zygote: Optional[ZygoteClient] = None
+        self._next: Optional["asyncio.Task[ZygoteClient]"] = None
+        self._retired: List[ZygoteClient] = []
+        self._tasks: List["asyncio.Task[Any]"] = []
+        self._lock = asyncio.Lock()
+
+    async def _start_zygote(self) -> ZygoteClient:
+        zygote = ZygoteClient(self.pool_size)
+        await zygote.start()
+        for target, cwd in list(self.preloads.items()):
+            await self._preload(zygote, target, cwd)
+        return zygote
+
+    async def _preload(
+        self, zygote: ZygoteClient, target: str, cwd: Optional[str]
+    ) -> None:
+        error = await zygote.preload(target, cwd)
+        if error is not None:
+            logger.warning(f"Could not preload {target}: {error}")
+
+    def _warm_up(self) -> "asyncio.Task[ZygoteClient]":
+        if self._next is None:
+            self._next = asyncio.ensure_future(self._start_zygote())
+        return self._next
+
+    def warm_up(self) -> None:
+        """Start the first zygote in the background."""
+        if self.zygote is None:
+            self._warm_up()
+
+    async def ready(self) -> None:
+        """Wait for the current zygote to be warm."""
+        await self._current()
+
+    async def _current(self) -> ZygoteClient:
+        if self.zygote is None:
+            self.zygote, self._next = await self._warm_up(), None
+        return self.zygote
+
+    async def run(
+        self, env: Dict[str, str], cwd: str, stream_output: bool = True
+    ) -> Tuple[int, Awaitable[int]]:
+        """Start a flow run from the current zygote."""
+        # a zygote being retired takes no more runs
+        async with self._lock:
+            zygote = await self._current()
+            started = await zygote.run(env, cwd, stream_output)
+            if zygote.runs >= self.recycle_after:
+                # the next zygote warms up while the runs of this one finish
+                self.zygote = None
+                self._next = asyncio.ensure_future(self._start_zygote())
+                self._retired.append(zygote)
+                await zygote.retire()
+        return started
+
+    def learn(self, target: str, cwd: Optional[str] = None) -> None:
+        """Preload a module or script in the current and future zygotes."""
+        if target in self.preloads:
+            return
+        self.preloads[target] = cwd
+        if self.zygote is not None:
+            self._tasks.append(
+                asyncio.ensure_future(self._preload(self.zygote, target, cwd))
+            )
+
+    async def close(self) -> None:
+        """Retire every zygote and wait for them to exit."""
+        if self._next is not None:
+            self.zygote = self.zygote or await self._next
+        zygotes = [*self._retired, *([self.zygote] if self.zygote else [])]
+        for zygote in zygotes:
+            await zygote.retire()
+        for zygote in zygotes:
+            await zygote.wait()
+        for task in self._tasks:
+            with contextlib.suppress(Exception):
+                await task
+
+
+class WarmProcessWorker(ProcessWorker):
+    """A process worker starting flow runs from a warm zygote."""
+
+    _description = "Execute flow runs in processes forked from a warm zygote."
+    _display_name = "Warm Local Subprocess"
+
+    def __init__(
+        self,
+        *args: Any,
+        pool_size: int = 1,
+        recycle_after: int = 100,
+        preload: Sequence[str] = (),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._pool = WarmPool(pool_size, recycle_after, preload)
+        self._entrypoints: Dict[uuid.UUID, Tuple[List[str], Optional[str]]] = {}
+
+    @classmethod
+    def __dispatch_key__(cls) -> str:
+        # polls process work pools, but does not replace the stock worker
+        return "warm-process"
+
+    async def setup(self) -> None:
+        await super().setup()  # type: ignore[no-untyped-call]
+        self._pool.warm_up()
+
+    async def teardown(self, *exc_info: Any) -> None:
+        await super().teardown(*exc_info)  # type: ignore[no-untyped-call]
+        await self._pool.close()
+
+    async def _learn(self, flow_run: "FlowRun") -> None:
+        """Preload the flow file of the run's deployment for its next runs."""
+        if flow_run.deployment_id is None or self._client is None:
+            return
+        if flow_run.deployment_id not in self._entrypoints:
+            deployment = await self._client.read_deployment(flow_run.deployment_id)
+            self._entrypoints[flow_run.deployment_id] = (
+                preload_targets(deployment.entrypoint),
+                deployment.path,
+            )
+        targets, path = self._entrypoints[flow_run.deployment_id]
+        for target in targets:
+            self._pool.learn(target, path)
+
+    async def run(  # type: ignore[override]
+        self,
+        flow_run: "FlowRun",
+        configuration: ProcessJobConfiguration,
+        task_status: Optional["anyio.abc.TaskStatus[str]"] = None,
+    ) -> ProcessWorkerResult:
+        # forks apply the resource limits of runs themselves
+        if configuration.command != f"{sys.executable} -m prefect.engine" and not (
+            is_run_resources_command(configuration.command)
+        ):
+            result: ProcessWorkerResult = await super().run(
+                flow_run, configuration, task_status
+            )
+            return result
+
+        flow_run_logger = self.get_flow_run_logger(flow_run)
+        flow_run_logger.info("Forking a warm process...")
+        env = {
+            key: str(value)
+            for key, value in configuration.env.items()
+            if value is not None
+        }
+        working_dir_ctx: ContextManager[Any]
+        if not configuration.working_dir:
+            working_dir_ctx = tempfile.TemporaryDirectory(suffix="prefect")
+        else:
+            working_dir_ctx = contextlib.nullcontext(configuration.working_dir)
+        with working_dir_ctx as working_dir:
+            pid, returncode = await self._pool.run(
+                env, str(working_dir), configuration.stream_output
+            )
+            if task_status is not None:
+                task_status.started(f"{socket.gethostname()}:{pid}")
+            try:
+                await self._learn(flow_run)
+            except Exception as exc:
+                flow_run_logger.debug(
+                    f"Could not read the entrypoint to preload: {exc}"
+                )
+            status_code = await returncode
+
+        if status_code:
+            flow_run_logger.error(
+                f"Process {pid} exited with status code: {status_code}"
+            )
+        else:
+            flow_run_logger.info(f"Process {pid} exited cleanly.")
+        return ProcessWorkerResult(status_code=status_code, identifier=str(pid))
+
+
+async def start_warm_worker(
+    work_pool_name: str,
+    name: Optional[str] = None,
+    limit: Optional[int] = None,
+    pool_size: int = 1,
+    recycle_after: int = 100,
+    preload: Sequence[str] = (),
+) -> None:
+    """Poll a work pool and run its flow runs until interrupted.
+
+    Like `prefect worker start`, a first SIGINT or SIGTERM stops polling and
+    waits for the runs in progress to finish.
+    """
+    from prefect.settings import (
+        PREFECT_WORKER_HEARTBEAT_SECONDS,
+        PREFECT_WORKER_QUERY_SECONDS,
+    )
+    from prefect.utilities.processutils import setup_signal_handlers_worker
+    from prefect.utilities.services import critical_service_loop
+
+    setup_signal_handlers_worker(os.getpid(), "the warm process worker", print)
+    query_seconds = PREFECT_WORKER_QUERY_SECONDS.value()
+    async with WarmProcessWorker(
+        work_pool_name=work_pool_name,
+        name=name,
+        limit=limit,
+        pool_size=pool_size,
+        recycle_after=recycle_after,
+        preload=preload,
+    ) as worker:
+        print(f"Worker {worker.name!r} started!")
+        async with anyio.create_task_group() as task_group:
+            await worker.sync_with_backend()
+            for workload, interval in (
+                (worker.get_and_submit_flow_runs, query_seconds),
+                (worker.sync_with_backend, PREFECT_WORKER_HEARTBEAT_SECONDS.value()),
+                (worker.check_for_cancelled_flow_runs, query_seconds * 2),
+            ):
+                task_group.start_soon(
+                    partial(
+                        critical_service_loop,
+                        workload=workload,
+                        interval=interval,
+                        printer=print,
+                        jitter_range=0.3,
+                    )
+                )
+    print(f"Worker {worker.name!r} stopped!")
+
+
+BENCHMARK_FLOW = """
+import time
+
+{imports}
+from prefect import flow
+
+
+@flow(name="meta-prefect-run-start-benchmark")
+def benchmark(output: str) -> None:
+    with open(output, "a") as file:
+        file.write(f"{{time.time()}}\\n")
+"""
+
+
+class BenchmarkResult(NamedTuple):
+    """The run-start latencies of a worker, in seconds."""
+
+    worker: str
+    start_seconds: List[float]
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.start_seconds)
+
+    @property
+    def p90(self) -> float:
+        ordered = sorted(self.start_seconds)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+
+async def benchmark_run_start(
+    runs: int = 5,
+    imports: Sequence[str] = (),
+    work_pool_name: str = "meta-prefect-benchmark",
+) -> List[BenchmarkResult]:
+    """Measure the time from handing a flow run to a worker to its flow starting.
+
+    A deployment of a flow importing `imports` is created in a process work pool
+    of the current workspace, and run `runs` times, one run at a time, by the
+    stock process worker and by the warm worker preloading `imports`, once its
+    zygote is up. The deployment is deleted afterwards.
+    """
+    from prefect.client.schemas.actions import WorkPoolCreate
+    from prefect.exceptions import ObjectAlreadyExists
+
+    from meta_prefect.implementations.client import get_client
+
+    workers: Dict[str, Callable[..., ProcessWorker]] = {
+        "process": ProcessWorker,
+        "warm-process": partial(WarmProcessWorker, preload=imports),
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        flow_file = Path(directory) / "benchmark_flow.py"
+        flow_file.write_text(
+            BENCHMARK_FLOW.format(
+                imports="\n".join(f"import {module}" for module in imports)
+            )
+        )
+        output = Path(directory) / "starts.txt"
+        async with get_client() as client:
+            with contextlib.suppress(ObjectAlreadyExists):
+                await client.create_work_pool(
+                    WorkPoolCreate(name=work_pool_name, type="process")
+                )
+            flow_id = await client.create_flow_from_name(
+                "meta-prefect-run-start-benchmark"
+            )
+            deployment_id = await client.create_deployment(
+                flow_id,
+                "run-start",
+                work_pool_name=work_pool_name,
+                path=directory,
+                entrypoint="benchmark_flow.py:benchmark",
+                parameters={"output": str(output)},
+            )
+            try:
+                for kind, worker_class in workers.items():
+                    start_seconds = []
+                    async with worker_class(work_pool_name=work_pool_name) as worker:
+                        await worker.sync_with_backend()
+                        if kind == "warm-process":
+                            await worker._pool.ready()
+                        for _ in range(runs):
+                            flow_run = await client.create_flow_run_from_deployment(
+                                deployment_id
+                            )
+                            configuration = await worker._get_configuration(flow_run)
+                            handed_at = time.time()
+                            await worker.run(flow_run, configuration)
+                            start_seconds.append(
+                                float(output.read_text().split()[-1]) - handed_at
+                            )
+                    results.append(BenchmarkResult(kind, start_seconds))
+            finally:
+                await client.delete_deployment(deployment_id)
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pool", required=True, help="The work pool to poll.")
+    parser.add_argument("--name", help="The name of the worker.")
+    parser.add_argument("--limit", type=int, help="The most runs at a time.")
+    parser.add_argument(
+        "--pool-size", type=int, default=1, help="The idle forked processes kept."
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="The runs after which the zygote is replaced.",
+    )
+    parser.add_argument(
+        "--preload",
+        action="append",
+        default=[],
+        help="A module to import in the zygote, can be repeated.",
+    )
+    args = parser.parse_args(argv)
+    asyncio.run(
+        start_warm_worker(
+            args.pool,
+            args.name,
+            args.limit,
+            args.pool_size,
+            args.recycle_after,
+            args.preload,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""A zygote forking warm interpreters to run flow runs in.
+
+The process worker starts every flow run with `python -m prefect.engine`, which
+imports Prefect and the flow's dependencies again each time. The zygote is a
+Python process which imports them once, then keeps `pool_size` forked copies of
+itself idle. A flow run is handed to an idle copy, which sets the run's
+environment and working directory and runs `prefect.engine` like the stock
+worker does, so the run starts without importing anything.
+
+The zygote talks to the worker owning it over a socket, in JSON lines:
+
+* `{"op": "run", "id": ..., "env": {...}, "cwd": ..., "stream_output": ...}`
+  is answered with `{"event": "started", "id": ..., "pid": ...}`, and later
+  `{"event": "exited", "id": ..., "pid": ..., "returncode": ...}`;
+* `{"op": "preload", "target": ..., "cwd": ...}` imports a module, or runs a
+  script such as a flow file from `cwd`, then replaces the idle copies with
+  warmer ones, and is answered with `{"event": "preloaded", "target": ...,
+  "error": ...}`;
+* `{"op": "retire"}`, or the worker closing the socket, makes the zygote exit
+  once its runs are done.
+
+The zygote only imports modules and forks, it never starts threads or event
+loops, which would not survive a fork.
+"""
+import argparse
+import atexit
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import sys
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+DEFAULT_PRELOAD = ("prefect", "prefect.engine")
+
+
+def returncode_from_status(status: int) -> int:
+    """Get a returncode like `subprocess`'s from a `waitpid` status."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def preload(target: str, cwd: Optional[str] = None) -> None:
+    """Import a module, or run a `.py` script from `cwd` for its imports."""
+    if not target.endswith(".py"):
+        importlib.import_module(target)
+        return
+    from prefect.utilities.importtools import load_script_as_module
+
+    previous = os.getcwd()
+    try:
+        if cwd:
+            os.chdir(cwd)
+        load_script_as_module(target)
+    finally:
+        os.chdir(previous)
+
+
+def _run_flow_run(job: Dict[str, Any]) -> int:
+    """Run a flow run in a forked copy, as `python -m prefect.engine` would."""
+    import runpy
+    import warnings
+
+    import prefect.context
+    from prefect.logging.configuration import setup_logging
+
+    from meta_prefect.implementations.run_resources import (
+        apply_run_resources,
+        RunResources,
+    )
+
+    os.environ.clear()
+    os.environ.update(job["env"])
+    os.chdir(job["cwd"])
+    if not job.get("stream_output", True):
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+    for line in apply_run_resources(RunResources.from_env(os.environ)):
+        print(f"meta-prefect: flow run {line}", file=sys.stderr)
+    # settings were read from the zygote's environment on import
+    prefect.context.GLOBAL_SETTINGS_CONTEXT = prefect.context.root_settings_context()
+    setup_logging()
+    sys.argv = [sys.executable]
+    try:
+        with warnings.catch_warnings():
+            # prefect imports its engine, which `python -m prefect.engine` runs again
+            warnings.filterwarnings("ignore", "'prefect.engine' found in sys.modules")
+            runpy.run_module("prefect.engine", run_name="__main__", alter_sys=True)
+    except SystemExit as exc:
+        code = exc.code
+        return code if isinstance(code, int) else (0 if code is None else 1)
+    return 0
+
+
+class Zygote:
+    """Forks idle copies of itself and hands them the flow runs to run."""
+
+    def __init__(self, control: socket.socket, pool_size: int) -> None:
+        self.control = control
+        self.pool_size = pool_size
+        self.idle: List[Tuple[int, int]] = []  # (pid, write end of its job pipe)
+        self.runs: Dict[int, str] = {}  # pid -> job id
+        self.retiring = False
+        self._buffer = b""
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        try:
+            self.control.sendall(json.dumps(message).encode() + b"\n")
+        except OSError:
+            # the worker is gone, finish the runs in progress and exit
+            self.retire()
+
+    def _child(self, job_pipe: int) -> None:
+        """Wait for a job as an idle copy, run it and exit."""
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.control.close()
+        for _, pipe in self.idle:
+            os.close(pipe)
+        chunks = []
+        while True:
+            chunk = os.read(job_pipe, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        code = 0
+        if chunks:
+            try:
+                code = _run_flow_run(json.loads(b"".join(chunks)))
+            except BaseException:
+                logger.exception("The flow run failed to start.")
+                code = 1
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            atexit._run_exitfuncs()
+        finally:
+            os._exit(code)
+
+    def fork_idle(self) -> None:
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(write_end)
+            self._child(read_end)
+        os.close(read_end)
+        self.idle.append((pid, write_end))
+
+    def _refill(self) -> None:
+        while not self.retiring and len(self.idle) < self.pool_size:
+            self.fork_idle()
+
+    def _release_idle(self) -> None:
+        # idle copies exit when their job pipe is closed without a job
+        for _, pipe in self.idle:
+            os.close(pipe)
+        self.idle = []
+
+    def retire(self) -> None:
+        self.retiring = True
+        self._release_idle()
+
+    def _handle(self, message: Dict[str, Any]) -> None:
+        if message["op"] == "run":
+            if not self.idle:
+                self.fork_idle()
+            pid, pipe = self.idle.pop(0)
+            job = {key: value for key, value in message.items() if key != "op"}
+            os.write(pipe, json.dumps(job).encode())
+            os.close(pipe)
+            self.runs[pid] = message["id"]
+            self._send({"event": "started", "id": message["id"], "pid": pid})
+            self._refill()
+        elif message["op"] == "preload":
+            error = None
+            try:
+                preload(message["target"], message.get("cwd"))
+            except Exception as exc:
+                error = repr(exc)
+            else:
+                # copies forked before the preload are not warm for it
+                self._release_idle()
+                self._refill()
+            self._send(
+                {"event": "preloaded", "target": message["target"], "error": error}
+            )
+        elif message["op"] == "retire":
+            self.retire()
+
+    def _read_control(self) -> None:
+        data = self.control.recv(65536)
+        if not data:
+            self.retire()
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self._handle(json.loads(line))
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            job_id = self.runs.pop(pid, None)
+            if job_id is not None:
+                self._send(
+                    {
+                        "event": "exited",
+                        "id": job_id,
+                        "pid": pid,
+                        "returncode": returncode_from_status(status),
+                    }
+                )
+            else:
+                # an idle copy died before it was handed a run
+                for idle, pipe in self.idle:
+                    if idle == pid:
+                        os.close(pipe)
+                self.idle = [(idle, pipe) for idle, pipe in self.idle if idle != pid]
+
+    def serve(self) -> None:
+        """Hand out flow runs until retired and every run exited."""
+        self._refill()
+        self._send({"event": "ready", "pid": os.getpid()})
+        while not (self.retiring and not self.runs):
+            readable = [] if self.retiring else [self.control]
+            ready, _, _ = select.select(readable, [], [], 0.05)
+            if ready:
+                self._read_control()
+            self._reap()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fd", type=int, required=True)
+    parser.add_argument("--pool-size", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # interrupts are for the worker, which drains its runs before retiring us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for target in DEFAULT_PRELOAD:
+        preload(target)
+    Zygote(socket.socket(fileno=args.fd), args.pool_size).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 from typing import Any, Dict
 
 from prefect.deployments import Deployment as _Deployment  # type: ignore
+from prefect.utilities.asyncutils import sync_compatible
 
 
 class Deployment(_Deployment):
     """Prefect deployment with additional properties."""
 
     additional_properties: Dict[str, Any] = {}
+
+    @sync_compatible
+    async def load(self) -> bool:
+        """Load the deployment from the API, keeping its additional properties."""
+        # the API does not store additional properties, so they are not loaded
+        self.__fields_set__.add("additional_properties")
+        return await super().load()
@@ -0,0 +1,108 @@
+"""A fake Kubernetes API whose pods take a while to run, as after scheduling."""
+import asyncio
+import copy
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from meta_prefect.implementations.kubernetes_api import KubernetesApi, Manifest
+
+ObjectKey = Tuple[str, Optional[str], str]
+
+
+class FakeKubernetesApi(KubernetesApi):
+    """Keeps applied objects, and starts the pods of Jobs and Deployments.
+
+    Pods are pending for `pod_start_seconds`, standing in for scheduling, image
+    pulls and container startup, and then running. Applies take `latency_seconds`,
+    and the most applies in flight at once are kept.
+    """
+
+    def __init__(
+        self, pod_start_seconds: float = 0.05, latency_seconds: float = 0
+    ) -> None:
+        self.pod_start_seconds = pod_start_seconds
+        self.latency_seconds = latency_seconds
+        self.applied: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.objects: Dict[ObjectKey, Manifest] = {}
+        self.pods: Dict[ObjectKey, List[Tuple[float, Dict[str, str]]]] = {}
+        self.calls: Counter = Counter()
+
+    @staticmethod
+    def _key(kind: str, name: str, namespace: Optional[str]) -> ObjectKey:
+        return kind, namespace, name
+
+    def _start_pods(self, key: ObjectKey, manifest: Manifest) -> None:
+        kind, _, name = key
+        if kind == "Job":
+            pods = [{"job-name": name}] * manifest["spec"].get("parallelism", 1)
+        elif kind == "Deployment":
+            labels = manifest["spec"]["template"]["metadata"]["labels"]
+            pods = [labels] * manifest["spec"].get("replicas", 1)
+        else:
+            return
+        ready_at = asyncio.get_running_loop().time() + self.pod_start_seconds
+        self.pods[key] = [(ready_at, labels) for labels in pods]
+
+    async def apply(self, manifest: Manifest) -> Manifest:
+        self.calls["apply"] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency_seconds)
+        finally:
+            self.in_flight -= 1
+        self.applied.append(manifest["kind"])
+        metadata = manifest["metadata"]
+        key = self._key(manifest["kind"], metadata["name"], metadata.get("namespace"))
+        if key not in self.objects:
+            self._start_pods(key, manifest)
+            self.calls["create"] += 1
+        elif manifest["kind"] == "Deployment" and (
+            manifest["spec"] != self.objects[key]["spec"]
+        ):
+            # a changed Deployment rolls its pods out again
+            self._start_pods(key, manifest)
+        self.objects[key] = copy.deepcopy(manifest)
+        return copy.deepcopy(manifest)
+
+    async def read(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> Optional[Manifest]:
+        self.calls["read"] += 1
+        manifest = self.objects.get(self._key(kind, name, namespace))
+        return copy.deepcopy(manifest) if manifest is not None else None
+
+    async def delete(
+        self, api_version: str, kind: str, name: str, namespace: Optional[str] = None
+    ) -> None:
+        self.calls["delete"] += 1
+        key = self._key(kind, name, namespace)
+        self.objects.pop(key, None)
+        self.pods.pop(key, None)
+
+    async def list_objects(
+        self, api_version: str, kind: str, namespace: str, labels: Dict[str, str]
+    ) -> List[Manifest]:
+        self.calls["list_objects"] += 1
+        return [
+            copy.deepcopy(manifest)
+            for (object_kind, object_namespace, _), manifest in self.objects.items()
+            if (object_kind, object_namespace) == (kind, namespace)
+            and labels.items() <= manifest["metadata"].get("labels", {}).items()
+        ]
+
+    async def list_pods(self, namespace: str, labels: Dict[str, str]) -> List[Manifest]:
+        self.calls["list_pods"] += 1
+        now = asyncio.get_running_loop().time()
+        return [
+            {
+                "metadata": {"namespace": namespace, "labels": pod_labels},
+                "status": {"phase": "Running" if now >= ready_at else "Pending"},
+            }
+            for (_, pod_namespace, _), pods in self.pods.items()
+            if pod_namespace == namespace
+            for ready_at, pod_labels in pods
+            if labels.items() <= pod_labels.items()
+        ]
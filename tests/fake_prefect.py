@@ -0,0 +1,74 @@
+"""A fake Prefect client serving work pools, queues and deployments by page."""
+import asyncio
+from typing import Any, Awaitable, List, Sequence, TypeVar
+from uuid import uuid4
+
+from prefect.client.schemas.objects import WorkPool, WorkQueue
+
+from meta_prefect.implementations.client import _pooled_client
+from meta_prefect.implementations.index import invalidate_indexes
+
+T = TypeVar("T")
+
+
+class FakePrefectClient:
+    """Serves work pools, their queues and deployments, counting the pages read.
+
+    Queues without a work pool are served for every pool.
+    """
+
+    def __init__(self) -> None:
+        self.work_pools: List[WorkPool] = []
+        self.work_queues: List[WorkQueue] = []
+        self.deployments: List[Any] = []
+        self.reads = 0
+
+    def _page(self, items: Sequence[T], limit: int, offset: int) -> List[T]:
+        self.reads += 1
+        return list(items[offset : offset + limit])
+
+    def add_work_pool(self, name: str, type: str = "process", **kwargs: Any) -> None:
+        self.work_pools.append(
+            WorkPool(name=name, type=type, default_queue_id=uuid4(), **kwargs)
+        )
+
+    def add_work_queue(self, name: str, **kwargs: Any) -> WorkQueue:
+        work_queue = WorkQueue(id=uuid4(), name=name, **kwargs)
+        self.work_queues.append(work_queue)
+        return work_queue
+
+    async def read_work_pools(
+        self, work_pool_filter: Any, limit: int = 200, offset: int = 0
+    ) -> List[WorkPool]:
+        types = set(work_pool_filter.type.any_)
+        work_pools = [pool for pool in self.work_pools if pool.type in types]
+        return self._page(work_pools, limit, offset)
+
+    async def read_work_queues(
+        self, work_pool_name: str, limit: int = 200, offset: int = 0
+    ) -> List[WorkQueue]:
+        work_queues = [
+            work_queue
+            for work_queue in self.work_queues
+            if work_queue.work_pool_name in (None, work_pool_name)
+        ]
+        return self._page(work_queues, limit, offset)
+
+    async def read_deployments(
+        self, limit: int = 200, offset: int = 0, **filters: Any
+    ) -> List[Any]:
+        return self._page(self.deployments, limit, offset)
+
+
+def run_with_client(client: Any, coroutine: Awaitable[T]) -> T:
+    """Run a coroutine with the client as the pooled one, and fresh indexes."""
+
+    async def run() -> T:
+        invalidate_indexes()
+        token = _pooled_client.set(client)
+        try:
+            return await coroutine
+        finally:
+            _pooled_client.reset(token)
+
+    return asyncio.run(run())
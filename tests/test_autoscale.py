@@ -0,0 +1,186 @@
+"""Test the supervisor's workers scale with the backlog of their pools."""
+import asyncio
+import json
+from typing import List
+
+from meta_prefect.implementations.autoscale import (
+    AutoscaleApi,
+    AutoscaleConfig,
+    HostMemory,
+    MB,
+    PoolBacklog,
+    scale_workers,
+    WorkerAutoscaler,
+)
+from meta_prefect.implementations.supervisor import (
+    PoolRegistration,
+    SupervisorHome,
+    WorkerSupervisor,
+)
+
+GB = 1024 * MB
+POOL = PoolRegistration("pool", "prod")
+
+
+class SimulatedApi(AutoscaleApi):
+    """A pool whose workers each run one run of `run_seconds` at a time."""
+
+    run_seconds = 60.0
+
+    def __init__(self, trace: List[int], interval: float, memory: HostMemory):
+        self.trace = trace
+        self.interval = interval
+        self.memory = memory
+        self.workers = 1
+        self.waiting: List[float] = []  # seconds waited
+        self.running: List[float] = []  # seconds left
+        self.tick = 0
+
+    def advance(self) -> None:
+        self.running = [left - self.interval for left in self.running]
+        self.running = [left for left in self.running if left > 0]
+        self.waiting = [waited + self.interval for waited in self.waiting]
+        self.waiting += [0.0] * (
+            self.trace[self.tick] if self.tick < len(self.trace) else 0
+        )
+        self.tick += 1
+        while self.waiting and len(self.running) < self.workers:
+            self.waiting.pop(0)
+            self.running.append(self.run_seconds)
+
+    async def read_backlog(self, registration):
+        return PoolBacklog(
+            due=len(self.waiting),
+            late=sum(waited > 30 for waited in self.waiting),
+            running=len(self.running),
+            latency_seconds=max(self.waiting, default=0.0),
+        )
+
+    async def read_memory(self):
+        return self.memory
+
+
+CONFIG = AutoscaleConfig(
+    min_workers=1,
+    max_workers=8,
+    interval_seconds=15,
+    scale_up_cooldown_seconds=30,
+    scale_down_cooldown_seconds=120,
+    worker_memory_mb=1024,
+)
+
+
+def _simulate(api: SimulatedApi, ticks: int, tmp_path) -> WorkerAutoscaler:
+    autoscaler = WorkerAutoscaler(api, CONFIG, metrics_file=tmp_path / "metrics.jsonl")
+
+    async def main():
+        for tick in range(ticks):
+            api.advance()
+            await autoscaler.step([POOL], tick * CONFIG.interval_seconds)
+            api.workers = autoscaler.workers(POOL)
+
+    asyncio.run(main())
+    return autoscaler
+
+
+def test_workers_follow_a_burst_without_flapping(tmp_path):
+    """Test a burst adds workers up to the bound, then they go one at a time.
+
+    20 runs arrive at once. Workers are added at most 4 at a time and once per
+    scale up cooldown, then removed one per scale down cooldown once the
+    backlog drained, and the count never goes back up in between.
+    """
+    api = SimulatedApi([20], interval=15, memory=HostMemory(32 * GB, 64 * GB))
+
+    _simulate(api, ticks=60, tmp_path=tmp_path)
+
+    metrics = [
+        json.loads(line)
+        for line in (tmp_path / "metrics.jsonl").read_text().splitlines()
+    ]
+    workers = [entry["workers"] for entry in metrics]
+    changes = [
+        entry for entry in metrics if entry["workers"] != entry["previous_workers"]
+    ]
+    assert workers[:5] == [5, 5, 8, 8, 8]
+    peak = workers.index(8)
+    assert workers[: peak + 1] == sorted(workers[: peak + 1])
+    assert workers[peak:] == sorted(workers[peak:], reverse=True)
+    assert workers[-1] == 1
+    down = [
+        entry["time"]
+        for entry in changes
+        if entry["workers"] < entry["previous_workers"]
+    ]
+    assert all(b - a >= 120 for a, b in zip(down, down[1:]))
+    # a single worker would keep the last run waiting for 19 minutes
+    assert max(entry["latency_seconds"] for entry in metrics) <= 120
+    assert {"due", "late", "running", "memory_available_mb"} <= set(metrics[0])
+
+
+def test_memory_headroom_caps_and_sheds_workers():
+    """Test workers are only added within the memory left above the headroom."""
+    waiting = PoolBacklog(due=10, late=10, running=2)
+    # 8GB available, 6.4GB of which kept free: one 1GB worker fits
+    tight = HostMemory(available=8 * GB, total=32 * GB)
+    full = HostMemory(available=6 * GB, total=32 * GB)
+
+    assert scale_workers(2, waiting, tight, CONFIG) == (3, "scale up, 10 runs waiting")
+    assert scale_workers(2, waiting, full, CONFIG) == (
+        1,
+        "scale down, 6144MB available below 6553MB headroom",
+    )
+    assert scale_workers(1, waiting, full, CONFIG)[0] == 1
+    assert scale_workers(3, PoolBacklog(0, 0, 2), tight, CONFIG) == (
+        2,
+        "scale down, 1 idle slots",
+    )
+    assert scale_workers(2, PoolBacklog(0, 0, 2), tight, CONFIG) == (2, "hold")
+
+
+def test_supervisor_starts_the_workers_the_autoscaler_picks(tmp_path):
+    """Test the supervisor starts limited workers for each pool, as scaled."""
+    api = SimulatedApi([6], interval=15, memory=HostMemory(32 * GB, 64 * GB))
+    api.advance()
+    spawned = []
+
+    def spawn(home, slot):
+        spawned.append((slot.index, slot.run_limit))
+        return type("Process", (), {"pid": 1, "poll": lambda self: None})()
+
+    home = SupervisorHome(tmp_path)
+    home.register(POOL)
+    supervisor = WorkerSupervisor(
+        home,
+        spawn=spawn,
+        clock=lambda: 0.0,
+        autoscaler=WorkerAutoscaler(api, CONFIG),
+    )
+    supervisor.autoscale()
+    supervisor.reconcile()
+
+    assert spawned == [(index, 1) for index in range(5)]
+
+
+def test_pools_without_a_backlog_scale_to_zero_workers(tmp_path):
+    """Test a pool scaled to no workers gets none, not the supervisor's count."""
+    config = CONFIG.copy(update={"min_workers": 0})
+    api = SimulatedApi([], interval=15, memory=HostMemory(32 * GB, 64 * GB))
+    autoscaler = WorkerAutoscaler(api, config)
+    spawned = []
+
+    def spawn(home, slot):
+        spawned.append(slot.index)
+        return type("Process", (), {"pid": 1, "poll": lambda self: None})()
+
+    home = SupervisorHome(tmp_path)
+    home.register(POOL)
+    supervisor = WorkerSupervisor(
+        home, spawn=spawn, clock=lambda: 0.0, count=3, autoscaler=autoscaler
+    )
+    for tick in range(20):
+        asyncio.run(autoscaler.step([POOL], tick * config.interval_seconds))
+    supervisor.reconcile()
+
+    assert autoscaler.workers(POOL) == 0
+    assert spawned == []
@@ -0,0 +1,167 @@
+"""Test the adaptive work queue concurrency controller on synthetic load."""
+import asyncio
+import statistics
+from typing import List
+
+from meta_prefect.implementations.autotune import (
+    aimd_limit,
+    AutotuneApi,
+    AutotuneConfig,
+    HostPressure,
+    PrefectAutotuneApi,
+    QueueAutotuner,
+    QueueSignals,
+)
+from meta_prefect.implementations.components.work_queue import WorkQueue
+from tests.fake_prefect import FakePrefectClient, run_with_client
+
+
+class SimulatedApi(AutotuneApi):
+    """A work queue on a host whose cores are shared by the running runs.
+
+    Every run needs `work_seconds` of a core. Runs beyond the number of cores
+    slow each other down, and use CPU and memory in proportion to their number.
+    """
+
+    def __init__(self, trace: List[int], cores: int, limit: int, interval: float):
+        self.trace = trace
+        self.cores = cores
+        self.interval = interval
+        self.work_queue = WorkQueue(name="etl", concurrency_limit=limit)
+        self.waiting = 0
+        self.running: List[List[float]] = []  # [remaining work, elapsed]
+        self.durations: List[float] = []
+        self.tick = 0
+
+    def advance(self) -> None:
+        speed = min(1.0, self.cores / len(self.running)) if self.running else 0
+        for run in self.running:
+            run[0] -= speed * self.interval
+            run[1] += self.interval
+        self.durations.extend(
+            elapsed for remaining, elapsed in self.running if remaining <= 0
+        )
+        self.running = [run for run in self.running if run[0] > 0]
+
+        self.waiting += self.trace[self.tick] if self.tick < len(self.trace) else 0
+        self.tick += 1
+        # like a worker polling the queue, waiting runs start as slots free up
+        while self.waiting and len(self.running) < self.work_queue.concurrency_limit:
+            self.waiting -= 1
+            self.running.append([self.work_seconds, 0.0])
+
+    work_seconds = 60.0
+
+    async def read_work_queues(self):
+        return [self.work_queue]
+
+    async def read_signals(self, work_queue):
+        recent = self.durations[-20:]
+        return QueueSignals(
+            backlog=self.waiting,
+            running=len(self.running),
+            duration_seconds=statistics.median(recent) if recent else None,
+        )
+
+    async def read_host(self):
+        return HostPressure(
+            cpu_percent=min(100.0, 100.0 * len(self.running) / self.cores),
+            memory_percent=30.0 + 2.0 * len(self.running),
+        )
+
+    async def set_concurrency_limit(self, work_queue, limit):
+        work_queue.concurrency_limit = limit
+
+
+def _simulate(api: SimulatedApi, config: AutotuneConfig, ticks: int, tune=True):
+    autotuner = QueueAutotuner(api, config)
+    decisions = []
+
+    async def main():
+        for tick in range(ticks):
+            api.advance()
+            if tune:
+                decisions.extend(await autotuner.step(tick * config.interval_seconds))
+
+    asyncio.run(main())
+    return decisions
+
+
+CONFIG = AutotuneConfig(
+    min_limit=1, max_limit=12, interval_seconds=30, cooldown_seconds=90
+)
+
+
+def test_limit_tracks_host_capacity_under_a_burst():
+    """Test a burst raises the limit until the host saturates, then backs off.
+
+    40 runs arrive at once, then 2 per step, on a 4 core host. The limit grows
+    one slot at a time while runs wait, is halved when CPU use crosses 85%, and
+    the backlog drains much sooner than with a static limit of 1.
+    """
+    trace = [40] + [2] * 59
+    tuned = SimulatedApi(trace, cores=4, limit=1, interval=30)
+    static = SimulatedApi(trace, cores=4, limit=1, interval=30)
+
+    decisions = _simulate(tuned, CONFIG, ticks=60)
+    _simulate(static, CONFIG, ticks=60, tune=False)
+
+    limits = [decision.limit for decision in decisions]
+    reasons = {decision.reason.split(",")[0] for decision in decisions}
+    assert {"increase", "decrease"} <= reasons
+    assert max(limits) <= 5 and min(limits) >= 1
+    assert statistics.mean(limits[20:]) >= 2.5
+    assert len(tuned.durations) > 2 * len(static.durations)
+
+
+def test_limit_grows_to_its_bound_on_an_idle_host():
+    """Test a large host lets a backlog raise the limit up to max_limit."""
+    api = SimulatedApi([200], cores=64, limit=2, interval=30)
+
+    decisions = _simulate(api, CONFIG, ticks=20)
+
+    assert [decision.limit for decision in decisions][:4] == [3, 4, 5, 6]
+    assert decisions[-1].limit == CONFIG.max_limit
+    assert all(decision.limit <= CONFIG.max_limit for decision in decisions)
+
+
+def test_slower_runs_and_cooldowns_gate_decreases():
+    """Test runs slowing down cut the limit, at most once per cooldown."""
+    calm = HostPressure(cpu_percent=20, memory_percent=20)
+    slow = QueueSignals(backlog=5, running=8, duration_seconds=200)
+
+    assert aimd_limit(8, slow, calm, 100, CONFIG) == (
+        4,
+        "decrease, runs 2.0x slower than baseline",
+    )
+    assert aimd_limit(8, slow, calm, 100, CONFIG, may_decrease=False)[0] == 8
+    assert aimd_limit(8, slow, calm, 180, CONFIG) == (
+        9,
+        "increase, 5 runs waiting for a slot",
+    )
+
+
+def _tuned(work_queue_names=None) -> List[str]:
+    client = FakePrefectClient()
+    client.add_work_queue("default")
+    client.add_work_queue("etl", concurrency_limit=4)
+    client.add_work_queue("meta-prefect-limit-3-priority-3", concurrency_limit=3)
+    client.add_work_queue(
+        "meta-prefect-limit-1-priority-1-nightly-1a2b3c4d", concurrency_limit=1
+    )
+
+    async def read_work_queues():
+        api = PrefectAutotuneApi("pool", work_queue_names)
+        return [work_queue.name for work_queue in await api.read_work_queues()]
+
+    return run_with_client(client, read_work_queues())
+
+
+def test_only_queues_unique_to_a_deployment_are_never_tuned():
+    """Test tier and shared queues are tuned, unlike a deployment's own queue."""
+    owned = "meta-prefect-limit-1-priority-1-nightly-1a2b3c4d"
+    assert _tuned() == ["etl", "meta-prefect-limit-3-priority-3"]
+    assert _tuned(["default", "meta-prefect-limit-3-priority-3", owned]) == [
+        "default",
+        "meta-prefect-limit-3-priority-3",
+    ]
@@ -0,0 +1,162 @@
+"""Test dependency bundles are built once, offline, and mounted into eks pods."""
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List
+from uuid import uuid4
+
+import pytest
+from prefect import flow
+from prefect.client.schemas.objects import FlowRun
+
+from meta_prefect.implementations.builders.infra.eks import eks
+from meta_prefect.implementations.bundle import (
+    build_bundle,
+    DependencyBundle,
+    fetch_steps,
+)
+from meta_prefect.interface import DeployableFlow, Deployment
+
+
+@flow
+def etl() -> None:
+    pass
+
+
+def _write_wheel(wheelhouse: Path, name: str, version: str) -> None:
+    """Write a pure Python wheel, as if downloaded by an earlier build."""
+    dist_info = f"{name}-{version}.dist-info"
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(wheelhouse / f"{name}-{version}-py3-none-any.whl", "w") as f:
+        f.writestr(f"{name}/__init__.py", f"VERSION = {version!r}\n")
+        f.writestr(
+            f"{dist_info}/METADATA",
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        )
+        f.writestr(
+            f"{dist_info}/WHEEL",
+            "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\n"
+            "Tag: py3-none-any\n",
+        )
+        f.writestr(f"{dist_info}/RECORD", "")
+
+
+def _bundle(tmp_path: Path, **kwargs) -> DependencyBundle:
+    lockfile = tmp_path / "requirements.txt"
+    if not lockfile.exists():
+        lockfile.write_text("tinydep==1.0\n")
+    return DependencyBundle(
+        **{
+            "lockfile": lockfile,
+            "packages": (),
+            "store": str(tmp_path / "store"),
+            "wheelhouse": tmp_path / "wheelhouse",
+            "offline": True,
+            **kwargs,
+        }
+    )
+
+
+def test_bundles_are_keyed_by_lockfile_and_target(tmp_path):
+    """Test the key changes with the locked versions and the pods' Python."""
+    bundle = _bundle(tmp_path)
+    key = bundle.key
+
+    assert _bundle(tmp_path).key == key
+    assert _bundle(tmp_path, python_version="3.9").key != key
+    bundle.lockfile.write_text("tinydep==2.0\n")
+    assert bundle.key != key
+
+
+def test_bundles_are_built_offline_from_local_wheels_once(tmp_path):
+    """Test a bundle is built from the wheelhouse, and reused once published."""
+    _write_wheel(tmp_path / "wheelhouse", "tinydep", "1.0")
+    bundle = _bundle(tmp_path)
+
+    key = build_bundle(bundle)
+
+    with tarfile.open(tmp_path / "store" / f"{key}.tar.gz") as tar:
+        names = tar.getnames()
+    assert "site-packages/tinydep/__init__.py" in names
+    # a published bundle is not built again, even without its wheels
+    (tmp_path / "wheelhouse" / "tinydep-1.0-py3-none-any.whl").unlink()
+    assert build_bundle(bundle) == key
+
+
+def test_eks_pods_get_bundles_instead_of_installing(tmp_path):
+    """Test pods mount or fetch the bundle and put it on their PYTHONPATH."""
+    deployable_flow = DeployableFlow.from_prefect_flow(etl)
+
+    def pod_spec(bundle: DependencyBundle) -> dict:
+        builder = eks(namespace="flows", cpu=1, memory_gb=1, bundle=bundle)
+        deployment = builder.update_deployment(
+            deployable_flow, Deployment(name="prod", flow_name="etl")
+        )
+        job = deployment.infrastructure.prepare_for_flow_run(
+            FlowRun(flow_id=uuid4())
+        ).build_job()
+        return job["spec"]["template"]["spec"]
+
+    mounted = pod_spec(_bundle(tmp_path, claim_name="bundles"))
+    fetched = pod_spec(_bundle(tmp_path, store="s3://bucket/bundles"))
+
+    container = mounted["containers"][0]
+    env = {var["name"]: var["value"] for var in container["env"]}
+    assert "EXTRA_PIP_PACKAGES" not in env
+    assert env["PYTHONPATH"] == "/opt/meta-prefect/bundle/site-packages"
+    assert mounted["volumes"][0]["persistentVolumeClaim"] == {
+        "claimName": "bundles",
+        "readOnly": True,
+    }
+    assert container["volumeMounts"][0]["subPath"] == _bundle(tmp_path).key
+    assert "initContainers" not in mounted
+    download, extract = fetched["initContainers"]
+    assert download["image"] == "amazon/aws-cli"
+    assert (
+        download["command"][-2] == f"s3://bucket/bundles/{_bundle(tmp_path).key}.tar.gz"
+    )
+    assert extract["image"] == fetched["containers"][0]["image"]
+    assert fetched["volumes"][0]["emptyDir"] == {}
+    with pytest.raises(ValueError, match="can only be mounted"):
+        pod_spec(_bundle(tmp_path))
+
+
+def _extract(command: List[str]) -> None:
+    """Run an extraction step with the standard library only, without s3fs."""
+    assert command[0] == "python"
+    subprocess.run([sys.executable, "-S", *command[1:]], check=True)
+
+
+def test_init_containers_fetch_bundles_without_s3fs(tmp_path):
+    """Test S3 tarballs are extracted once downloaded, HTTP ones as streamed."""
+    _write_wheel(tmp_path / "wheelhouse", "tinydep", "1.0")
+    key = build_bundle(_bundle(tmp_path))
+    tarball = tmp_path / "store" / f"{key}.tar.gz"
+
+    # the AWS CLI downloads the tarball next to where it is extracted
+    mount = tmp_path / "s3-pod"
+    mount.mkdir()
+    download, extract = fetch_steps(
+        _bundle(tmp_path, store="s3://bucket/bundles"), str(mount)
+    )
+    assert download.command[:3] == ["aws", "s3", "cp"]
+    shutil.copy(tarball, download.command[-1])
+    _extract(extract.command)
+    assert (mount / "site-packages" / "tinydep" / "__init__.py").exists()
+    assert not (mount / f"{key}.tar.gz").exists()
+
+    handler = partial(SimpleHTTPRequestHandler, directory=str(tmp_path / "store"))
+    with ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        store = f"http://127.0.0.1:{server.server_port}"
+        mount = tmp_path / "http-pod"
+        (extract,) = fetch_steps(_bundle(tmp_path, store=store), str(mount))
+        _extract(extract.command)
+        server.shutdown()
+    assert (mount / "site-packages" / "tinydep" / "__init__.py").exists()
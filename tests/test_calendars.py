@@ -0,0 +1,66 @@
+"""Test business calendars and their on-disk cache."""
+import datetime
+
+import dateutil.tz
+import numpy as np
+from prefect.client.schemas.schedules import CronSchedule
+
+from meta_prefect.implementations.builders.scheduling.calendar import (
+    business_calendar_schedule_updater,
+)
+from meta_prefect.implementations.calendars import (
+    CALENDAR_CACHE_ENV,
+    CalendarCache,
+    country_calendar,
+    get_calendar,
+    market_calendar,
+)
+
+START = datetime.datetime(2024, 1, 1, tzinfo=dateutil.tz.gettz("Europe/London"))
+
+
+def test_calendars_are_resolved_by_name():
+    """Test aliases, market codes and country codes with subdivisions."""
+    assert get_calendar("nyse") == market_calendar(market="NYSE")
+    assert get_calendar("TARGET2") == market_calendar(market="ECB")
+    assert get_calendar("UK") == country_calendar(country="GB", subdiv="ENG")
+    assert get_calendar("GB-SCT") == country_calendar(country="GB", subdiv="SCT")
+    assert get_calendar("FR") == country_calendar(country="FR")
+
+
+def test_compiled_calendars_are_memory_mapped_and_widened(tmp_path):
+    """Test a compiled calendar is reused by other deploys and covers new years."""
+    provider = get_calendar("TARGET2")
+    CalendarCache(tmp_path).load(provider, [2024])
+
+    calendar = CalendarCache(tmp_path).load(provider, [2024])
+    assert isinstance(calendar.dates, np.memmap)
+    assert datetime.date(2024, 12, 26) in calendar
+    assert datetime.date(2024, 12, 24) not in calendar
+
+    widened = CalendarCache(tmp_path).load(provider, [2030])
+    assert [path.name for path in tmp_path.iterdir()] == [
+        f"{provider.cache_key}-2024-2030.npy"
+    ]
+    assert widened.contains(
+        np.array(["2024-03-29", "2027-03-26", "2030-04-19"], dtype="M8[D]")
+    ).tolist() == [True, True, True]
+
+
+def test_updater_excludes_named_calendars_and_custom_dates(tmp_path, monkeypatch):
+    """Test holidays of any calendar and custom dates are excluded."""
+    monkeypatch.setenv(CALENDAR_CACHE_ENV, str(tmp_path))
+    schedule = CronSchedule(cron="0 9 * * 1-5", timezone="Europe/London")
+    updater = business_calendar_schedule_updater(
+        calendars=["UK", "NYSE"],
+        dates=[datetime.date(2024, 7, 5)],
+        horizon_years=0,
+    )
+
+    updated = updater._update_schedule(schedule, start=START)
+
+    exdates = updated.rrule.split("EXDATE:")[1].split(",")
+    assert "20240826T090000" in exdates  # late summer bank holiday
+    assert "20240704T090000" in exdates  # independence day
+    assert "20240705T090000" in exdates
+    assert "20240708T090000" not in exdates
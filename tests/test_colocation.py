@@ -0,0 +1,106 @@
+"""Test tiny flows share a runner pod, and what it saves over a Job per run."""
+import asyncio
+
+import pytest
+from prefect import flow
+from prefect.testing.utilities import prefect_test_harness
+from pydantic import ValidationError
+
+from meta_prefect.implementations.builders.infra.eks import eks
+from meta_prefect.implementations.colocation import ColocationGroup, measure_overhead
+from meta_prefect.implementations.kubernetes_api import use_kubernetes_api
+from meta_prefect.interface import DeployableFlow, Deployment
+from tests.fake_kubernetes import FakeKubernetesApi
+
+# runs of 0.5GB, of which 4 fit in the runner's 2GB
+GROUP = ColocationGroup(
+    name="tiny", concurrency=16, cpu=1, memory_gb=2, run_memory_gb=0.5
+)
+
+
+@flow
+def ping() -> None:
+    pass
+
+
+@flow
+def pong() -> None:
+    pass
+
+
+def _builder() -> eks:
+    return eks(namespace="flows", cpu=1, memory_gb=1, env="prod", colocate=GROUP)
+
+
+def test_colocated_runs_go_to_the_group_runner_within_its_memory():
+    """Test deployments are routed to the runner, which runs as many runs as fit."""
+    deployment = _builder().update_deployment(
+        DeployableFlow.from_prefect_flow(ping),
+        Deployment(name="ping-prod", flow_name="ping"),
+    )
+    runner = _builder().build_runner_manifest("flows", GROUP)
+
+    assert deployment.work_pool_name == "colocated-tiny"
+    assert "colocation=tiny" in deployment.tags
+    assert deployment.infra_overrides["run_memory_mb"] == 512
+    assert deployment.infra_overrides["run_limit_with"] == "rlimit"
+    assert GROUP.slots == 4
+    container = runner["spec"]["template"]["spec"]["containers"][0]
+    assert container["args"][container["args"].index("--limit") + 1] == "4"
+    assert container["resources"]["limits"] == {"cpu": "1.0", "memory": "2.0Gi"}
+    assert runner["spec"]["template"]["spec"]["restartPolicy"] == "Always"
+    with pytest.raises(ValidationError, match="cannot fan out"):
+        eks(namespace="flows", cpu=1, memory_gb=1, colocate=GROUP, parallelism=2)
+
+
+def test_the_runner_of_a_group_is_applied_once_deployed():
+    """Test the group's work pool is bounded and its runner applied once."""
+    api = FakeKubernetesApi()
+
+    async def deploy():
+        from meta_prefect.implementations.client import get_client
+
+        for deployable_flow in (
+            DeployableFlow.from_prefect_flow(ping).pipe(_builder()),
+            DeployableFlow.from_prefect_flow(pong).pipe(_builder()),
+        ):
+            for action in deployable_flow.pre_deployment_actions:
+                await action.run()
+            deployment = await deployable_flow.build_deployment()
+            await deployable_flow.post_deployment_update(deployment)
+        async with get_client() as client:
+            return await client.read_work_pool("colocated-tiny")
+
+    with prefect_test_harness(), use_kubernetes_api(api):
+        work_pool = asyncio.run(deploy())
+
+    assert work_pool.type == "process"
+    assert work_pool.concurrency_limit == 4
+    assert api.calls["create"] == 1
+    assert list(api.objects) == [("Deployment", "flows", "meta-prefect-runner-tiny")]
+
+
+def test_colocated_runs_pay_pod_startup_once():
+    """Test the Kubernetes overhead per run, against a Job per run."""
+    builder = _builder()
+    job_manifest = builder.build_job_manifest("flows")
+    runner_manifest = builder.build_runner_manifest("flows", GROUP)
+    api = FakeKubernetesApi(pod_start_seconds=0.05)
+
+    async def main():
+        first = await measure_overhead(
+            api, job_manifest, runner_manifest, runs=20, interval=0.005
+        )
+        second = await measure_overhead(
+            api, job_manifest, runner_manifest, runs=20, interval=0.005
+        )
+        return first, second
+
+    (jobs, colocated), (_, warm) = asyncio.run(main())
+
+    assert (jobs.pods_started, colocated.pods_started, warm.pods_started) == (20, 1, 0)
+    assert jobs.seconds_per_run >= 0.05
+    assert colocated.seconds_per_run < jobs.seconds_per_run / 10
+    assert warm.overhead_seconds == 0
+    # the Jobs are cleaned up, the runner is kept
+    assert list(api.objects) == [("Deployment", "flows", "meta-prefect-runner-tiny")]
@@ -0,0 +1,168 @@
+"""Test deploying a project's flows, to one or several profiles."""
+from pathlib import Path
+from typing import List, Set, Tuple
+
+import pytest
+import toml
+from prefect.settings import PREFECT_PROFILES_PATH, temporary_settings
+from prefect.testing.cli import invoke_and_assert
+from prefect.utilities.asyncutils import sync_compatible
+from pydantic import BaseModel
+
+import meta_prefect.cli.main  # noqa: F401, registers the commands
+from meta_prefect.implementations.actions import base
+from meta_prefect.implementations.actions.base import Action
+from meta_prefect.implementations.client import get_workspace_key
+from meta_prefect.implementations.journal import DeployJournal, DeployPhase
+from meta_prefect.interface import DeployableFlowBuilderInterface, Deployment
+
+# what the builders of the project ran, and in which workspace
+EVENTS: List[Tuple[str, str]] = []
+# the workspaces in which the next post-deployment update fails
+FAIL_POST: Set[str] = set()
+
+PROJECT = """
+from prefect import flow
+
+from meta_prefect.interface import DeployableFlow
+from tests.test_deploy import recorder
+
+
+@flow
+def add(x: int, y: int) -> int:
+    return x + y
+
+
+deployable_add = DeployableFlow.from_prefect_flow(add).pipe(recorder())
+"""
+
+
+class RecordAction(Action):
+    """Record the workspace the action is run in."""
+
+    async def _run(self) -> str:
+        EVENTS.append(("action", get_workspace_key()))
+        return get_workspace_key()
+
+
+class recorder(BaseModel, DeployableFlowBuilderInterface):
+    """Record the builder's steps."""
+
+    @property
+    def pre_deployment_actions(self):
+        return {RecordAction()}
+
+    @sync_compatible
+    async def update_deployment(self, flow, deployment: Deployment) -> Deployment:
+        EVENTS.append(("build", get_workspace_key()))
+        deployment.name = "add-dev"
+        return deployment
+
+    @sync_compatible
+    async def update_post_deployment(self, flow, deployment: Deployment) -> None:
+        if get_workspace_key() in FAIL_POST:
+            FAIL_POST.discard(get_workspace_key())
+            raise RuntimeError("post-deployment update failed")
+        EVENTS.append(("post", get_workspace_key()))
+
+
+@pytest.fixture
+def project(tmp_path: Path):
+    """A project with one flow, and profiles of two ephemeral APIs and a down one."""
+    (tmp_path / "project").mkdir()
+    (tmp_path / "project" / "flows.py").write_text(PROJECT)
+    profiles = {
+        "active": "a",
+        "profiles": {
+            name: {
+                "PREFECT_API_DATABASE_CONNECTION_URL": (
+                    f"sqlite+aiosqlite:///{tmp_path / name}.db"
+                )
+            }
+            for name in ("a", "b")
+        },
+    }
+    profiles["profiles"]["down"] = {"PREFECT_API_URL": "http://127.0.0.1:9/api"}
+    (tmp_path / "profiles.toml").write_text(toml.dumps(profiles))
+    EVENTS.clear()
+    FAIL_POST.clear()
+    base.cache.clear()
+    with temporary_settings({PREFECT_PROFILES_PATH: tmp_path / "profiles.toml"}):
+        yield tmp_path / "project"
+
+
+def _deploy(project: Path, *args: str, expected_code: int = 0) -> str:
+    result = invoke_and_assert(
+        ["deploy", "--path", str(project), "--no-mirror", *args],
+        expected_code=expected_code,
+        echo=False,
+    )
+    return " ".join(result.stdout.split())
+
+
+def test_profiles_are_deployed_concurrently_and_failures_reported(project):
+    """Test each profile runs its own actions, and a failed one fails the deploy."""
+    output = _deploy(project, "--profiles", "a,b,down", expected_code=1)
+
+    # actions are cached per workspace, so they run once in each
+    assert sorted(EVENTS) == [
+        ("action", "a"),
+        ("action", "b"),
+        ("action", "down"),
+        ("build", "a"),
+        ("build", "b"),
+        # building needs no API, applying to the down one fails
+        ("build", "down"),
+        ("post", "a"),
+        ("post", "b"),
+    ]
+    assert {key[0] for key in base.cache} == {"a", "b", "down"}
+    assert "Deploy failed for profiles: down" in output
+    assert "failed:" in output
+
+
+def test_resume_skips_completed_deployments_and_dry_runs_keep_the_journal(project):
+    """Test a resumed deploy skips post-updated deployments, dry runs change nothing."""
+    journal = project / ".meta_prefect" / "deploy_journal.jsonl"
+    _deploy(project, "--profiles", "a")
+    EVENTS.clear()
+    base.cache.clear()
+
+    output = _deploy(project, "--profiles", "a", "--resume")
+
+    assert "Deploy failed" not in output
+    assert EVENTS == []
+    resumed = DeployJournal(journal)
+    resumed.load()
+    assert resumed.completed("a::add::0") == set(DeployPhase)
+    recorded = journal.read_text()
+
+    # a dry run neither resets the journal, nor expires changed inputs
+    (project / "flows.py").write_text(PROJECT + "\n# changed\n")
+    _deploy(project, "--profiles", "a", "--dry-run")
+    _deploy(project, "--profiles", "a", "--dry-run", "--resume")
+
+    assert journal.read_text() == recorded
+    assert ("build", "a") not in EVENTS
+
+
+def test_resume_only_post_updates_applied_deployments(project):
+    """Test a deploy failing after apply resumes with the post-update alone."""
+    journal = project / ".meta_prefect" / "deploy_journal.jsonl"
+    FAIL_POST.add("a")
+    _deploy(project, "--profiles", "a", expected_code=1)
+    failed = DeployJournal(journal)
+    failed.load()
+    assert DeployPhase.APPLIED in failed.completed("a::add::0")
+    assert DeployPhase.POST_UPDATED not in failed.completed("a::add::0")
+    EVENTS.clear()
+    base.cache.clear()
+
+    output = _deploy(project, "--profiles", "a", "--resume")
+
+    assert "Skipping add-dev for flow add, already applied." in output
+    # actions run again for the builders, but the deployment is not rebuilt
+    assert EVENTS == [("action", "a"), ("post", "a")]
+    resumed = DeployJournal(journal)
+    resumed.load()
+    assert resumed.completed("a::add::0") == set(DeployPhase)
@@ -0,0 +1,141 @@
+"""Test the eks builder fans flow runs out as Indexed Jobs."""
+import asyncio
+from typing import Any, Dict
+from uuid import uuid4
+
+import pytest
+from prefect import flow
+from prefect.client.schemas.objects import FlowRun
+from prefect.states import Completed, Failed, Running
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations.builders.infra.eks import eks
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.sharding import (
+    create_shard_run,
+    fail_parent_run,
+    shard,
+)
+from meta_prefect.interface import DeployableFlow, Deployment
+
+
+@flow
+def backfill(days: list) -> None:
+    pass
+
+
+def _job(builder: eks) -> Dict[str, Any]:
+    deployable_flow = DeployableFlow.from_prefect_flow(backfill)
+    deployment = builder.update_deployment(
+        deployable_flow, Deployment(name="prod", flow_name="backfill")
+    )
+    # agents give the infrastructure the command and env of the flow run
+    infrastructure = deployment.infrastructure.prepare_for_flow_run(
+        FlowRun(flow_id=uuid4())
+    )
+    return infrastructure.build_job()
+
+
+def test_single_pod_jobs_run_the_flow_run_with_the_engine():
+    """Test a default deployment's Job is a single pod with its resources."""
+    job = _job(eks(namespace="flows", cpu=0.5, memory_gb=1))
+
+    assert (job["spec"]["completions"], job["spec"]["parallelism"]) == (1, 1)
+    assert "completionMode" not in job["spec"]
+    container = job["spec"]["template"]["spec"]["containers"][0]
+    assert container["args"] == ["python", "-m", "prefect.engine"]
+    assert container["resources"]["limits"] == {"cpu": "0.5", "memory": "1.0Gi"}
+
+
+def test_fanned_out_jobs_are_indexed_and_run_shards():
+    """Test 8 shards run 4 at a time as an Indexed Job of the sharding engine."""
+    job = _job(eks(namespace="flows", cpu=1, memory_gb=2, parallelism=4, completions=8))
+
+    assert (job["spec"]["completions"], job["spec"]["parallelism"]) == (8, 4)
+    assert job["spec"]["completionMode"] == "Indexed"
+    container = job["spec"]["template"]["spec"]["containers"][0]
+    assert container["args"] == [
+        "python",
+        "-m",
+        "meta_prefect.implementations.sharding",
+    ]
+    env = {var["name"]: var["value"] for var in container["env"]}
+    assert env["META_PREFECT__JOB_COMPLETIONS"] == "8"
+    assert job["metadata"]["namespace"] == "flows"
+
+
+def test_shards_split_inputs_across_pods(monkeypatch):
+    """Test every input goes to exactly one pod, whichever the pod count."""
+    days = [f"2024-01-{day:02}" for day in range(1, 11)]
+    monkeypatch.setenv("META_PREFECT__JOB_COMPLETIONS", "3")
+
+    shards = []
+    for index in range(3):
+        monkeypatch.setenv("JOB_COMPLETION_INDEX", str(index))
+        shards.append(shard(days))
+
+    assert [len(days) for days in shards] == [4, 3, 3]
+    assert sorted(sum(shards, [])) == days
+    monkeypatch.setenv("JOB_COMPLETION_INDEX", "3")
+    with pytest.raises(ValueError, match="out of range"):
+        shard(days)
+
+
+def test_shard_runs_are_runs_of_the_deployment_created_once():
+    """Test a restarted pod picks up the shard run created by its first attempt."""
+
+    async def main():
+        async with get_client() as client:
+            flow_id = await client.create_flow(backfill)
+            deployment_id = await client.create_deployment(flow_id, "prod")
+            parent = await client.create_flow_run_from_deployment(
+                deployment_id, parameters={"days": ["a", "b"]}, tags=["etl"]
+            )
+        first = await create_shard_run(str(parent.id), 1, 2)
+        second = await create_shard_run(str(parent.id), 1, 2)
+        return deployment_id, first[1], second[1]
+
+    with prefect_test_harness():
+        deployment_id, first, second = asyncio.run(main())
+
+    assert first.id == second.id
+    assert first.deployment_id == deployment_id
+    assert first.parameters == {"days": ["a", "b"]}
+    assert sorted(first.tags) == ["etl", "shard=1/2"]
+
+
+def test_failed_shards_fail_their_parent_once_it_is_done():
+    """Test a parent still running is failed when done, a failed one is kept."""
+
+    async def main():
+        async with get_client() as client:
+            flow_id = await client.create_flow(backfill)
+            deployment_id = await client.create_deployment(flow_id, "prod")
+            running, failed = [
+                await client.create_flow_run_from_deployment(deployment_id)
+                for _ in range(2)
+            ]
+            await client.set_flow_run_state(running.id, Running())
+            await client.set_flow_run_state(failed.id, Failed(message="oom"))
+
+            shard_failed = Failed(message="bad input")
+            reported = asyncio.ensure_future(
+                fail_parent_run(str(running.id), 1, 2, shard_failed, 0.01)
+            )
+            await asyncio.sleep(0.1)
+            assert not reported.done()
+            await client.set_flow_run_state(running.id, Completed())
+            await reported
+            await fail_parent_run(str(failed.id), 1, 2, shard_failed, 0.01)
+
+            return [
+                (await client.read_flow_run(flow_run.id)).state
+                for flow_run in (running, failed)
+            ]
+
+    with prefect_test_harness():
+        running, failed = asyncio.run(main())
+
+    assert running.is_failed()
+    assert running.message == "Shard 1/2 failed: bad input"
+    assert failed.message == "oom"
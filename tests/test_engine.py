@@ -0,0 +1,118 @@
+"""Test vectorized schedule engine."""
+import datetime
+
+import dateutil.rrule
+import numpy as np
+import pendulum
+from croniter import croniter
+from prefect.client.schemas.schedules import (
+    CronSchedule,
+    IntervalSchedule,
+    MAX_RRULE_LENGTH,
+)
+
+from meta_prefect.implementations.builders.scheduling.engine import get_occurrence_grid
+from meta_prefect.implementations.builders.scheduling.federal import (
+    federal_holiday_schedule_updater,
+)
+from meta_prefect.implementations.calendars import CalendarCache, country_calendar
+
+START = pendulum.datetime(2024, 1, 1, tz="US/Eastern")
+
+
+def _rrule_occurrences(schedule, start, end):
+    return np.array(
+        [
+            occurrence.replace(tzinfo=None)
+            for occurrence in schedule.to_rrule().between(start, end, inc=True)
+            if occurrence < end
+        ],
+        dtype="M8[s]",
+    )
+
+
+def test_cron_grid_matches_croniter_and_its_rrule():
+    """Test cron occurrences match croniter and the converted rrule schedule."""
+    schedule = CronSchedule(cron="*/20 9-17 1,15 * MON", timezone="US/Eastern")
+    end = START.add(months=2)
+    grid = get_occurrence_grid(schedule)
+
+    occurrences = grid.occurrences(START, end)
+
+    expected = []
+    iterator = croniter(schedule.cron, START.naive() - datetime.timedelta(seconds=1))
+    while (occurrence := iterator.get_next(datetime.datetime)) < end.naive():
+        expected.append(occurrence)
+    assert np.array_equal(occurrences, np.array(expected, dtype="M8[s]"))
+    assert np.array_equal(
+        occurrences, _rrule_occurrences(grid.to_rrule_schedule(), START, end)
+    )
+
+
+def test_interval_schedules_exclude_holidays(tmp_path):
+    """Test a 15 minute interval is converted and skips holidays in its timezone."""
+    schedule = IntervalSchedule(
+        interval=datetime.timedelta(minutes=15),
+        anchor_date=pendulum.datetime(2023, 1, 1, 0, 5, tz="UTC"),
+        timezone="US/Eastern",
+    )
+    updater = federal_holiday_schedule_updater(horizon_years=0)
+    grid = get_occurrence_grid(schedule)
+
+    updated = updater._update_schedule(schedule, start=START)
+
+    end = START.add(years=1)
+    occurrences = grid.occurrences(START, end)
+    holidays = CalendarCache(tmp_path).load(country_calendar(country="US"), [2024])
+    on_holidays = holidays.contains(grid.local_dates(occurrences))
+    assert on_holidays.sum() == 11 * 96
+    assert "EXRULE" in updated.rrule
+    assert np.array_equal(
+        _rrule_occurrences(updated, START, end), occurrences[~on_holidays]
+    )
+
+
+def test_minute_level_interval_over_a_year_is_expanded_at_once():
+    """Test a minutely schedule over a year yields every occurrence."""
+    schedule = IntervalSchedule(
+        interval=datetime.timedelta(minutes=1),
+        anchor_date=pendulum.datetime(2023, 1, 1, tz="UTC"),
+    )
+    grid = get_occurrence_grid(schedule)
+
+    occurrences = grid.occurrences(START, START.add(years=1))
+
+    assert len(occurrences) == 366 * 24 * 60
+
+
+def test_minute_level_interval_outside_utc_excludes_holidays_within_the_limit():
+    """Test a minutely schedule in New York excludes each holiday compactly.
+
+    The schedule is converted to UTC rules, so every holiday spans two UTC days.
+    """
+    schedule = IntervalSchedule(
+        interval=datetime.timedelta(minutes=1),
+        anchor_date=pendulum.datetime(2023, 1, 1, 5, 7, tz="America/New_York"),
+        timezone="America/New_York",
+    )
+    updater = federal_holiday_schedule_updater(horizon_years=0)
+    grid = get_occurrence_grid(schedule)
+
+    updated = updater._update_schedule(
+        schedule, start=pendulum.datetime(2024, 1, 1, tz="America/New_York")
+    )
+
+    assert len(updated.rrule) <= MAX_RRULE_LENGTH
+    occurrences = grid.occurrences(
+        pendulum.datetime(2024, 7, 3, tz="America/New_York"),
+        pendulum.datetime(2024, 7, 6, tz="America/New_York"),
+    )
+    first, last = occurrences[[0, -1]].astype(datetime.datetime)
+    # the rules have no DTSTART, so they are iterated from the window only
+    rruleset = dateutil.rrule.rrulestr(updated.rrule, dtstart=first, forceset=True)
+    on_holiday = grid.local_dates(occurrences) == np.datetime64("2024-07-04")
+    assert on_holiday.sum() == 24 * 60
+    assert np.array_equal(
+        np.array(rruleset.between(first, last, inc=True), dtype="M8[s]"),
+        occurrences[~on_holiday],
+    )
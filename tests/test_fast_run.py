@@ -0,0 +1,124 @@
+"""Test local runs of deployments start in-process and are kept in their history."""
+import asyncio
+import os
+
+import pytest
+from prefect import flow
+from prefect.client.schemas.actions import WorkPoolCreate
+from prefect.flows import load_flow_from_entrypoint
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations.actions.work_pool import (
+    local_process_base_job_template,
+)
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.fast_run import run_locally
+from meta_prefect.interface.deployment import Deployment
+
+
+@flow
+def etl(x: int, y: int = 1) -> dict:
+    return {"sum": x + y, "env": os.environ.get("META_PREFECT__ENV")}
+
+
+def test_local_runs_are_run_in_process_as_runs_of_their_deployment():
+    """Test the run gets the deployment's env and parameters, and its history."""
+    deployment = Deployment(
+        name="local-run-prod",
+        flow_name="etl",
+        work_pool_name="pool",
+        parameters={"x": 1, "y": 2},
+        infra_overrides={"env": "prod"},
+    )
+
+    async def deploy():
+        async with get_client() as client:
+            await client.create_work_pool(
+                WorkPoolCreate(
+                    name="pool",
+                    type="process",
+                    base_job_template=local_process_base_job_template("dev"),
+                )
+            )
+            flow_id = await client.create_flow(etl)
+            return await client.create_deployment(
+                flow_id, "local-run-prod", work_pool_name="pool"
+            )
+
+    async def read_runs():
+        async with get_client() as client:
+            return await client.read_flow_runs()
+
+    with prefect_test_harness():
+        deployment_id = asyncio.run(deploy())
+        state = run_locally(etl, deployment, {"x": 5})
+        runs = asyncio.run(read_runs())
+
+    assert state.is_completed()
+    assert state.result() == {"sum": 7, "env": "prod"}
+    assert "META_PREFECT__ENV" not in os.environ
+    assert [(run.deployment_id, run.state.type.value) for run in runs] == [
+        (deployment_id, "COMPLETED")
+    ]
+
+
+ISOLATED_FLOW = """
+import os
+from pathlib import Path
+
+from prefect import flow
+
+
+@flow
+def etl(x: int, out: str) -> None:
+    Path(out).write_text(f"{os.getpid()} {x}")
+"""
+
+
+def test_isolated_runs_are_forked_from_a_warm_process(tmp_path):
+    """Test the run loads its flow from the deployment, in another process."""
+    (tmp_path / "flows.py").write_text(ISOLATED_FLOW)
+    isolated_etl = load_flow_from_entrypoint(f"{tmp_path / 'flows.py'}:etl")
+    deployment = Deployment(
+        name="local-run-prod",
+        flow_name="etl",
+        path=str(tmp_path),
+        entrypoint="flows.py:etl",
+        parameters={"x": 1, "out": str(tmp_path / "ran.txt")},
+    )
+
+    async def deploy():
+        async with get_client() as client:
+            flow_id = await client.create_flow(isolated_etl)
+            return await client.create_deployment(
+                flow_id, "local-run-prod", path=str(tmp_path), entrypoint="flows.py:etl"
+            )
+
+    with prefect_test_harness():
+        asyncio.run(deploy())
+        state = run_locally(isolated_etl, deployment, {"x": 3}, isolated=True)
+
+    assert state.is_completed()
+    pid, x = (tmp_path / "ran.txt").read_text().split()
+    assert int(pid) != os.getpid()
+    assert x == "3"
+
+
+def test_flows_never_deployed_are_run_unlinked_unless_isolated():
+    """Test a flow without a deployment runs in-process only, not isolated."""
+    deployment = Deployment(name="local-run-prod", flow_name="etl")
+
+    async def read_runs():
+        async with get_client() as client:
+            return await client.read_flow_runs()
+
+    with prefect_test_harness():
+        with pytest.raises(ValueError, match="etl/local-run-prod is not deployed"):
+            run_locally(etl, deployment, {"x": 1}, isolated=True)
+        state = run_locally(etl, deployment, {"x": 1})
+        runs = asyncio.run(read_runs())
+
+    assert state.result() == {"sum": 2, "env": None}
+    assert [(run.deployment_id, run.state.type.value) for run in runs] == [
+        (None, "COMPLETED")
+    ]
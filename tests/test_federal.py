@@ -0,0 +1,48 @@
+"""Test federal holiday schedule updater."""
+import datetime
+
+import dateutil.tz
+from prefect.client.schemas.schedules import RRuleSchedule
+
+from meta_prefect.implementations.builders.scheduling.federal import (
+    federal_holiday_schedule_updater,
+)
+from meta_prefect.implementations.calendars import CalendarCache, country_calendar
+
+START = datetime.datetime(2024, 1, 1, tzinfo=dateutil.tz.gettz("US/Eastern"))
+
+
+def test_only_holidays_coinciding_with_occurrences_are_excluded(tmp_path):
+    """Test EXDATEs match scheduled occurrences on holidays, at their time."""
+    schedule = RRuleSchedule(
+        rrule="DTSTART:20230102T093000\nRRULE:FREQ=WEEKLY;BYDAY=MO",
+        timezone="US/Eastern",
+    )
+    updater = federal_holiday_schedule_updater(horizon_years=0)
+
+    updated = updater._update_schedule(schedule, start=START)
+
+    exdates = updated.rrule.split("EXDATE:")[1].split(",")
+    # in 2024, New Year's, MLK, Presidents, Memorial, Labor, Columbus and
+    # Veterans days fall on Mondays
+    assert len(exdates) == 7
+    assert all(exdate.endswith("T093000") for exdate in exdates)
+    assert "20240704T093000" not in exdates
+    holidays = CalendarCache(tmp_path).load(country_calendar(country="US"), [2024])
+    assert all(
+        occurrence.date() not in holidays
+        for occurrence in updated.to_rrule().between(
+            START, START.replace(year=2025), inc=True
+        )
+    )
+
+
+def test_multi_year_horizons_stay_within_the_rrule_length_limit():
+    """Test a daily schedule can exclude holidays over a decade."""
+    schedule = RRuleSchedule(rrule="FREQ=DAILY;BYHOUR=6", timezone="UTC")
+    updater = federal_holiday_schedule_updater(horizon_years=10)
+
+    updated = updater._update_schedule(schedule, start=START)
+
+    assert updated.rrule.startswith("FREQ=DAILY;BYHOUR=6\nEXDATE:")
+    assert schedule.rrule == "FREQ=DAILY;BYHOUR=6"
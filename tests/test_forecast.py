@@ -0,0 +1,149 @@
+"""Test forecasting the load of schedules on work pools and queues."""
+import asyncio
+import csv
+import json
+
+import pendulum
+from prefect import flow
+from prefect.client.schemas.schedules import CronSchedule, IntervalSchedule
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations.actions.base import read_only_actions
+from meta_prefect.implementations.actions.concurrency_limit import (
+    EnsureConcurrencyLimitsCreatedAction,
+)
+from meta_prefect.implementations.builders.concurrency.limiter import (
+    concurrency_limiter,
+)
+from meta_prefect.implementations.builders.infra.local_run import local_run_provisioner
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.index import invalidate_indexes
+from meta_prefect.implementations.load import (
+    forecast_load,
+    ScheduledLoad,
+    write_forecast,
+)
+from meta_prefect.interface import DeployableFlow
+
+START = pendulum.datetime(2024, 1, 1)
+
+
+@flow
+def etl() -> None:
+    pass
+
+
+def _forecasts():
+    loads = [
+        ScheduledLoad(
+            key=f"flow/run-{index}",
+            schedule=CronSchedule(cron="0 9 * * *", timezone="US/Eastern"),
+            duration_seconds=1200,
+            work_pool_name="pool",
+            work_queue_name="reports",
+        )
+        for index in range(3)
+    ] + [
+        ScheduledLoad(
+            key="flow/poll",
+            schedule=IntervalSchedule(interval=pendulum.duration(minutes=5)),
+            duration_seconds=30,
+            work_pool_name="pool",
+            work_queue_name="default",
+        )
+    ]
+    limits = {"pool": (5, {"reports": 2, "default": None})}
+    return forecast_load(loads, START, START.add(days=2), 900, limits)
+
+
+def test_forecast_flags_buckets_over_the_concurrency_limit():
+    """Test starts and concurrent runs are counted per pool and queue."""
+    pool, default, reports = _forecasts()
+
+    assert (pool.work_queue_name, default.work_queue_name) == (None, "default")
+    assert pool.starts.sum() == 2 * 3 + 2 * 24 * 12
+    assert default.starts.max() == 3
+    # 9am eastern is 2pm utc, the runs last over two 15 minute buckets
+    assert [str(value) for value in reports.bucket_starts[reports.overloaded]] == [
+        "2024-01-01T14:00:00",
+        "2024-01-01T14:15:00",
+        "2024-01-02T14:00:00",
+        "2024-01-02T14:15:00",
+    ]
+    assert pool.concurrency.max() == 4 and not pool.overloaded.any()
+    assert not default.overloaded.any()
+
+
+def test_forecast_exports_to_csv_and_json(tmp_path):
+    """Test every bucket of every forecast is exported."""
+    forecasts = _forecasts()
+
+    write_forecast(forecasts, tmp_path / "forecast.csv")
+    write_forecast(forecasts, tmp_path / "forecast.json")
+
+    with open(tmp_path / "forecast.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 3 * 2 * 96
+    assert json.loads((tmp_path / "forecast.json").read_text())[0] == {
+        "work_pool_name": "pool",
+        "work_queue_name": None,
+        "bucket_start": "2024-01-01T00:00:00Z",
+        "starts": 3,
+        "concurrency": 1,
+        "concurrency_limit": 5,
+        "overloaded": False,
+    }
+
+
+def test_runs_without_a_queue_are_counted_once():
+    """Test runs sent to their pool's default queue only count in the pool."""
+    loads = [
+        ScheduledLoad(
+            key="flow/hourly",
+            schedule=IntervalSchedule(interval=pendulum.duration(hours=1)),
+            duration_seconds=60,
+            work_pool_name="pool",
+            work_queue_name=None,
+        )
+    ]
+
+    (pool,) = forecast_load(loads, START, START.add(hours=3), 3600, {"pool": (1, {})})
+
+    assert pool.starts.tolist() == [1, 1, 1]
+    assert not pool.overloaded.any()
+
+
+def test_forecasts_build_deployments_without_creating_anything():
+    """Test planning resolves missing pools, queues and limits as unlimited."""
+    from meta_prefect.cli.main import _build_deployments, _read_concurrency_limits
+
+    deployable_flow = (
+        DeployableFlow.from_prefect_flow(etl)
+        .pipe(local_run_provisioner(env="dev"))
+        .pipe(concurrency_limiter(concurrency_limit=1, owner="etl/etl-dev"))
+    )
+
+    async def plan():
+        ((_, deployment),) = await _build_deployments({"etl": [deployable_flow]})
+        with read_only_actions():
+            limits = await EnsureConcurrencyLimitsCreatedAction(
+                limits=frozenset({("etl", 2)})
+            ).run()
+        pool_limits = await _read_concurrency_limits(deployment.work_pool_name)
+        async with get_client() as client:
+            created = (
+                [pool.name for pool in await client.read_work_pools()],
+                await client.read_concurrency_limits(limit=10, offset=0),
+            )
+        return deployment, limits, pool_limits, created
+
+    with prefect_test_harness():
+        invalidate_indexes()
+        deployment, limits, pool_limits, created = asyncio.run(plan())
+
+    assert deployment.work_pool_name == "local-process-work-pool"
+    assert deployment.work_queue_name.startswith("meta-prefect-limit-1-priority-1-")
+    assert limits == []
+    assert pool_limits == (None, {})
+    # only the server's own agent pool exists
+    assert created == (["default-agent-pool"], [])
@@ -0,0 +1,120 @@
+"""Test deployments are limited through global concurrency limits."""
+import asyncio
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+import prefect.concurrency.asyncio
+from prefect import flow
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations import concurrency_limits
+from meta_prefect.implementations.builders.concurrency.global_limits import (
+    global_concurrency_limiter,
+)
+from meta_prefect.implementations.concurrency_limits import (
+    apply_concurrency_limits,
+    deployment_limit_name,
+    ensure_concurrency_limits,
+    limit_names,
+    limit_tag,
+)
+from meta_prefect.implementations.index import (
+    get_concurrency_limit_index,
+    invalidate_indexes,
+)
+from meta_prefect.interface.deployment import Deployment
+
+
+@flow
+async def sleepy(seconds: float) -> tuple:
+    start = time.monotonic()
+    await asyncio.sleep(seconds)
+    return start, time.monotonic()
+
+
+def _overlaps(intervals) -> bool:
+    (_, first_end), (second_start, _) = sorted(intervals)
+    return second_start < first_end
+
+
+def test_builder_tags_deployments_and_wraps_their_entrypoint():
+    """Test a deployment takes a slot of its own limit and of its tag limits."""
+    limiter = global_concurrency_limiter(
+        concurrency_limit=1, owner="etl/run-prod", tag_limits={"warehouse": 3}
+    )
+    deployment = Deployment(
+        name="run-prod", entrypoint="flows/etl.py:etl", tags=["env=prod"]
+    )
+
+    deployment = limiter.update_deployment(flow=None, deployment=deployment)
+
+    (action,) = limiter.pre_deployment_actions
+    assert dict(action.limits) == {"deployment:etl:run-prod": 1, "warehouse": 3}
+    assert deployment.tags == [
+        "concurrency=deployment:etl:run-prod",
+        "concurrency=warehouse",
+        "env=prod",
+        "warehouse",
+    ]
+    assert deployment.entrypoint == (
+        "meta_prefect.implementations.limited_entrypoint:flows/etl.py@etl"
+    )
+
+
+def test_limits_are_created_once_and_updated_idempotently():
+    """Test limits are read in bulk and only written when missing or changed."""
+
+    async def main():
+        invalidate_indexes()
+        await ensure_concurrency_limits({"deployment:a:x": 1, "warehouse": 2})
+        invalidate_indexes()
+        await ensure_concurrency_limits({"deployment:a:x": 1, "warehouse": 3})
+        invalidate_indexes()
+        index = await get_concurrency_limit_index()
+        return {limit.name: limit.limit for limit in index.all()}
+
+    with prefect_test_harness():
+        assert asyncio.run(main()) == {"deployment:a:x": 1, "warehouse": 3}
+
+
+def test_runs_of_a_deployment_are_serialized_but_not_across_deployments(
+    monkeypatch,
+):
+    """Test unrelated unique deployments run in parallel, each one at a time."""
+    slots = defaultdict(lambda: asyncio.Semaphore(1))
+    run_tags = ContextVar("run_tags")
+
+    async def acquire(names, occupy, mode="concurrency"):
+        for name in names:
+            await slots[name].acquire()
+        return []
+
+    async def release(names, occupy, occupancy_seconds):
+        for name in names:
+            slots[name].release()
+        return []
+
+    monkeypatch.setattr(
+        prefect.concurrency.asyncio, "acquire_concurrency_slots", acquire
+    )
+    monkeypatch.setattr(
+        prefect.concurrency.asyncio, "release_concurrency_slots", release
+    )
+    monkeypatch.setattr(
+        concurrency_limits, "_run_limit_names", lambda: limit_names(run_tags.get())
+    )
+    first, second = (deployment_limit_name(owner) for owner in ("a/x", "b/x"))
+    limited = apply_concurrency_limits(sleepy)
+
+    async def run(name: str) -> tuple:
+        run_tags.set(["env=prod", limit_tag(name)])
+        return await limited.fn(0.2)
+
+    async def main():
+        return await asyncio.gather(run(first), run(first), run(second))
+
+    same_first, same_second, other = asyncio.run(main())
+
+    assert not _overlaps([same_first, same_second])
+    assert _overlaps([same_first, other])
@@ -0,0 +1,93 @@
+"""Test request governor against a fault-injecting transport."""
+import asyncio
+from typing import List
+
+import httpx
+import pytest
+
+from meta_prefect.implementations.governor import (
+    CircuitOpenError,
+    GovernedTransport,
+    GovernorSettings,
+    RequestGovernor,
+)
+
+
+class FaultInjectingTransport(httpx.AsyncBaseTransport):
+    """A local API stand-in replying with scripted status codes."""
+
+    def __init__(self, script: List[int], retry_after: str = "") -> None:
+        self.script = list(script)
+        self.retry_after = retry_after
+        self.requests: List[httpx.Request] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        status_code = self.script.pop(0) if self.script else 200
+        headers = {"Retry-After": self.retry_after} if self.retry_after else {}
+        return httpx.Response(status_code, headers=headers, request=request)
+
+
+class FakeTime:
+    """A clock that only moves when slept on."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def clock(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _client(transport, **settings) -> httpx.AsyncClient:
+    fake_time = FakeTime()
+    governor = RequestGovernor(
+        GovernorSettings(**settings), clock=fake_time.clock, sleep=fake_time.sleep
+    )
+    client = httpx.AsyncClient(
+        transport=GovernedTransport(transport, governor), base_url="http://api"
+    )
+    client.fake_time = fake_time
+    return client
+
+
+def test_idempotent_reads_are_retried_on_server_errors():
+    """Test reads are retried with backoff until they succeed."""
+    transport = FaultInjectingTransport([503, 502, 200])
+    client = _client(transport)
+
+    response = asyncio.run(client.post("/work_pools/filter", json={}))
+
+    assert response.status_code == 200
+    assert len(transport.requests) == 3
+
+
+def test_writes_are_not_retried_on_server_errors_but_honor_retry_after():
+    """Test writes are only retried when rate limited, after Retry-After."""
+    transport = FaultInjectingTransport([429, 500], retry_after="7")
+    client = _client(transport)
+
+    response = asyncio.run(client.post("/work_pools/", json={}))
+
+    assert response.status_code == 500
+    assert len(transport.requests) == 2
+    assert 7 in client.fake_time.sleeps
+
+
+def test_circuit_opens_after_sustained_errors():
+    """Test the circuit fails fast once the failure threshold is reached."""
+    transport = FaultInjectingTransport([500] * 10)
+    client = _client(transport, failure_threshold=3, max_attempts=1)
+
+    async def _send_many():
+        for _ in range(3):
+            await client.post("/deployments/", json={})
+        await client.post("/deployments/", json={})
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(_send_many())
+    assert len(transport.requests) == 3
@@ -0,0 +1,75 @@
+"""Test paginated reads and the work pool and queue indexes built from them."""
+import asyncio
+
+from meta_prefect.implementations.actions.work_pool import (
+    local_process_base_job_template,
+)
+from meta_prefect.implementations.client import PAGE_SIZE, read_pages
+from meta_prefect.implementations.components.work_queue import (
+    WorkQueue as IndexedWorkQueue,
+)
+from meta_prefect.implementations.index import get_work_pool_index, get_work_queue_index
+from tests.fake_prefect import FakePrefectClient, run_with_client
+
+
+def test_pages_are_read_until_a_short_one():
+    """Test every page is read once, and a full last page is followed by one more."""
+    offsets = []
+
+    async def read_page(offset, limit):
+        offsets.append(offset)
+        return list(range(10))[offset : offset + limit]
+
+    assert asyncio.run(read_pages(read_page, page_size=4)) == list(range(10))
+    assert offsets == [0, 4, 8]
+    offsets.clear()
+    assert asyncio.run(read_pages(read_page, page_size=5)) == list(range(10))
+    assert offsets == [0, 5, 10]
+
+
+def test_work_pools_are_indexed_by_type_and_env():
+    """Test pools of other types are filtered out, and pools found by their env."""
+    client = FakePrefectClient()
+    for index in range(PAGE_SIZE + 10):
+        client.add_work_pool(
+            f"process-{index}",
+            base_job_template=local_process_base_job_template("dev"),
+        )
+    client.add_work_pool("plain")
+    client.add_work_pool("k8s", type="kubernetes")
+
+    async def lookups():
+        index = await get_work_pool_index("process")
+        # a second lookup is answered by the loaded index
+        assert await get_work_pool_index("process") is index
+        return index
+
+    index = run_with_client(client, lookups())
+
+    assert client.reads == 2
+    assert len(index) == PAGE_SIZE + 11
+    assert index.get("k8s") is None
+    assert index.get("process-205").type == "process"
+    # pools are found by the env templated into their runs
+    assert index.first_with_env_key("{{env}}").name == "process-0"
+    assert index.first_with_env_key(None).name == "plain"
+    assert index.first_with_env_key("dev") is None
+
+
+def test_work_queues_are_indexed_by_concurrency_limit():
+    """Test queues are found by limit, also once replaced or removed."""
+    client = FakePrefectClient()
+    client.add_work_queue("default")
+    client.add_work_queue("limit-1", concurrency_limit=1)
+    client.add_work_queue("limit-2", concurrency_limit=2)
+
+    index = run_with_client(client, get_work_queue_index("pool"))
+
+    assert index.first_with_concurrency_limit(None).name == "default"
+    assert index.first_with_concurrency_limit(1).name == "limit-1"
+    index.add(IndexedWorkQueue(name="limit-1", concurrency_limit=3))
+    assert index.first_with_concurrency_limit(1) is None
+    assert index.first_with_concurrency_limit(3).name == "limit-1"
+    index.remove("limit-2")
+    assert index.first_with_concurrency_limit(2) is None
+    assert [queue.name for queue in index.all()] == ["default", "limit-1"]
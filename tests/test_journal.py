@@ -0,0 +1,35 @@
+"""Test deploy journal."""
+from meta_prefect.implementations.journal import DeployJournal, DeployPhase
+
+
+def test_journal_replays_completed_phases(tmp_path):
+    """Test completed phases survive reloading the journal."""
+    journal = DeployJournal(tmp_path / "journal.jsonl")
+    journal.record("default::add::0", "abc", DeployPhase.BUILT)
+    journal.record(
+        "default::add::0", "abc", DeployPhase.APPLIED, deployment_name="run-dev"
+    )
+
+    reloaded = DeployJournal(tmp_path / "journal.jsonl")
+    reloaded.load()
+
+    assert reloaded.completed("default::add::0") == {
+        DeployPhase.BUILT,
+        DeployPhase.APPLIED,
+    }
+    assert reloaded.deployment_name("default::add::0") == "run-dev"
+
+
+def test_journal_expires_entries_whose_inputs_changed(tmp_path):
+    """Test entries with a stale fingerprint are expired per workspace."""
+    journal = DeployJournal(tmp_path / "journal.jsonl")
+    journal.record("a::add::0", "old", DeployPhase.POST_UPDATED)
+    journal.record("a::sub::0", "same", DeployPhase.POST_UPDATED)
+    journal.record("b::add::0", "old", DeployPhase.POST_UPDATED)
+
+    expired = journal.expire("a", {"a::add::0": "new", "a::sub::0": "same"})
+
+    assert expired == ["a::add::0"]
+    assert journal.completed("a::add::0") == set()
+    assert journal.completed("a::sub::0") == {DeployPhase.POST_UPDATED}
+    assert journal.completed("b::add::0") == {DeployPhase.POST_UPDATED}
@@ -0,0 +1,127 @@
+"""Test the Kubernetes agent's queues are sharded over replicas, and scaled."""
+import asyncio
+from typing import Dict, List, Sequence
+
+import pytest
+from prefect.settings import PREFECT_API_URL, temporary_settings
+from pydantic import ValidationError
+
+from meta_prefect.implementations.kubernetes_agent import (
+    agent_replicas,
+    AgentScalingPolicy,
+    assign_queues,
+    PrefectKubernetesAgent,
+)
+from tests.fake_kubernetes import FakeKubernetesApi
+
+QUEUES = [f"queue-{index}" for index in range(40)]
+POLICY = AgentScalingPolicy(
+    min_replicas=1, max_replicas=4, target_backlog=10, interval_seconds=0.001
+)
+
+
+def _agent(**kwargs) -> PrefectKubernetesAgent:
+    return PrefectKubernetesAgent(
+        name="agent",
+        namespace="flows",
+        image="prefecthq/prefect:2-latest-kubernetes",
+        work_queue_names=QUEUES,
+        **kwargs,
+    )
+
+
+def _polled_queues(api: FakeKubernetesApi) -> Dict[str, List[str]]:
+    polled = {}
+    for (kind, _, name), manifest in api.objects.items():
+        if kind == "Deployment":
+            command = manifest["spec"]["template"]["spec"]["containers"][0]["command"]
+            polled[name] = command[4::2]
+            assert "--match" not in command
+    return polled
+
+
+def test_adding_a_replica_only_moves_its_queues():
+    """Test queues are spread over replicas, and kept on theirs on scaling up."""
+    four = assign_queues(QUEUES, 4)
+    five = assign_queues(QUEUES, 5)
+
+    assert sorted(sum(four, [])) == sorted(QUEUES)
+    assert all(shard for shard in four)
+    for replica, shard in enumerate(four):
+        assert set(shard) - set(five[replica]) <= set(five[4])
+    assert 0 < len(five[4]) < len(QUEUES) / 2
+
+
+def test_replicas_follow_the_backlog():
+    """Test replicas are added at once, and removed one at a time."""
+    assert agent_replicas({"a": 0}, 1, POLICY) == (1, "hold")
+    assert agent_replicas({"a": 25, "b": 5}, 1, POLICY)[0] == 3
+    assert agent_replicas({"a": 500}, 2, POLICY)[0] == 4
+    assert agent_replicas({"a": 0}, 4, POLICY)[0] == 3
+    with pytest.raises(ValidationError, match="Only listed work queues"):
+        PrefectKubernetesAgent(name="agent", namespace="flows", image="i", replicas=2)
+
+
+def test_agent_objects_are_applied_concurrently_and_scaled():
+    """Test the agent is deployed to a fake API, and rescaled with its backlog."""
+    api = FakeKubernetesApi(latency_seconds=0.01)
+    backlogs = iter([35, 35, 0])
+
+    async def read_depths(work_queue_names: Sequence[str]) -> Dict[str, int]:
+        return {work_queue_names[0]: next(backlogs)}
+
+    async def main():
+        deployed = await _agent(replicas=2).deploy(api=api)
+        polled = _polled_queues(api)
+        applied = list(api.applied), api.max_in_flight
+        created = api.calls["create"]
+        await _agent(replicas=2).deploy(api=api)
+        replicas = await _agent(scaling=POLICY).autoscale(
+            iterations=3, api=api, read_depths=read_depths
+        )
+        return deployed, polled, applied, created, replicas
+
+    with temporary_settings({PREFECT_API_URL: "http://prefect:4200/api"}):
+        deployed, polled, applied, created, replicas = asyncio.run(main())
+
+    assert deployed == ["agent-0", "agent-1"]
+    assert sorted(sum(polled.values(), [])) == sorted(QUEUES)
+    # the namespace first, then the other objects at once
+    kinds, max_in_flight = applied
+    assert kinds[0] == "Namespace"
+    assert max_in_flight == 5
+
+    # objects are created once, and patched on redeploys
+    assert created == 6
+    assert replicas == 3
+    assert sorted(_polled_queues(api)) == ["agent-0", "agent-1", "agent-2"]
+    container = api.objects[("Deployment", "flows", "agent-0")]["spec"]["template"][
+        "spec"
+    ]["containers"][0]
+    assert {"name": "PREFECT_API_URL", "value": "http://prefect:4200/api"} in (
+        container["env"]
+    )
+
+
+def test_deployments_no_longer_wanted_are_deleted():
+    """Test redeploys delete the unsharded Deployment and replicas beyond the most."""
+    api = FakeKubernetesApi()
+
+    async def main():
+        await _agent().deploy(api=api)
+        await PrefectKubernetesAgent(
+            name="other", namespace="flows", image="i", work_queue_names=["other"]
+        ).deploy(api=api)
+        unsharded = sorted(_polled_queues(api))
+        await _agent(scaling=POLICY).deploy(4, api=api)
+        sharded = sorted(_polled_queues(api))
+        lowered = AgentScalingPolicy(min_replicas=1, max_replicas=2)
+        await _agent(scaling=lowered).deploy(2, api=api)
+        return unsharded, sharded
+
+    with temporary_settings({PREFECT_API_URL: "http://prefect:4200/api"}):
+        unsharded, sharded = asyncio.run(main())
+
+    assert unsharded == ["agent", "other"]
+    assert sharded == ["agent-0", "agent-1", "agent-2", "agent-3", "other"]
+    assert sorted(_polled_queues(api)) == ["agent-0", "agent-1", "other"]
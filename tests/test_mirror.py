@@ -0,0 +1,130 @@
+"""Test state mirror against an in-memory API stand-in."""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pendulum
+
+from meta_prefect.implementations import mirror as mirror_module
+from meta_prefect.implementations.mirror import StateMirror
+from tests.fake_prefect import FakePrefectClient
+
+
+class FakeClient(FakePrefectClient):
+    """Serves flows, deployments, pools and queues, counting the reads."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.now = pendulum.datetime(2023, 1, 1)
+        self.flows = []
+        self.add_work_pool("pool")
+
+    def add_deployment(self, flow_name, name, version, tags=()):
+        self.now = self.now.add(seconds=1)
+        flow = next((f for f in self.flows if f.name == flow_name), None)
+        if flow is None:
+            flow = SimpleNamespace(id=uuid4(), name=flow_name, updated=self.now)
+            self.flows.append(flow)
+        self.deployments.append(
+            SimpleNamespace(
+                id=uuid4(),
+                flow_id=flow.id,
+                name=name,
+                version=version,
+                tags=list(tags),
+                updated=self.now,
+            )
+        )
+
+    def _latest_page(self, items, limit, offset):
+        items = sorted(items, key=lambda item: item.updated, reverse=True)
+        return self._page(items, limit, offset)
+
+    async def read_flows(self, sort=None, limit=None, offset=0):
+        return self._latest_page(self.flows, limit, offset)
+
+    async def read_deployments(self, sort=None, limit=None, offset=0):
+        return self._latest_page(self.deployments, limit, offset)
+
+    def add_work_pool(self, name, type="process"):
+        super().add_work_pool(name, type=type)
+        self.add_work_queue("default", work_pool_name=name)
+
+    async def read_workers_for_work_pool(self, work_pool_name, **kwargs):
+        return self._page([], kwargs["limit"], kwargs["offset"])
+
+
+def _mirror(tmp_path, monkeypatch, client) -> StateMirror:
+    @asynccontextmanager
+    async def get_client():
+        yield client
+
+    monkeypatch.setattr(mirror_module, "get_client", get_client)
+    return StateMirror(tmp_path / "state.sqlite")
+
+
+def test_mirror_answers_lookups_after_sync(tmp_path, monkeypatch):
+    """Test versions, pools and queues are read from the mirror."""
+    client = FakeClient()
+    client.add_deployment("add", "run-dev", "3", tags=["env=dev"])
+    client.add_deployment("add", "run-prod", "1", tags=["env=prod"])
+    mirror = _mirror(tmp_path, monkeypatch, client)
+
+    asyncio.run(mirror.sync())
+
+    assert mirror.latest_deployment_version("add", "run-dev", ["env=dev"]) == "3"
+    assert mirror.latest_deployment_version("add", "run-dev", ["env=prod"]) is None
+    assert mirror.latest_deployment_version("sub", "run-dev") is None
+    assert [pool.name for pool in asyncio.run(mirror.work_pools("process"))] == ["pool"]
+    assert [queue.name for queue in asyncio.run(mirror.work_queues("pool"))] == [
+        "default"
+    ]
+
+
+def test_warm_sync_reads_only_what_changed(tmp_path, monkeypatch):
+    """Test an incremental sync reads a single page per object kind."""
+    client = FakeClient()
+    for index in range(450):
+        client.add_deployment(f"flow-{index}", "run-dev", "1")
+    mirror = _mirror(tmp_path, monkeypatch, client)
+
+    cold = asyncio.run(mirror.sync())
+    client.add_deployment("flow-7", "run-dev", "2")
+    warm = asyncio.run(mirror.sync())
+
+    assert cold.deployments == 450
+    assert warm.deployments < 200
+    # flows and deployments, pools and queues are read when looked up
+    assert warm.reads == 2
+    assert mirror.latest_deployment_version("flow-7", "run-dev") == "2"
+
+
+def test_pools_queues_and_workers_are_read_once_when_looked_up(tmp_path, monkeypatch):
+    """Test a warm deploy to one pool reads neither the other pools nor theirs."""
+    client = FakeClient()
+    for index in range(30):
+        client.add_work_pool(f"pool-{index}")
+        client.add_work_pool(f"k8s-{index}", type="kubernetes")
+    mirror = _mirror(tmp_path, monkeypatch, client)
+    asyncio.run(mirror.sync())
+
+    async def deploy():
+        await mirror.sync()
+        for _ in range(2):
+            work_pools = await mirror.work_pools("process")
+            await mirror.work_queues("pool-7")
+            await mirror.live_workers("pool-7")
+        return work_pools
+
+    client.reads = 0
+    work_pools = asyncio.run(deploy())
+
+    # flows, deployments, process pools, and the queues and workers of pool-7
+    assert client.reads == 5
+    assert len(work_pools) == 31
+    assert {pool.type for pool in work_pools} == {"process"}
+    client.reads = 0
+    asyncio.run(mirror.sync())
+    asyncio.run(mirror.work_queues("pool-7"))
+    assert client.reads == 3
@@ -0,0 +1,94 @@
+"""Test capacity-aware schedule packing."""
+from pathlib import Path
+
+import numpy as np
+import pendulum
+from prefect.client.schemas.schedules import CronSchedule, RRuleSchedule
+
+from meta_prefect.implementations.builders.scheduling.plan import (
+    SchedulePlan,
+    use_schedule_plan,
+)
+from meta_prefect.implementations.builders.scheduling.stagger import schedule_staggerer
+from meta_prefect.implementations.load import (
+    load_durations_csv,
+    ScheduledLoad,
+    simulate_delays,
+)
+from meta_prefect.implementations.packing import (
+    allowed_offsets,
+    pack_work_pool,
+    PackingItem,
+)
+from meta_prefect.interface.deployment import Deployment
+
+START = pendulum.datetime(2024, 1, 1)
+
+
+def _items(staggerer: schedule_staggerer, count: int):
+    for index in range(count):
+        schedule = (
+            CronSchedule(cron="0 * * * *", timezone="UTC")
+            if index % 2
+            else RRuleSchedule(rrule="FREQ=DAILY;BYHOUR=0,6,12", timezone="UTC")
+        )
+        load = ScheduledLoad(
+            key=f"flow/run-{index}",
+            schedule=schedule,
+            duration_seconds=300,
+            work_pool_name="pool",
+            work_queue_name="queue" if index < 4 else "default",
+        )
+        yield PackingItem(load, allowed_offsets(staggerer, schedule))
+
+
+def test_packing_lowers_the_peak_within_the_window():
+    """Test runs of the same hour are spread out and queue limits are honored."""
+    items = list(_items(schedule_staggerer(window_seconds=3600), 20))
+
+    result = pack_work_pool(
+        "pool",
+        items,
+        START,
+        START.add(days=2),
+        concurrency_limit=2,
+        queue_limits={"queue": 1},
+    )
+
+    report = result.report
+    assert (report.peak_before, report.peak_after) == (20, 2)
+    assert report.utilization_after == 1.0
+    assert report.mean_delay_after == 0 < report.mean_delay_before
+    assert all(0 <= offset < 3600 for offset in result.offsets.values())
+    # the runs of the limited queue never overlap
+    queue_offsets = sorted(result.offsets[f"flow/run-{index}"] for index in range(4))
+    assert np.diff(queue_offsets).min() >= 300
+    assert result.schedules["flow/run-1"].cron.startswith(
+        str(result.offsets["flow/run-1"] // 60)
+    )
+
+
+def test_durations_and_delays():
+    """Test durations are medians and runs wait first come first served."""
+    durations = load_durations_csv(Path(__file__).parent / "durations.csv")
+    assert durations == {"add/run-dev": 20.0, "add/run-prod": 300.0}
+
+    starts = np.array(["2024-01-01T00:00:00"] * 3, dtype="M8[s]")
+    delays = simulate_delays(starts, np.array([60.0, 60.0, 60.0]), limit=2)
+    assert delays.tolist() == [0.0, 0.0, 60.0]
+
+
+def test_staggerer_applies_the_planned_offset(tmp_path):
+    """Test a saved plan overrides the hash based offset of a deployment."""
+    plan = SchedulePlan.for_project(str(tmp_path))
+    plan.offsets["add/run-dev"] = 600
+    plan.save()
+    deployment = Deployment(name="run-dev", flow_name="add")
+    deployment.schedule = CronSchedule(cron="0 9 * * *")
+
+    with use_schedule_plan(SchedulePlan.for_project(str(tmp_path))):
+        deployment = schedule_staggerer(window_seconds=0).update_deployment(
+            flow=None, deployment=deployment
+        )
+
+    assert deployment.schedule.cron == "10 9 * * *"
@@ -0,0 +1,245 @@
+"""Test the work queue registry against an in-memory API stand-in."""
+import asyncio
+from types import SimpleNamespace
+
+from prefect.client.schemas.actions import WorkPoolCreate
+from prefect.exceptions import ObjectAlreadyExists
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.index import invalidate_indexes
+from meta_prefect.implementations.queues import (
+    ensure_work_queue,
+    QueueSpec,
+    reconcile_work_queues,
+)
+from tests.fake_prefect import FakePrefectClient, run_with_client
+
+
+class FakeClient(FakePrefectClient):
+    """Serves the queues and deployments of a single work pool."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_work_queue("default")
+        self.waiting_queues = set()
+        # deployments with auto-scheduled runs, dropped when they are updated
+        self.scheduled = set()
+        self.created = 0
+
+    def add_deployment(self, name, work_queue_name):
+        self.deployments.append(
+            SimpleNamespace(name=name, work_queue_name=work_queue_name)
+        )
+
+    async def read_flow_runs(self, work_queue_filter, **kwargs):
+        names = set(work_queue_filter.name.any_)
+        scheduled = {
+            deployment.work_queue_name
+            for deployment in self.deployments
+            if deployment.name in self.scheduled
+        }
+        return list(names & (self.waiting_queues | scheduled))
+
+    async def create_work_queue(self, name, **kwargs):
+        if any(work_queue.name == name for work_queue in self.work_queues):
+            raise ObjectAlreadyExists(None)
+        self.created += 1
+        return self.add_work_queue(
+            name,
+            concurrency_limit=kwargs["concurrency_limit"],
+            priority=kwargs["priority"],
+        )
+
+    async def update_work_queue(self, id, **kwargs):
+        for work_queue in self.work_queues:
+            if work_queue.id == id:
+                for name, value in kwargs.items():
+                    setattr(work_queue, name, value)
+
+    async def update_deployment(self, deployment):
+        self.scheduled.discard(deployment.name)
+
+    async def delete_work_queue_by_id(self, id):
+        self.work_queues = [
+            work_queue for work_queue in self.work_queues if work_queue.id != id
+        ]
+
+    def names(self):
+        return sorted(work_queue.name for work_queue in self.work_queues)
+
+
+def test_queues_are_named_after_their_spec_and_reused():
+    """Test a spec maps to the same queue on every deploy."""
+    client = FakeClient()
+    shared = QueueSpec(work_pool_name="pool", concurrency_limit=1)
+    owned = QueueSpec(work_pool_name="pool", concurrency_limit=1, owner="add/run-dev")
+
+    for _ in range(2):
+        assert run_with_client(client, ensure_work_queue(shared)).name == (
+            "meta-prefect-limit-1-priority-1"
+        )
+        assert run_with_client(client, ensure_work_queue(owned)).name.startswith(
+            "meta-prefect-limit-1-priority-1-add-run-dev-"
+        )
+
+    assert client.created == 2
+    assert (
+        QueueSpec(work_pool_name="pool", owner="add/run_dev").name
+        != QueueSpec(work_pool_name="pool", owner="add/run-dev").name
+    )
+
+
+def test_drifted_limits_of_owned_queues_are_reset_to_the_spec():
+    """Test only the limit of a deployment's own queue is set back to its name's.
+
+    The limits of shared queues are left to the autotuner.
+    """
+    client = FakeClient()
+    owned = QueueSpec(work_pool_name="pool", concurrency_limit=1, owner="add/run-dev")
+    shared = QueueSpec(work_pool_name="pool", concurrency_limit=1)
+    client.add_work_queue(owned.name, concurrency_limit=6)
+    client.add_work_queue(shared.name, concurrency_limit=6)
+
+    assert run_with_client(client, ensure_work_queue(owned)).concurrency_limit == 1
+    assert run_with_client(client, ensure_work_queue(shared)).concurrency_limit == 6
+    assert [work_queue.concurrency_limit for work_queue in client.work_queues] == [
+        None,
+        1,
+        6,
+    ]
+    assert client.created == 0
+
+
+def test_registry_queues_are_ranked_by_the_priority_in_their_name():
+    """Test the API's queue priorities follow the registry names.
+
+    The server renumbers the priorities of a pool's queues on every change, so
+    queues created in any order are ranked by the priority in their name, with
+    the pool's default queue last, and ranked again once moved in the UI.
+    """
+    specs = [
+        QueueSpec(work_pool_name="pool", concurrency_limit=2, priority=2),
+        QueueSpec(work_pool_name="pool", priority=3),
+        QueueSpec(work_pool_name="pool", concurrency_limit=1, priority=1),
+        QueueSpec(work_pool_name="pool", concurrency_limit=1, priority=2),
+        QueueSpec(work_pool_name="pool", priority=1, owner="add/run-dev"),
+        QueueSpec(work_pool_name="pool", priority=1),
+    ]
+
+    async def read_ranks():
+        async with get_client() as client:
+            work_queues = await client.read_work_queues(work_pool_name="pool")
+        return [
+            (work_queue.priority, work_queue.name)
+            for work_queue in sorted(work_queues, key=lambda queue: queue.priority)
+        ]
+
+    async def main():
+        invalidate_indexes()
+        async with get_client() as client:
+            await client.create_work_pool(WorkPoolCreate(name="pool", type="process"))
+        for spec in specs:
+            await ensure_work_queue(spec)
+        created = await read_ranks()
+
+        async with get_client() as client:
+            default = await client.read_work_queue_by_name(
+                "default", work_pool_name="pool"
+            )
+            await client.update_work_queue(default.id, priority=1)
+        invalidate_indexes()
+        await ensure_work_queue(specs[0])
+        return created, await read_ranks()
+
+    with prefect_test_harness():
+        created, restored = asyncio.run(main())
+
+    names = [
+        spec.name for spec in sorted(specs, key=lambda spec: (spec.priority, spec.name))
+    ]
+    expected = list(enumerate(names + ["default"], start=1))
+    assert created == expected
+    assert restored == expected
+
+
+def test_reconciliation_deletes_orphans_and_merges_legacy_queues():
+    """Test unused queues go, legacy ones are merged and busy ones are kept."""
+    client = FakeClient()
+    client.add_work_queue("work-queue-1a2b3c4d", concurrency_limit=1)
+    client.add_work_queue("work-queue-5e6f7a8b")
+    client.add_work_queue(
+        "meta-prefect-limit-1-priority-1-gone-12345678", concurrency_limit=1
+    )
+    client.add_work_queue("meta-prefect-limit-2-priority-1", concurrency_limit=2)
+    client.add_work_queue("meta-prefect-unlimited-priority-1")
+    client.add_work_queue("team-queue")
+    client.add_deployment("run-dev", "work-queue-1a2b3c4d")
+    client.add_deployment("run-prod", "meta-prefect-unlimited-priority-1")
+    client.waiting_queues.add("meta-prefect-limit-2-priority-1")
+
+    actions = {
+        reconciliation.work_queue_name: reconciliation.action
+        for reconciliation in run_with_client(client, reconcile_work_queues("pool"))
+    }
+
+    assert actions == {
+        "work-queue-1a2b3c4d": "merged",
+        "work-queue-5e6f7a8b": "deleted",
+        "meta-prefect-limit-1-priority-1-gone-12345678": "deleted",
+        "meta-prefect-limit-2-priority-1": "kept",
+    }
+    assert client.deployments[0].work_queue_name == "meta-prefect-limit-1-priority-1"
+    assert client.names() == [
+        "default",
+        "meta-prefect-limit-1-priority-1",
+        "meta-prefect-limit-2-priority-1",
+        "meta-prefect-unlimited-priority-1",
+        "team-queue",
+    ]
+
+
+def test_legacy_queues_of_scheduled_deployments_are_merged():
+    """Test moving a scheduled deployment drops its runs, so its queue goes."""
+    client = FakeClient()
+    client.add_work_queue("work-queue-1a2b3c4d", concurrency_limit=1)
+    client.add_work_queue("work-queue-5e6f7a8b")
+    client.add_deployment("nightly", "work-queue-1a2b3c4d")
+    client.add_deployment("hourly", "work-queue-5e6f7a8b")
+    client.scheduled.update({"nightly", "hourly"})
+    # a run started by hand is not dropped, so its queue is kept for now
+    client.waiting_queues.add("work-queue-5e6f7a8b")
+
+    dry_run = run_with_client(client, reconcile_work_queues("pool", dry_run=True))
+    reconciliations = run_with_client(client, reconcile_work_queues("pool"))
+
+    assert [reconciliation.action for reconciliation in dry_run] == [
+        "merged",
+        "merged",
+    ]
+    assert [
+        (reconciliation.action, reconciliation.merged_into)
+        for reconciliation in reconciliations
+    ] == [
+        ("merged", "meta-prefect-limit-1-priority-1"),
+        ("kept", "meta-prefect-unlimited-priority-1"),
+    ]
+    assert [deployment.work_queue_name for deployment in client.deployments] == [
+        "meta-prefect-limit-1-priority-1",
+        "meta-prefect-unlimited-priority-1",
+    ]
+    assert client.names() == [
+        "default",
+        "meta-prefect-limit-1-priority-1",
+        "meta-prefect-unlimited-priority-1",
+        "work-queue-5e6f7a8b",
+    ]
+
+    # once the run is done, the emptied legacy queue is deleted
+    client.waiting_queues.clear()
+    reconciliations = run_with_client(client, reconcile_work_queues("pool"))
+
+    assert [
+        (reconciliation.work_queue_name, reconciliation.action)
+        for reconciliation in reconciliations
+    ] == [("work-queue-5e6f7a8b", "deleted")]
@@ -0,0 +1,125 @@
+"""Test pods are right-sized from the peak usage of past runs."""
+import asyncio
+import csv
+import json
+from pathlib import Path
+
+from prefect import flow
+
+from meta_prefect.implementations.builders.infra.eks import eks
+from meta_prefect.implementations.rightsizing import (
+    DEFAULT_PROFILES,
+    FileMetricsSource,
+    PodResources,
+    recommend,
+    ResourceUsage,
+    size_pods,
+    USAGE_COLUMNS,
+    use_metrics_source,
+)
+from meta_prefect.interface import DeployableFlow, Deployment
+
+# an overprovisioned deployment, and one running close to its memory limit
+USAGE = {
+    ("etl", "run-prod"): [(0.4 + 0.01 * run, 0.9 + 0.02 * run) for run in range(20)],
+    ("ml", "run-prod"): [(1.5, 7.5), (1.8, 8.0), (1.6, 7.9), (1.7, 8.1), (1.2, 7.0)],
+}
+
+
+@flow
+def etl() -> None:
+    pass
+
+
+def _write_usage(path: Path) -> Path:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=USAGE_COLUMNS)
+        writer.writeheader()
+        for (flow_name, deployment_name), runs in USAGE.items():
+            for cpu, memory_gb in runs:
+                writer.writerow(
+                    {
+                        "flow_name": flow_name,
+                        "deployment_name": deployment_name,
+                        "cpu": cpu,
+                        "memory_gb": memory_gb,
+                    }
+                )
+    return path
+
+
+def test_requests_and_limits_cover_percentiles_of_peaks_with_headroom():
+    """Test requests cover typical peaks, limits every peak, dev pods less."""
+    usage = [ResourceUsage(*run) for run in USAGE[("etl", "run-prod")]]
+
+    prod = size_pods(usage, DEFAULT_PROFILES["prod"])
+    dev = size_pods(usage, DEFAULT_PROFILES["dev"])
+
+    assert prod == PodResources(
+        cpu_request=0.7, cpu_limit=0.9, memory_request_gb=1.5, memory_limit_gb=2.0
+    )
+    assert prod.memory_limit_gb >= max(run.memory_gb for run in usage)
+    assert dev.cpu_request < prod.cpu_request
+    assert dev.memory_limit_gb < prod.memory_limit_gb
+
+
+def test_recommendations_need_history_and_flag_oom_risks(tmp_path):
+    """Test deployments with few runs keep their size, and tight ones grow."""
+    source = FileMetricsSource(_write_usage(tmp_path / "usage.csv"))
+
+    async def main():
+        current = PodResources.fixed(2, 8)
+        return (
+            await recommend("etl/run-prod", "prod", current, source=source),
+            await recommend("ml/run-prod", "prod", current, source=source),
+            await recommend("new/run-prod", "prod", current, source=source),
+        )
+
+    overprovisioned, tight, new = asyncio.run(main())
+
+    assert overprovisioned.cpu_saved == 1.3
+    assert overprovisioned.memory_saved_gb == 6.5
+    assert not overprovisioned.oom_risk
+    assert tight.oom_risk
+    assert tight.resources.memory_limit_gb > 8
+    assert new.recommended is None
+    assert new.resources == new.current and new.cpu_saved == 0
+
+
+def test_eks_applies_the_recommended_requests_and_limits(tmp_path):
+    """Test applied sizes set distinct requests and limits on the Job's pods."""
+    path = tmp_path / "usage.json"
+    path.write_text(
+        json.dumps(
+            [
+                {
+                    "flow_name": "etl",
+                    "deployment_name": "run-prod",
+                    "cpu": cpu,
+                    "memory_gb": memory_gb,
+                }
+                for cpu, memory_gb in USAGE[("etl", "run-prod")]
+            ]
+        )
+    )
+    deployable_flow = DeployableFlow.from_prefect_flow(etl)
+
+    def resources(rightsizing: str) -> dict:
+        builder = eks(
+            namespace="flows", cpu=2, memory_gb=8, env="prod", rightsizing=rightsizing
+        )
+        with use_metrics_source(FileMetricsSource(path)):
+            deployment = builder.update_deployment(
+                deployable_flow, Deployment(name="run-prod", flow_name="etl")
+            )
+        job = deployment.infrastructure.job
+        return job["spec"]["template"]["spec"]["containers"][0]["resources"]
+
+    assert resources("apply") == {
+        "requests": {"cpu": "0.7", "memory": "1.5Gi"},
+        "limits": {"cpu": "0.9", "memory": "2.0Gi"},
+    }
+    assert resources("recommend") == {
+        "requests": {"cpu": "2.0", "memory": "8.0Gi"},
+        "limits": {"cpu": "2.0", "memory": "8.0Gi"},
+    }
@@ -0,0 +1,103 @@
+"""Test local flow runs are pinned, limited and reniced as their deployment says."""
+import json
+import os
+import subprocess
+import sys
+
+from prefect.utilities.templating import apply_values
+from prefect.workers.process import ProcessJobConfiguration
+
+from meta_prefect.implementations.actions.work_pool import (
+    local_process_base_job_template,
+)
+from meta_prefect.implementations.run_resources import (
+    enter_cgroup,
+    is_run_resources_command,
+    next_cpu_set,
+    RunResources,
+)
+
+
+def _job_configuration(infra_overrides) -> ProcessJobConfiguration:
+    template = local_process_base_job_template("dev")
+    variables = ProcessJobConfiguration._get_base_config_defaults(
+        template["variables"]["properties"]
+    )
+    variables.update(infra_overrides)
+    return ProcessJobConfiguration(
+        **apply_values(template["job_configuration"], variables)
+    )
+
+
+def test_work_pool_template_carries_the_limits_of_deployments():
+    """Test only deployments setting limits get the wrapper command and its env."""
+    plain = _job_configuration({"env": "prod"})
+    assert plain.command is None
+    assert not is_run_resources_command(plain.command)
+    assert plain.env == {"META_PREFECT__ENV": "prod"}
+
+    resources = RunResources(cpus=2, memory_mb=512, nice=10)
+    limited = _job_configuration({"env": "prod", **resources.infra_overrides()})
+    assert limited.command.endswith("-m meta_prefect.implementations.run_resources")
+    assert is_run_resources_command(limited.command)
+    assert RunResources.from_env(limited.env) == resources
+
+
+def test_cpu_sets_are_handed_out_round_robin(tmp_path, monkeypatch):
+    """Test consecutive runs are pinned to the next cores, wrapping around."""
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0, 1, 2, 3, 4})
+    counter = tmp_path / "cpu-round-robin"
+
+    cpu_sets = [next_cpu_set(2, counter) for _ in range(4)]
+
+    assert cpu_sets == [[0, 1], [2, 3], [0, 4], [1, 2]]
+
+
+def test_worker_is_moved_into_a_leaf_before_controllers_are_enabled(tmp_path):
+    """Test a run under a populated cgroup empties it, then gets its own cgroup."""
+    parent = tmp_path / "worker.service"
+    parent.mkdir()
+    (parent / "cgroup.procs").write_text(f"{os.getppid()}\n{os.getpid()}\n")
+    (parent / "cgroup.subtree_control").write_text("")
+    (parent / f"meta-prefect-run-{os.getpid() + 1}").mkdir()
+
+    cgroup = enter_cgroup(memory_mb=512, cpu_quota=1.5, parent=parent)
+
+    assert sorted(path.name for path in parent.iterdir() if path.is_dir()) == [
+        cgroup.name,
+        "worker",
+    ]
+    assert (parent / "worker" / "cgroup.procs").exists()
+    assert (parent / "cgroup.subtree_control").read_text() == "+memory +cpu"
+    assert (cgroup / "memory.max").read_text() == str(512 * 1024 * 1024)
+    assert (cgroup / "cpu.max").read_text() == "150000 100000"
+    assert (cgroup / "cgroup.procs").read_text() == str(os.getpid())
+
+
+def test_limits_are_applied_to_the_run_process(tmp_path):
+    """Test a run without a delegated cgroup is pinned, reniced and rlimited."""
+    env = {
+        **os.environ,
+        "META_PREFECT__WORKERS_HOME": str(tmp_path),
+        "META_PREFECT__CGROUP_PARENT": str(tmp_path / "no-cgroup"),
+        "META_PREFECT__RUN_CPUS": "1",
+        "META_PREFECT__RUN_MEMORY_MB": "4096",
+        "META_PREFECT__RUN_NICE": "5",
+    }
+    script = (
+        "import json, os, resource\n"
+        "from meta_prefect.implementations.run_resources import *\n"
+        "applied = apply_run_resources(RunResources.from_env(os.environ))\n"
+        "print(json.dumps([applied, sorted(os.sched_getaffinity(0)),\n"
+        "    os.getpriority(os.PRIO_PROCESS, 0),\n"
+        "    resource.getrlimit(resource.RLIMIT_AS)[0]]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], env=env, capture_output=True, check=True
+    ).stdout
+
+    applied, cores, nice, address_space = json.loads(output)
+    assert cores == [sorted(os.sched_getaffinity(0))[0]]
+    assert nice == max(5, os.getpriority(os.PRIO_PROCESS, 0))
+    assert address_space == 4096 * 1024 * 1024
+    assert "falling back to RLIMIT_AS" in applied[1]
@@ -0,0 +1,97 @@
+"""Test the hash-based schedule staggerer."""
+import datetime
+
+import numpy as np
+import pendulum
+from prefect.client.schemas.schedules import (
+    CronSchedule,
+    IntervalSchedule,
+    RRuleSchedule,
+)
+
+from meta_prefect.implementations.builders.scheduling.engine import get_occurrence_grid
+from meta_prefect.implementations.builders.scheduling.federal import (
+    federal_holiday_schedule_updater,
+)
+from meta_prefect.implementations.builders.scheduling.stagger import schedule_staggerer
+
+START = pendulum.datetime(2024, 1, 1, tz="US/Eastern")
+
+
+def test_offsets_are_stable_and_spread_within_the_window():
+    """Test each deployment keeps its offset and deployments are spread out."""
+    staggerer = schedule_staggerer(window_seconds=900)
+    schedule = CronSchedule(cron="0 * * * *", timezone="US/Eastern")
+
+    offsets = [staggerer.get_offset(f"flow/run-{i}", schedule) for i in range(100)]
+
+    assert offsets == [
+        staggerer.get_offset(f"flow/run-{i}", schedule) for i in range(100)
+    ]
+    assert all(0 <= offset < 900 and offset % 60 == 0 for offset in offsets)
+    assert len(set(offsets)) == 15
+    assert staggerer.get_offset("flow/run-0", schedule) != schedule_staggerer(
+        salt="reshuffle"
+    ).get_offset("flow/run-0", schedule)
+
+
+def test_offsets_respect_the_earliest_and_latest_bounds():
+    """Test occurrences are kept within the declared times of day."""
+    schedule = CronSchedule(cron="0 9,17 * * *", timezone="US/Eastern")
+    staggerer = schedule_staggerer(
+        window_seconds=3600,
+        earliest=datetime.time(9, 10),
+        latest=datetime.time(17, 20),
+    )
+
+    offsets = {staggerer.get_offset(f"flow/run-{i}", schedule) for i in range(100)}
+
+    assert offsets == set(range(600, 1201, 60))
+    assert (
+        schedule_staggerer(latest=datetime.time(16)).get_offset("flow", schedule)
+        is None
+    )
+
+
+def test_cron_stays_cron_and_interval_moves_its_anchor():
+    """Test shifted schedules keep their type and occurrences move by the offset."""
+    staggerer = schedule_staggerer()
+    cron = CronSchedule(cron="*/20 9-17 * * MON-FRI", timezone="US/Eastern")
+    interval = IntervalSchedule(
+        interval=datetime.timedelta(hours=2),
+        anchor_date=pendulum.datetime(2020, 1, 1, tz="US/Eastern"),
+        timezone="US/Eastern",
+    )
+
+    for schedule in (cron, interval):
+        offset = staggerer.get_offset("flow/run", schedule)
+        shifted = staggerer._update_schedule("flow/run", schedule)
+        assert type(shifted) is type(schedule)
+        end = START.add(months=2)
+        expected = get_occurrence_grid(schedule).occurrences(START, end)
+        actual = get_occurrence_grid(shifted).occurrences(START, end)
+        assert np.array_equal(actual, expected + np.timedelta64(offset, "s"))
+
+
+def test_staggering_keeps_holidays_excluded():
+    """Test a staggered schedule excludes the same holidays either way round."""
+    schedule = RRuleSchedule(
+        rrule="DTSTART:20200101T000000\nRRULE:FREQ=DAILY;BYHOUR=0,12",
+        timezone="US/Eastern",
+    )
+    staggerer = schedule_staggerer()
+    holidays = federal_holiday_schedule_updater()
+    offset = staggerer.get_offset("flow/run", schedule)
+
+    before = staggerer._update_schedule(
+        "flow/run", holidays._update_schedule(schedule, START)
+    )
+    after = holidays._update_schedule(
+        staggerer._update_schedule("flow/run", schedule), START
+    )
+
+    end = START.add(years=1)
+    expected = get_occurrence_grid(after).occurrences(START, end)
+    assert np.array_equal(get_occurrence_grid(before).occurrences(START, end), expected)
+    assert len(expected) == 2 * (366 - 11)
+    assert (expected.astype("M8[s]") - expected.astype("M8[h]")).max() == offset
@@ -0,0 +1,137 @@
+"""Test the supervisor keeps, restarts and drains local process workers."""
+import fcntl
+import signal
+from typing import List, Optional
+
+from meta_prefect.implementations.supervisor import (
+    ensure_supervisor,
+    PoolRegistration,
+    SupervisorHome,
+    WorkerSupervisor,
+)
+
+
+class FakeProcess:
+    """A worker process exiting when told, or after the signals it handles."""
+
+    pid_counter = 1000
+
+    def __init__(self, exits_on_sigint: bool = True):
+        FakeProcess.pid_counter += 1
+        self.pid = FakeProcess.pid_counter
+        self.exits_on_sigint = exits_on_sigint
+        self.exit_code: Optional[int] = None
+        self.signals: List[int] = []
+
+    def poll(self) -> Optional[int]:
+        return self.exit_code
+
+    def send_signal(self, sig: int) -> None:
+        self.signals.append(sig)
+        if self.exits_on_sigint:
+            self.exit_code = 0
+
+    def kill(self) -> None:
+        self.signals.append(signal.SIGKILL)
+        self.exit_code = -signal.SIGKILL
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _supervisor(tmp_path, clock, processes) -> WorkerSupervisor:
+    def spawn(home, slot):
+        processes.append(FakeProcess())
+        return processes[-1]
+
+    return WorkerSupervisor(
+        SupervisorHome(tmp_path),
+        count=2,
+        backoff_seconds=1,
+        max_backoff_seconds=8,
+        stable_seconds=30,
+        drain_seconds=60,
+        spawn=spawn,
+        clock=clock,
+    )
+
+
+def test_crashed_workers_are_restarted_with_backoff(tmp_path):
+    """Test a crash-looping worker waits 1, 2 then 4s, and 1s again once stable."""
+    clock, processes = Clock(), []
+    supervisor = _supervisor(tmp_path, clock, processes)
+    SupervisorHome(tmp_path).register(PoolRegistration("pool", "prod"))
+
+    supervisor.reconcile()
+    assert [slot.state for slot in supervisor.slots.values()] == ["running"] * 2
+
+    restarts = []
+    for _ in range(3):
+        processes[-1].exit_code = 1
+        crashed_at, spawned = clock.now, len(processes)
+        supervisor.reconcile()
+        while len(processes) == spawned:
+            clock.now += 0.5
+            supervisor.reconcile()
+        restarts.append(clock.now - crashed_at)
+    assert restarts == [1, 2, 4]
+
+    clock.now += 30
+    processes[-1].exit_code = 1
+    supervisor.reconcile()
+    slot = supervisor.slots[("prod/pool", 1)]
+    assert (slot.state, slot.next_start_at - clock.now) == ("backoff", 1)
+    assert slot.restarts == 3 and slot.last_exit_code == 1
+
+    status = SupervisorHome(tmp_path).status_file.read_text()
+    assert '"state": "backoff"' in status and '"restarts": 3' in status
+
+
+def test_workers_are_drained_then_killed_after_the_drain_timeout(tmp_path):
+    """Test unregistered pools and stops drain with SIGINT, then SIGKILL."""
+    clock, processes = Clock(), []
+    supervisor = _supervisor(tmp_path, clock, processes)
+    home = SupervisorHome(tmp_path)
+    home.register(PoolRegistration("pool", "prod"), count=1)
+    home.register(PoolRegistration("busy", "prod"), count=1)
+    supervisor.reconcile()
+    idle, busy = processes
+    busy.exits_on_sigint = False
+
+    home.unregister(PoolRegistration("pool", "prod"))
+    supervisor.reconcile()
+    assert idle.signals == [signal.SIGINT]
+    assert list(supervisor.slots) == [("prod/busy", 0)]
+
+    supervisor.stop()
+    supervisor.reconcile()
+    assert supervisor.slots[("prod/busy", 0)].state == "draining"
+    clock.now += 59
+    supervisor.reconcile()
+    assert busy.signals == [signal.SIGINT]
+    clock.now += 1
+    supervisor.reconcile()
+    assert busy.signals == [signal.SIGINT, signal.SIGKILL]
+    assert not supervisor.slots and len(processes) == 2
+
+
+def test_a_single_supervisor_runs_while_its_pid_file_is_locked(tmp_path):
+    """Test a supervisor exits at once while another holds its pid file."""
+    home = SupervisorHome(tmp_path)
+    processes: List[FakeProcess] = []
+    home.pid_file.write_text("4242")
+    assert home.supervisor_pid() is None
+
+    with open(home.pid_file) as pid_file:
+        fcntl.flock(pid_file, fcntl.LOCK_EX)
+        _supervisor(tmp_path, Clock(), processes).run()
+
+        assert processes == []
+        assert home.supervisor_pid() == 4242
+        assert ensure_supervisor(home) == 4242
+    assert home.supervisor_pid() is None
@@ -0,0 +1,107 @@
+"""Test priority tiers route deployments to prioritized work queues."""
+import asyncio
+
+import pendulum
+import pytest
+from prefect.client.schemas.actions import WorkPoolCreate
+from prefect.states import Scheduled
+from prefect.testing.utilities import prefect_test_harness
+
+from meta_prefect.implementations.actions.base import cache
+from meta_prefect.implementations.builders.concurrency.tiers import (
+    priority_tier_router,
+    PriorityTier,
+)
+from meta_prefect.implementations.client import get_client
+from meta_prefect.implementations.index import invalidate_indexes
+from meta_prefect.implementations.queues import ensure_work_queue, QueueSpec
+from meta_prefect.interface.deployment import Deployment
+
+
+def test_unknown_tiers_are_rejected():
+    """Test a deployment can only be given a configured tier."""
+    with pytest.raises(ValueError, match="Unknown priority tier"):
+        priority_tier_router(tier="urgent")
+
+
+def test_critical_runs_are_picked_up_first_under_saturation():
+    """Test a saturated work pool hands out critical runs before earlier batch runs.
+
+    The tiers' queues are created out of order in a pool with its default queue.
+    Batch runs are late by an hour, standard ones by half an hour, critical ones
+    by a minute and runs of the default queue by two hours, while the pool only
+    has room for five runs. Workers poll the scheduled runs of the pool ordered
+    by queue priority first, so the critical and standard runs are picked up,
+    the capped batch queue only gets the one slot left and the default queue
+    none.
+    """
+    tiers = {
+        "standard": PriorityTier(priority=2),
+        "batch": PriorityTier(priority=3, concurrency_limit=2),
+        "critical": PriorityTier(priority=1),
+    }
+    runs = {"critical": (2, 60), "standard": (2, 1800), "batch": (6, 3600)}
+
+    async def main():
+        invalidate_indexes()
+        cache.clear()
+        async with get_client() as client:
+            await client.create_work_pool(
+                WorkPoolCreate(name="pool", type="process", concurrency_limit=5)
+            )
+            flow_id = await client.create_flow_from_name("etl")
+
+            queues = {"default": "default"}
+            for name, tier in tiers.items():
+                work_queue = await ensure_work_queue(
+                    QueueSpec(work_pool_name="pool", **tier.dict())
+                )
+                queues[work_queue.name] = name
+            runs["default"] = (2, 7200)
+            for work_queue_name, name in queues.items():
+                deployment_id = await client.create_deployment(
+                    flow_id,
+                    name,
+                    work_pool_name="pool",
+                    work_queue_name=work_queue_name,
+                )
+                count, late = runs[name]
+                for _ in range(count):
+                    await client.create_flow_run_from_deployment(
+                        deployment_id,
+                        state=Scheduled(
+                            scheduled_time=pendulum.now("UTC").subtract(seconds=late)
+                        ),
+                    )
+
+            work_queues = await client.read_work_queues(work_pool_name="pool")
+            picked = await client.get_scheduled_flow_runs_for_work_pool("pool")
+        ranked = [
+            queues[work_queue.name]
+            for work_queue in sorted(work_queues, key=lambda queue: queue.priority)
+        ]
+        return ranked, [queues[run.flow_run.work_queue_name] for run in picked]
+
+    with prefect_test_harness():
+        ranked, picked = asyncio.run(main())
+
+    assert ranked == ["critical", "standard", "batch", "default"]
+    assert sorted(picked) == ["batch", "critical", "critical", "standard", "standard"]
+
+
+def test_router_sends_deployments_to_their_tier_queue():
+    """Test the queue of a tier is created through the action machinery."""
+    router = priority_tier_router(tier="batch")
+
+    async def main():
+        invalidate_indexes()
+        cache.clear()
+        for action in router.pre_deployment_actions:
+            await action.run()
+        deployment = Deployment(name="backfill")
+        return await router.update_deployment(flow=None, deployment=deployment)
+
+    with prefect_test_harness():
+        deployment = asyncio.run(main())
+
+    assert deployment.work_queue_name == "meta-prefect-unlimited-priority-3"
@@ -0,0 +1,84 @@
+"""Test the warm worker forks flow runs from zygotes it recycles."""
+import asyncio
+import os
+import sys
+
+from meta_prefect.implementations.concurrency_limits import limited_entrypoint
+from meta_prefect.implementations.supervisor import (
+    PoolRegistration,
+    SupervisorHome,
+    WorkerSupervisor,
+)
+from meta_prefect.implementations.warm_worker import (
+    preload_targets,
+    warm_worker_command,
+    WARM_WORKER_MODULE,
+    WarmPool,
+)
+
+
+def test_preload_targets_unwrap_limited_entrypoints():
+    """Test a limited flow preloads both its wrapper and the flow's file."""
+    assert preload_targets(None) == []
+    assert preload_targets("flows/etl.py:etl") == ["flows/etl.py"]
+    assert preload_targets(limited_entrypoint("flows/etl.py:etl")) == [
+        "meta_prefect.implementations.limited_entrypoint",
+        "flows/etl.py",
+    ]
+
+
+def test_warm_pool_recycles_its_zygote(tmp_path):
+    """Test runs are forked by a zygote replaced after `recycle_after` runs.
+
+    The runs are handed an invalid flow run id, so that `prefect.engine` exits
+    with 1 once started in the fork, without reaching the API.
+    """
+    env = {**os.environ, "PREFECT__FLOW_RUN_ID": "not-a-uuid"}
+
+    async def main():
+        pool = WarmPool(pool_size=1, recycle_after=2, preload=["json"])
+        zygotes, returncodes = [], []
+        try:
+            for _ in range(3):
+                pid, returncode = await pool.run(env, str(tmp_path), False)
+                zygotes.append(pool.zygote or pool._retired[-1])
+                returncodes.append(await returncode)
+                assert pid not in {zygote.process.pid for zygote in zygotes}
+        finally:
+            await pool.close()
+        return zygotes, returncodes
+
+    zygotes, returncodes = asyncio.run(main())
+
+    assert returncodes == [1, 1, 1]
+    assert zygotes[0] is zygotes[1] is not zygotes[2]
+    assert [zygote.runs for zygote in (zygotes[0], zygotes[2])] == [2, 1]
+    assert all(zygote.process.returncode == 0 for zygote in zygotes)
+
+
+def test_supervisor_starts_warm_workers(tmp_path):
+    """Test the supervisor starts the configured worker command for each slot."""
+    commands = []
+
+    def spawn(home, slot):
+        commands.append(slot.command)
+        return type("Process", (), {"pid": 1, "poll": lambda self: None})()
+
+    home = SupervisorHome(tmp_path)
+    home.register(PoolRegistration("pool", "prod"), count=1)
+    command = warm_worker_command(pool_size=2, preload=["pandas"])
+    WorkerSupervisor(home, spawn=spawn, worker_command=command).reconcile()
+
+    assert commands == [
+        (
+            sys.executable,
+            "-m",
+            WARM_WORKER_MODULE,
+            "--pool-size",
+            "2",
+            "--recycle-after",
+            "100",
+            "--preload",
+            "pandas",
+        )
+    ]